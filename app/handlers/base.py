@@ -19,12 +19,15 @@ except ImportError:
     import json
 
 import bson
+import concurrent.futures
 import httplib
+import time
 import tornado
 import tornado.escape
 import tornado.gen
 import tornado.web
 import types
+import weakref
 
 import handlers.common.query
 import handlers.common.request
@@ -33,7 +36,10 @@ import handlers.response as hresponse
 import models
 import utils
 import utils.db
+import utils.instrumentation as instr
+import utils.jsoncodec
 import utils.log
+import utils.metrics
 import utils.validator as validator
 
 
@@ -48,6 +54,19 @@ STATUS_MESSAGES = {
     506: "Wrong response type from database"
 }
 
+# The route of the requests not served by a named URL.
+DEFAULT_ROUTE = "other"
+# The histograms of the request phases are named after the route and the
+# phase, the counters after the route and the status code.
+ROUTE_HISTOGRAM_FMT = "http-{:s}-{:s}"
+ROUTE_COUNTER_FMT = "http-{:s}-{:d}"
+
+# The named URL specs of each application, grouped by handler class.
+ROUTE_SPECS = weakref.WeakKeyDictionary()
+
+# Where the request metrics are sent to Redis, outside of the IOLoop.
+METRICS_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
 
 # pylint: disable=unused-argument
 # pylint: disable=too-many-public-methods
@@ -56,6 +75,8 @@ class BaseHandler(tornado.web.RequestHandler):
     """The base handler."""
 
     def __init__(self, application, request, **kwargs):
+        self.timer = instr.RequestTimer()
+        self.queries = None
         super(BaseHandler, self).__init__(application, request, **kwargs)
 
     @property
@@ -73,6 +94,11 @@ class BaseHandler(tornado.web.RequestHandler):
         """The accepted content-type header."""
         return "application/json"
 
+    @property
+    def accepts_bulk_post(self):
+        """If POST requests can send a list of JSON objects."""
+        return False
+
     # pylint: disable=invalid-name
     @property
     def db(self):
@@ -89,6 +115,26 @@ class BaseHandler(tornado.web.RequestHandler):
         """The logger of this object."""
         return utils.log.get_log(debug=self.settings["debug"])
 
+    @property
+    def route(self):
+        """The name of the URL that matched the request."""
+        specs = ROUTE_SPECS.get(self.application, None)
+        if specs is None:
+            specs = {}
+            for _, host_specs in self.application.handlers:
+                for spec in host_specs:
+                    if spec.name:
+                        specs.setdefault(spec.handler_class, []).append(spec)
+            ROUTE_SPECS[self.application] = specs
+
+        route = DEFAULT_ROUTE
+        for spec in specs.get(self.__class__, []):
+            if spec.regex.match(self.request.path):
+                route = spec.name
+                break
+
+        return route
+
     @staticmethod
     def _valid_keys(method):
         """The accepted keys for the valid sent content type.
@@ -143,17 +189,17 @@ class BaseHandler(tornado.web.RequestHandler):
             reason = self._get_status_message(status_code)
             to_dump = dict(code=status_code, reason=reason)
 
-        result = json.dumps(
-            to_dump,
-            default=bson.json_util.default,
-            ensure_ascii=False,
-            separators=(",", ":")
-        )
+        with self.timer.phase(instr.SERIALIZE_PHASE):
+            result = utils.jsoncodec.dumps(to_dump)
 
         self.set_status(status_code=status_code, reason=reason)
         self._write_buffer.append(tornado.escape.utf8(result))
         self.set_header("Content-Type", "application/json; charset=UTF-8")
 
+        if self.settings.get("server_timing", False):
+            self.timer.add(instr.TOTAL_PHASE, self.request.request_time())
+            self.set_header("Server-Timing", self.timer.server_timing())
+
         if headers:
             for key, val in headers.iteritems():
                 self.add_header(key, val)
@@ -171,9 +217,64 @@ class BaseHandler(tornado.web.RequestHandler):
         else:
             super(BaseHandler, self).write_error(status_code, kwargs)
 
+    def on_finish(self):
+        """Record the duration of the request phases, if enabled.
+
+        The durations are added to the histograms of the request route, and
+        the counter of the route and status code is incremented.
+        """
+        if self.settings.get("metrics", False):
+            route = self.route
+            durations = dict(self.timer.durations)
+            durations[instr.TOTAL_PHASE] = self.request.request_time()
+
+            values = dict(
+                (ROUTE_HISTOGRAM_FMT.format(route, phase), value)
+                for phase, value in durations.iteritems()
+            )
+            counters = [ROUTE_COUNTER_FMT.format(route, self.get_status())]
+
+            METRICS_POOL.submit(
+                utils.metrics.observe_many,
+                self.redisdb, values, counters=counters)
+
+    def submit(self, func, *args, **kwargs):
+        """Submit a function to the executor, timing its execution.
+
+        The time spent waiting in the executor queue is recorded, and the
+        request timer is bound to the executor thread while the function
+        runs. The queries performed by the function are recorded in
+        `queries`.
+
+        :param func: The function to execute.
+        :type func: function
+        :return A `Future` object.
+        """
+        self.timer.submitted = time.time()
+        return self.executor.submit(self._execute_timed, func, *args, **kwargs)
+
+    def _execute_timed(self, func, *args, **kwargs):
+        """Execute a function with the request timer bound to the thread.
+
+        :param func: The function to execute.
+        :type func: function
+        :return The function result.
+        """
+        self.timer.add(instr.QUEUE_PHASE, time.time() - self.timer.submitted)
+        instr.bind(self.timer)
+        self.queries = instr.start_recording(
+            "%s %s" % (self.request.method, self.request.path))
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            instr.stop_recording()
+            instr.bind(None)
+
+        return result
+
     @tornado.gen.coroutine
     def put(self, *args, **kwargs):
-        future = yield self.executor.submit(self.execute_put, *args, **kwargs)
+        future = yield self.submit(self.execute_put, *args, **kwargs)
         self.write(future)
 
     def execute_put(self, *args, **kwargs):
@@ -204,7 +305,7 @@ class BaseHandler(tornado.web.RequestHandler):
 
     @tornado.gen.coroutine
     def post(self, *args, **kwargs):
-        future = yield self.executor.submit(self.execute_post, *args, **kwargs)
+        future = yield self.submit(self.execute_post, *args, **kwargs)
         self.write(future)
 
     def execute_post(self, *args, **kwargs):
@@ -221,20 +322,29 @@ class BaseHandler(tornado.web.RequestHandler):
 
             if valid_request == 200:
                 try:
-                    json_obj = json.loads(self.request.body.decode("utf8"))
+                    with self.timer.phase(instr.BODY_PHASE):
+                        json_obj = json.loads(
+                            self.request.body.decode("utf8"))
 
-                    valid_json, errors = validator.is_valid_json(
-                        json_obj, self._valid_keys("POST"))
-                    if valid_json:
-                        kwargs["json_obj"] = json_obj
+                    if all([isinstance(json_obj, types.ListType),
+                            self.accepts_bulk_post]):
+                        kwargs["json_objs"] = json_obj
                         kwargs["token"] = token
 
-                        response = self._post(*args, **kwargs)
-                        response.errors = errors
+                        response = self._post_bulk(*args, **kwargs)
                     else:
-                        response = hresponse.HandlerResponse(400)
-                        response.reason = "Provided JSON is not valid"
-                        response.errors = errors
+                        valid_json, errors = validator.is_valid_json(
+                            json_obj, self._valid_keys("POST"))
+                        if valid_json:
+                            kwargs["json_obj"] = json_obj
+                            kwargs["token"] = token
+
+                            response = self._post(*args, **kwargs)
+                            response.errors = errors
+                        else:
+                            response = hresponse.HandlerResponse(400)
+                            response.reason = "Provided JSON is not valid"
+                            response.errors = errors
                 except ValueError, ex:
                     self.log.exception(ex)
                     error = "No JSON data found in the POST request"
@@ -273,10 +383,23 @@ class BaseHandler(tornado.web.RequestHandler):
         """
         return hresponse.HandlerResponse(501)
 
+    def _post_bulk(self, *args, **kwargs):
+        """Placeholder method - used internally.
+
+        Like `_post`, but called when the POST request data is a list of JSON
+        objects and the handler accepts bulk POST requests (see
+        `accepts_bulk_post`).
+
+        This method will receive a named argument containing the list of JSON
+        objects. The argument is called `json_objs`.
+
+        :return A `HandlerResponse` object.
+        """
+        return hresponse.HandlerResponse(501)
+
     @tornado.gen.coroutine
     def delete(self, *args, **kwargs):
-        future = yield self.executor.submit(
-            self.execute_delete, *args, **kwargs)
+        future = yield self.submit(self.execute_delete, *args, **kwargs)
         self.write(future)
 
     def execute_delete(self, *args, **kwargs):
@@ -317,7 +440,7 @@ class BaseHandler(tornado.web.RequestHandler):
 
     @tornado.gen.coroutine
     def get(self, *args, **kwargs):
-        future = yield self.executor.submit(self.execute_get, *args, **kwargs)
+        future = yield self.submit(self.execute_get, *args, **kwargs)
         self.write(future)
 
     def execute_get(self, *args, **kwargs):
@@ -388,12 +511,20 @@ class BaseHandler(tornado.web.RequestHandler):
         It should return a `HandlerResponse` object, with the `result`
         attribute set with the operation results.
 
+        Admin tokens can pass the `explain` query argument to retrieve the
+        query plan instead of the documents.
+
         :return A `HandlerResponse` object.
         """
         response = hresponse.HandlerResponse()
         spec, sort, fields, skip, limit, unique = self._get_query_args()
 
-        if unique:
+        if handlers.common.query.get_boolean_value(
+                self.get_query_arguments, models.EXPLAIN_KEY):
+            response = self._explain(
+                kwargs.get("token", None),
+                spec, sort, fields, skip, limit, unique)
+        elif unique:
             response.result = utils.db.aggregate(
                 self.collection,
                 unique,
@@ -423,6 +554,41 @@ class BaseHandler(tornado.web.RequestHandler):
         response.limit = limit
         return response
 
+    # pylint: disable=too-many-arguments
+    def _explain(self, token, spec, sort, fields, skip, limit, unique):
+        """Explain how the database would run a GET query.
+
+        :param token: The token of the request: only admin tokens are
+        allowed.
+        :type token: Token
+        :param spec: The spec of the query.
+        :type spec: dict
+        :param sort: The sort of the query.
+        :type sort: list
+        :param fields: The fields to return.
+        :param skip: How many documents would be skipped.
+        :type skip: int
+        :param limit: How many documents would be returned.
+        :type limit: int
+        :param unique: The field of an aggregation, not supported.
+        :type unique: str
+        :return A `HandlerResponse` object.
+        """
+        response = hresponse.HandlerResponse()
+
+        if not all([token, getattr(token, "is_admin", False)]):
+            response.status_code = 403
+            response.reason = "Only admin tokens can explain queries"
+        elif unique:
+            response.status_code = 400
+            response.reason = "Cannot explain queries with 'aggregate'"
+        else:
+            response.result = utils.db.explain(
+                self.collection,
+                spec=spec, fields=fields, sort=sort, skip=skip, limit=limit)
+
+        return response
+
     def _get_query_args(self, method="GET"):
         """Retrieve all the arguments from the query string.
 
@@ -441,9 +607,10 @@ class BaseHandler(tornado.web.RequestHandler):
         unique = None
 
         if self.request.arguments:
-            spec, sort, fields, skip, limit, unique = \
-                handlers.common.query.get_all_query_values(
-                    self.get_query_arguments, self._valid_keys(method))
+            with self.timer.phase(instr.QUERY_PHASE):
+                spec, sort, fields, skip, limit, unique = \
+                    handlers.common.query.get_all_query_values(
+                        self.get_query_arguments, self._valid_keys(method))
 
         return spec, sort, fields, skip, limit, unique
 
@@ -23,6 +23,7 @@ import handlers.common.request
 import handlers.response as hresponse
 import models
 import taskqueue.tasks.common as taskq
+import utils.batch.common
 import utils.validator as validator
 
 
@@ -62,7 +63,8 @@ class BatchHandler(hbase.BaseHandler):
                         response = hresponse.HandlerResponse(200)
                         response.result = \
                             self.prepare_and_perform_batch_ops(
-                                json_obj, self.settings["dboptions"]
+                                json_obj,
+                                self.settings["dboptions"], database=self.db
                             )
                     else:
                         response = hresponse.HandlerResponse(400)
@@ -81,17 +83,64 @@ class BatchHandler(hbase.BaseHandler):
         return response
 
     @staticmethod
-    def prepare_and_perform_batch_ops(json_obj, db_options):
+    def prepare_and_perform_batch_ops(json_obj, db_options, database=None):
         """Perform the operation defined in the JSON object.
 
         The JSON oject must be a valid batch operations object.
 
+        Identical operations are performed only once. The fast operations
+        (count and distinct ones) are executed concurrently in this process,
+        the others are sent to the task queue. Each result reports, in its
+        `execution` field, how the operation has been executed.
+
         :param json_obj: The JSON object that defines all the bath operations
         to perform.
         :type json_obj: dict
         :param db_options: The mongodb database connection parameters.
         :type db_options: dict
+        :param database: The database connection for the fast operations.
+        :return A list with the results, in the same order of the operations.
         """
-        return taskq.run_batch_group(
-            json_obj.get(models.BATCH_KEY), db_options
+        batch_ops = json_obj.get(models.BATCH_KEY)
+        unique_ops, op_indexes = \
+            utils.batch.common.dedup_batch_operations(batch_ops)
+        results = [None] * len(unique_ops)
+
+        fast_idx = []
+        queue_idx = []
+        for idx, batch_op in enumerate(unique_ops):
+            if utils.batch.common.is_fast_operation(batch_op):
+                fast_idx.append(idx)
+            else:
+                queue_idx.append(idx)
+
+        # Submit the fast operations first, they run while waiting for the
+        # task queue.
+        futures = utils.batch.common.submit_batch_operations(
+            [unique_ops[idx] for idx in fast_idx],
+            db_options, database=database)
+
+        def _set_results(indexes, op_results, execution):
+            for idx, result in zip(indexes, op_results):
+                if isinstance(result, dict):
+                    result[models.EXECUTION_KEY] = execution
+                results[idx] = result
+
+        if queue_idx:
+            _set_results(
+                queue_idx,
+                taskq.run_batch_group(
+                    [unique_ops[idx] for idx in queue_idx], db_options),
+                utils.batch.common.QUEUE_EXECUTION
+            )
+
+        _set_results(
+            fast_idx,
+            [future.result() for future in futures],
+            utils.batch.common.IN_PROCESS_EXECUTION
         )
+
+        return [
+            utils.batch.common.get_operation_result(results[idx], batch_op)
+            for batch_op, idx in zip(batch_ops, op_indexes)
+        ]
@@ -33,7 +33,7 @@ class BisectHandler(hbase.BaseHandler):
 
     @tornado.gen.coroutine
     def get(self, *args, **kwargs):
-        future = yield self.executor.submit(self.execute_get, *args, **kwargs)
+        future = yield self.submit(self.execute_get, *args, **kwargs)
         self.write(future)
 
     @property
@@ -24,6 +24,10 @@ import models.lab as mlab
 import models.token as mtoken
 import taskqueue.tasks.boot as taskq
 import utils.db
+import utils.validator as validator
+
+# Maximum number of boot reports that can be sent with a bulk POST.
+MAX_BULK_REPORTS = 1000
 
 
 class BootHandler(hbase.BaseHandler):
@@ -44,6 +48,10 @@ class BootHandler(hbase.BaseHandler):
     def _token_validation_func():
         return handlers.common.token.valid_token_bh
 
+    @property
+    def accepts_bulk_post(self):
+        return True
+
     def _post(self, *args, **kwargs):
         lab_name = kwargs["json_obj"].get(models.LAB_NAME_KEY, None)
         req_token = kwargs["token"]
@@ -73,6 +81,78 @@ class BootHandler(hbase.BaseHandler):
 
         return response
 
+    def _post_bulk(self, *args, **kwargs):
+        json_objs = kwargs["json_objs"]
+        req_token = kwargs["token"]
+
+        if not json_objs:
+            response = hresponse.HandlerResponse(400)
+            response.reason = "No boot reports provided"
+        elif len(json_objs) > MAX_BULK_REPORTS:
+            response = hresponse.HandlerResponse(400)
+            response.reason = (
+                "Too many boot reports: at most %d can be sent at once" %
+                MAX_BULK_REPORTS)
+        else:
+            to_import = []
+            errors = []
+            # Validate the token only once for each lab.
+            valid_labs = {}
+            valid_keys = self._valid_keys("POST")
+
+            for idx, json_obj in enumerate(json_objs):
+                valid_json, error = validator.is_valid_json(
+                    json_obj, valid_keys)
+
+                if valid_json:
+                    lab_name = json_obj.get(models.LAB_NAME_KEY, None)
+                    if lab_name not in valid_labs:
+                        valid_labs[lab_name] = \
+                            self._is_valid_token(req_token, lab_name)
+
+                    valid_lab, error = valid_labs[lab_name]
+                    if valid_lab:
+                        to_import.append(json_obj)
+                    else:
+                        error = (
+                            "Provided authentication token is not "
+                            "associated with lab '%s' or is not valid" %
+                            lab_name)
+
+                if error:
+                    errors.append("Boot report %d: %s" % (idx, error))
+
+            if to_import:
+                response = hresponse.HandlerResponse(202)
+                response.reason = (
+                    "Request accepted: %d boot reports being imported" %
+                    len(to_import))
+
+                taskq.import_boots.apply_async(
+                    [
+                        to_import,
+                        self.settings["dboptions"],
+                        self.settings["mailoptions"]
+                    ],
+                    link=taskq.find_regressions.s(
+                        self.settings["dboptions"],
+                        self.settings["mailoptions"]
+                    )
+                )
+            elif valid_labs:
+                # All the valid boot reports have been refused.
+                response = hresponse.HandlerResponse(403)
+                response.reason = (
+                    "Provided authentication token is not associated with "
+                    "the boot reports labs or is not valid")
+            else:
+                response = hresponse.HandlerResponse(400)
+                response.reason = "No valid boot reports provided"
+
+            response.errors = errors
+
+        return response
+
     def _is_valid_token(self, req_token, lab_name):
         """Make sure the token used to perform the POST is valid.
 
@@ -16,15 +16,12 @@
 import bson
 
 import handlers.base as hbase
+import handlers.common.query
 import handlers.response as hresponse
 import models
+import utils.boot.regressions
 import utils.db
 
-from utils.boot.regressions import (
-    create_regressions_key,
-    get_regressions_by_key
-)
-
 
 class BootRegressionsHandler(hbase.BaseHandler):
     """Handle boot regressions request."""
@@ -35,12 +32,50 @@ class BootRegressionsHandler(hbase.BaseHandler):
 
     @property
     def collection(self):
-        return self.db[models.BOOT_REGRESSIONS_COLLECTION]
+        return self.db[models.BOOT_REGRESSIONS_BY_KEY_COLLECTION]
 
     @staticmethod
     def _valid_keys(method):
         return models.BOOT_REGRESSIONS_VALID_KEYS.get(method, None)
 
+    def _get(self, **kwargs):
+        """Get the regressions of each job and kernel.
+
+        Each regression is stored in its own document: they are grouped back
+        by job and kernel, with the regressions in the nested data structure
+        of the `regressions` key, as this resource has always returned them.
+        The `skip` and `limit` values apply to the grouped documents, the
+        `aggregate` and `explain` ones to the regression documents.
+
+        :return A `HandlerResponse` object.
+        """
+        spec, sort, fields, skip, limit, unique = self._get_query_args()
+
+        if any([
+                unique,
+                handlers.common.query.get_boolean_value(
+                    self.get_query_arguments, models.EXPLAIN_KEY)]):
+            return super(BootRegressionsHandler, self)._get(**kwargs)
+
+        response = hresponse.HandlerResponse()
+        result = group_regressions(
+            utils.db.find(self.collection, 0, 0, spec=spec, sort=sort))
+
+        response.count = len(result)
+        response.skip = skip
+        response.limit = limit
+
+        if limit:
+            result = result[skip:skip + limit]
+        else:
+            result = result[skip:]
+
+        if fields:
+            result = [filter_fields(doc, fields) for doc in result]
+        response.result = result
+
+        return response
+
     def _get_one(self, doc_id, **kwargs):
         """Get just one single document from the collection.
 
@@ -67,6 +102,67 @@ class BootRegressionsHandler(hbase.BaseHandler):
         return response
 
 
+def group_regressions(regr_docs):
+    """Group the flat regression documents by job and kernel.
+
+    The groups are returned in the order of their first regression document.
+    The creation date of a group is the one of its oldest regression.
+
+    :param regr_docs: The flat regression documents.
+    :type regr_docs: list
+    :return list The grouped documents, with the nested regressions.
+    """
+    groups = {}
+    group_keys = []
+
+    for regr_doc in regr_docs:
+        group_key = (
+            regr_doc.get(models.JOB_KEY), regr_doc.get(models.KERNEL_KEY))
+
+        if group_key not in groups:
+            groups[group_key] = []
+            group_keys.append(group_key)
+        groups[group_key].append(regr_doc)
+
+    result = []
+    for group_key in group_keys:
+        group_docs = groups[group_key]
+
+        result.append({
+            models.CREATED_KEY: min(
+                regr.get(models.CREATED_KEY) for regr in group_docs),
+            models.JOB_ID_KEY: group_docs[0].get(models.JOB_ID_KEY),
+            models.JOB_KEY: group_key[0],
+            models.KERNEL_KEY: group_key[1],
+            models.REGRESSIONS_KEY:
+                utils.boot.regressions.nest_regressions(group_docs)
+        })
+
+    return result
+
+
+def filter_fields(doc, fields):
+    """Keep only the requested fields of a grouped document.
+
+    :param doc: The grouped document.
+    :type doc: dict
+    :param fields: The `fields` data structure of the query: a list of the
+    fields to return, or a dictionary of fields to return or to exclude.
+    :type fields: list, dict
+    :return dict The document with only the requested fields.
+    """
+    if isinstance(fields, dict):
+        wanted = [key for key, val in fields.iteritems() if val]
+        excluded = [key for key, val in fields.iteritems() if not val]
+    else:
+        wanted = fields
+        excluded = []
+
+    return dict(
+        (key, val) for key, val in doc.iteritems()
+        if all([not wanted or key in wanted, key not in excluded]))
+
+
 def find_regressions(doc_id, database):
     """Look for the regressions of a boot report.
 
@@ -91,13 +187,24 @@ def find_regressions(doc_id, database):
             }
 
             result = utils.db.find_one2(
-                database[models.BOOT_REGRESSIONS_COLLECTION],
+                database[models.BOOT_REGRESSIONS_BY_KEY_COLLECTION],
                 spec, fields=[models.REGRESSIONS_KEY])
 
             if result:
-                response.result = get_regressions_by_key(
-                    create_regressions_key(boot_doc),
-                    result[models.REGRESSIONS_KEY])
+                response.result = result[models.REGRESSIONS_KEY]
+            else:
+                # Not migrated yet: it is still an old nested document.
+                result = utils.db.find_one2(
+                    database[models.BOOT_REGRESSIONS_COLLECTION],
+                    spec, fields=[models.REGRESSIONS_KEY])
+
+                if result:
+                    response.result = \
+                        utils.boot.regressions.get_nested_regressions(
+                            utils.boot.regressions.create_regressions_key(
+                                boot_doc), result)
+
+            if response.result:
                 response.count = len(response.result)
     else:
         response.status_code = 404
@@ -246,6 +246,28 @@ def get_aggregate_value(query_args_func):
     return aggregate
 
 
+def get_boolean_value(query_args_func, key):
+    """Get the boolean value of a query argument.
+
+    The values "1", "true" and "yes" are considered True, in any case. If a
+    list of values is retrieved, only the last one will be used.
+
+    :param query_args_func: The function used to get the query arguments.
+    :type query_args_func: function
+    :param key: The name of the query argument.
+    :type key: str
+    :return The value as boolean.
+    """
+    value = query_args_func(key)
+    if value and isinstance(value, types.ListType):
+        value = value[-1]
+
+    return all([
+        isinstance(value, types.StringTypes),
+        value and value.lower() in ["1", "true", "yes"]
+    ])
+
+
 def get_compared_value(query_args_func):
     """Get the value of the compared key.
 
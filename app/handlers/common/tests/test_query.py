@@ -32,6 +32,7 @@ from handlers.common.query import (
     get_and_add_date_range,
     get_and_add_gte_lt_keys,
     get_and_add_time_range,
+    get_boolean_value,
     get_compared_value,
     get_created_on_date,
     get_query_fields,
@@ -179,6 +180,19 @@ class TestCommonQuery(unittest.TestCase):
             calculate_date_range("15foo$%^%&^%&")
         )
 
+    def test_get_boolean_value(self):
+        def query_args_func(key):
+            return {
+                "foo": ["false", "TRUE"],
+                "bar": ["0"],
+                "baz": ["yes"]
+            }.get(key, [])
+
+        self.assertTrue(get_boolean_value(query_args_func, "foo"))
+        self.assertFalse(get_boolean_value(query_args_func, "bar"))
+        self.assertTrue(get_boolean_value(query_args_func, "baz"))
+        self.assertFalse(get_boolean_value(query_args_func, "async"))
+
     def test_get_aggregate_value_empty(self):
         def query_args_func(key):
             return []
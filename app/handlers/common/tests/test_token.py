@@ -161,6 +161,16 @@ class TestCommonToken(unittest.TestCase):
         self.assertFalse(handlers.common.token.valid_token_bh(
             self.token, "DELETE"))
 
+    def test_valid_token_admin(self):
+        self.token.is_admin = True
+        self.assertTrue(
+            handlers.common.token.valid_token_admin(self.token, "GET"))
+
+        self.token.is_admin = False
+        self.token.is_superuser = True
+        self.assertFalse(
+            handlers.common.token.valid_token_admin(self.token, "GET"))
+
     def test_valid_token_th_true(self):
         self.token.is_admin = True
 
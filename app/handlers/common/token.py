@@ -19,6 +19,7 @@ import models
 import models.token as mtoken
 import utils
 import utils.db
+import utils.instrumentation
 
 
 def valid_token_general(token, method):
@@ -85,6 +86,21 @@ def valid_token_th(token, method):
     return valid_token
 
 
+def valid_token_admin(token, method):
+    """Make sure a token is an admin token.
+
+    :param token: The Token object to validate.
+    :param method: The HTTP verb this token is being validated for.
+    :return True or False.
+    """
+    valid_token = False
+
+    if token.is_admin:
+        valid_token = True
+
+    return valid_token
+
+
 def valid_token_upload(token, method):
     """Make sure a token is enabled to upload files.
 
@@ -102,6 +118,23 @@ def valid_token_upload(token, method):
     return valid_token
 
 
+def valid_token_upload_session(token, method):
+    """Make sure a token is enabled to handle chunked upload sessions.
+
+    Upload tokens can also check and abort their sessions.
+
+    :param token: The token object to validate.
+    :param method: The HTTP method this token is being validated for.
+    :return True or False.
+    """
+    valid_token = False
+
+    if any([token.is_admin, token.is_superuser, token.is_upload_token]):
+        valid_token = True
+
+    return valid_token
+
+
 def valid_token_tests(token, method):
     """Make sure a token is enabled for test reports.
 
@@ -229,6 +262,9 @@ def token_validation(
         req_token, remote_ip, validation_func, database, master_key=None):
     """Perform the real token validation.
 
+    The time it takes is added to the request timer, if any, without the
+    time of the database lookup.
+
     :param method: The HTTP verb to validate.
     :type method: str
     :param req_token: The token as taken from the request.
@@ -244,13 +280,16 @@ def token_validation(
     """
     valid_token = False
     token = None
-    token_obj = find_token(database, {models.TOKEN_KEY: req_token})
 
-    if token_obj:
-        valid_token, token = validate_token(
-            token_obj,
-            method,
-            remote_ip,
-            validation_func
-        )
+    with utils.instrumentation.timed(utils.instrumentation.TOKEN_PHASE):
+        token_obj = find_token(database, {models.TOKEN_KEY: req_token})
+
+        if token_obj:
+            valid_token, token = validate_token(
+                token_obj,
+                method,
+                remote_ip,
+                validation_func
+            )
+
     return valid_token, token
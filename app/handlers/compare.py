@@ -22,10 +22,12 @@ import bson
 
 import handlers.base as hbase
 import handlers.common
+import handlers.common.query
 import handlers.response as hresponse
 import models
 import models.compare as mcompare
 import taskqueue.tasks.compare as taskq
+import utils.compare.common
 import utils.db
 import utils.validator as validator
 
@@ -113,39 +115,99 @@ class CompareHandler(hbase.BaseHandler):
 
         return response
 
+    def _set_location(self, response, doc_id):
+        """Set the headers pointing to the delta document.
+
+        :param response: The response object.
+        :type response: HandlerResponse
+        :param doc_id: The ID of the delta document.
+        """
+        response.headers = {
+            "Location": "/%s/compare/%s/" % (self.resource, str(doc_id)),
+            "X-Kernelci-Compare-Id": str(doc_id)
+        }
+
     def _post(self, *args, **kwargs):
         """Execute the real POST operations."""
         response = hresponse.HandlerResponse()
 
-        task = None
-        if self.resource == "job":
-            task = taskq.calculate_job_delta
-        elif self.resource == "build":
-            task = taskq.calculate_build_delta
+        # Serve previously calculated results without going through the
+        # task queue.
+        saved = utils.compare.common.get_saved_delta_doc(
+            self.collection,
+            utils.compare.common.get_request_hash(kwargs["json_obj"]))
+
+        if saved:
+            response.result, doc_id = saved
+            self._set_location(response, doc_id)
         else:
-            task = taskq.calculate_boot_delta
+            task = None
+            if self.resource == "job":
+                task = taskq.calculate_job_delta
+            elif self.resource == "build":
+                task = taskq.calculate_build_delta
+            else:
+                task = taskq.calculate_boot_delta
 
-        res = task.apply_async(
-            [kwargs["json_obj"]],
-            kwargs={
-                "db_options": self.settings["dboptions"],
-                "mail_options": self.settings["mailoptions"]
-            }
-        )
-
-        # With the while-loop it is faster to get the results back.
-        # Like ~40ms with, ~500ms without.
-        while not res.ready():
-            pass
-        status_code, result, doc_id, errors = res.get()
-
-        response.status_code = status_code
-        response.result = result
-        if doc_id:
-            response.headers = {
-                "Location": "/%s/compare/%s/" % (self.resource, str(doc_id)),
-                "X-Kernelci-Compare-Id": str(doc_id)
+            if handlers.common.query.get_boolean_value(
+                    self.get_query_arguments, models.ASYNC_KEY):
+                response = self._post_async(task, kwargs["json_obj"])
+            else:
+                res = task.apply_async(
+                    [kwargs["json_obj"]],
+                    kwargs={
+                        "db_options": self.settings["dboptions"],
+                        "mail_options": self.settings["mailoptions"]
+                    }
+                )
+
+                # With the while-loop it is faster to get the results back.
+                # Like ~40ms with, ~500ms without.
+                while not res.ready():
+                    pass
+                status_code, result, doc_id, errors = res.get()
+
+                response.status_code = status_code
+                response.result = result
+                if doc_id:
+                    self._set_location(response, doc_id)
+
+        return response
+
+    def _post_async(self, task, json_obj):
+        """Start the delta calculation without waiting for its result.
+
+        The response points to the document that tracks the calculation: it
+        can be retrieved to know its status and, once complete, the result.
+
+        :param task: The task that performs the delta calculation.
+        :param json_obj: The JSON data with the values.
+        :type json_obj: dict
+        :return A `HandlerResponse` object.
+        """
+        response = hresponse.HandlerResponse(202)
+
+        pending_id = utils.compare.common.create_pending_delta_doc(
+            self.collection)
+        if pending_id:
+            task.apply_async(
+                [json_obj],
+                kwargs={
+                    "db_options": self.settings["dboptions"],
+                    "mail_options": self.settings["mailoptions"],
+                    "pending_id": pending_id
+                }
+            )
+
+            response.reason = "Comparison request accepted"
+            response.result = {
+                models.ID_KEY: pending_id,
+                models.STATUS_KEY: mcompare.COMPARE_PENDING_STATUS
             }
+            self._set_location(response, pending_id)
+        else:
+            response.status_code = 500
+            response.reason = "Error scheduling the comparison"
 
         return response
 
@@ -198,7 +260,12 @@ class CompareHandler(hbase.BaseHandler):
             result = utils.db.find_one2(
                 self.collection, {models.ID_KEY: obj_id})
 
-            if result:
+            if not result:
+                response.status_code = 404
+                response.reason = "Resource '%s' not found" % doc_id
+            elif "data" not in result:
+                response = self._get_pending(result)
+            else:
                 # result here is returned as a dictionary from mongodb and we
                 # extract a list from the "data" key.
                 result = result["data"]
@@ -206,9 +273,6 @@ class CompareHandler(hbase.BaseHandler):
                 result[0][models.ID_KEY] = obj_id
 
                 response.result = result
-            else:
-                response.status_code = 404
-                response.reason = "Resource '%s' not found" % doc_id
         except bson.errors.InvalidId, ex:
             self.log.exception(ex)
             self.log.error("Provided doc ID '%s' is not valid", doc_id)
@@ -216,3 +280,44 @@ class CompareHandler(hbase.BaseHandler):
             response.reason = "Wrong ID value provided"
 
         return response
+
+    def _get_pending(self, pending):
+        """Report the status of an asynchronous delta calculation.
+
+        While the calculation is pending, the response has a 202 status code.
+        Once complete, it has the result of the calculation, or its errors.
+
+        :param pending: The document that tracks the calculation.
+        :type pending: dict
+        :return A `HandlerResponse` object.
+        """
+        response = hresponse.HandlerResponse()
+        status = pending[models.STATUS_KEY]
+        status_code = pending.get(models.STATUS_CODE_KEY, None)
+        delta_id = pending.get(models.DELTA_ID_KEY, None)
+
+        if status == mcompare.COMPARE_PENDING_STATUS:
+            response.status_code = 202
+            response.reason = "Comparison in progress"
+            response.result = {
+                models.ID_KEY: pending[models.ID_KEY],
+                models.STATUS_KEY: status
+            }
+        elif delta_id:
+            result = utils.db.find_one2(
+                self.collection, {models.ID_KEY: delta_id})
+            if result:
+                result = result["data"]
+                result[0][models.ID_KEY] = delta_id
+
+                response.result = result
+                self._set_location(response, delta_id)
+            else:
+                response.status_code = 404
+                response.reason = "Comparison result not found"
+        else:
+            response.status_code = status_code or 500
+            response.reason = "Error calculating the comparison"
+            response.errors = pending.get(models.ERRORS_KEY, None)
+
+        return response
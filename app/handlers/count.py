@@ -15,6 +15,8 @@
 
 """Handle the /count URLs used to count objects in the database."""
 
+import types
+
 import tornado.gen
 
 import handlers.base as hbase
@@ -29,6 +31,10 @@ import utils.db
 # not interested in the values.
 COUNT_FIELDS = {models.ID_KEY: True}
 
+# How many fields can differ between counts performed with a single
+# aggregation.
+MAX_GROUPED_COUNT_KEYS = 2
+
 
 class CountHandler(hbase.BaseHandler):
     """Handle the /count URLs."""
@@ -74,6 +80,122 @@ class CountHandler(hbase.BaseHandler):
         self.write_error(status_code=501)
 
 
+def get_count_spec(query_args_func, valid_keys):
+    """Build the spec to count the documents of a collection.
+
+    :param query_args_func: A function used to return a list of the query
+    arguments.
+    :type query_args_func: function
+    :param valid_keys: A list containing the valid keys that should be
+    retrieved.
+    :type valid_keys: list
+    :return The spec data structure (dictionary).
+    """
+    spec = handlers.common.query.get_query_spec(query_args_func, valid_keys)
+    handlers.common.query.get_and_add_date_range(spec, query_args_func)
+    utils.update_id_fields(spec)
+
+    return spec
+
+
+def get_grouped_count_spec(specs):
+    """Split the specs of counts on the same collection for an aggregation.
+
+    The fields that have the same value in all the specs are matched, the
+    others are the ones the documents are grouped on. The specs can be
+    counted together only if the grouped fields have plain values, not
+    query operators, and there are no more than `MAX_GROUPED_COUNT_KEYS`.
+
+    :param specs: The specs of the counts.
+    :type specs: list
+    :return A 2-tuple: the spec to match and the list of fields to group on.
+    None if the specs cannot be counted together.
+    """
+    grouped_spec = None
+    match = {}
+    group_keys = set()
+
+    for key, val in specs[0].iteritems():
+        if all([key in spec and spec[key] == val for spec in specs[1:]]):
+            match[key] = val
+
+    for spec in specs:
+        group_keys.update([key for key in spec if key not in match])
+
+    plain_values = all([
+        not isinstance(
+            spec[key], (types.DictionaryType, types.ListType))
+        for spec in specs for key in group_keys if key in spec
+    ])
+
+    if all([plain_values, len(group_keys) <= MAX_GROUPED_COUNT_KEYS]):
+        grouped_spec = (match, sorted(group_keys))
+
+    return grouped_spec
+
+
+def _match_grouped_value(doc_val, spec_val):
+    """Match a grouped value with the one of a spec as `$match` does.
+
+    The `$group` stage returns the whole value of a field: when it is an
+    array, the spec value matches if it is one of the array elements.
+
+    :param doc_val: The value of the field in the group.
+    :param spec_val: The value of the field in the spec.
+    :return True or False.
+    """
+    if isinstance(doc_val, types.ListType):
+        return spec_val in doc_val
+    return doc_val == spec_val
+
+
+def count_grouped(collection, collection_name, specs):
+    """Count the documents matching each spec with a single aggregation.
+
+    The specs must be compatible, see `get_grouped_count_spec`.
+
+    A document whose grouped field is an array is counted for each spec that
+    matches one of its elements. A spec cannot match a whole array, but the
+    specs with lists are never grouped.
+
+    :param collection: The collection whose elements should be counted.
+    :param collection_name: The name of the collection to count.
+    :type collection_name: str
+    :param specs: The specs of the counts.
+    :type specs: list
+    :return A list with, for each spec, the same result as
+    `count_one_collection`.
+    """
+    match, group_keys = get_grouped_count_spec(specs)
+
+    groups = utils.db.aggregate_pipeline(
+        collection,
+        [
+            {"$match": match},
+            {
+                "$group": {
+                    models.ID_KEY: {key: "$" + key for key in group_keys},
+                    models.COUNT_KEY: {"$sum": 1}
+                }
+            }
+        ]
+    )
+
+    counts = []
+    for spec in specs:
+        number = sum([
+            group[models.COUNT_KEY] for group in groups
+            if all([
+                _match_grouped_value(
+                    group[models.ID_KEY].get(key, None), spec[key])
+                for key in group_keys if key in spec
+            ])
+        ])
+        counts.append([dict(collection=collection_name, count=number)])
+
+    return counts
+
+
 def count_one_collection(
         collection, collection_name, query_args_func, valid_keys):
     """Count all the available documents in the provide collection.
@@ -91,10 +213,7 @@ def count_one_collection(
     optionally the `fields` fields.
     """
     result = []
-    spec = handlers.common.query.get_query_spec(
-        query_args_func, valid_keys)
-    handlers.common.query.get_and_add_date_range(spec, query_args_func)
-    utils.update_id_fields(spec)
+    spec = get_count_spec(query_args_func, valid_keys)
 
     if spec:
         _, number = utils.db.find_and_count(
@@ -127,10 +246,7 @@ def count_all_collections(database, query_args_func, valid_keys):
     fields.
     """
     result = []
-
-    spec = handlers.common.query.get_query_spec(query_args_func, valid_keys)
-    handlers.common.query.get_and_add_date_range(spec, query_args_func)
-    utils.update_id_fields(spec)
+    spec = get_count_spec(query_args_func, valid_keys)
 
     if spec:
         for collection in models.COUNT_COLLECTIONS:
@@ -13,17 +13,78 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-"""Make sure indexes are created at startup."""
+"""Versioned migrations of the database indexes.
 
+Each migration has a version number and creates the indexes introduced with
+it, in the background, or moves the documents whose schema changed. The
+version of the last applied migration is stored in the database: at startup
+the server checks it and, only if it is older, runs the missing migrations in
+a separate thread without delaying the start. Only the unique indexes, that
+prevent duplicated documents, are built before serving. A lease stored with
+the version makes sure that only one process applies the migrations.
+
+The migrations can also be run before a deploy, from the app/ directory:
+
+    PYTHONPATH=. python handlers/dbindexes.py
+
+The connection parameters are read from the server configuration file and
+can be overridden on the command line: see `--help`.
+
+To change the indexes or a schema, add a new migration to `MIGRATIONS`.
+"""
+
+import argparse
+import bson.tz_util
+import datetime
 import pymongo
+import pymongo.errors
+import threading
 
 import models
+import models.compare
+import utils
+import utils.boot.regressions
+import utils.db
+
+# The ID of the document storing the indexes version.
+INDEXES_VERSION_ID = "indexes"
+
+# The field of the indexes version document with the time a process took the
+# migration lease: only that process migrates until the lease expires.
+MIGRATION_LEASE_KEY = "migrating_on"
+
+# How long a migration lease lasts: it is renewed after each migration, and
+# lets another process migrate if the one holding it died.
+MIGRATION_LEASE_TIME = datetime.timedelta(hours=1)
+
+# The collections with the saved delta results.
+DELTA_COLLECTIONS = [
+    models.BOOT_DELTA_COLLECTION,
+    models.BUILD_DELTA_COLLECTION, models.JOB_DELTA_COLLECTION
+]
+
+# The unique indexes that prevent duplicated documents when concurrent
+# requests save the same data: (collection, keys, options). They are built
+# before serving when the migrations are not up to date.
+UNIQUE_INDEXES = [
+    (
+        collection_name,
+        [(models.REQUEST_HASH_KEY, pymongo.ASCENDING)], {"sparse": True}
+    )
+    for collection_name in DELTA_COLLECTIONS
+] + [
+    (
+        models.BOOT_REGRESSIONS_BY_KEY_COLLECTION,
+        utils.boot.regressions.REGRESSIONS_BY_KEY_INDEX, {}
+    )
+]
 
 
 def ensure_indexes(database):
     """Ensure that mongodb indexes exists, if not create them.
 
-    This should be called at server startup.
+    This is the first migration, with all the indexes created before the
+    migrations were introduced.
 
     :param database: The database connection.
     """
@@ -35,6 +96,9 @@ def ensure_indexes(database):
     _ensure_bisect_indexes(database)
     _ensure_error_logs_indexes(database)
     _ensure_stats_indexes(database)
+    _ensure_delta_indexes(database)
+    _ensure_regressions_indexes(database)
+    _ensure_upload_indexes(database)
 
 
 def _ensure_job_indexes(database):
@@ -245,6 +309,24 @@ def _ensure_stats_indexes(database):
         [(models.CREATED_KEY, pymongo.DESCENDING)], background=True)
 
 
+def _ensure_delta_indexes(database):
+    """Ensure indexes exist on the delta collections.
+
+    :param database: The database connection.
+    """
+    for collection_name in DELTA_COLLECTIONS:
+        collection = database[collection_name]
+        collection.ensure_index(
+            [(models.REQUEST_HASH_KEY, pymongo.ASCENDING)],
+            unique=True, sparse=True, background=True)
+        collection.ensure_index(
+            [(models.REFERENCED_JOBS_KEY, pymongo.ASCENDING)],
+            background=True)
+        collection.ensure_index(
+            [(models.CREATED_KEY, pymongo.ASCENDING)],
+            expireAfterSeconds=models.compare.DELTA_DOC_TTL, background=True)
+
+
 def _ensure_regressions_indexes(database):
     """Ensure indexes exist on the regression collection.
 
@@ -262,9 +344,276 @@ def _ensure_regressions_indexes(database):
     collection.ensure_index(
         [(models.JOB_ID_KEY, pymongo.DESCENDING)], background=True)
 
+    # The regressions stored by job, kernel and regression key.
+    collection = database[models.BOOT_REGRESSIONS_BY_KEY_COLLECTION]
+    collection.ensure_index(
+        utils.boot.regressions.REGRESSIONS_BY_KEY_INDEX,
+        background=True, unique=True
+    )
+    collection.ensure_index(
+        [
+            (models.BOARD_KEY, pymongo.ASCENDING),
+            (models.CREATED_KEY, pymongo.DESCENDING)
+        ],
+        background=True
+    )
+    collection.ensure_index(
+        [
+            (models.LAB_NAME_KEY, pymongo.ASCENDING),
+            (models.CREATED_KEY, pymongo.DESCENDING)
+        ],
+        background=True
+    )
+    collection.ensure_index(
+        [(models.JOB_ID_KEY, pymongo.DESCENDING)], background=True)
+    collection.ensure_index(
+        [(models.CREATED_KEY, pymongo.DESCENDING)], background=True)
+
     # The index collection.
     collection = database[models.BOOT_REGRESSIONS_BY_BOOT_COLLECTION]
     collection.ensure_index(
         [(models.BOOT_ID_KEY, pymongo.DESCENDING)], background=True)
     collection.ensure_index(
         [(models.CREATED_KEY, pymongo.DESCENDING)], background=True)
+
+
+def _ensure_upload_indexes(database):
+    """Ensure indexes exist on the upload collection.
+
+    :param database: The database connection.
+    """
+    collection = database[models.UPLOAD_COLLECTION]
+    collection.ensure_index(
+        [(models.CREATED_KEY, pymongo.ASCENDING)],
+        expireAfterSeconds=models.UPLOAD_SESSION_TTL, background=True)
+
+
+# The migrations, sorted by version: (version, function).
+MIGRATIONS = [
+    (1, ensure_indexes),
+    (2, utils.boot.regressions.migrate_nested_regressions)
+]
+
+# The version the database indexes should have.
+INDEXES_VERSION = MIGRATIONS[-1][0]
+
+
+def get_indexes_version(database):
+    """Get the version of the indexes migrations applied to the database.
+
+    :param database: The database connection.
+    :return int The version, 0 if no migration has been applied.
+    """
+    version = 0
+    doc = utils.db.find_one2(
+        database[models.SCHEMA_COLLECTION], INDEXES_VERSION_ID)
+
+    if doc:
+        version = doc.get(models.VERSION_KEY, 0)
+
+    return version
+
+
+def _set_indexes_version(database, version):
+    """Store the version of the last migration applied.
+
+    :param database: The database connection.
+    :param version: The version of the migration.
+    :type version: int
+    """
+    now = datetime.datetime.now(tz=bson.tz_util.utc)
+
+    utils.db.update(
+        database[models.SCHEMA_COLLECTION],
+        {models.ID_KEY: INDEXES_VERSION_ID},
+        {
+            MIGRATION_LEASE_KEY: now,
+            models.VERSION_KEY: version,
+            models.UPDATED_KEY: now
+        },
+        upsert=True
+    )
+
+
+def _acquire_migration_lease(database):
+    """Take the lease to migrate the indexes.
+
+    The lease is taken atomically on the indexes version document: it fails
+    if another process holds a lease that did not expire yet.
+
+    :param database: The database connection.
+    :return bool True if the lease has been taken.
+    """
+    now = datetime.datetime.now(tz=bson.tz_util.utc)
+    acquired = True
+
+    try:
+        utils.db.find_and_modify(
+            database[models.SCHEMA_COLLECTION],
+            {
+                models.ID_KEY: INDEXES_VERSION_ID,
+                "$or": [
+                    {MIGRATION_LEASE_KEY: None},
+                    {MIGRATION_LEASE_KEY: {"$exists": False}},
+                    {MIGRATION_LEASE_KEY: {"$lt": now - MIGRATION_LEASE_TIME}}
+                ]
+            },
+            {"$set": {MIGRATION_LEASE_KEY: now}},
+            fields=[models.ID_KEY], upsert=True)
+    except pymongo.errors.DuplicateKeyError:
+        # The document exists but the lease is held: the upsert fails.
+        acquired = False
+
+    return acquired
+
+
+def _release_migration_lease(database):
+    """Release the lease to migrate the indexes.
+
+    :param database: The database connection.
+    """
+    utils.db.update(
+        database[models.SCHEMA_COLLECTION],
+        {models.ID_KEY: INDEXES_VERSION_ID}, {MIGRATION_LEASE_KEY: None})
+
+
+def migrate_indexes(database, target_version=INDEXES_VERSION):
+    """Apply the migrations not yet applied, up to a version.
+
+    The version is stored after each migration: if one fails, the following
+    run starts again from it.
+
+    Only one process migrates at a time: nothing is applied if another one
+    holds the migration lease.
+
+    :param database: The database connection.
+    :param target_version: The last version to apply.
+    :type target_version: int
+    :return list The versions of the applied migrations.
+    """
+    applied = []
+
+    if not _acquire_migration_lease(database):
+        utils.LOG.info("Indexes migrations already running in another process")
+        return applied
+
+    try:
+        version = get_indexes_version(database)
+
+        for migration_version, migration in MIGRATIONS:
+            if version < migration_version <= target_version:
+                utils.LOG.info(
+                    "Applying indexes migration %d", migration_version)
+                migration(database)
+                _set_indexes_version(database, migration_version)
+                applied.append(migration_version)
+    finally:
+        _release_migration_lease(database)
+
+    return applied
+
+
+def ensure_unique_indexes(database):
+    """Ensure the unique indexes in `UNIQUE_INDEXES` exist.
+
+    The call returns when the indexes are built: on existing collections
+    the build does not block the database, but can take a while.
+
+    :param database: The database connection.
+    """
+    for collection_name, keys, options in UNIQUE_INDEXES:
+        database[collection_name].ensure_index(
+            keys, unique=True, background=True, **options)
+
+
+def find_missing_unique_indexes(database):
+    """Find which of the unique indexes in `UNIQUE_INDEXES` do not exist.
+
+    :param database: The database connection.
+    :return list The missing indexes: (collection, keys) tuples.
+    """
+    missing = []
+    for collection_name, keys, _ in UNIQUE_INDEXES:
+        indexes = database[collection_name].index_information()
+        if not any([
+                index.get("unique", False) and [
+                    (field, int(direction))
+                    for field, direction in index["key"]] == keys
+                for index in indexes.itervalues()]):
+            missing.append((collection_name, keys))
+
+    return missing
+
+
+def _migrate_indexes_thread(database):
+    """Apply the missing migrations, logging any error."""
+    try:
+        migrate_indexes(database)
+    except pymongo.errors.PyMongoError, ex:
+        utils.LOG.error("Error applying the indexes migrations")
+        utils.LOG.exception(ex)
+
+
+def check_indexes(database, migrate=True):
+    """Check the indexes version at startup.
+
+    Nothing is done if the indexes are up to date. Otherwise the missing
+    migrations are applied in a separate thread, or just reported.
+
+    The unique indexes are always built before returning when migrating,
+    since the requests rely on them to avoid duplicated documents. When not
+    migrating, the missing ones are reported as errors.
+
+    :param database: The database connection.
+    :param migrate: If the missing migrations should be applied.
+    :type migrate: bool
+    :return int The version of the indexes found.
+    """
+    version = get_indexes_version(database)
+
+    if version >= INDEXES_VERSION:
+        utils.LOG.info("Indexes up to date at version %d", version)
+    elif migrate:
+        utils.LOG.info(
+            "Indexes at version %d, migrating to %d in the background",
+            version, INDEXES_VERSION)
+        ensure_unique_indexes(database)
+        migration_thread = threading.Thread(
+            target=_migrate_indexes_thread,
+            args=(database,), name="indexes-migration")
+        migration_thread.daemon = True
+        migration_thread.start()
+    else:
+        utils.LOG.warn(
+            "Indexes at version %d, expected %d: run the migrations",
+            version, INDEXES_VERSION)
+        for collection_name, keys in find_missing_unique_indexes(database):
+            utils.LOG.error(
+                "Missing unique index %s on %s: duplicated documents can be "
+                "stored", keys, collection_name)
+
+    return version
+
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser(
+        description="Apply the database indexes migrations")
+    PARSER.add_argument(
+        "--target",
+        type=int,
+        default=INDEXES_VERSION, help="The last version to apply")
+    PARSER.add_argument(
+        "--status",
+        action="store_true", help="Only show the current indexes version")
+    utils.db.add_db_arguments(PARSER)
+    ARGS = PARSER.parse_args()
+
+    DATABASE = utils.db.get_db_connection(utils.db.get_db_options(ARGS))
+
+    if ARGS.status:
+        print "Indexes version: %d (latest %d)" % (
+            get_indexes_version(DATABASE), INDEXES_VERSION)
+    else:
+        APPLIED = migrate_indexes(DATABASE, target_version=ARGS.target)
+        print "Applied migrations: %s" % (
+            ", ".join(str(version) for version in APPLIED) or "none")
@@ -0,0 +1,68 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The RequestHandler for the /metrics URL."""
+
+import handlers.base as hbase
+import handlers.common.token
+import handlers.response as hresponse
+import models
+import utils.cache
+import utils.metrics
+
+
+# pylint: disable=too-many-public-methods
+class MetricsHandler(hbase.BaseHandler):
+    """Handle the /metrics URL.
+
+    Provide the histograms and the counters stored in Redis, like the ones
+    of the request phases of each route, and the caches statistics. Only
+    admin tokens can access them.
+    """
+
+    def __init__(self, application, request, **kwargs):
+        super(MetricsHandler, self).__init__(application, request, **kwargs)
+
+    @staticmethod
+    def _token_validation_func():
+        return handlers.common.token.valid_token_admin
+
+    def _get(self, **kwargs):
+        response = hresponse.HandlerResponse()
+
+        histograms = dict(
+            (name, utils.metrics.get_histogram(
+                self.redisdb, name, buckets=None))
+            for name in utils.metrics.get_histogram_names(self.redisdb)
+        )
+
+        counters = utils.metrics.get_counters(self.redisdb)
+
+        response.result = [
+            {
+                models.CACHES_KEY: utils.cache.get_published_stats(counters),
+                models.COUNTERS_KEY: counters,
+                models.HISTOGRAMS_KEY: histograms
+            }
+        ]
+
+        return response
+
+    def execute_post(self, *args, **kwargs):
+        return hresponse.HandlerResponse(501)
+
+    def execute_put(self, *args, **kwargs):
+        return hresponse.HandlerResponse(501)
+
+    def execute_delete(self, *args, **kwargs):
+        return hresponse.HandlerResponse(501)
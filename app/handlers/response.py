@@ -18,6 +18,11 @@
 import pymongo.cursor
 import types
 
+import utils.db
+
+# The cursors whose documents are fetched when set as the result.
+CURSOR_TYPES = (pymongo.cursor.Cursor, utils.db.RecordedCursor)
+
 
 class HandlerResponse(object):
     """A custom response object that handlers should use to communicate.
@@ -173,10 +178,11 @@ class HandlerResponse(object):
         if value is None:
             self._result = value
         else:
-            # The pymongo cursor is an iterable.
-            if not isinstance(value, (types.ListType, pymongo.cursor.Cursor)):
+            # The cursors are iterables: the documents are fetched here, in
+            # the handler executor, and not when the response is serialized.
+            if not isinstance(value, (types.ListType,) + CURSOR_TYPES):
                 value = [value]
-            elif isinstance(value, pymongo.cursor.Cursor):
+            elif isinstance(value, CURSOR_TYPES):
                 value = [r for r in value]
             self._result = value
 
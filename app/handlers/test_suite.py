@@ -24,6 +24,7 @@ import models.test_suite as mtsuite
 import taskqueue.tasks.test as taskq
 import utils
 import utils.db
+import utils.tests_import
 
 
 # pylint: disable=too-many-public-methods
@@ -322,10 +323,12 @@ class TestSuiteHandler(htbase.TestBaseHandler):
 
         return response
 
-    # TODO: consider caching results here as well.
     def _check_references(self, build_id, job_id, boot_id):
         """Check that the provided IDs are valid.
 
+        The found documents are cached in this process: the next test suites
+        of the same build, job or boot report are checked without a query.
+
         :param build_id: The ID of the associated build.
         :type build_id: string
         :param job_id: The ID of the associated job.
@@ -347,24 +350,24 @@ class TestSuiteHandler(htbase.TestBaseHandler):
             ret_val = 400
             error = "Invalid value passed for build_id, job_id, or boot_id"
         else:
-            build_doc = utils.db.find_one2(
-                self.db[models.BUILD_COLLECTION], build_oid, [models.ID_KEY])
+            find_reference = utils.tests_import.find_reference
+
+            build_doc = find_reference(
+                self.db[models.BUILD_COLLECTION], build_oid)
             if not build_doc:
                 ret_val = 400
                 error = "Build document with ID '%s' not found" % build_id
             else:
                 if job_id:
-                    job_doc = utils.db.find_one2(
-                        self.db[models.JOB_COLLECTION],
-                        job_oid, [models.ID_KEY])
+                    job_doc = find_reference(
+                        self.db[models.JOB_COLLECTION], job_oid)
                     if not job_doc:
                         ret_val = 400
                         error = "Job document with ID '%s' not found" % job_id
 
                 if all([boot_id, error is None]):
-                    boot_doc = utils.db.find_one2(
-                        self.db[models.BOOT_COLLECTION],
-                        boot_oid, [models.ID_KEY])
+                    boot_doc = find_reference(
+                        self.db[models.BOOT_COLLECTION], boot_oid)
                     if not boot_doc:
                         ret_val = 400
                         error = (
@@ -116,8 +116,7 @@ class TestBatchHandler(TestHandlerBase):
             "batch": [
                 {
                     "method": "GET",
-                    "resource": "count",
-                    "document": "boot",
+                    "resource": "boot",
                     "operation_id": "bar",
                     "query": "foo=bar"
                 }
@@ -125,7 +124,7 @@ class TestBatchHandler(TestHandlerBase):
         }
         body = json.dumps(batch_dict)
 
-        mocked_run_batch.return_value = {}
+        mocked_run_batch.return_value = [{"operation_id": "bar"}]
 
         response = self.fetch(
             "/batch", method="POST", body=body, headers=headers)
@@ -136,9 +135,8 @@ class TestBatchHandler(TestHandlerBase):
         mocked_run_batch.assert_called_once_with(
             [
                 {
-                    "resource": "count",
+                    "resource": "boot",
                     "method": "GET",
-                    "document": "boot",
                     "operation_id": "bar",
                     "query": "foo=bar"
                 }
@@ -148,3 +146,107 @@ class TestBatchHandler(TestHandlerBase):
                 "mongodb_password": ""
             }
         )
+        self.assertEqual(
+            "queue", json.loads(response.body)["result"][0]["execution"])
+
+    @mock.patch("taskqueue.tasks.common.run_batch_group")
+    def test_post_count_in_process(self, mocked_run_batch):
+        headers = {"Authorization": "foo", "Content-Type": "application/json"}
+        self.database["boot"].insert([{"status": "PASS"} for _ in range(3)])
+        batch_dict = {
+            "batch": [
+                {
+                    "method": "GET",
+                    "resource": "count",
+                    "document": "boot",
+                    "operation_id": "bar"
+                }
+            ]
+        }
+        body = json.dumps(batch_dict)
+
+        response = self.fetch(
+            "/batch", method="POST", body=body, headers=headers)
+        result = json.loads(response.body)["result"][0]
+
+        self.assertEqual(response.code, 200)
+        self.assertFalse(mocked_run_batch.called)
+        self.assertEqual("in-process", result["execution"])
+        self.assertEqual("bar", result["operation_id"])
+        self.assertEqual(3, result["result"][0]["count"])
+
+    @mock.patch("taskqueue.tasks.common.run_batch_group")
+    def test_post_mixed(self, mocked_run_batch):
+        headers = {"Authorization": "foo", "Content-Type": "application/json"}
+        batch_dict = {
+            "batch": [
+                {
+                    "method": "GET",
+                    "resource": "boot",
+                    "operation_id": "op-0"
+                },
+                {
+                    "method": "GET",
+                    "resource": "count",
+                    "document": "boot",
+                    "operation_id": "op-1"
+                },
+                {
+                    "method": "GET",
+                    "resource": "job",
+                    "operation_id": "op-2"
+                }
+            ]
+        }
+        body = json.dumps(batch_dict)
+
+        mocked_run_batch.return_value = [
+            {"operation_id": "op-0"}, {"operation_id": "op-2"}]
+
+        response = self.fetch(
+            "/batch", method="POST", body=body, headers=headers)
+        results = json.loads(response.body)["result"]
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(1, mocked_run_batch.call_count)
+        self.assertEqual(2, len(mocked_run_batch.call_args[0][0]))
+        self.assertEqual(
+            ["op-0", "op-1", "op-2"],
+            [result["operation_id"] for result in results])
+        self.assertEqual(
+            ["queue", "in-process", "queue"],
+            [result["execution"] for result in results])
+
+    @mock.patch("taskqueue.tasks.common.run_batch_group")
+    def test_post_duplicated(self, mocked_run_batch):
+        headers = {"Authorization": "foo", "Content-Type": "application/json"}
+        batch_dict = {
+            "batch": [
+                {
+                    "method": "GET",
+                    "resource": "boot",
+                    "query": "job=foo&status=FAIL",
+                    "operation_id": "op-0"
+                },
+                {
+                    "method": "GET",
+                    "resource": "boot",
+                    "query": "status=FAIL&job=foo",
+                    "operation_id": "op-1"
+                }
+            ]
+        }
+        body = json.dumps(batch_dict)
+
+        mocked_run_batch.return_value = [
+            {"operation_id": "op-0", "result": [{"count": 0}]}]
+
+        response = self.fetch(
+            "/batch", method="POST", body=body, headers=headers)
+        results = json.loads(response.body)["result"]
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(1, len(mocked_run_batch.call_args[0][0]))
+        self.assertEqual(
+            ["op-0", "op-1"], [result["operation_id"] for result in results])
+        self.assertEqual(results[0]["result"], results[1]["result"])
@@ -199,6 +199,78 @@ class TestBootHandler(TestHandlerBase):
 
         self.assertEqual(response.code, 202)
 
+    @mock.patch("taskqueue.tasks.boot.import_boots")
+    @mock.patch("utils.db.find_one2")
+    def test_post_bulk_valid(self, find_one, import_boots):
+        self.req_token.token = "foo"
+        find_one.side_effect = [
+            {"name": "lab-name", "token": "id-token"},
+            {
+                "_id": "id-token",
+                "token": "foo", "expired": False, "email": "email@example.net"
+            }
+        ]
+        report = {
+            "version": "1.0",
+            "board": "board",
+            "job": "job",
+            "kernel": "kernel",
+            "defconfig": "defconfig",
+            "lab_name": "lab-name",
+            "arch": "arm"
+        }
+        body = [report, dict(report, board="board1"), {"foo": "bar"}]
+        headers = {"Authorization": "foo", "Content-Type": "application/json"}
+
+        response = self.fetch(
+            "/boot", method="POST", body=json.dumps(body), headers=headers)
+
+        self.assertEqual(response.code, 202)
+        # The lab token is validated only once.
+        self.assertEqual(2, find_one.call_count)
+        self.assertEqual(1, import_boots.apply_async.call_count)
+        self.assertEqual(
+            2, len(import_boots.apply_async.call_args[0][0][0]))
+        self.assertEqual(1, len(json.loads(response.body)["errors"]))
+
+    @mock.patch("taskqueue.tasks.boot.import_boots")
+    @mock.patch("utils.db.find_one2")
+    def test_post_bulk_different_token(self, find_one, import_boots):
+        find_one.side_effect = [
+            {"token": "bar"},
+            {
+                "token": "bar",
+                "expired": False,
+                "email": "email@example.net", "_id": "token-id"
+            }
+        ]
+        body = [
+            {
+                "version": "1.0",
+                "board": "board",
+                "job": "job",
+                "kernel": "kernel",
+                "defconfig": "defconfig",
+                "lab_name": "lab-name",
+                "arch": "arm"
+            }
+        ]
+        headers = {"Authorization": "foo", "Content-Type": "application/json"}
+
+        response = self.fetch(
+            "/boot", method="POST", body=json.dumps(body), headers=headers)
+
+        self.assertEqual(response.code, 403)
+        self.assertFalse(import_boots.apply_async.called)
+
+    def test_post_bulk_empty(self):
+        headers = {"Authorization": "foo", "Content-Type": "application/json"}
+
+        response = self.fetch(
+            "/boot", method="POST", body=json.dumps([]), headers=headers)
+
+        self.assertEqual(response.code, 400)
+
     def test_post_valid_content_expired_req_token(self):
         self.req_token.expired = True
         body = {
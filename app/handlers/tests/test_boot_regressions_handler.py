@@ -0,0 +1,272 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test module for the boot regressions lookup."""
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import bson
+import logging
+import mongomock
+import tornado
+import unittest
+
+import handlers.boot_regressions as hbootregressions
+import urls
+import utils.boot.regressions
+
+from handlers.tests.test_handler_base import TestHandlerBase
+
+
+class TestFindRegressions(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.database = mongomock.Connection()["kernel-ci"]
+
+        self.boot_doc = {
+            "status": "FAIL",
+            "job": "job",
+            "kernel": "kernel",
+            "arch": "arm",
+            "defconfig_full": "defconfig",
+            "compiler_version_ext": "gcc 5.1.1",
+            "lab_name": "lab",
+            "board": "board"
+        }
+        self.boot_id = self.database["boot"].insert(self.boot_doc)
+        self.regr_key = utils.boot.regressions.create_regressions_key(
+            self.boot_doc)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def _index_boot(self, regr_id):
+        self.database["boot_regressions_by_boot_id"].insert(
+            {"boot_id": self.boot_id, "boot_regressions_id": regr_id})
+
+    def test_find_regressions(self):
+        regr_id = self.database["boot_regressions_by_key"].insert(
+            {"regression_key": self.regr_key, "regressions": ["a", "b"]})
+        self._index_boot(regr_id)
+
+        response = hbootregressions.find_regressions(
+            self.boot_id, self.database)
+
+        self.assertEqual(200, response.status_code)
+        self.assertListEqual(["a", "b"], response.result)
+        self.assertEqual(2, response.count)
+
+    def test_find_regressions_nested(self):
+        regr_id = self.database["boot_regressions"].insert(
+            {
+                "regressions": utils.boot.regressions.nest_regressions(
+                    [{"regression_key": self.regr_key, "regressions": ["a"]}])
+            }
+        )
+        self._index_boot(regr_id)
+
+        response = hbootregressions.find_regressions(
+            self.boot_id, self.database)
+
+        self.assertListEqual(["a"], response.result)
+        self.assertEqual(1, response.count)
+
+    def test_find_regressions_not_tracked(self):
+        response = hbootregressions.find_regressions(
+            self.boot_id, self.database)
+
+        self.assertEqual(200, response.status_code)
+        self.assertIsNone(response.result)
+
+    def test_find_regressions_no_boot(self):
+        response = hbootregressions.find_regressions(
+            bson.ObjectId(), self.database)
+
+        self.assertEqual(404, response.status_code)
+
+
+class TestGroupRegressions(unittest.TestCase):
+
+    def setUp(self):
+        self.regr_docs = [
+            {
+                "created_on": 2,
+                "job": "job",
+                "job_id": "job-id",
+                "kernel": "kernel",
+                "regression_key": "lab.arm.board.0.defconfig.gcc",
+                "regressions": ["a", "b"]
+            },
+            {
+                "created_on": 3,
+                "job": "job1",
+                "job_id": "job1-id",
+                "kernel": "kernel",
+                "regression_key": "lab.arm.board.0.defconfig.gcc",
+                "regressions": ["c", "d"]
+            },
+            {
+                "created_on": 1,
+                "job": "job",
+                "job_id": "job-id",
+                "kernel": "kernel",
+                "regression_key": "lab.arm.board1.0.defconfig.gcc",
+                "regressions": ["e", "f"]
+            }
+        ]
+
+    def test_group_regressions(self):
+        expected = [
+            {
+                "created_on": 1,
+                "job": "job",
+                "job_id": "job-id",
+                "kernel": "kernel",
+                "regressions": {
+                    "lab": {
+                        "arm": {
+                            "board": {
+                                "0": {"defconfig": {"gcc": ["a", "b"]}}
+                            },
+                            "board1": {
+                                "0": {"defconfig": {"gcc": ["e", "f"]}}
+                            }
+                        }
+                    }
+                }
+            },
+            {
+                "created_on": 3,
+                "job": "job1",
+                "job_id": "job1-id",
+                "kernel": "kernel",
+                "regressions": {
+                    "lab": {
+                        "arm": {
+                            "board": {
+                                "0": {"defconfig": {"gcc": ["c", "d"]}}
+                            }
+                        }
+                    }
+                }
+            }
+        ]
+
+        self.assertListEqual(
+            expected, hbootregressions.group_regressions(self.regr_docs))
+
+    def test_group_regressions_empty(self):
+        self.assertListEqual([], hbootregressions.group_regressions([]))
+
+    def test_filter_fields_list(self):
+        doc = hbootregressions.group_regressions(self.regr_docs)[0]
+
+        self.assertDictEqual(
+            {"job": "job", "kernel": "kernel"},
+            hbootregressions.filter_fields(doc, ["job", "kernel"]))
+
+    def test_filter_fields_dict(self):
+        doc = hbootregressions.group_regressions(self.regr_docs)[0]
+
+        self.assertDictEqual(
+            {"created_on": 1, "job": "job", "job_id": "job-id"},
+            hbootregressions.filter_fields(
+                doc, {"kernel": False, "regressions": False}))
+
+
+class TestBootRegressionsHandler(TestHandlerBase):
+
+    def get_app(self):
+        return tornado.web.Application(
+            [urls._BOOT_REGRESSIONS_URL], **self.settings)
+
+    def setUp(self):
+        super(TestBootRegressionsHandler, self).setUp()
+
+        for board, created_on in [("board", 2), ("board1", 1)]:
+            self.database["boot_regressions_by_key"].insert({
+                "board": board,
+                "created_on": created_on,
+                "job": "job",
+                "kernel": "kernel",
+                "regression_key":
+                    "lab.arm.{:s}.0.defconfig.gcc".format(board),
+                "regressions": [board]
+            })
+        self.database["boot_regressions_by_key"].insert({
+            "board": "board",
+            "created_on": 3,
+            "job": "job1",
+            "kernel": "kernel",
+            "regression_key": "lab.arm.board.0.defconfig.gcc",
+            "regressions": ["board"]
+        })
+
+    def test_get_nested(self):
+        headers = {"Authorization": "foo"}
+        response = self.fetch(
+            "/boot/regressions?job=job&field=job&field=regressions",
+            headers=headers)
+
+        self.assertEqual(response.code, 200)
+        self.assertDictEqual(
+            {
+                "code": 200,
+                "count": 1,
+                "limit": 0,
+                "skip": 0,
+                "result": [
+                    {
+                        "job": "job",
+                        "regressions": {
+                            "lab": {
+                                "arm": {
+                                    "board": {
+                                        "0": {
+                                            "defconfig": {"gcc": ["board"]}
+                                        }
+                                    },
+                                    "board1": {
+                                        "0": {
+                                            "defconfig": {"gcc": ["board1"]}
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                ]
+            },
+            json.loads(response.body))
+
+    def test_get_limit(self):
+        headers = {"Authorization": "foo"}
+        response = self.fetch(
+            "/boot/regressions?board=board&limit=1&skip=1&field=job"
+            "&sort=created_on&sort_order=1",
+            headers=headers)
+
+        self.assertEqual(response.code, 200)
+        self.assertDictEqual(
+            {
+                "code": 200,
+                "count": 2,
+                "limit": 1,
+                "skip": 1,
+                "result": [{"job": "job1"}]
+            },
+            json.loads(response.body))
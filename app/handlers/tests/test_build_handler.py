@@ -66,6 +66,44 @@ class TestBuildHandler(TestHandlerBase):
             response.headers["Content-Type"], self.content_type)
         self.assertDictEqual(json.loads(response.body), expected_body)
 
+    @mock.patch("utils.db.explain")
+    def test_get_explain(self, mock_explain):
+        self.req_token.is_admin = True
+        mock_explain.return_value = {"index": "job", "docs_examined": 3}
+
+        headers = {"Authorization": "foo"}
+        response = self.fetch(
+            "/build?explain=true&job=foo&limit=10&sort=created_on",
+            headers=headers)
+
+        self.assertEqual(response.code, 200)
+        self.assertDictEqual(
+            {"index": "job", "docs_examined": 3},
+            json.loads(response.body)["result"][0])
+        mock_explain.assert_called_once_with(
+            mock.ANY,
+            spec={"job": "foo"},
+            fields=None, sort=[("created_on", -1)], skip=0, limit=10)
+
+    @mock.patch("utils.db.explain")
+    def test_get_explain_not_admin(self, mock_explain):
+        headers = {"Authorization": "foo"}
+        response = self.fetch("/build?explain=true", headers=headers)
+
+        self.assertEqual(response.code, 403)
+        self.assertFalse(mock_explain.called)
+
+    @mock.patch("utils.db.explain")
+    def test_get_explain_aggregate(self, mock_explain):
+        self.req_token.is_admin = True
+
+        headers = {"Authorization": "foo"}
+        response = self.fetch(
+            "/build?explain=true&aggregate=kernel", headers=headers)
+
+        self.assertEqual(response.code, 400)
+        self.assertFalse(mock_explain.called)
+
     def test_get_old_defconfig_url(self):
         headers = {"Authorization": "foo"}
         response = self.fetch("/defconfig", headers=headers)
@@ -0,0 +1,210 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test module for the indexes migrations."""
+
+import bson.tz_util
+import datetime
+import logging
+import mock
+import mongomock
+import unittest
+
+import handlers.dbindexes as hdbindexes
+import models
+
+
+class TestDbIndexes(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.database = mongomock.Connection()["kernel-ci"]
+
+        self.migration_1 = mock.Mock()
+        self.migration_2 = mock.Mock()
+        patched_migrations = mock.patch(
+            "handlers.dbindexes.MIGRATIONS",
+            [(1, self.migration_1), (2, self.migration_2)])
+        patched_migrations.start()
+        self.addCleanup(patched_migrations.stop)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_get_indexes_version_empty(self):
+        self.assertEqual(0, hdbindexes.get_indexes_version(self.database))
+
+    def test_migrate_indexes(self):
+        applied = hdbindexes.migrate_indexes(self.database, target_version=2)
+
+        self.assertListEqual([1, 2], applied)
+        self.migration_1.assert_called_once_with(self.database)
+        self.migration_2.assert_called_once_with(self.database)
+        self.assertEqual(2, hdbindexes.get_indexes_version(self.database))
+        self.assertEqual(1, self.database[models.SCHEMA_COLLECTION].count())
+
+    def test_migrate_indexes_partial(self):
+        hdbindexes.migrate_indexes(self.database, target_version=1)
+        self.assertFalse(self.migration_2.called)
+        self.assertEqual(1, hdbindexes.get_indexes_version(self.database))
+
+        applied = hdbindexes.migrate_indexes(self.database, target_version=2)
+
+        self.assertListEqual([2], applied)
+        self.assertEqual(1, self.migration_1.call_count)
+
+    def test_migrate_indexes_up_to_date(self):
+        hdbindexes.migrate_indexes(self.database, target_version=2)
+
+        applied = hdbindexes.migrate_indexes(self.database, target_version=2)
+
+        self.assertListEqual([], applied)
+        self.assertEqual(1, self.migration_2.call_count)
+
+    def test_migrate_indexes_failure(self):
+        self.migration_2.side_effect = ValueError
+
+        self.assertRaises(
+            ValueError,
+            hdbindexes.migrate_indexes, self.database, target_version=2)
+        self.assertEqual(1, hdbindexes.get_indexes_version(self.database))
+
+    def _get_schema_doc(self):
+        return self.database[models.SCHEMA_COLLECTION].find_one(
+            {"_id": hdbindexes.INDEXES_VERSION_ID})
+
+    def test_migrate_indexes_lease_released(self):
+        hdbindexes.migrate_indexes(self.database, target_version=2)
+
+        schema_doc = self._get_schema_doc()
+        self.assertIsNone(schema_doc["migrating_on"])
+        self.assertEqual(bson.tz_util.utc, schema_doc["updated_on"].tzinfo)
+
+    def test_migrate_indexes_failure_lease_released(self):
+        self.migration_2.side_effect = ValueError
+
+        self.assertRaises(
+            ValueError,
+            hdbindexes.migrate_indexes, self.database, target_version=2)
+        self.assertIsNone(self._get_schema_doc()["migrating_on"])
+
+    def test_migrate_indexes_lease_held(self):
+        self.database[models.SCHEMA_COLLECTION].insert({
+            "_id": hdbindexes.INDEXES_VERSION_ID,
+            "version": 0,
+            "migrating_on": datetime.datetime.now(tz=bson.tz_util.utc)
+        })
+
+        applied = hdbindexes.migrate_indexes(self.database, target_version=2)
+
+        self.assertListEqual([], applied)
+        self.assertFalse(self.migration_1.called)
+        self.assertIsNotNone(self._get_schema_doc()["migrating_on"])
+
+    def test_migrate_indexes_lease_expired(self):
+        self.database[models.SCHEMA_COLLECTION].insert({
+            "_id": hdbindexes.INDEXES_VERSION_ID,
+            "version": 1,
+            "migrating_on": (
+                datetime.datetime.now(tz=bson.tz_util.utc) -
+                hdbindexes.MIGRATION_LEASE_TIME -
+                datetime.timedelta(minutes=1))
+        })
+
+        applied = hdbindexes.migrate_indexes(self.database, target_version=2)
+
+        self.assertListEqual([2], applied)
+        self.assertFalse(self.migration_1.called)
+
+    def test_migrate_indexes_no_lease(self):
+        self.database[models.SCHEMA_COLLECTION].insert(
+            {"_id": hdbindexes.INDEXES_VERSION_ID, "version": 1})
+
+        applied = hdbindexes.migrate_indexes(self.database, target_version=2)
+
+        self.assertListEqual([2], applied)
+
+    @mock.patch("threading.Thread")
+    def test_check_indexes_up_to_date(self, mock_thread):
+        hdbindexes.migrate_indexes(self.database)
+
+        version = hdbindexes.check_indexes(self.database)
+
+        self.assertEqual(hdbindexes.INDEXES_VERSION, version)
+        self.assertFalse(mock_thread.called)
+
+    @mock.patch("handlers.dbindexes.ensure_unique_indexes")
+    @mock.patch("threading.Thread")
+    def test_check_indexes_migrate(self, mock_thread, mock_unique):
+        version = hdbindexes.check_indexes(self.database)
+
+        self.assertEqual(0, version)
+        mock_unique.assert_called_once_with(self.database)
+        mock_thread.return_value.start.assert_called_once_with()
+
+    @mock.patch("handlers.dbindexes.find_missing_unique_indexes")
+    @mock.patch("handlers.dbindexes.ensure_unique_indexes")
+    @mock.patch("threading.Thread")
+    def test_check_indexes_no_migrate(
+            self, mock_thread, mock_unique, mock_missing):
+        mock_missing.return_value = []
+
+        hdbindexes.check_indexes(self.database, migrate=False)
+
+        self.assertFalse(mock_thread.called)
+        self.assertFalse(mock_unique.called)
+        self.assertFalse(self.migration_1.called)
+        mock_missing.assert_called_once_with(self.database)
+
+    def test_ensure_unique_indexes(self):
+        database = mock.MagicMock()
+
+        hdbindexes.ensure_unique_indexes(database)
+
+        calls = database.__getitem__.return_value.ensure_index.call_args_list
+        self.assertEqual(len(hdbindexes.UNIQUE_INDEXES), len(calls))
+        self.assertTrue(all([c[1].get("unique") for c in calls]))
+
+    def test_find_missing_unique_indexes(self):
+        existing = {
+            models.BUILD_DELTA_COLLECTION: {
+                "_id_": {"key": [("_id", 1)]},
+                "request_hash_1": {
+                    "key": [(models.REQUEST_HASH_KEY, 1.0)], "unique": True}
+            },
+            models.JOB_DELTA_COLLECTION: {
+                "request_hash_1": {"key": [(models.REQUEST_HASH_KEY, 1)]}
+            }
+        }
+        database = mock.MagicMock()
+        database.__getitem__.side_effect = lambda name: mock.Mock(
+            index_information=mock.Mock(return_value=existing.get(name, {})))
+
+        missing = hdbindexes.find_missing_unique_indexes(database)
+
+        self.assertListEqual(
+            [
+                models.BOOT_DELTA_COLLECTION,
+                models.JOB_DELTA_COLLECTION,
+                models.BOOT_REGRESSIONS_BY_KEY_COLLECTION
+            ],
+            [collection_name for collection_name, _ in missing])
+
+    def test_ensure_indexes_background(self):
+        database = mock.MagicMock()
+
+        hdbindexes.ensure_indexes(database)
+
+        calls = database.__getitem__.return_value.ensure_index.call_args_list
+        self.assertTrue(calls)
+        self.assertTrue(all([c[1].get("background") for c in calls]))
@@ -29,8 +29,10 @@ from tornado.testing import (
 import handlers.app
 import models.token as mtoken
 
+from tests.helpers import QueryBudgetMixin
 
-class TestHandlerBase(AsyncHTTPTestCase, LogTrapTestCase):
+
+class TestHandlerBase(AsyncHTTPTestCase, LogTrapTestCase, QueryBudgetMixin):
 
     def setUp(self):
         # Default Content-Type header returned by Tornado.
@@ -60,7 +62,8 @@ class TestHandlerBase(AsyncHTTPTestCase, LogTrapTestCase):
             "debug": False,
             "version": "foo",
             "master_key": "bar",
-            "senddelay": 60 * 60
+            "senddelay": 60 * 60,
+            "storage_url": None
         }
 
         super(TestHandlerBase, self).setUp()
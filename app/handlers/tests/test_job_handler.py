@@ -22,6 +22,7 @@ import mock
 import tornado
 
 import urls
+import utils.compare.common
 
 from handlers.tests.test_handler_base import TestHandlerBase
 
@@ -610,3 +611,101 @@ class TestJobCompareHandler(TestHandlerBase):
         self.assertEqual(response.headers["Location"], "/job/compare/doc_id/")
         self.assertEqual(
             response.headers["Content-Type"], self.content_type)
+
+    @mock.patch("taskqueue.tasks.compare.calculate_job_delta")
+    def test_post_saved(self, mock_calculate):
+        body = {
+            "job": "job",
+            "kernel": "kernel",
+            "compare_to": [
+                {
+                    "job": "job",
+                    "kernel": "kernel1"
+                }
+            ]
+        }
+        self.database["job_delta"].insert(
+            {
+                "_id": "doc_id",
+                "request_hash": utils.compare.common.get_request_hash(body),
+                "data": [{"baseline": {}}]
+            }
+        )
+
+        headers = {"Authorization": "foo", "Content-Type": "application/json"}
+        response = self.fetch(
+            "/job/compare/",
+            method="POST", body=json.dumps(body), headers=headers)
+
+        self.assertFalse(mock_calculate.apply_async.called)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers["Location"], "/job/compare/doc_id/")
+        self.assertDictEqual(
+            {"baseline": {}, "_id": "doc_id"},
+            json.loads(response.body)["result"][0])
+
+    @mock.patch("taskqueue.tasks.compare.calculate_job_delta")
+    def test_post_async(self, mock_calculate):
+        body = {
+            "job": "job",
+            "kernel": "kernel",
+            "compare_to": [
+                {
+                    "job": "job",
+                    "kernel": "kernel1"
+                }
+            ]
+        }
+
+        headers = {"Authorization": "foo", "Content-Type": "application/json"}
+        response = self.fetch(
+            "/job/compare/?async=true",
+            method="POST", body=json.dumps(body), headers=headers)
+
+        self.assertEqual(response.code, 202)
+        self.assertFalse(mock_calculate.apply_async.return_value.get.called)
+
+        pending_id = mock_calculate.apply_async.call_args[1]["kwargs"][
+            "pending_id"]
+        self.assertEqual(
+            "/job/compare/%s/" % pending_id, response.headers["Location"])
+        self.assertEqual(
+            "PENDING", json.loads(response.body)["result"][0]["status"])
+
+        response = self.fetch(
+            response.headers["Location"], method="GET", headers=headers)
+        self.assertEqual(response.code, 202)
+
+    def test_get_async_complete(self):
+        delta_id = self.database["job_delta"].insert(
+            {"data": [{"baseline": {}}]})
+        pending_id = self.database["job_delta"].insert(
+            {"status": "COMPLETE", "status_code": 201, "delta_id": delta_id})
+
+        headers = {"Authorization": "foo"}
+        response = self.fetch(
+            "/job/compare/%s/" % pending_id, method="GET", headers=headers)
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(
+            "/job/compare/%s/" % delta_id, response.headers["Location"])
+        self.assertEqual(
+            {"baseline": {}, "_id": {"$oid": str(delta_id)}},
+            json.loads(response.body)["result"][0])
+
+    def test_get_async_error(self):
+        pending_id = self.database["job_delta"].insert(
+            {
+                "status": "COMPLETE",
+                "status_code": 404,
+                "delta_id": None, "errors": ["No job found"]
+            }
+        )
+
+        headers = {"Authorization": "foo"}
+        response = self.fetch(
+            "/job/compare/%s/" % pending_id, method="GET", headers=headers)
+
+        self.assertEqual(response.code, 404)
+        self.assertEqual(
+            ["No job found"], json.loads(response.body)["errors"])
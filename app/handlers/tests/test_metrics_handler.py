@@ -0,0 +1,139 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test module for the MetricsHandler and the requests instrumentation."""
+
+import bson
+import json
+import mock
+import tornado
+
+import models
+import urls
+import utils.metrics
+
+from handlers.tests.test_handler_base import TestHandlerBase
+
+
+class TestMetricsHandler(TestHandlerBase):
+
+    def setUp(self):
+        super(TestMetricsHandler, self).setUp()
+        self.redisdb.flushall()
+        self.headers = {"Authorization": "foo"}
+
+        patched_pool = mock.patch("handlers.base.METRICS_POOL")
+        self.metrics_pool = patched_pool.start()
+        self.addCleanup(patched_pool.stop)
+
+    def get_app(self):
+        return tornado.web.Application(
+            [urls._METRICS_URL, urls._JOB_URL, urls._JOB_ID_URL],
+            **self.settings)
+
+    def test_get_no_token(self):
+        response = self.fetch("/metrics", method="GET")
+        self.assertEqual(response.code, 403)
+
+    def test_get_wrong_token(self):
+        self.validate_token.return_value = (False, None)
+
+        response = self.fetch("/metrics", method="GET", headers=self.headers)
+        self.assertEqual(response.code, 403)
+
+    def test_get(self):
+        utils.metrics.observe_many(
+            self.redisdb, {"http-job-db": 0.01}, counters=["http-job-200"])
+
+        response = self.fetch("/metrics", method="GET", headers=self.headers)
+        result = json.loads(response.body)["result"][0]
+
+        self.assertEqual(response.code, 200)
+        self.assertDictEqual({"http-job-200": 1}, result["counters"])
+        self.assertEqual(1, result["histograms"]["http-job-db"]["count"])
+        self.assertDictEqual({}, result["caches"])
+
+    def test_get_caches(self):
+        utils.metrics.add_to_counters(
+            self.redisdb,
+            {"cache-object-ids-hits": 3, "cache-object-ids-misses": 1})
+
+        response = self.fetch("/metrics", method="GET", headers=self.headers)
+        result = json.loads(response.body)["result"][0]
+
+        self.assertDictEqual(
+            {"object-ids": {"hits": 3, "misses": 1, "hit_rate": 0.75}},
+            result["caches"])
+
+    def test_post(self):
+        response = self.fetch(
+            "/metrics", method="POST", body="", headers=self.headers)
+        self.assertEqual(response.code, 501)
+
+    def test_no_server_timing(self):
+        response = self.fetch("/job", method="GET", headers=self.headers)
+
+        self.assertEqual(response.code, 200)
+        self.assertNotIn("Server-Timing", response.headers)
+        self.assertFalse(self.metrics_pool.submit.called)
+
+    def test_server_timing(self):
+        self._app.settings["server_timing"] = True
+
+        response = self.fetch(
+            "/job?job=foo", method="GET", headers=self.headers)
+        server_timing = response.headers["Server-Timing"]
+
+        self.assertEqual(response.code, 200)
+        self.assertIn("queue;dur=", server_timing)
+        self.assertIn("query;dur=", server_timing)
+        self.assertIn("serialize;dur=", server_timing)
+        self.assertIn("total;dur=", server_timing)
+
+    def test_metrics_recorded(self):
+        self._app.settings["metrics"] = True
+
+        response = self.fetch("/job", method="GET", headers=self.headers)
+
+        self.assertEqual(response.code, 200)
+        self.metrics_pool.submit.assert_called_once_with(
+            utils.metrics.observe_many,
+            self.redisdb, mock.ANY, counters=["http-job-200"])
+
+        values = self.metrics_pool.submit.call_args[0][2]
+        self.assertIn("http-job-queue", values)
+        self.assertIn("http-job-serialize", values)
+        self.assertIn("http-job-total", values)
+
+    def test_metrics_recorded_route(self):
+        self._app.settings["metrics"] = True
+
+        response = self.fetch(
+            "/job/%s" % bson.ObjectId(), method="GET", headers=self.headers)
+
+        self.assertEqual(response.code, 404)
+        self.metrics_pool.submit.assert_called_once_with(
+            utils.metrics.observe_many,
+            self.redisdb, mock.ANY, counters=["http-job-id-404"])
+
+    def test_get_queries(self):
+        job_id = self.database[models.JOB_COLLECTION].insert(
+            {models.JOB_KEY: "job"})
+
+        with self.assertMaxQueries(1, collection=models.JOB_COLLECTION):
+            response = self.fetch(
+                "/job/%s" % job_id, method="GET", headers=self.headers)
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(
+            "job", json.loads(response.body)["result"][0][models.JOB_KEY])
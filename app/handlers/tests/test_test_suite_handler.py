@@ -21,12 +21,17 @@ import mock
 import tornado
 
 import urls
+import utils.tests_import
 
 from handlers.tests.test_handler_base import TestHandlerBase
 
 
 class TestTestSuiteHandler(TestHandlerBase):
 
+    def setUp(self):
+        super(TestTestSuiteHandler, self).setUp()
+        utils.tests_import.REF_CACHE.clear()
+
     def get_app(self):
         return tornado.web.Application([urls._TEST_SUITE_URL], **self.settings)
 
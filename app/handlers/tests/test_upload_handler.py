@@ -13,6 +13,8 @@
 
 """Test module for the UploadHandler."""
 
+import json
+import mock
 import tornado
 
 import urls
@@ -81,3 +83,84 @@ class TestUploadHandler(TestHandlerBase):
         self.assertEqual(response.code, 415)
         self.assertEqual(
             response.headers["Content-Type"], self.content_type)
+
+    @mock.patch("utils.upload.create_or_update_file")
+    @mock.patch("utils.upload.check_or_create_upload_dir")
+    def test_put_buffered(self, mock_check, mock_create):
+        mock_check.return_value = (200, None)
+        mock_create.return_value = {
+            "status": 201, "error": None, "bytes": 3, "filename": "file"}
+        headers = {"Authorization": "foo"}
+
+        response = self.fetch(
+            "/upload/path/to/file", method="PUT", body="foo", headers=headers)
+
+        self.assertEqual(response.code, 201)
+        mock_create.assert_called_once_with(
+            "path/to", "file", None, "foo", dedup=False)
+
+    @mock.patch("utils.upload.link_object_file")
+    @mock.patch("utils.upload.check_or_create_upload_dir")
+    def test_put_digest(self, mock_check, mock_link):
+        digest = "a" * 64
+        mock_check.return_value = (200, None)
+        mock_link.return_value = {
+            "status": 404,
+            "error": "No content found", "bytes": 0, "filename": "file"
+        }
+        headers = {"Authorization": "foo"}
+
+        response = self.fetch(
+            "/upload/path/to/file?digest=" + digest,
+            method="PUT", body="", headers=headers)
+
+        self.assertEqual(response.code, 404)
+        mock_link.assert_called_once_with(digest, "path/to", "file")
+
+    @mock.patch("utils.upload.check_or_create_upload_dir")
+    def test_put_wrong_digest(self, mock_check):
+        mock_check.return_value = (200, None)
+        headers = {"Authorization": "foo"}
+
+        response = self.fetch(
+            "/upload/path/to/file?digest=foo",
+            method="PUT", body="", headers=headers)
+
+        self.assertEqual(response.code, 400)
+
+    @mock.patch("utils.upload.create_or_update_file")
+    @mock.patch("utils.upload.check_or_create_upload_dir")
+    def test_post_multiple_files(self, mock_check, mock_create):
+        mock_check.return_value = (200, None)
+        mock_create.side_effect = lambda path, filename, *args, **kwargs: {
+            "status": 201, "error": None, "bytes": 3, "filename": filename}
+
+        boundary = "----boundary"
+        parts = ["--%s\r\n"
+                 "Content-Disposition: form-data; name=\"path\"\r\n\r\n"
+                 "path/to\r\n" % boundary]
+        for idx, filename in enumerate(["file0", "sub/file1", "sub/file2"]):
+            parts.append(
+                "--%s\r\n"
+                "Content-Disposition: form-data; name=\"file%d\"; "
+                "filename=\"%s\"\r\n"
+                "Content-Type: application/octet-stream\r\n\r\n"
+                "foo\r\n" % (boundary, idx, filename))
+        parts.append("--%s--\r\n" % boundary)
+
+        headers = {
+            "Authorization": "foo",
+            "Content-Type": "multipart/form-data; boundary=%s" % boundary
+        }
+        response = self.fetch(
+            "/upload", method="POST", body="".join(parts), headers=headers)
+
+        self.assertEqual(response.code, 200)
+        result = json.loads(response.body)["result"]
+        self.assertEqual(
+            ["file0", "sub/file1", "sub/file2"],
+            sorted(r["filename"] for r in result))
+        self.assertTrue(all("time" in r for r in result))
+        self.assertEqual(3, mock_create.call_count)
+        # The request path, and then the "sub" directory only once.
+        self.assertEqual(2, mock_check.call_count)
@@ -0,0 +1,232 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test module for the UploadSessionHandler."""
+
+import bson
+import json
+import mock
+import tornado
+
+import models
+import urls
+
+from handlers.tests.test_handler_base import TestHandlerBase
+
+
+class TestUploadSessionHandler(TestHandlerBase):
+
+    def setUp(self):
+        super(TestUploadSessionHandler, self).setUp()
+        self.session_id = bson.ObjectId()
+        self.database[models.UPLOAD_COLLECTION].insert({
+            models.ID_KEY: self.session_id,
+            models.PATH_KEY: "path/to/file",
+            models.SIZE_KEY: 10,
+            models.CHUNKS_KEY: [[0, 4]]
+        })
+        self.url = "/upload/session/%s" % self.session_id
+        self.headers = {"Authorization": "foo"}
+
+    def get_app(self):
+        return tornado.web.Application(
+            [
+                urls._UPLOAD_SESSION_ID_URL,
+                urls._UPLOAD_SESSION_URL, urls._UPLOAD_URL
+            ],
+            **self.settings
+        )
+
+    def _get_session(self):
+        return self.database[models.UPLOAD_COLLECTION].find_one(
+            {models.ID_KEY: self.session_id})
+
+    def test_get_no_token(self):
+        response = self.fetch(self.url, method="GET")
+        self.assertEqual(response.code, 403)
+
+    def test_get(self):
+        response = self.fetch(self.url, method="GET", headers=self.headers)
+        result = json.loads(response.body)["result"][0]
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual([[0, 4]], result["received"])
+        self.assertEqual([[4, 10]], result["missing"])
+
+    def test_get_not_session_url(self):
+        # Handled as a generic upload path.
+        response = self.fetch(
+            "/upload/sessions/%s" % self.session_id,
+            method="GET", headers=self.headers)
+        self.assertEqual(response.code, 501)
+
+        response = self.fetch(
+            "/upload/session/path/to/file",
+            method="GET", headers=self.headers)
+        self.assertEqual(response.code, 501)
+
+    def test_get_list_not_admin(self):
+        response = self.fetch(
+            "/upload/session", method="GET", headers=self.headers)
+        self.assertEqual(response.code, 403)
+
+    def test_get_list_admin(self):
+        self.req_token.is_admin = True
+
+        response = self.fetch(
+            "/upload/session", method="GET", headers=self.headers)
+
+        self.assertEqual(response.code, 200)
+        self.assertEqual(1, json.loads(response.body)["count"])
+
+    def test_get_not_found(self):
+        response = self.fetch(
+            "/upload/session/%s" % bson.ObjectId(),
+            method="GET", headers=self.headers)
+        self.assertEqual(response.code, 404)
+
+    @mock.patch("utils.upload.remove_stale_part_files")
+    @mock.patch("utils.upload.create_part_file")
+    def test_post_create(self, mock_create, mock_remove):
+        body = json.dumps({"path": "/path/to/other", "size": 1024})
+        self.headers["Content-Type"] = "application/json"
+
+        response = self.fetch(
+            "/upload/session", method="POST", body=body,
+            headers=self.headers)
+
+        self.assertEqual(response.code, 201)
+        session_id = json.loads(response.body)["result"][0]["_id"]["$oid"]
+        self.assertEqual(
+            "/upload/session/%s" % session_id, response.headers["Location"])
+        mock_create.assert_called_once_with(session_id, 1024)
+
+        session = self.database[models.UPLOAD_COLLECTION].find_one(
+            {models.ID_KEY: bson.ObjectId(session_id)})
+        self.assertEqual("path/to/other", session[models.PATH_KEY])
+        self.assertEqual([], session[models.CHUNKS_KEY])
+
+    @mock.patch("utils.upload.create_part_file")
+    def test_post_create_wrong_path(self, mock_create):
+        self.headers["Content-Type"] = "application/json"
+
+        for path in [
+                "../etc/file", "path/../../file", "path/..", ".objects/ab",
+                ".upload-tmp/file.part", "/"]:
+            response = self.fetch(
+                "/upload/session", method="POST",
+                body=json.dumps({"path": path, "size": 1024}),
+                headers=self.headers)
+
+            self.assertEqual(response.code, 400)
+
+        self.assertFalse(mock_create.called)
+        self.assertEqual(1, self.database[models.UPLOAD_COLLECTION].count())
+
+    def test_post_create_wrong_size(self):
+        body = json.dumps({"path": "path/to/other", "size": "foo"})
+        self.headers["Content-Type"] = "application/json"
+
+        response = self.fetch(
+            "/upload/session", method="POST", body=body,
+            headers=self.headers)
+
+        self.assertEqual(response.code, 400)
+
+    @mock.patch("utils.upload.write_chunk")
+    def test_put_chunk(self, mock_write):
+        mock_write.return_value = 6
+        self.headers["Content-Range"] = "bytes 4-9/10"
+
+        response = self.fetch(
+            self.url, method="PUT", body="abcdef", headers=self.headers)
+
+        self.assertEqual(response.code, 200)
+        mock_write.assert_called_once_with(str(self.session_id), 4, "abcdef")
+        self.assertEqual(
+            [[0, 4], [4, 10]], self._get_session()[models.CHUNKS_KEY])
+
+    def test_put_chunk_no_range(self):
+        response = self.fetch(
+            self.url, method="PUT", body="abcdef", headers=self.headers)
+        self.assertEqual(response.code, 400)
+
+    def test_put_chunk_wrong_range(self):
+        self.headers["Content-Range"] = "bytes 4-11/12"
+
+        response = self.fetch(
+            self.url, method="PUT", body="abcdefgh", headers=self.headers)
+        self.assertEqual(response.code, 416)
+
+    def test_put_chunk_wrong_size(self):
+        self.headers["Content-Range"] = "bytes 4-9/10"
+
+        response = self.fetch(
+            self.url, method="PUT", body="abc", headers=self.headers)
+        self.assertEqual(response.code, 400)
+
+    def test_post_finalize_incomplete(self):
+        body = json.dumps({"digest": "a" * 64})
+        self.headers["Content-Type"] = "application/json"
+
+        response = self.fetch(
+            self.url, method="POST", body=body, headers=self.headers)
+
+        self.assertEqual(response.code, 409)
+        self.assertEqual(
+            [[4, 10]], json.loads(response.body)["result"][0]["missing"])
+
+    @mock.patch("utils.upload.get_file_digest")
+    def test_post_finalize_wrong_digest(self, mock_digest):
+        mock_digest.return_value = "b" * 64
+        self.database[models.UPLOAD_COLLECTION].update(
+            {models.ID_KEY: self.session_id},
+            {"$push": {models.CHUNKS_KEY: [4, 10]}})
+        body = json.dumps({"digest": "a" * 64})
+        self.headers["Content-Type"] = "application/json"
+
+        response = self.fetch(
+            self.url, method="POST", body=body, headers=self.headers)
+
+        self.assertEqual(response.code, 400)
+        self.assertIsNotNone(self._get_session())
+
+    @mock.patch("utils.upload.move_temp_file")
+    @mock.patch("utils.upload.check_or_create_upload_dir")
+    @mock.patch("utils.upload.get_file_digest")
+    def test_post_finalize(self, mock_digest, mock_check, mock_move):
+        mock_digest.return_value = "a" * 64
+        mock_check.return_value = (200, None)
+        mock_move.return_value = {
+            "status": 201, "error": None, "bytes": 10, "filename": "file"}
+        self.database[models.UPLOAD_COLLECTION].update(
+            {models.ID_KEY: self.session_id},
+            {"$push": {models.CHUNKS_KEY: [2, 10]}})
+        body = json.dumps({"digest": "a" * 64})
+        self.headers["Content-Type"] = "application/json"
+
+        response = self.fetch(
+            self.url, method="POST", body=body, headers=self.headers)
+
+        self.assertEqual(response.code, 201)
+        mock_move.assert_called_once_with(
+            mock.ANY, "path/to", "file", digest=None)
+        self.assertIsNone(self._get_session())
+
+    @mock.patch("utils.upload.remove_part_file")
+    def test_delete(self, mock_remove):
+        response = self.fetch(self.url, method="DELETE", headers=self.headers)
+
+        self.assertEqual(response.code, 200)
+        mock_remove.assert_called_once_with(str(self.session_id))
+        self.assertIsNone(self._get_session())
@@ -13,7 +13,9 @@
 
 """The RequestHandler for /upload URLs."""
 
+import concurrent.futures
 import os
+import time
 import tornado.web
 import urlparse
 
@@ -23,6 +25,14 @@ import handlers.response as hresponse
 import models
 import utils.upload
 
+# How many files of a multi-file POST request are written at the same time.
+MAX_WRITE_WORKERS = 8
+
+# The pool where the files are written: it is separated from the handlers
+# executor since the writes are submitted from there.
+WRITE_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=MAX_WRITE_WORKERS)
+
 
 class UploadHandler(hbase.BaseHandler):
     """Handler the /upload URLs."""
@@ -30,6 +40,11 @@ class UploadHandler(hbase.BaseHandler):
     def __init__(self, application, request, **kwargs):
         super(UploadHandler, self).__init__(application, request, **kwargs)
 
+    @property
+    def dedup(self):
+        """If the uploaded files are stored by their digest."""
+        return self.settings.get("upload_dedup", False)
+
     @property
     def collection(self):
         return self.db[models.UPLOAD_COLLECTION]
@@ -163,8 +178,7 @@ class UploadHandler(hbase.BaseHandler):
                 if ret_val == 200:
                     prev_file = utils.upload.file_exists(path)
 
-                    ret_dict = utils.upload.create_or_update_file(
-                        dir_path, filename, None, self.request.body)
+                    ret_dict = self._save_file(dir_path, filename)
 
                     if ret_dict["status"] == 200 or ret_dict["status"] == 201:
                         if prev_file:
@@ -179,7 +193,8 @@ class UploadHandler(hbase.BaseHandler):
                                 response.headers = {"Location": location}
                     else:
                         response.status_code = ret_dict["status"]
-                        response.reason = "Unable to save file"
+                        response.reason = \
+                            ret_dict["error"] or "Unable to save file"
 
                     response.result = [ret_dict]
                 else:
@@ -195,6 +210,36 @@ class UploadHandler(hbase.BaseHandler):
 
         return response
 
+    def _save_file(self, path, filename):
+        """Save the PUT request body.
+
+        If the request has no body but the `digest` argument, the file is
+        linked to the already stored content with that digest.
+
+        :param path: The directory path where to save the file.
+        :type path: str
+        :param filename: The name of the file.
+        :type filename: str
+        :return dict The result of the save operation.
+        """
+        digest = self.get_argument("digest", None)
+
+        if all([digest, not self.request.body]):
+            if utils.upload.is_valid_digest(digest):
+                ret_dict = utils.upload.link_object_file(
+                    digest, path, filename)
+            else:
+                ret_dict = {
+                    "status": 400,
+                    "error": "Wrong digest value",
+                    "bytes": 0, "filename": filename
+                }
+        else:
+            ret_dict = utils.upload.create_or_update_file(
+                path, filename, None, self.request.body, dedup=self.dedup)
+
+        return ret_dict
+
     def _create_storage_url(self, path):
         """Create the new storage location for the uploaded file.
 
@@ -219,6 +264,10 @@ class UploadHandler(hbase.BaseHandler):
     def _save_files(self, path):
         """Parse the request and for each file, save it.
 
+        The destination directories are created once, then the files are
+        written in parallel. The result of each file reports the time, in
+        seconds, it took to write it.
+
         :param path: The directory path where to save the files.
         :type str
         :return A `HandlerResponse` object.
@@ -226,15 +275,36 @@ class UploadHandler(hbase.BaseHandler):
         response = hresponse.HandlerResponse()
 
         if self.request.files:
-            response.result = [
-                utils.upload.create_or_update_file(
-                    path,
-                    u_file[0]["filename"],
-                    u_file[0]["content_type"],
-                    u_file[0]["body"]
-                )
-                for u_file in self.request.files.itervalues()
-            ]
+            u_files = [u_file[0] for u_file in self.request.files.itervalues()]
+            dirs_status = utils.upload.create_file_dirs(
+                path, [u_file["filename"] for u_file in u_files])
+
+            def _save(u_file):
+                start = time.time()
+                filename = u_file["filename"]
+                file_dir = utils.upload.get_file_dir(path, filename)
+
+                if dirs_status[file_dir] == 200:
+                    ret_dict = utils.upload.create_or_update_file(
+                        path,
+                        filename,
+                        u_file["content_type"],
+                        u_file["body"], dedup=self.dedup, check_dir=False
+                    )
+                else:
+                    ret_dict = {
+                        "status": 500,
+                        "error": "Error creating upload dir '%s'" % file_dir,
+                        "bytes": 0, "filename": filename
+                    }
+
+                ret_dict["time"] = time.time() - start
+                return ret_dict
+
+            if len(u_files) > 1:
+                response.result = list(WRITE_POOL.map(_save, u_files))
+            else:
+                response.result = [_save(u_files[0])]
         else:
             response.status_code = 400
             response.reason = "No files provided"
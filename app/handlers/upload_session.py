@@ -0,0 +1,351 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The RequestHandler for /upload/session URLs.
+
+A chunked upload is done in three steps:
+- POST /upload/session with the destination path and the file size creates
+  the upload session.
+- PUT /upload/session/<id> sends a chunk of the file, with its position in
+  the Content-Range header. Chunks can be sent in any order and in parallel,
+  and sent again if they failed.
+- POST /upload/session/<id> with the file digest verifies it and moves the
+  file in place.
+
+A GET request on the session reports the received and missing byte ranges,
+so that an interrupted upload can be resumed. Only admin tokens can list all
+the sessions.
+"""
+
+import bson
+import datetime
+import os
+import re
+import types
+
+import handlers.base as hbase
+import handlers.common.token
+import handlers.response as hresponse
+import models
+import utils.db
+import utils.upload
+
+# The maximum size of a file uploaded in chunks.
+MAX_FILE_SIZE = 1024 * 1024 * 1024 * 64
+# The maximum size of a single chunk.
+MAX_CHUNK_SIZE = 1024 * 1024 * 64
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class UploadSessionHandler(hbase.BaseHandler):
+    """Handle the /upload/session URLs."""
+
+    def __init__(self, application, request, **kwargs):
+        super(UploadSessionHandler, self).__init__(
+            application, request, **kwargs)
+
+    @property
+    def collection(self):
+        return self.db[models.UPLOAD_COLLECTION]
+
+    @property
+    def dedup(self):
+        """If the uploaded files are stored by their digest."""
+        return self.settings.get("upload_dedup", False)
+
+    @staticmethod
+    def _valid_keys(method):
+        return models.UPLOAD_SESSION_VALID_KEYS.get(method, None)
+
+    @staticmethod
+    def _token_validation_func():
+        return handlers.common.token.valid_token_upload_session
+
+    def _get_session(self, session_id):
+        """Retrieve an upload session document.
+
+        :param session_id: The ID of the session.
+        :type session_id: str
+        :return A 2-tuple: the status code (200, 400 or 404) and the session
+        document.
+        """
+        ret_val = 200
+        session = None
+
+        try:
+            session = utils.db.find_one2(
+                self.collection, {models.ID_KEY: bson.ObjectId(session_id)})
+            if not session:
+                ret_val = 404
+        except bson.errors.InvalidId, ex:
+            self.log.exception(ex)
+            self.log.error("Provided doc ID '%s' is not valid", session_id)
+            ret_val = 400
+
+        return ret_val, session
+
+    def _get(self, **kwargs):
+        """List the upload sessions: only admin tokens can.
+
+        :return A `HandlerResponse` object.
+        """
+        token = kwargs.get("token", None)
+
+        if all([token, getattr(token, "is_admin", False)]):
+            response = super(UploadSessionHandler, self)._get(**kwargs)
+        else:
+            response = hresponse.HandlerResponse(403)
+            response.reason = "Only admin tokens can list the upload sessions"
+
+        return response
+
+    def _get_one(self, doc_id, **kwargs):
+        response = hresponse.HandlerResponse()
+
+        ret_val, session = self._get_session(doc_id)
+        if ret_val == 200:
+            chunks = session.pop(models.CHUNKS_KEY, [])
+            session["received"] = utils.upload.merge_ranges(chunks)
+            session["missing"] = utils.upload.missing_ranges(
+                chunks, session[models.SIZE_KEY])
+            response.result = session
+        elif ret_val == 404:
+            response.status_code = 404
+            response.reason = "Upload session '%s' not found" % doc_id
+        else:
+            response.status_code = 400
+            response.reason = "Wrong ID value provided"
+
+        return response
+
+    def _post(self, *args, **kwargs):
+        session_id = kwargs.get("id", None)
+        if session_id:
+            response = self._finalize(session_id, kwargs["json_obj"])
+        else:
+            response = self._create(kwargs["json_obj"])
+
+        return response
+
+    def _create(self, json_obj):
+        """Create a new upload session.
+
+        :param json_obj: The JSON data with the path and size of the file.
+        :type json_obj: dict
+        :return A `HandlerResponse` object.
+        """
+        response = hresponse.HandlerResponse(201)
+
+        raw_path = (json_obj.get(models.PATH_KEY, None) or "").strip("/")
+        path = utils.upload.normalize_upload_path(raw_path)
+        size = json_obj.get(models.SIZE_KEY, None)
+
+        if not raw_path:
+            response.status_code = 400
+            response.reason = "Missing destination path"
+        elif not path:
+            response.status_code = 400
+            response.reason = "Provided path is not valid"
+        elif not utils.upload.is_valid_dir_path(path):
+            response.status_code = 400
+            response.reason = "Provided path is not valid"
+        elif any([not isinstance(size, (types.IntType, types.LongType)),
+                  size < 0, size > MAX_FILE_SIZE]):
+            response.status_code = 400
+            response.reason = "Wrong file size value provided"
+        else:
+            utils.upload.remove_stale_part_files(models.UPLOAD_SESSION_TTL)
+
+            session = {
+                models.CHUNKS_KEY: [],
+                models.CREATED_KEY: datetime.datetime.now(
+                    tz=bson.tz_util.utc),
+                models.PATH_KEY: path,
+                models.SIZE_KEY: size
+            }
+            ret_val, session_id = utils.db.save2(
+                self.db, models.UPLOAD_COLLECTION, session)
+
+            if ret_val == 201:
+                try:
+                    utils.upload.create_part_file(str(session_id), size)
+                    response.result = {models.ID_KEY: session_id}
+                    response.headers = {
+                        "Location": "/upload/session/%s" % session_id}
+                except (IOError, OSError), ex:
+                    self.log.exception(ex)
+                    utils.db.delete(self.collection, session_id)
+                    response.status_code = 500
+                    response.reason = "Error creating the upload session"
+            else:
+                response.status_code = ret_val
+                response.reason = "Error creating the upload session"
+
+        return response
+
+    def _finalize(self, session_id, json_obj):
+        """Verify the uploaded file and move it in place.
+
+        :param session_id: The ID of the upload session.
+        :type session_id: str
+        :param json_obj: The JSON data with the digest of the file.
+        :type json_obj: dict
+        :return A `HandlerResponse` object.
+        """
+        response = hresponse.HandlerResponse()
+        digest = json_obj.get(models.DIGEST_KEY, None)
+
+        ret_val, session = self._get_session(session_id)
+        if ret_val != 200:
+            response.status_code = ret_val
+            response.reason = "Upload session '%s' not found" % session_id
+        elif not utils.upload.is_valid_digest(digest):
+            response.status_code = 400
+            response.reason = "Wrong digest value"
+        else:
+            missing = utils.upload.missing_ranges(
+                session[models.CHUNKS_KEY], session[models.SIZE_KEY])
+            part_path = utils.upload.get_part_path(session_id)
+
+            if missing:
+                response.status_code = 409
+                response.reason = "File upload not complete"
+                response.result = [{"missing": missing}]
+            elif utils.upload.get_file_digest(part_path) != digest:
+                response.status_code = 400
+                response.reason = "File digest does not match"
+            else:
+                path = session[models.PATH_KEY]
+                dir_path = os.path.dirname(path)
+
+                ret_val, error = \
+                    utils.upload.check_or_create_upload_dir(dir_path)
+                if ret_val == 200:
+                    ret_dict = utils.upload.move_temp_file(
+                        part_path,
+                        dir_path,
+                        os.path.basename(path),
+                        digest=digest if self.dedup else None)
+
+                    response.status_code = ret_dict["status"]
+                    response.result = [ret_dict]
+                    if ret_dict["error"]:
+                        response.reason = ret_dict["error"]
+                    else:
+                        response.reason = "File '%s' saved" % path
+
+                    # The part file is gone, the session cannot be used
+                    # anymore.
+                    utils.db.delete(self.collection, session[models.ID_KEY])
+                else:
+                    response.status_code = ret_val
+                    response.reason = error
+
+        return response
+
+    def _put(self, *args, **kwargs):
+        response = hresponse.HandlerResponse()
+        session_id = kwargs.get("id", None)
+
+        content_range = CONTENT_RANGE_RE.match(
+            self.request.headers.get("Content-Range", ""))
+        body = self.request.body or b""
+
+        if not session_id:
+            response.status_code = 400
+            response.reason = "No ID value specified"
+        elif not content_range:
+            response.status_code = 400
+            response.reason = "Missing or wrong Content-Range header"
+        elif len(body) > MAX_CHUNK_SIZE:
+            response.status_code = 413
+            response.reason = "Chunk too big"
+        else:
+            start, end, total = [int(x) for x in content_range.groups()]
+
+            ret_val, session = self._get_session(session_id)
+            if ret_val != 200:
+                response.status_code = ret_val
+                response.reason = \
+                    "Upload session '%s' not found" % session_id
+            elif any([total != session[models.SIZE_KEY],
+                      end < start, end >= total]):
+                response.status_code = 416
+                response.reason = "Wrong chunk range"
+            elif len(body) != end - start + 1:
+                response.status_code = 400
+                response.reason = "Chunk size does not match its range"
+            else:
+                response = self._save_chunk(session, start, body)
+
+        return response
+
+    def _save_chunk(self, session, offset, content):
+        """Write a chunk and record its range in the session.
+
+        Chunks are written at their offset in the part file, and the ranges
+        are pushed atomically: parallel requests do not step on each other.
+
+        :param session: The upload session document.
+        :type session: dict
+        :param offset: Where the chunk starts in the file.
+        :type offset: int
+        :param content: The chunk content.
+        :type content: str
+        :return A `HandlerResponse` object.
+        """
+        response = hresponse.HandlerResponse()
+        session_id = session[models.ID_KEY]
+
+        try:
+            written = utils.upload.write_chunk(
+                str(session_id), offset, content)
+
+            ret_val = utils.db.update(
+                self.collection,
+                {models.ID_KEY: session_id},
+                {models.CHUNKS_KEY: [offset, offset + written]},
+                operation="$push"
+            )
+            if ret_val == 200:
+                response.reason = "Chunk saved"
+                response.result = [{"bytes": written}]
+            else:
+                response.status_code = ret_val
+                response.reason = "Error updating the upload session"
+        except (IOError, OSError), ex:
+            self.log.exception(ex)
+            response.status_code = 500
+            response.reason = "Error writing the chunk"
+
+        return response
+
+    def _delete(self, doc_id, **kwargs):
+        response = hresponse.HandlerResponse()
+
+        ret_val, session = self._get_session(doc_id)
+        if ret_val == 200:
+            utils.upload.remove_part_file(doc_id)
+            ret_val = utils.db.delete(
+                self.collection, session[models.ID_KEY])
+            if ret_val == 200:
+                response.reason = "Upload session '%s' removed" % doc_id
+            else:
+                response.status_code = ret_val
+                response.reason = "Error removing the upload session"
+        else:
+            response.status_code = ret_val
+            response.reason = "Upload session '%s' not found" % doc_id
+
+        return response
@@ -26,6 +26,7 @@ AGGREGATE_KEY = "aggregate"
 ARCHITECTURE_KEY = "arch"
 ARM64_ARCHITECTURE_KEY = "arm64"
 ARM_ARCHITECTURE_KEY = "arm"
+ASYNC_KEY = "async"
 ATTACHMENTS_KEY = "attachments"
 BASELINE_KEY = "baseline"
 BOARD_INSTANCE_KEY = "board_instance"
@@ -55,7 +56,9 @@ BUILD_RESULT_KEY = "build_result"
 BUILD_TIME_KEY = "build_time"
 BUILD_TYPE_KEY = "build_type"
 BUILD_WARNINGS_KEY = "build_warnings"
+CACHES_KEY = "caches"
 CHAINLOADER_TYPE_KEY = "chainloader"
+CHUNKS_KEY = "chunks"
 COMPARED_KEY = "compared"
 COMPARE_TO_KEY = "compare_to"
 COMPILER_KEY = "compiler"
@@ -63,6 +66,7 @@ COMPILER_VERSION_EXT_KEY = "compiler_version_ext"
 COMPILER_VERSION_FULL_KEY = "compiler_version_full"
 COMPILER_VERSION_KEY = "compiler_version"
 CONTACT_KEY = "contact"
+COUNTERS_KEY = "counters"
 COUNT_KEY = "count"
 CREATED_KEY = "created_on"
 CROSS_COMPILE_KEY = "cross_compile"
@@ -74,7 +78,9 @@ DEFECT_ACK_KEY = "defect_ack"
 DEFECT_COMMENT_KEY = "defect_comment"
 DEFECT_URL_KEY = "defect_url"
 DEFINITION_URI_KEY = "definition_uri"
+DELTA_ID_KEY = "delta_id"
 DELTA_RESULT_KEY = "delta_result"
+DIGEST_KEY = "digest"
 DIRNAME_KEY = "dirname"
 DOC_ID_KEY = "doc_id"
 DTB_ADDR_KEY = "dtb_addr"
@@ -90,6 +96,8 @@ EMAIL_TXT_FORMAT_KEY = "txt"
 ENDIANNESS_KEY = "endian"
 ERRORS_COUNT_KEY = "errors_count"
 ERRORS_KEY = "errors"
+EXECUTION_KEY = "execution"
+EXPLAIN_KEY = "explain"
 EXPIRED_KEY = "expired"
 EXPIRES_KEY = "expires_on"
 FASTBOOT_CMD_KEY = "fastboot_cmd"
@@ -104,6 +112,7 @@ GIT_DESCRIBE_KEY = "git_describe"
 GIT_DESCRIBE_V_KEY = "git_describe_v"
 GIT_URL_KEY = "git_url"
 GTE_KEY = "gte"
+HISTOGRAMS_KEY = "histograms"
 ID_KEY = "_id"
 INITRD_ADDR_KEY = "initrd_addr"
 INITRD_KEY = "initrd"
@@ -139,19 +148,24 @@ MODULES_SIZE_KEY = "modules_size"
 NAME_KEY = "name"
 NOT_FIELD_KEY = "nfield"
 PARAMETERS_KEY = "parameters"
+PATH_KEY = "path"
 PRIVATE_KEY = "private"
 PROPERTIES_KEY = "properties"
 QEMU_COMMAND_KEY = "qemu_command"
 QEMU_KEY = "qemu"
+REFERENCED_JOBS_KEY = "referenced_jobs"
+REQUEST_HASH_KEY = "request_hash"
 RESULT_KEY = "result"
 RETRIES_KEY = "retries"
 SAMPLES_KEY = "samples"
 SAMPLES_SQUARE_SUM_KEY = "samples_sqr_sum"
 SAMPLES_SUM_KEY = "samples_sum"
+SIZE_KEY = "size"
 SKIP_KEY = "skip"
 SORT_KEY = "sort"
 SORT_ORDER_KEY = "sort_order"
 START_DATE_KEY = "start_date"
+STATUS_CODE_KEY = "status_code"
 STATUS_KEY = "status"
 SUBJECT_KEY = "subject"
 SURNAME_KEY = "surname"
@@ -177,6 +191,7 @@ UIMAGE_KEY = "uimage"
 UPDATED_KEY = "updated_on"
 USERNAME_KEY = "username"
 REGRESSIONS_KEY = "regressions"
+REGRESSION_KEY_KEY = "regression_key"
 VCS_COMMIT_KEY = "vcs_commit"
 VERSION_FULL_KEY = "full_version"
 VERSION_KEY = "version"
@@ -251,6 +266,7 @@ UNIQUE_KEY = "unique"
 # Collection names.
 BOOT_COLLECTION = "boot"
 BOOT_REGRESSIONS_BY_BOOT_COLLECTION = "boot_regressions_by_boot_id"
+BOOT_REGRESSIONS_BY_KEY_COLLECTION = "boot_regressions_by_key"
 BOOT_REGRESSIONS_COLLECTION = "boot_regressions"
 BUILD_COLLECTION = "build"
 COUNT_COLLECTION = "count"
@@ -266,6 +282,7 @@ TEST_SET_COLLECTION = "test_set"
 ERROR_LOGS_COLLECTION = "error_logs"
 ERRORS_SUMMARY_COLLECTION = "errors_summary"
 DAILY_STATS_COLLECTION = "daily_stats"
+SCHEMA_COLLECTION = "schema"
 # Delta collections.
 JOB_DELTA_COLLECTION = "job_delta"
 BUILD_DELTA_COLLECTION = "build_delta"
@@ -965,13 +982,37 @@ STATISTICS_VALID_KEYS = {
     ]
 }
 
+# How long, in seconds, an upload session is kept.
+UPLOAD_SESSION_TTL = 60 * 60 * 24
+
+UPLOAD_SESSION_VALID_KEYS = {
+    "POST": [
+        DIGEST_KEY,
+        PATH_KEY,
+        SIZE_KEY
+    ],
+    "GET": [
+        CREATED_KEY,
+        ID_KEY,
+        PATH_KEY,
+        SIZE_KEY
+    ]
+}
+
 BOOT_REGRESSIONS_VALID_KEYS = {
     "GET": [
+        ARCHITECTURE_KEY,
+        BOARD_INSTANCE_KEY,
+        BOARD_KEY,
+        COMPILER_VERSION_EXT_KEY,
         CREATED_KEY,
+        DEFCONFIG_FULL_KEY,
         ID_KEY,
         JOB_ID_KEY,
         JOB_KEY,
-        KERNEL_KEY
+        KERNEL_KEY,
+        LAB_NAME_KEY,
+        REGRESSION_KEY_KEY
     ]
 }
 
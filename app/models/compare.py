@@ -16,6 +16,13 @@
 import models
 
 
+# How long, in seconds, a saved delta document is kept in the database.
+DELTA_DOC_TTL = 60 * 60 * 24 * 30
+
+# The status of a delta calculation requested asynchronously.
+COMPARE_COMPLETE_STATUS = "COMPLETE"
+COMPARE_PENDING_STATUS = "PENDING"
+
 JOB_DELTA_COMPARE_TO_VALID_KEYS = [
     models.JOB_ID_KEY,
     models.JOB_KEY,
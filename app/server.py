@@ -20,19 +20,28 @@ import concurrent.futures
 import os
 import tornado
 import tornado.httpserver
+import tornado.ioloop
 import tornado.netutil
 import tornado.options as topt
 import tornado.web
 import uuid
 
 import handlers.app as happ
+import handlers.base as hbase
 import handlers.dbindexes as hdbindexes
 import urls
+import utils.cache
 import utils.database.redisdb as redisdb
 import utils.db
+import utils.indexadvisor
+import utils.jsoncodec
 
 
 DEFAULT_CONFIG_FILE = "/etc/linaro/kernelci-backend.cfg"
+# How often, in milliseconds, the query shapes are stored in Redis.
+SHAPES_FLUSH_INTERVAL = 60 * 1000
+# How often, in milliseconds, the caches statistics are stored in Redis.
+CACHE_STATS_INTERVAL = utils.cache.PUBLISH_INTERVAL * 1000
 
 topt.define(
     "master_key", default=str(uuid.uuid4()), type=str, help="The master key")
@@ -117,6 +126,44 @@ topt.define(
     default=1024 * 1024 * 500,
     type=int, help="The body buffer size for uploading files"
 )
+topt.define(
+    "upload_dedup",
+    default=False,
+    type=bool,
+    help="Store the uploaded files by their digest, linking identical files"
+)
+topt.define(
+    "metrics",
+    default=True,
+    type=bool,
+    help="Record the duration of the request phases of each route"
+)
+topt.define(
+    "server_timing",
+    default=False,
+    type=bool,
+    help="Add the Server-Timing header with the request phases durations"
+)
+topt.define(
+    "migrate_indexes",
+    default=True,
+    type=bool,
+    help=(
+        "Apply the missing database indexes migrations in the background at "
+        "startup")
+)
+topt.define(
+    "record_query_shapes",
+    default=False,
+    type=bool,
+    help="Record the shapes of the database queries for the index advisor"
+)
+topt.define(
+    "json_codec",
+    default=utils.jsoncodec.DEFAULT_CODEC,
+    type=str,
+    help="The JSON codec for the responses: fast or bson"
+)
 
 
 class KernelCiBackend(tornado.web.Application):
@@ -171,10 +218,28 @@ class KernelCiBackend(tornado.web.Application):
             "autoreload": topt.options.autoreload,
             "senddelay": topt.options.send_delay,
             "storage_url": topt.options.storage_url,
+            "upload_dedup": topt.options.upload_dedup,
+            "metrics": topt.options.metrics,
+            "server_timing": topt.options.server_timing,
             "max_buffer_size": topt.options.buffer_size
         }
 
-        hdbindexes.ensure_indexes(self.database)
+        hdbindexes.check_indexes(
+            self.database, migrate=topt.options.migrate_indexes)
+        utils.jsoncodec.set_default_codec(topt.options.json_codec)
+
+        if topt.options.metrics:
+            tornado.ioloop.PeriodicCallback(
+                lambda: hbase.METRICS_POOL.submit(
+                    utils.cache.publish_stats, self.redis_con),
+                CACHE_STATS_INTERVAL).start()
+
+        if topt.options.record_query_shapes:
+            utils.indexadvisor.enable()
+            tornado.ioloop.PeriodicCallback(
+                lambda: hbase.METRICS_POOL.submit(
+                    utils.indexadvisor.SHAPES.flush, self.redis_con),
+                SHAPES_FLUSH_INTERVAL).start()
 
         super(KernelCiBackend, self).__init__(urls.APP_URLS, **settings)
 
@@ -18,12 +18,17 @@ from __future__ import absolute_import
 import ast
 import celery
 import celery.schedules
+import celery.signals
+import inspect
 import io
 import kombu.serialization
 import os
 
 import taskqueue.celeryconfig as celeryconfig
 import taskqueue.serializer as serializer
+import utils.cache
+import utils.database.redisdb as redisdb
+import utils.instrumentation
 
 
 CELERY_CONFIG_FILE = "/etc/linaro/kernelci-celery.cfg"
@@ -35,7 +40,8 @@ TASKS_LIST = [
     "taskqueue.tasks.compare",
     "taskqueue.tasks.report",
     "taskqueue.tasks.stats",
-    "taskqueue.tasks.test"
+    "taskqueue.tasks.test",
+    "taskqueue.tasks.upload"
 ]
 
 # Register the custom decoder/encoder for celery with the name "kjson".
@@ -48,6 +54,16 @@ kombu.serialization.register(
     content_encoding="utf-8"
 )
 
+# The binary "kbson" serializer: it can be used only when the task arguments
+# can be stored in a BSON document, and is set by the tasks that need it.
+kombu.serialization.register(
+    "kbson",
+    serializer.kernelci_bson_encoder,
+    serializer.kernelci_bson_decoder,
+    content_type="application/x-bson",
+    content_encoding="binary"
+)
+
 app = celery.Celery(
     "tasks",
     include=TASKS_LIST
@@ -60,9 +76,45 @@ CELERYBEAT_SCHEDULE = {
     "calculate-daily-stats": {
         "task": "calculate-daily-statistics",
         "schedule": celery.schedules.crontab(minute=1, hour=12)
+    },
+    "collect-upload-objects": {
+        "task": "collect-upload-objects",
+        "schedule": celery.schedules.crontab(minute=31, hour=3)
     }
 }
 
+
+# pylint: disable=unused-argument
+@celery.signals.task_prerun.connect
+def start_query_recording(task_id=None, task=None, **kwargs):
+    """Record the queries performed by each task."""
+    utils.instrumentation.start_recording("Task %s" % task.name)
+
+
+# pylint: disable=unused-argument
+@celery.signals.task_postrun.connect
+def stop_query_recording(task_id=None, task=None, **kwargs):
+    """Stop recording the queries of a task, warning if too many."""
+    utils.instrumentation.stop_recording()
+
+
+# pylint: disable=unused-argument
+@celery.signals.task_postrun.connect
+def publish_cache_stats(task_id=None, task=None, args=None, kwargs=None, **kw):
+    """Publish the caches statistics of the worker, once in a while.
+
+    The Redis connection parameters are the ones the task received.
+    """
+    try:
+        db_options = inspect.getcallargs(
+            task.run, *(args or []), **(kwargs or {})).get("db_options", None)
+    except TypeError:
+        db_options = None
+
+    if db_options:
+        utils.cache.publish_stats(redisdb.get_db_connection(db_options))
+
+
 # Read from a config file from disk.
 if os.path.exists(CELERY_CONFIG_FILE):
     with io.open(CELERY_CONFIG_FILE) as conf_file:
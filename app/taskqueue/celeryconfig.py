@@ -21,8 +21,9 @@ BROKER_TRANSPORT_OPTIONS = {
     "fanout_patterns": True
 }
 CELERYD_PREFETCH_MULTIPLIER = 64
-# Use custom json encoder.
-CELERY_ACCEPT_CONTENT = ["kjson"]
+# Use custom json encoder, the tasks that import big lists of documents use
+# the bson one.
+CELERY_ACCEPT_CONTENT = ["kjson", "kbson"]
 CELERY_RESULT_SERIALIZER = "kjson"
 CELERY_TASK_SERIALIZER = "kjson"
 CELERY_TASK_RESULT_EXPIRES = 900
@@ -16,17 +16,19 @@
 The following module defines two custom functions to serialize and deserialize
 JSON objects that use BSON notation. These functions are intended to be used
 as the defual encoder/decoder functions that Celery uses to send messages.
+
+It also defines the functions of the binary BSON serializer: the messages
+are smaller and faster to decode, and the `ObjectId` and `datetime` values
+are kept as they are. It is used by the tasks that receive big lists of
+documents to import.
+
+The actual encoding and decoding is done with the default codec of the
+`utils.jsoncodec` module.
 """
 
-try:
-    import simplejson as json
-except ImportError:
-    import json
+import bson
 
-from bson.json_util import (
-    default,
-    object_hook
-)
+import utils.jsoncodec
 
 
 def kernelci_json_encoder(obj):
@@ -36,8 +38,7 @@ def kernelci_json_encoder(obj):
     :type obj: dict
     :return A unicode string.
     """
-    return json.dumps(
-        obj, default=default, ensure_ascii=False, separators=(",", ":"))
+    return utils.jsoncodec.dumps(obj)
 
 
 def kernelci_json_decoder(obj):
@@ -47,4 +48,26 @@ def kernelci_json_decoder(obj):
     :type obj: string or unicode
     :return A JSON object.
     """
-    return json.loads(obj, object_hook=object_hook)
+    return utils.jsoncodec.loads(obj)
+
+
+def kernelci_bson_encoder(obj):
+    """Custom BSON serialization function.
+
+    :param obj: The object to serialize, it must be a dictionary.
+    :type obj: dict
+    :return The BSON data as a string.
+    """
+    return bson.BSON.encode(obj)
+
+
+def kernelci_bson_decoder(obj):
+    """Custom BSON deserialization function.
+
+    The `datetime` values are timezone aware, as with the JSON decoder.
+
+    :param obj: The BSON data to deserialize.
+    :type obj: string
+    :return A dictionary.
+    """
+    return bson.BSON(obj).decode(tz_aware=True)
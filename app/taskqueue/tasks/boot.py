@@ -14,8 +14,13 @@
 """All boot related celery tasks."""
 
 import taskqueue.celery as taskc
+import utils
 import utils.boot
 import utils.boot.regressions
+import utils.errors
+
+# How many boot reports to import at once in the bulk import task.
+IMPORT_CHUNK_SIZE = 100
 
 
 @taskc.app.task(name="import-boot")
@@ -39,6 +44,40 @@ def import_boot(json_obj, db_options, mail_options):
     return ret_code, doc_id
 
 
+@taskc.app.task(name="import-boots", serializer="kbson")
+def import_boots(json_objs, db_options, mail_options):
+    """Import many boot reports with a single task.
+
+    The boot reports are imported in chunks of `IMPORT_CHUNK_SIZE` elements.
+    The errors of all the chunks are collected and logged.
+
+    :param json_objs: The JSON objects with the values necessary to import
+    the boot reports.
+    :type json_objs: list
+    :param db_options: The database connection parameters.
+    :type db_options: dictionary
+    :param mail_options: The options necessary to connect to the SMTP server.
+    :type mail_options: dictionary
+    :return list A list with the return code and the document id of each
+    boot report.
+    """
+    results = []
+    errors = {}
+
+    for idx in xrange(0, len(json_objs), IMPORT_CHUNK_SIZE):
+        chunk_results, chunk_errors = utils.boot.import_and_save_boots(
+            json_objs[idx:idx + IMPORT_CHUNK_SIZE], db_options)
+        results.extend(chunk_results)
+        utils.errors.update_errors(errors, chunk_errors)
+
+    for err_code, err_msgs in errors.iteritems():
+        utils.LOG.error(
+            "Errors importing boot reports (%d): %s",
+            err_code, "; ".join(err_msgs))
+
+    return results
+
+
 @taskc.app.task(name="boot-regressions")
 def find_regression(prev_res, db_options, mail_options):
     """Trigger the find regression function.
@@ -62,3 +101,25 @@ def find_regression(prev_res, db_options, mail_options):
         ret_code, doc_id = utils.boot.regressions.find(prev_res[1], db_options)
 
     return ret_code, doc_id
+
+
+@taskc.app.task(name="boots-regressions")
+def find_regressions(prev_res, db_options, mail_options):
+    """Trigger the find regression function for many boot reports.
+
+    This function is concataned to the `import_boots` one, and the results of
+    the previous execution are injected here.
+
+    :param prev_res: A list with the results of the previous task.
+    :type prev_res: list
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :param mail_options: The email server connection parameters.
+    :type mail_options: dict
+    :return list A list with the return code and the document id of each
+    regression found.
+    """
+    boot_ids = [
+        res[1] for res in prev_res if any([res[0] == 201, res[0] == 200])]
+
+    return utils.boot.regressions.find_many(boot_ids, db_options)
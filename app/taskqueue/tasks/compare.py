@@ -13,15 +13,55 @@
 
 """All delta/compare related celery tasks."""
 
+import models
 import taskqueue.celery as taskc
 import utils.build
 import utils.compare.boot
 import utils.compare.build
+import utils.compare.common
 import utils.compare.job
 
 
+def _execute_delta(delta_func, json_obj, collection, db_options, pending_id):
+    """Execute a delta calculation and track it if requested asynchronously.
+
+    :param delta_func: The function that performs the delta calculation.
+    :type delta_func: function
+    :param json_obj: The JSON data with the values.
+    :type json_obj: dict
+    :param collection: The name of the delta collection.
+    :type collection: str
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :param pending_id: The ID of the document that tracks the calculation.
+    :type pending_id: bson.objectid.ObjectId
+    :return A 4-tuple: status code, result, doc_id and errors.
+    """
+    try:
+        delta_result = delta_func(json_obj, db_options)
+    # pylint: disable=broad-except
+    except Exception, ex:
+        if pending_id:
+            utils.compare.common.complete_pending_delta_doc(
+                pending_id,
+                (
+                    500,
+                    None,
+                    None, {500: ["Error calculating the delta: %s" % ex]}
+                ),
+                collection, db_options)
+        raise
+
+    if pending_id:
+        utils.compare.common.complete_pending_delta_doc(
+            pending_id, delta_result, collection, db_options)
+
+    return delta_result
+
+
 @taskc.app.task(name="job-delta", ignore_result=False)
-def calculate_job_delta(json_obj, db_options=None, mail_options=None):
+def calculate_job_delta(
+        json_obj, db_options=None, mail_options=None, pending_id=None):
     """Perform the job delta calculations.
 
     Wrapper around the real function to provide a task-based access.
@@ -32,13 +72,19 @@ def calculate_job_delta(json_obj, db_options=None, mail_options=None):
     :type db_options: dict
     :param mail_options: The email connection parameters.
     :type mail_options: dict
+    :param pending_id: The ID of the document that tracks the calculation,
+    when requested asynchronously.
+    :type pending_id: bson.objectid.ObjectId
     :return a 4-tuple: status code, result, doc_id, errors.
     """
-    return utils.compare.job.execute_job_delta(json_obj, db_options)
+    return _execute_delta(
+        utils.compare.job.execute_job_delta,
+        json_obj, models.JOB_DELTA_COLLECTION, db_options, pending_id)
 
 
 @taskc.app.task(name="build-delta", ignore_result=False)
-def calculate_build_delta(json_obj, db_options=None, mail_options=None):
+def calculate_build_delta(
+        json_obj, db_options=None, mail_options=None, pending_id=None):
     """Perform the build delta calculations.
 
     Wrapper around the real function to provide a task-based access.
@@ -49,14 +95,20 @@ def calculate_build_delta(json_obj, db_options=None, mail_options=None):
     :type db_options: dict
     :param mail_options: The email connection parameters.
     :type mail_options: dict
+    :param pending_id: The ID of the document that tracks the calculation,
+    when requested asynchronously.
+    :type pending_id: bson.objectid.ObjectId
     :return A 4-tuple: status code, result, doc_id and errors.
     :rtype tuple
     """
-    return utils.compare.build.execute_delta(json_obj, db_options)
+    return _execute_delta(
+        utils.compare.build.execute_delta,
+        json_obj, models.BUILD_DELTA_COLLECTION, db_options, pending_id)
 
 
 @taskc.app.task(name="boot-delta", ignore_result=False)
-def calculate_boot_delta(json_obj, db_options=None, mail_options=None):
+def calculate_boot_delta(
+        json_obj, db_options=None, mail_options=None, pending_id=None):
     """Perform the boot delta calculations.
 
     Wrapper around the real function to provide a task-based access.
@@ -67,7 +119,12 @@ def calculate_boot_delta(json_obj, db_options=None, mail_options=None):
     :type db_options: dict
     :param mail_options: The email connection parameters.
     :type mail_options: dict
+    :param pending_id: The ID of the document that tracks the calculation,
+    when requested asynchronously.
+    :type pending_id: bson.objectid.ObjectId
     :return A 4-tuple: status code, result, doc_id and errors.
     :rtype tuple
     """
-    return utils.compare.boot.execute_delta(json_obj, db_options)
+    return _execute_delta(
+        utils.compare.boot.execute_delta,
+        json_obj, models.BOOT_DELTA_COLLECTION, db_options, pending_id)
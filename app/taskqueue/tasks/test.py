@@ -13,6 +13,10 @@
 
 """All test related celery tasks."""
 
+from __future__ import absolute_import
+
+import celery
+
 import models
 import taskqueue.celery as taskc
 import utils
@@ -22,6 +26,10 @@ import utils.tests_import as tests_import
 
 ADD_ERR = utils.errors.add_error
 
+# Test suites with more tests than this are imported in chunks of this size,
+# in parallel.
+IMPORT_CHUNK_SIZE = 1000
+
 
 # pylint: disable=too-many-arguments
 # pylint: disable=invalid-name
@@ -57,70 +65,201 @@ def complete_test_suite_import(
     return ret_val, update_doc
 
 
-@taskc.app.task(
-    name="import-sets-from-suite", ignore_result=False, add_to_parent=False)
-def import_test_sets_from_test_suite(
-        prev_results,
-        suite_id, suite_name, tests_list, db_options, mail_options):
-    """Import the test sets provided in a test suite.
-
-    This task is linked from the test suite update one: the first argument is a
-    list that contains the return values from the previous task. That argument
-    is injected once the task has been completed.
+def _update_suite_references(suite_id, suite_name, key, test_ids, db_options):
+    """Add the imported test sets or cases to the test suite.
 
-    :param prev_results: Injected value that contain the parent task results.
-    :type prev_results: list
     :param suite_id: The ID of the suite.
     :type suite_id: bson.objectid.ObjectId
     :param suite_name: The name of the test suite.
     :type suite_name: str
-    :pram tests_list: The list of tests to import.
-    :type tests_list: list
+    :param key: The test suite key to update (test_set or test_case).
+    :type key: str
+    :param test_ids: The IDs of the imported test objects.
+    :type test_ids: list
     :param db_options: The database connection parameters.
     :type db_options: dict
-    :param mail_options: The email system parameters.
-    :type mail_options: dict
     :return 200 if OK, 500 in case of errors; a dictionary with errors or an
     empty one.
     """
     ret_val = 200
     errors = {}
 
+    if test_ids:
+        utils.LOG.info(
+            "Updating test suite '%s' (%s) with %s IDs",
+            suite_name, str(suite_id), key)
+        database = utils.db.get_db_connection(db_options)
+        ret_val = utils.db.update(
+            database[models.TEST_SUITE_COLLECTION],
+            {models.ID_KEY: suite_id},
+            {key: {"$each": test_ids}}, operation="$addToSet")
+        if ret_val != 200:
+            ADD_ERR(
+                errors,
+                ret_val,
+                "Error updating test suite '%s' with %s references" %
+                (str(suite_id), key)
+            )
+    else:
+        ret_val = 500
+
+    return ret_val, errors
+
+
+def _log_import_errors(errors, suite_id, suite_name, key):
+    """Log the errors of the import of the test sets or cases.
+
+    :param errors: The errors, by error code.
+    :type errors: dict
+    :param suite_id: The ID of the suite.
+    :type suite_id: bson.objectid.ObjectId
+    :param suite_name: The name of the test suite.
+    :type suite_name: str
+    :param key: The test suite key to update (test_set or test_case).
+    :type key: str
+    """
+    for err_code, err_msgs in errors.iteritems():
+        utils.LOG.error(
+            "Errors importing %s of test suite '%s' (%s) (%d): %s",
+            key, suite_name, str(suite_id), err_code, "; ".join(err_msgs))
+
+
+def _import_chunk(
+        import_func,
+        tests_list, suite_id, suite_name, db_options, other_args):
+    """Import a chunk of the test sets or cases of a test suite.
+
+    All the errors are caught and returned as such: the chord callback has to
+    run anyway to update the test suite with the other chunks.
+
+    :param import_func: The function that imports a list of tests.
+    :type import_func: function
+    :param tests_list: The list of tests to import.
+    :type tests_list: list
+    :param suite_id: The ID of the suite.
+    :type suite_id: bson.objectid.ObjectId
+    :param suite_name: The name of the test suite.
+    :type suite_name: str
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :param other_args: The values of the test suite references.
+    :type other_args: dict
+    :return A list with the saved test IDs; a dictionary with errors or an
+    empty one.
+    """
+    try:
+        test_ids, errors = import_func(
+            tests_list, suite_id, suite_name, db_options, **other_args)
+    # pylint: disable=broad-except
+    except Exception, ex:
+        utils.LOG.exception(ex)
+        test_ids = []
+        errors = {
+            500: [
+                "Error importing %d tests of test suite '%s' (%s): %s" %
+                (len(tests_list), suite_name, str(suite_id), ex)
+            ]
+        }
+
+    return test_ids, errors
+
+
+# pylint: disable=too-many-arguments
+def _import_tests(
+        import_func,
+        chunk_task,
+        key, prev_results, suite_id, suite_name, tests_list, db_options):
+    """Import the test sets or cases of a test suite.
+
+    Small lists are imported right away. Big lists are split in chunks of
+    IMPORT_CHUNK_SIZE tests, imported in parallel by a chord whose callback
+    updates the test suite with all the IDs.
+
+    :param import_func: The function that imports a list of tests.
+    :type import_func: function
+    :param chunk_task: The task that imports a chunk of tests.
+    :param key: The test suite key to update (test_set or test_case).
+    :type key: str
+    :param prev_results: The results of the test suite update task.
+    :type prev_results: list
+    :param suite_id: The ID of the suite.
+    :type suite_id: bson.objectid.ObjectId
+    :param suite_name: The name of the test suite.
+    :type suite_name: str
+    :param tests_list: The list of tests to import.
+    :type tests_list: list
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :return 200 if OK, 500 in case of errors.
+    """
+    ret_val = 200
+
     prev_val = prev_results[0]
     other_args = prev_results[1]
 
     if all([prev_val == 200, suite_id]):
-        test_ids, errors = tests_import.import_multi_test_sets(
-            tests_list, suite_id, suite_name, db_options, **other_args)
-
-        if test_ids:
-            utils.LOG.info(
-                "Updating test suite '%s' (%s) with test set IDs",
-                suite_name, str(suite_id))
-            database = utils.db.get_db_connection(db_options)
-            ret_val = utils.db.update(
-                database[models.TEST_SUITE_COLLECTION],
-                {models.ID_KEY: suite_id}, {models.TEST_SET_KEY: test_ids})
-            if ret_val != 200:
-                ADD_ERR(
-                    errors,
-                    ret_val,
-                    "Error updating test suite '%s' with test set references" %
-                    (str(suite_id))
-                )
+        if len(tests_list) > IMPORT_CHUNK_SIZE:
+            celery.chord(
+                chunk_task.s(
+                    tests_list[idx:idx + IMPORT_CHUNK_SIZE],
+                    suite_id, suite_name, db_options, other_args)
+                for idx in xrange(0, len(tests_list), IMPORT_CHUNK_SIZE)
+            )(
+                update_suite_references.s(
+                    suite_id, suite_name, key, db_options)
+            )
         else:
-            ret_val = 500
+            test_ids, errors = import_func(
+                tests_list, suite_id, suite_name, db_options, **other_args)
+            ret_val, update_errors = _update_suite_references(
+                suite_id, suite_name, key, test_ids, db_options)
+
+            utils.errors.update_errors(errors, update_errors)
+            _log_import_errors(errors, suite_id, suite_name, key)
     else:
         utils.LOG.warn(
-            "Error saving test suite '%s', will not import tests cases",
+            "Error saving test suite '%s', will not import tests",
             suite_name)
 
-    # TODO: handle errors.
     return ret_val
 
 
 @taskc.app.task(
-    name="import-cases-from-suite", ignore_result=False, add_to_parent=False)
+    name="import-sets-from-suite",
+    ignore_result=False, add_to_parent=False, serializer="kbson")
+def import_test_sets_from_test_suite(
+        prev_results,
+        suite_id, suite_name, tests_list, db_options, mail_options):
+    """Import the test sets provided in a test suite.
+
+    This task is linked from the test suite update one: the first argument is a
+    list that contains the return values from the previous task. That argument
+    is injected once the task has been completed.
+
+    :param prev_results: Injected value that contain the parent task results.
+    :type prev_results: list
+    :param suite_id: The ID of the suite.
+    :type suite_id: bson.objectid.ObjectId
+    :param suite_name: The name of the test suite.
+    :type suite_name: str
+    :pram tests_list: The list of tests to import.
+    :type tests_list: list
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :param mail_options: The email system parameters.
+    :type mail_options: dict
+    :return 200 if OK, 500 in case of errors.
+    """
+    return _import_tests(
+        tests_import.import_multi_test_sets,
+        import_test_sets_chunk,
+        models.TEST_SET_KEY,
+        prev_results, suite_id, suite_name, tests_list, db_options)
+
+
+@taskc.app.task(
+    name="import-cases-from-suite",
+    ignore_result=False, add_to_parent=False, serializer="kbson")
 def import_test_cases_from_test_suite(
         prev_results,
         suite_id, suite_name, tests_list, db_options, mail_options):
@@ -142,46 +281,104 @@ def import_test_cases_from_test_suite(
     :type db_options: dict
     :param mail_options: The email system parameters.
     :type mail_options: dict
-    :return 200 if OK, 500 in case of errors; a dictionary with errors or an
-    empty one.
+    :return 200 if OK, 500 in case of errors.
     """
-    ret_val = 200
-    errors = {}
+    return _import_tests(
+        tests_import.import_multi_test_cases,
+        import_test_cases_chunk,
+        models.TEST_CASE_KEY,
+        prev_results, suite_id, suite_name, tests_list, db_options)
 
-    prev_val = prev_results[0]
-    other_args = prev_results[1]
 
-    if all([prev_val == 200, suite_id]):
-        test_ids, errors = tests_import.import_multi_test_cases(
-            tests_list, suite_id, suite_name, db_options, **other_args)
+@taskc.app.task(
+    name="import-test-sets-chunk", ignore_result=False, serializer="kbson")
+def import_test_sets_chunk(
+        tests_list, suite_id, suite_name, db_options, other_args):
+    """Import a chunk of the test sets of a test suite.
 
-        if test_ids:
-            utils.LOG.info(
-                "Updating test suite '%s' (%s) with test case IDs",
-                suite_name, str(suite_id))
-            database = utils.db.get_db_connection(db_options)
-            ret_val = utils.db.update(
-                database[models.TEST_SUITE_COLLECTION],
-                {models.ID_KEY: suite_id}, {models.TEST_CASE_KEY: test_ids})
-            if ret_val != 200:
-                ADD_ERR(
-                    errors,
-                    ret_val,
-                    "Error updating test suite '%s' with test case "
-                    "references" % (str(suite_id))
-                )
-        else:
-            ret_val = 500
-    else:
-        utils.LOG.warn(
-            "Error saving test suite '%s', will not import tests cases",
-            suite_name)
+    :param tests_list: The list of test sets to import.
+    :type tests_list: list
+    :param suite_id: The ID of the suite.
+    :type suite_id: bson.objectid.ObjectId
+    :param suite_name: The name of the test suite.
+    :type suite_name: str
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :param other_args: The values of the test suite references.
+    :type other_args: dict
+    :return A list with the saved test set IDs; a dictionary with errors or
+    an empty one.
+    """
+    return _import_chunk(
+        tests_import.import_multi_test_sets,
+        tests_list, suite_id, suite_name, db_options, other_args)
+
+
+@taskc.app.task(
+    name="import-test-cases-chunk", ignore_result=False, serializer="kbson")
+def import_test_cases_chunk(
+        tests_list, suite_id, suite_name, db_options, other_args):
+    """Import a chunk of the test cases of a test suite.
+
+    :param tests_list: The list of test cases to import.
+    :type tests_list: list
+    :param suite_id: The ID of the suite.
+    :type suite_id: bson.objectid.ObjectId
+    :param suite_name: The name of the test suite.
+    :type suite_name: str
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :param other_args: The values of the test suite references.
+    :type other_args: dict
+    :return A list with the saved test case IDs; a dictionary with errors or
+    an empty one.
+    """
+    return _import_chunk(
+        tests_import.import_multi_test_cases,
+        tests_list, suite_id, suite_name, db_options, other_args)
+
+
+@taskc.app.task(name="update-suite-references", ignore_result=False)
+def update_suite_references(results, suite_id, suite_name, key, db_options):
+    """Update the test suite with the test objects imported in chunks.
+
+    This is the callback of the chord that imports the chunks: the first
+    argument is the list of the chunks results.
+
+    :param results: The results of the chunk import tasks.
+    :type results: list
+    :param suite_id: The ID of the suite.
+    :type suite_id: bson.objectid.ObjectId
+    :param suite_name: The name of the test suite.
+    :type suite_name: str
+    :param key: The test suite key to update (test_set or test_case).
+    :type key: str
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :return 200 if OK, 500 in case of errors.
+    """
+    test_ids = []
+    errors = {}
+    for chunk_ids, chunk_errors in results:
+        test_ids.extend(chunk_ids)
+        # The error codes are strings once serialized.
+        utils.errors.update_errors(
+            errors,
+            dict(
+                (int(err_code), err_msgs)
+                for err_code, err_msgs in (chunk_errors or {}).iteritems()))
+
+    ret_val, update_errors = _update_suite_references(
+        suite_id, suite_name, key, test_ids, db_options)
+
+    utils.errors.update_errors(errors, update_errors)
+    _log_import_errors(errors, suite_id, suite_name, key)
 
-    # TODO: handle errors
     return ret_val
 
 
-@taskc.app.task(name="import-test-cases-from-set", ignore_result=False)
+@taskc.app.task(
+    name="import-test-cases-from-set", ignore_result=False, serializer="kbson")
 def import_test_cases_from_test_set(
         tests_list, suite_id, suite_name, set_id, db_options, mail_options):
     """Wrapper around the real import function.
@@ -0,0 +1,28 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tasks to maintain the uploaded files."""
+
+import taskqueue.celery as taskc
+
+import utils
+import utils.upload
+
+
+@taskc.app.task(name="collect-upload-objects", ack_late=True)
+def collect_upload_objects():
+    """Remove the stored upload objects that no file links anymore."""
+    removed = utils.upload.collect_objects()
+    utils.LOG.info("Removed %d unused upload objects", removed)
+
+    return removed
@@ -0,0 +1,110 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test module for the Celery serializers."""
+
+import bson
+import bson.tz_util
+import celery
+import datetime
+import kombu.serialization
+import unittest
+
+import taskqueue.celeryconfig as celeryconfig
+import taskqueue.serializer as serializer
+import taskqueue.tasks.test as ttest
+
+
+class TestBsonSerializer(unittest.TestCase):
+
+    def setUp(self):
+        self.suite_id = bson.objectid.ObjectId()
+        self.set_id = bson.objectid.ObjectId()
+        # BSON stores the milliseconds only.
+        self.created_on = datetime.datetime(
+            2016, 7, 1, 10, 20, 30, 123000, tzinfo=bson.tz_util.utc)
+        self.db_options = {"mongodb_host": "localhost"}
+
+        # A Celery 3.1 message body of a chunk task of a chord.
+        self.body = {
+            "task": ttest.import_test_sets_chunk.name,
+            "id": "task-id",
+            "args": [
+                [
+                    {
+                        "_id": self.set_id,
+                        "created_on": self.created_on,
+                        "name": "test-set"
+                    }
+                ],
+                self.suite_id,
+                "test-suite",
+                self.db_options,
+                {"build_id": bson.objectid.ObjectId()}
+            ],
+            "kwargs": {},
+            "retries": 0,
+            "eta": None,
+            "expires": None,
+            "utc": True,
+            "callbacks": None,
+            "errbacks": None,
+            "timelimit": (None, None),
+            "taskset": "group-id",
+            "chord": ttest.update_suite_references.s(
+                self.suite_id, "test-suite", "test_set", self.db_options)
+        }
+
+    def test_accept_content(self):
+        self.assertIn("kbson", celeryconfig.CELERY_ACCEPT_CONTENT)
+
+    def test_round_trip(self):
+        decoded = serializer.kernelci_bson_decoder(
+            serializer.kernelci_bson_encoder(self.body))
+
+        self.assertEqual(self.body["task"], decoded["task"])
+        self.assertListEqual(self.body["args"], decoded["args"])
+        self.assertIsInstance(decoded["args"][1], bson.objectid.ObjectId)
+
+        created_on = decoded["args"][0][0]["created_on"]
+        self.assertEqual(self.created_on, created_on)
+        self.assertEqual(
+            datetime.timedelta(0), created_on.tzinfo.utcoffset(created_on))
+        self.assertListEqual([None, None], decoded["timelimit"])
+
+    def test_round_trip_chord_callback(self):
+        decoded = serializer.kernelci_bson_decoder(
+            serializer.kernelci_bson_encoder(self.body))
+
+        callback = celery.signature(decoded["chord"])
+
+        self.assertEqual(ttest.update_suite_references.name, callback.task)
+        self.assertTupleEqual(
+            (self.suite_id, "test-suite", "test_set", self.db_options),
+            tuple(callback.args))
+        self.assertDictEqual({}, callback.kwargs)
+
+    def test_round_trip_kombu(self):
+        content_type, content_encoding, data = kombu.serialization.dumps(
+            self.body, serializer="kbson")
+
+        self.assertEqual("application/x-bson", content_type)
+        # As the worker does with the accepted content.
+        decoded = kombu.serialization.loads(
+            data, content_type, content_encoding,
+            accept=kombu.serialization.prepare_accept_content(
+                celeryconfig.CELERY_ACCEPT_CONTENT))
+
+        self.assertListEqual(self.body["args"], decoded["args"])
+        self.assertEqual(
+            self.body["chord"]["task"], decoded["chord"]["task"])
@@ -0,0 +1,207 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test module for the test suite import tasks."""
+
+import logging
+import mock
+import unittest
+
+import taskqueue.tasks.test as ttest
+
+
+class TestImportChunks(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.db_options = {"mongodb_host": "localhost"}
+        self.other_args = {"build_id": "build-id"}
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    @mock.patch("celery.chord")
+    @mock.patch("utils.tests_import.import_multi_test_cases")
+    def test_import_small_list(self, mock_import, mock_chord):
+        mock_import.return_value = (["id0"], {})
+
+        with mock.patch(
+                "taskqueue.tasks.test._update_suite_references") as mock_upd:
+            mock_upd.return_value = (200, {})
+
+            ret_val = ttest.import_test_cases_from_test_suite(
+                [200, self.other_args],
+                "suite-id", "suite", ["case"], self.db_options, {})
+
+        self.assertEqual(200, ret_val)
+        self.assertFalse(mock_chord.called)
+        mock_import.assert_called_once_with(
+            ["case"], "suite-id", "suite", self.db_options,
+            build_id="build-id")
+        mock_upd.assert_called_once_with(
+            "suite-id", "suite", "test_case", ["id0"], self.db_options)
+
+    @mock.patch("celery.chord")
+    def test_import_chunks(self, mock_chord):
+        tests_list = range(2 * ttest.IMPORT_CHUNK_SIZE + 1)
+
+        ret_val = ttest.import_test_sets_from_test_suite(
+            [200, self.other_args],
+            "suite-id", "suite", tests_list, self.db_options, {})
+
+        self.assertEqual(200, ret_val)
+
+        chunks = list(mock_chord.call_args[0][0])
+        self.assertEqual(3, len(chunks))
+        self.assertListEqual(
+            tests_list,
+            [test for chunk in chunks for test in chunk.args[0]])
+
+        for chunk in chunks:
+            self.assertEqual(ttest.import_test_sets_chunk.name, chunk.task)
+            self.assertTupleEqual(
+                ("suite-id", "suite", self.db_options, self.other_args),
+                chunk.args[1:])
+
+        self.assertListEqual(
+            [ttest.IMPORT_CHUNK_SIZE, ttest.IMPORT_CHUNK_SIZE, 1],
+            [len(chunk.args[0]) for chunk in chunks])
+
+        mock_chord.return_value.assert_called_once_with(
+            ttest.update_suite_references.s(
+                "suite-id", "suite", "test_set", self.db_options))
+
+    @mock.patch("celery.chord")
+    def test_import_chunks_suite_error(self, mock_chord):
+        ret_val = ttest.import_test_cases_from_test_suite(
+            [500, {}],
+            "suite-id", "suite", range(ttest.IMPORT_CHUNK_SIZE + 1),
+            self.db_options, {})
+
+        self.assertEqual(200, ret_val)
+        self.assertFalse(mock_chord.called)
+
+    @mock.patch("utils.tests_import.import_multi_test_sets")
+    def test_import_test_sets_chunk(self, mock_import):
+        mock_import.return_value = (["id0", "id1"], {400: ["error"]})
+
+        self.assertTupleEqual(
+            (["id0", "id1"], {400: ["error"]}),
+            ttest.import_test_sets_chunk(
+                ["set0", "set1"],
+                "suite-id", "suite", self.db_options, self.other_args))
+        mock_import.assert_called_once_with(
+            ["set0", "set1"], "suite-id", "suite", self.db_options,
+            build_id="build-id")
+
+    @mock.patch("utils.tests_import.import_multi_test_sets")
+    def test_import_test_sets_chunk_error(self, mock_import):
+        mock_import.side_effect = ValueError("boom")
+
+        test_ids, errors = ttest.import_test_sets_chunk(
+            ["set0", "set1"],
+            "suite-id", "suite", self.db_options, self.other_args)
+
+        self.assertListEqual([], test_ids)
+        self.assertListEqual([500], errors.keys())
+        self.assertEqual(1, len(errors[500]))
+        self.assertIn("boom", errors[500][0])
+
+    @mock.patch("utils.tests_import.import_multi_test_cases")
+    def test_import_test_cases_chunk(self, mock_import):
+        mock_import.return_value = (["id0"], {})
+
+        self.assertTupleEqual(
+            (["id0"], {}),
+            ttest.import_test_cases_chunk(
+                ["case0"], "suite-id", "suite", self.db_options, {}))
+        mock_import.assert_called_once_with(
+            ["case0"], "suite-id", "suite", self.db_options)
+
+    @mock.patch("utils.tests_import.import_multi_test_cases")
+    def test_import_test_cases_chunk_error(self, mock_import):
+        mock_import.side_effect = KeyError("boom")
+
+        test_ids, errors = ttest.import_test_cases_chunk(
+            ["case0"], "suite-id", "suite", self.db_options, {})
+
+        self.assertListEqual([], test_ids)
+        self.assertListEqual([500], errors.keys())
+        self.assertIn("boom", errors[500][0])
+
+
+class TestUpdateSuiteReferences(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.db_options = {"mongodb_host": "localhost"}
+
+        patched_update = mock.patch(
+            "taskqueue.tasks.test._update_suite_references")
+        self.update_refs = patched_update.start()
+        self.update_refs.return_value = (200, {})
+        self.addCleanup(patched_update.stop)
+
+        patched_log = mock.patch("taskqueue.tasks.test._log_import_errors")
+        self.log_errors = patched_log.start()
+        self.addCleanup(patched_log.stop)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_merge_results(self):
+        # The results as they are once serialized: lists and string keys.
+        results = [
+            [["id0", "id1"], {"400": ["error0"]}],
+            [["id2"], {"400": ["error1"], "500": ["error2"]}],
+            [["id3"], {}]
+        ]
+
+        ret_val = ttest.update_suite_references(
+            results, "suite-id", "suite", "test_case", self.db_options)
+
+        self.assertEqual(200, ret_val)
+        self.update_refs.assert_called_once_with(
+            "suite-id", "suite", "test_case",
+            ["id0", "id1", "id2", "id3"], self.db_options)
+        self.log_errors.assert_called_once_with(
+            {400: ["error0", "error1"], 500: ["error2"]},
+            "suite-id", "suite", "test_case")
+
+    def test_merge_failed_chunk(self):
+        results = [
+            [["id0"], None],
+            [[], {"500": ["error"]}]
+        ]
+        self.update_refs.return_value = (
+            500, {500: ["Error updating test suite"]})
+
+        ret_val = ttest.update_suite_references(
+            results, "suite-id", "suite", "test_set", self.db_options)
+
+        self.assertEqual(500, ret_val)
+        self.update_refs.assert_called_once_with(
+            "suite-id", "suite", "test_set", ["id0"], self.db_options)
+        self.log_errors.assert_called_once_with(
+            {500: ["error", "Error updating test suite"]},
+            "suite-id", "suite", "test_set")
+
+    def test_no_results(self):
+        self.update_refs.return_value = (500, {})
+
+        self.assertEqual(
+            500,
+            ttest.update_suite_references(
+                [], "suite-id", "suite", "test_set", self.db_options))
+        self.update_refs.assert_called_once_with(
+            "suite-id", "suite", "test_set", [], self.db_options)
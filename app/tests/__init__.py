@@ -26,15 +26,18 @@ def test_modules():
         "handlers.tests.test_batch_handler",
         "handlers.tests.test_bisect_handler",
         "handlers.tests.test_boot_handler",
+        "handlers.tests.test_boot_regressions_handler",
         "handlers.tests.test_boot_trigger_handler",
         "handlers.tests.test_build_handler",
         "handlers.tests.test_build_logs_handler",
         "handlers.tests.test_compare_handler",
         "handlers.tests.test_count_handler",
+        "handlers.tests.test_dbindexes",
         "handlers.tests.test_handler_response",
         "handlers.tests.test_job_handler",
         "handlers.tests.test_job_logs_handler",
         "handlers.tests.test_lab_handler",
+        "handlers.tests.test_metrics_handler",
         "handlers.tests.test_report_handler",
         "handlers.tests.test_send_handler",
         "handlers.tests.test_stats_handler",
@@ -43,6 +46,7 @@ def test_modules():
         "handlers.tests.test_test_suite_handler",
         "handlers.tests.test_token_handler",
         "handlers.tests.test_upload_handler",
+        "handlers.tests.test_upload_session_handler",
         "handlers.tests.test_version_handler",
         "models.tests.test_bisect_model",
         "models.tests.test_boot_model",
@@ -57,12 +61,15 @@ def test_modules():
         "models.tests.test_test_set_model",
         "models.tests.test_test_suite_model",
         "models.tests.test_token_model",
+        "taskqueue.tests.test_serializer",
+        "taskqueue.tests.test_test_tasks",
         "utils.batch.tests.test_batch_common",
         "utils.bisect.tests.test_bisect",
         "utils.boot.tests.test_boot_import",
         "utils.boot.tests.test_boot_regressions",
         "utils.build.tests.test_build_import",
         "utils.compare.tests.test_boot_compare",
+        "utils.compare.tests.test_compare_common",
         "utils.compare.tests.test_build_compare",
         "utils.compare.tests.test_job_compare",
         "utils.report.tests.test_boot_report",
@@ -70,8 +77,15 @@ def test_modules():
         "utils.report.tests.test_report_common",
         "utils.stats.tests.test_daily_stats",
         "utils.tests.test_base",
+        "utils.tests.test_cache",
+        "utils.tests.test_db",
+        "utils.tests.test_elf",
+        "utils.tests.test_instrumentation",
         "utils.tests.test_emails",
+        "utils.tests.test_indexadvisor",
+        "utils.tests.test_jsoncodec",
         "utils.tests.test_log_parser",
+        "utils.tests.test_metrics",
         "utils.tests.test_tests_import",
         "utils.tests.test_upload",
         "utils.tests.test_validator"
@@ -0,0 +1,67 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Helpers shared by the test cases."""
+
+import contextlib
+import mock
+
+import utils.instrumentation
+
+
+# pylint: disable=invalid-name
+class QueryBudgetMixin(object):
+    """Assert how many queries the tested code performs.
+
+    To be used with a `unittest.TestCase`.
+    """
+
+    @contextlib.contextmanager
+    def assertMaxQueries(self, max_queries, collection=None):
+        """Fail if the code in the context performs too many queries.
+
+        The queries performed through the `utils.db` functions are counted,
+        from any thread: also the ones run by the handlers executor.
+
+        :param max_queries: How many queries can be performed at most.
+        :type max_queries: int
+        :param collection: Count only the queries on this collection.
+        :type collection: str
+        """
+        recorder = utils.instrumentation.QueryRecorder(
+            "test", max_queries=None)
+
+        def _record_query(collection, operation, spec, duration, **kwargs):
+            recorder.record(collection, operation, spec, duration)
+
+        with mock.patch(
+                "utils.instrumentation.record_query", new=_record_query):
+            yield recorder
+
+        if collection is None:
+            count = recorder.count
+        else:
+            count = recorder.get_count(collection)
+
+        self.assertLessEqual(
+            count,
+            max_queries,
+            "%d queries performed, expected at most %d: %s" %
+            (
+                count,
+                max_queries,
+                ", ".join(
+                    "%s (%d)" % (name, stats["count"])
+                    for name, stats in sorted(recorder.collections.items()))
+            )
+        )
@@ -29,6 +29,7 @@ import handlers.job
 import handlers.boot_regressions
 import handlers.job_logs
 import handlers.lab
+import handlers.metrics
 import handlers.report
 import handlers.send
 import handlers.stats
@@ -37,6 +38,7 @@ import handlers.test_set
 import handlers.test_suite
 import handlers.token
 import handlers.upload
+import handlers.upload_session
 import handlers.version
 
 
@@ -156,6 +158,9 @@ _BISECT_URL = tornado.web.url(
 _LAB_URL = tornado.web.url(
     r"/lab[s]?/?(?P<id>.*)", handlers.lab.LabHandler, name="lab")
 
+_METRICS_URL = tornado.web.url(
+    r"/metrics/?$", handlers.metrics.MetricsHandler, name="metrics")
+
 _VERSION_URL = tornado.web.url(
     r"/version", handlers.version.VersionHandler, name="version")
 
@@ -165,6 +170,14 @@ _REPORT_URL = tornado.web.url(
 _UPLOAD_URL = tornado.web.url(
     r"/upload/?(?P<path>.*)", handlers.upload.UploadHandler, name="upload")
 
+_UPLOAD_SESSION_URL = tornado.web.url(
+    r"/upload/session/?$",
+    handlers.upload_session.UploadSessionHandler, name="upload-session")
+
+_UPLOAD_SESSION_ID_URL = tornado.web.url(
+    r"/upload/session/(?P<id>[A-Za-z0-9]{24})/?$",
+    handlers.upload_session.UploadSessionHandler, name="upload-session-id")
+
 _SEND_URL = tornado.web.url(r"/send/?", handlers.send.SendHandler, name="send")
 
 _TEST_SUITE_URL = tornado.web.url(
@@ -250,6 +263,7 @@ APP_URLS = [
     _JOB_LOGS_URL,
     _JOB_URL,
     _LAB_URL,
+    _METRICS_URL,
     _REPORT_URL,
     _SEND_URL,
     _STATS_URL,
@@ -263,6 +277,9 @@ APP_URLS = [
     _TEST_SUITE_DISTINCT_URL,
     _TEST_SUITE_URL,
     _TOKEN_URL,
+    # Must come before the generic upload URL.
+    _UPLOAD_SESSION_ID_URL,
+    _UPLOAD_SESSION_URL,
     _UPLOAD_URL,
     _VERSION_URL
 ]
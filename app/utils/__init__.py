@@ -16,6 +16,8 @@
 """Common functions, variables for all kernelci utils modules."""
 
 import bson
+import errno
+import os
 import re
 
 import models
@@ -51,6 +53,22 @@ VALID_TEST_NAME = re.compile(r"[^a-zA-Z0-9\.\-_+]")
 VALID_KCI_NAME = re.compile(r"[^a-zA-Z0-9\.\-_+=]")
 
 
+def remove_file_link(path):
+    """Remove a file before writing it again, if it exists.
+
+    The uploaded files can be links to an object shared with other files
+    (see `utils.upload`): they must be replaced, never written in place.
+
+    :param path: The path of the file.
+    :type path: str
+    """
+    try:
+        os.unlink(path)
+    except OSError, ex:
+        if ex.errno != errno.ENOENT:
+            raise
+
+
 def update_id_fields(spec):
     """Make sure ID fields are treated correctly.
 
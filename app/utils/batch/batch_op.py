@@ -85,6 +85,14 @@ class BatchOperation(object):
             self._database = utils.db.get_db_connection(self.db_options)
         return self._database
 
+    @database.setter
+    def database(self, value):
+        """Set the database connection to use.
+
+        :param value: The database connection.
+        """
+        self._database = value
+
     def prepare_operation(self):
         """Prepare the operation that needs to be performed.
 
@@ -252,6 +260,14 @@ class BatchCountOperation(BatchOperation):
                 self.valid_keys.get(self.method)
             ]
 
+    def get_count_spec(self):
+        """The spec used to count the documents.
+
+        :return The spec data structure (dictionary).
+        """
+        return hcount.get_count_spec(
+            self.query_args_func, self.valid_keys.get(self.method))
+
 
 class BatchTestCaseOperation(BatchOperation):
     """A batch operation for test cases."""
@@ -13,11 +13,41 @@
 
 """Common functions for batch operations."""
 
+import concurrent.futures
+import json
 import types
 
+import handlers.count as hcount
 import models
 import utils.batch.batch_op as batchop
 
+# How many batch operations are executed at the same time on the web node.
+BATCH_POOL_SIZE = 8
+
+# The pool where the fast batch operations are executed: it is separated
+# from the handlers executor since they are submitted from there.
+BATCH_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=BATCH_POOL_SIZE)
+
+# The query arguments whose values order changes the results: the sort
+# fields, and the arguments of which only the last value is used.
+ORDERED_QUERY_KEYS = frozenset([
+    models.AGGREGATE_KEY,
+    models.COMPARED_KEY,
+    models.CREATED_KEY,
+    models.DATE_RANGE_KEY,
+    models.EXPLAIN_KEY,
+    models.LIMIT_KEY,
+    models.SKIP_KEY,
+    models.SORT_KEY,
+    models.SORT_ORDER_KEY,
+    models.TIME_RANGE_KEY
+])
+
+# How a batch operation has been executed.
+IN_PROCESS_EXECUTION = "in-process"
+QUEUE_EXECUTION = "queue"
+
 
 def get_batch_query_args(query):
     """From a query string, retrieve the key-value pairs.
@@ -29,7 +59,8 @@ def get_batch_query_args(query):
 
         [?]key=value[&key=value&key=value...]
 
-    The values are then retrieved and stored in a set to avoid duplicates.
+    The values are then retrieved and stored in a list, in order and without
+    duplicates.
 
     :param query: The query string to analyze.
     :type query: string
@@ -49,17 +80,31 @@ def get_batch_query_args(query):
                 # Can't have query with just one element, they have to be
                 # key=value.
                 if len(arg) > 1:
-                    try:
-                        args[arg[0]].append(arg[1])
-                        args[arg[0]] = list(set(args[arg[0]]))
-                    except KeyError:
-                        args[arg[0]] = []
-                        args[arg[0]].append(arg[1])
+                    values = args.setdefault(arg[0], [])
+                    if arg[1] not in values:
+                        values.append(arg[1])
 
     return args
 
 
-def create_batch_operation(json_obj, db_options):
+def is_fast_operation(json_obj):
+    """Check if a batch operation is cheap enough to run on the web node.
+
+    Count and distinct operations only return a number or a list of values,
+    all the others can return whole documents.
+
+    :param json_obj: The JSON object of the batch operation.
+    :type json_obj: dict
+    :return True or False.
+    """
+    get_func = json_obj.get
+    return any([
+        get_func(models.RESOURCE_KEY, None) == models.COUNT_COLLECTION,
+        get_func(models.DISTINCT_KEY, None)
+    ])
+
+
+def create_batch_operation(json_obj, db_options, database=None):
     """Create a `BatchOperation` object from a JSON object.
 
     No validity checks are performed on the JSON object, it must be a valid
@@ -69,6 +114,8 @@ def create_batch_operation(json_obj, db_options):
     :type json_obj: dict
     :param db_options: The mongodb configuration parameters.
     :type db_options: dict
+    :param database: The database connection to use, if not specified a new
+    one is created with the `db_options`.
     :return A `BatchOperation` object, or None if the `BatchOperation` cannot
     be constructed.
     """
@@ -77,6 +124,8 @@ def create_batch_operation(json_obj, db_options):
 
     def _complete_batch_op():
         batch_op.db_options = db_options
+        if database is not None:
+            batch_op.database = database
         batch_op.query_args = get_batch_query_args(
             get_func(models.QUERY_KEY, None))
 
@@ -118,7 +167,91 @@ def create_batch_operation(json_obj, db_options):
     return batch_op
 
 
-def execute_batch_operation(json_obj, db_options):
+def get_operation_key(json_obj):
+    """Build a key that identifies what a batch operation does.
+
+    The operation ID is not considered and the values of the query arguments
+    are sorted, except for the `ORDERED_QUERY_KEYS` ones: operations with the
+    same key return the same results.
+
+    :param json_obj: The JSON object of the batch operation.
+    :type json_obj: dict
+    :return The key as a string.
+    """
+    get_func = json_obj.get
+    query_args = get_batch_query_args(get_func(models.QUERY_KEY, None))
+
+    return json.dumps(
+        {
+            models.DISTINCT_KEY: get_func(models.DISTINCT_KEY, None),
+            models.DOCUMENT_KEY: get_func(models.DOCUMENT_KEY, None),
+            models.METHOD_KEY: get_func(models.METHOD_KEY, None),
+            models.QUERY_KEY: {
+                key: val if key in ORDERED_QUERY_KEYS else sorted(val)
+                for key, val in query_args.iteritems()
+            },
+            models.RESOURCE_KEY: get_func(models.RESOURCE_KEY, None)
+        },
+        sort_keys=True
+    )
+
+
+def dedup_batch_operations(json_objs):
+    """Find the identical operations of a batch.
+
+    :param json_objs: The JSON objects of the batch operations.
+    :type json_objs: list
+    :return A 2-tuple: the list of the unique operations, and the list with,
+    for each operation, the index of its unique one.
+    """
+    unique_ops = []
+    indexes = []
+    seen = {}
+
+    for json_obj in json_objs:
+        key = get_operation_key(json_obj)
+        if key not in seen:
+            seen[key] = len(unique_ops)
+            unique_ops.append(json_obj)
+        indexes.append(seen[key])
+
+    return unique_ops, indexes
+
+
+def get_operation_result(result, json_obj):
+    """Get the result of a batch operation from the one of an identical one.
+
+    :param result: The result of the identical operation.
+    :param json_obj: The JSON object of the batch operation.
+    :type json_obj: dict
+    :return The result with the operation ID of the batch operation.
+    """
+    if isinstance(result, types.DictionaryType):
+        result = dict(result)
+        op_id = json_obj.get(models.OP_ID_KEY, None)
+        if op_id:
+            result[models.OP_ID_KEY] = op_id
+        else:
+            result.pop(models.OP_ID_KEY, None)
+
+    return result
+
+
+def run_batch_operation(batch_op):
+    """Run a batch operation.
+
+    :param batch_op: The batch operation to run.
+    :type batch_op: BatchOperation
+    :return The result of the operation execution, or None.
+    """
+    result = None
+    if batch_op:
+        result = batch_op.run()
+
+    return result
+
+
+def execute_batch_operation(json_obj, db_options, database=None):
     """Create and execute the batch op as defined in the JSON object.
 
     :param json_obj: The JSON object that will be used to create the batch
@@ -126,12 +259,92 @@ def execute_batch_operation(json_obj, db_options):
     :type json_obj: dict
     :param db_options: The mongodb database connection parameters.
     :type db_options: dict
+    :param database: The database connection to use.
     :return The result of the operation execution, or None.
     """
-    batch_op = create_batch_operation(json_obj, db_options)
+    return run_batch_operation(
+        create_batch_operation(json_obj, db_options, database=database))
 
-    result = None
-    if batch_op:
-        result = batch_op.run()
 
-    return result
+def get_count_groups(batch_ops):
+    """Find the count operations that can be performed together.
+
+    The count operations on the same collection are grouped if their specs
+    are compatible.
+
+    :param batch_ops: The batch operations.
+    :type batch_ops: list
+    :return A list of lists with the indexes of the grouped operations.
+    """
+    by_collection = {}
+    for idx, batch_op in enumerate(batch_ops):
+        if all([isinstance(batch_op, batchop.BatchCountOperation),
+                batch_op.document]):
+            by_collection.setdefault(batch_op.document, []).append(idx)
+
+    groups = []
+    for indexes in by_collection.itervalues():
+        if len(indexes) > 1:
+            specs = [batch_ops[idx].get_count_spec() for idx in indexes]
+            if hcount.get_grouped_count_spec(specs) is not None:
+                groups.append(indexes)
+
+    return groups
+
+
+def _run_count_group(batch_ops, futures):
+    """Run grouped count operations with a single aggregation.
+
+    :param batch_ops: The count operations, all on the same collection.
+    :type batch_ops: list
+    :param futures: Where to set the result of each operation.
+    :type futures: list
+    """
+    try:
+        document = batch_ops[0].document
+        counts = hcount.count_grouped(
+            batch_ops[0].database[document],
+            document, [batch_op.get_count_spec() for batch_op in batch_ops])
+
+        for batch_op, future, count in zip(batch_ops, futures, counts):
+            future.set_result(batch_op.prepare_response(count))
+    # pylint: disable=broad-except
+    except Exception, ex:
+        for future in futures:
+            future.set_exception(ex)
+
+
+def submit_batch_operations(json_objs, db_options, database=None):
+    """Execute the batch operations concurrently in this process.
+
+    The operations are submitted to the `BATCH_POOL`: the results have to be
+    retrieved from the returned futures. Compatible count operations on the
+    same collection are performed with a single aggregation.
+
+    :param json_objs: The JSON objects of the batch operations.
+    :type json_objs: list
+    :param db_options: The mongodb database connection parameters.
+    :type db_options: dict
+    :param database: The database connection to use.
+    :return A list of `Future` objects, in the same order of the operations.
+    """
+    batch_ops = [
+        create_batch_operation(json_obj, db_options, database=database)
+        for json_obj in json_objs
+    ]
+    futures = [None] * len(batch_ops)
+
+    for indexes in get_count_groups(batch_ops):
+        group_futures = [concurrent.futures.Future() for _ in indexes]
+        for idx, future in zip(indexes, group_futures):
+            futures[idx] = future
+
+        BATCH_POOL.submit(
+            _run_count_group,
+            [batch_ops[idx] for idx in indexes], group_futures)
+
+    for idx, batch_op in enumerate(batch_ops):
+        if futures[idx] is None:
+            futures[idx] = BATCH_POOL.submit(run_batch_operation, batch_op)
+
+    return futures
@@ -12,6 +12,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import mock
 import unittest
 
 from utils.batch.batch_op import (
@@ -27,7 +28,12 @@ from utils.batch.batch_op import (
 )
 from utils.batch.common import (
     create_batch_operation,
-    get_batch_query_args
+    dedup_batch_operations,
+    get_batch_query_args,
+    get_count_groups,
+    get_operation_key,
+    get_operation_result,
+    submit_batch_operations
 )
 
 
@@ -69,7 +75,7 @@ class TestBatch(unittest.TestCase):
 
     def test_get_batch_query_multiple_values(self):
         query = "bar=foo&foo=bar&bar=foo&foo=baz&bar=foo"
-        expected = {"foo": ["baz", "bar"], "bar": ["foo"]}
+        expected = {"foo": ["bar", "baz"], "bar": ["foo"]}
 
         self.assertEqual(expected, get_batch_query_args(query))
 
@@ -186,3 +192,196 @@ class TestBatch(unittest.TestCase):
         op = create_batch_operation(json_obj, {})
         self.assertIsInstance(op, BatchDistinctOperation)
         self.assertEqual("board", op.distinct)
+
+    def test_get_operation_key_same_query(self):
+        json_obj = {
+            "method": "GET",
+            "resource": "count",
+            "document": "boot",
+            "query": "job=foo&status=FAIL",
+            "operation_id": "foo"
+        }
+        other_obj = {
+            "method": "GET",
+            "resource": "count",
+            "document": "boot",
+            "query": "?status=FAIL&job=foo&job=foo",
+            "operation_id": "bar"
+        }
+
+        self.assertEqual(
+            get_operation_key(json_obj), get_operation_key(other_obj))
+
+    def test_get_operation_key_different_query(self):
+        json_obj = {
+            "method": "GET", "resource": "boot", "query": "status=FAIL"}
+        other_obj = {
+            "method": "GET", "resource": "boot", "query": "status=PASS"}
+
+        self.assertNotEqual(
+            get_operation_key(json_obj), get_operation_key(other_obj))
+
+    def test_get_operation_key_unordered_values(self):
+        json_obj = {
+            "method": "GET",
+            "resource": "boot",
+            "query": "board=foo&board=bar&field=job&field=kernel"
+        }
+        other_obj = {
+            "method": "GET",
+            "resource": "boot",
+            "query": "field=kernel&board=bar&field=job&board=foo"
+        }
+
+        self.assertEqual(
+            get_operation_key(json_obj), get_operation_key(other_obj))
+
+    def test_get_operation_key_ordered_values(self):
+        json_obj = {
+            "method": "GET",
+            "resource": "boot",
+            "query": "sort=board&sort=created_on"
+        }
+        other_obj = {
+            "method": "GET",
+            "resource": "boot",
+            "query": "sort=created_on&sort=board"
+        }
+
+        self.assertNotEqual(
+            get_operation_key(json_obj), get_operation_key(other_obj))
+
+    def test_get_batch_query_keeps_order(self):
+        query = "sort=created_on&sort=board&sort=created_on"
+        expected = {"sort": ["created_on", "board"]}
+
+        self.assertEqual(expected, get_batch_query_args(query))
+
+    def test_dedup_batch_operations(self):
+        json_objs = [
+            {"resource": "boot", "query": "job=foo", "operation_id": "0"},
+            {"resource": "job", "query": "job=foo", "operation_id": "1"},
+            {"resource": "boot", "query": "job=foo", "operation_id": "2"}
+        ]
+
+        unique_ops, indexes = dedup_batch_operations(json_objs)
+
+        self.assertEqual([json_objs[0], json_objs[1]], unique_ops)
+        self.assertEqual([0, 1, 0], indexes)
+
+    def test_get_operation_result(self):
+        result = {"operation_id": "foo", "result": [{"count": 1}]}
+
+        self.assertEqual(
+            {"operation_id": "bar", "result": [{"count": 1}]},
+            get_operation_result(result, {"operation_id": "bar"}))
+        self.assertEqual(
+            {"result": [{"count": 1}]}, get_operation_result(result, {}))
+        self.assertEqual("foo", result["operation_id"])
+        self.assertIsNone(get_operation_result(None, {}))
+
+    def test_get_count_groups(self):
+        json_objs = [
+            {"method": "GET", "resource": "count", "document": "boot",
+             "query": "job=foo"},
+            {"method": "GET", "resource": "boot", "query": "job=foo"},
+            {"method": "GET", "resource": "count", "document": "boot",
+             "query": "job=foo&status=FAIL"},
+            {"method": "GET", "resource": "count", "document": "job",
+             "query": "job=foo"}
+        ]
+        batch_ops = [
+            create_batch_operation(json_obj, {}) for json_obj in json_objs]
+
+        self.assertEqual([[0, 2]], get_count_groups(batch_ops))
+
+    def test_get_count_groups_not_compatible(self):
+        json_objs = [
+            {"method": "GET", "resource": "count", "document": "boot",
+             "query": "status=PASS&status=FAIL"},
+            {"method": "GET", "resource": "count", "document": "boot",
+             "query": "job=foo"}
+        ]
+        batch_ops = [
+            create_batch_operation(json_obj, {}) for json_obj in json_objs]
+
+        self.assertEqual([], get_count_groups(batch_ops))
+
+    def test_submit_batch_operations_grouped_counts(self):
+        database = mock.MagicMock()
+        database["boot"].aggregate.return_value = {
+            "result": [
+                {"_id": {"status": "FAIL"}, "count": 2},
+                {"_id": {"status": "PASS"}, "count": 3},
+                {"_id": {}, "count": 1}
+            ]
+        }
+        json_objs = [
+            {"method": "GET", "resource": "count", "document": "boot",
+             "query": "job=foo", "operation_id": "all"},
+            {"method": "GET", "resource": "count", "document": "boot",
+             "query": "job=foo&status=FAIL", "operation_id": "fail"}
+        ]
+
+        futures = submit_batch_operations(json_objs, {}, database=database)
+        results = [future.result() for future in futures]
+
+        self.assertEqual(1, database["boot"].aggregate.call_count)
+        pipeline = database["boot"].aggregate.call_args[0][0]
+        self.assertEqual({"$match": {"job": "foo"}}, pipeline[0])
+        self.assertEqual(
+            {"status": "$status"}, pipeline[1]["$group"]["_id"])
+        self.assertEqual(
+            {
+                "operation_id": "all",
+                "result": [{"collection": "boot", "count": 6}]
+            },
+            results[0]
+        )
+        self.assertEqual(
+            {
+                "operation_id": "fail",
+                "result": [{"collection": "boot", "count": 2}]
+            },
+            results[1]
+        )
+
+    def test_submit_batch_operations_grouped_counts_array(self):
+        database = mock.MagicMock()
+        database["test_case"].aggregate.return_value = {
+            "result": [
+                {"_id": {"name": ["foo", "bar"]}, "count": 2},
+                {"_id": {"name": "foo"}, "count": 3},
+                {"_id": {"name": []}, "count": 1}
+            ]
+        }
+        json_objs = [
+            {"method": "GET", "resource": "count", "document": "test_case",
+             "query": "name=foo", "operation_id": "foo"},
+            {"method": "GET", "resource": "count", "document": "test_case",
+             "query": "name=bar", "operation_id": "bar"}
+        ]
+
+        futures = submit_batch_operations(json_objs, {}, database=database)
+        results = [future.result() for future in futures]
+
+        self.assertEqual(1, database["test_case"].aggregate.call_count)
+        self.assertEqual(
+            [{"collection": "test_case", "count": 5}], results[0]["result"])
+        self.assertEqual(
+            [{"collection": "test_case", "count": 2}], results[1]["result"])
+
+    def test_submit_batch_operations_error(self):
+        database = mock.MagicMock()
+        database["boot"].aggregate.side_effect = ValueError("foo")
+        json_objs = [
+            {"method": "GET", "resource": "count", "document": "boot",
+             "query": "job=foo"},
+            {"method": "GET", "resource": "count", "document": "boot",
+             "query": "job=bar"}
+        ]
+
+        futures = submit_batch_operations(json_objs, {}, database=database)
+
+        for future in futures:
+            self.assertRaises(ValueError, future.result)
@@ -30,6 +30,7 @@ import re
 import models
 import models.boot as mboot
 import utils
+import utils.cache
 import utils.db
 import utils.errors
 
@@ -50,6 +51,38 @@ NON_NULL_KEYS = [
     models.KERNEL_KEY
 ]
 
+# Fields needed to update a previous boot document.
+PREV_BOOT_FIELDS = [
+    models.CREATED_KEY,
+    models.ID_KEY
+]
+
+# Fields of the build document used to update the boot document.
+BUILD_REF_FIELDS = [
+    models.COMPILER_KEY,
+    models.COMPILER_VERSION_EXT_KEY,
+    models.COMPILER_VERSION_FULL_KEY,
+    models.COMPILER_VERSION_KEY,
+    models.CROSS_COMPILE_KEY,
+    models.GIT_BRANCH_KEY,
+    models.GIT_COMMIT_KEY,
+    models.GIT_DESCRIBE_KEY,
+    models.GIT_URL_KEY,
+    models.ID_KEY,
+    models.JOB_ID_KEY,
+    models.KERNEL_IMAGE_SIZE_KEY
+]
+
+# Short-lived cache of the job and build documents referenced by boot
+# reports: the same job and build are usually referenced by many boots
+# from different labs within minutes.
+# How long, in seconds, an entry is valid.
+REF_CACHE_TTL = 60
+# Maximum number of entries: the cache is emptied when it grows bigger.
+REF_CACHE_SIZE = 2048
+REF_CACHE = utils.cache.TTLCache(
+    REF_CACHE_TTL, REF_CACHE_SIZE, name="boot-references")
+
 # Local error function.
 ERR_ADD = utils.errors.add_error
 
@@ -62,20 +95,14 @@ class BootValidationError(ValueError, BootImportError):
     """General error for values of boot data."""
 
 
-def save_or_update(boot_doc, database, errors):
-    """Save or update the document in the database.
-
-    Check if we have a document available in the db, and in case perform an
-    update on it.
+def _get_boot_spec(boot_doc):
+    """Create the spec to search a previous boot document.
 
-    :param boot_doc: The boot document to save.
-    :type boot_doc: BaseDocument
-    :param database: The database connection.
-    :param errors: Where errors should be stored.
-    :type errors: dict
-    :return The save action return code and the doc ID.
+    :param boot_doc: The boot document.
+    :type boot_doc: BootDocument
+    :return The spec as a dictionary.
     """
-    spec = {
+    return {
         models.ARCHITECTURE_KEY: boot_doc.arch,
         models.BOARD_KEY: boot_doc.board,
         models.DEFCONFIG_FULL_KEY: (
@@ -86,13 +113,45 @@ def save_or_update(boot_doc, database, errors):
         models.LAB_NAME_KEY: boot_doc.lab_name
     }
 
-    fields = [
-        models.CREATED_KEY,
-        models.ID_KEY,
-    ]
 
+def _save_error(boot_doc, ret_val, errors):
+    """Add the error for a boot document that could not be saved.
+
+    :param boot_doc: The boot document.
+    :type boot_doc: BootDocument
+    :param ret_val: The return value of the save operation.
+    :type ret_val: int
+    :param errors: Where errors should be stored.
+    :type errors: dict
+    """
+    err_msg = (
+        "Error saving/updating boot report in the database "
+        "for '%s-%s-%s (%s, %s)'" %
+        (
+            boot_doc.job,
+            boot_doc.kernel,
+            boot_doc.defconfig_full, boot_doc.arch, boot_doc.board
+        )
+    )
+    ERR_ADD(errors, ret_val, err_msg)
+
+
+def save_or_update(boot_doc, database, errors):
+    """Save or update the document in the database.
+
+    Check if we have a document available in the db, and in case perform an
+    update on it.
+
+    :param boot_doc: The boot document to save.
+    :type boot_doc: BaseDocument
+    :param database: The database connection.
+    :param errors: Where errors should be stored.
+    :type errors: dict
+    :return The save action return code and the doc ID.
+    """
     prev_doc = utils.db.find_one2(
-        database[models.BOOT_COLLECTION], spec, fields=fields)
+        database[models.BOOT_COLLECTION],
+        _get_boot_spec(boot_doc), fields=PREV_BOOT_FIELDS)
 
     if prev_doc:
         doc_get = prev_doc.get
@@ -106,20 +165,79 @@ def save_or_update(boot_doc, database, errors):
         ret_val, doc_id = utils.db.save(database, boot_doc, manipulate=True)
 
     if ret_val == 500:
-        err_msg = (
-            "Error saving/updating boot report in the database "
-            "for '%s-%s-%s (%s, %s)'" %
-            (
-                boot_doc.job,
-                boot_doc.kernel,
-                boot_doc.defconfig_full, boot_doc.arch, boot_doc.board
-            )
-        )
-        ERR_ADD(errors, ret_val, err_msg)
+        _save_error(boot_doc, ret_val, errors)
 
     return ret_val, doc_id
 
 
+def save_or_update_all(boot_docs, database, errors):
+    """Save or update many boot documents in the database.
+
+    The previous boot documents are searched with a single query, the new
+    documents are then inserted in bulk, while the previous ones are updated
+    one by one.
+
+    :param boot_docs: The boot documents to save.
+    :type boot_docs: list
+    :param database: The database connection.
+    :param errors: Where errors should be stored.
+    :type errors: dict
+    :return A list of 2-tuples with the save action return code and the doc
+    ID, in the same order of the boot documents.
+    """
+    specs = [_get_boot_spec(b) for b in boot_docs]
+    prev_docs = utils.db.find_by_specs(
+        database[models.BOOT_COLLECTION], specs, fields=PREV_BOOT_FIELDS)
+
+    to_insert = []
+    to_update = []
+    # The same boot might be reported more than once in the same batch:
+    # only the first one gets inserted, the others will update it.
+    first_seen = {}
+    for boot_doc, spec, prev_doc in zip(boot_docs, specs, prev_docs):
+        if prev_doc:
+            boot_doc.id = prev_doc.get(models.ID_KEY)
+            boot_doc.created_on = prev_doc.get(models.CREATED_KEY)
+            to_update.append(boot_doc)
+        else:
+            spec_key = tuple(sorted(spec.iteritems()))
+            if spec_key in first_seen:
+                to_update.append((boot_doc, first_seen[spec_key]))
+            else:
+                first_seen[spec_key] = boot_doc
+                to_insert.append(boot_doc)
+
+    results = {}
+    if to_insert:
+        _, doc_ids = utils.db.insert_all(database, to_insert)
+        for boot_doc, doc_id in zip(to_insert, doc_ids):
+            if doc_id:
+                boot_doc.id = doc_id
+                results[id(boot_doc)] = (201, doc_id)
+            else:
+                _save_error(boot_doc, 500, errors)
+                results[id(boot_doc)] = (500, None)
+
+    for boot_doc in to_update:
+        if isinstance(boot_doc, tuple):
+            boot_doc, first_doc = boot_doc
+            boot_doc.id = first_doc.id
+            boot_doc.created_on = first_doc.created_on
+
+        if boot_doc.id:
+            utils.LOG.info(
+                "Updating boot document with id '%s'", boot_doc.id)
+            ret_val, _ = utils.db.save(database, boot_doc)
+        else:
+            ret_val = 500
+
+        if ret_val == 500:
+            _save_error(boot_doc, ret_val, errors)
+        results[id(boot_doc)] = (ret_val, boot_doc.id)
+
+    return [results[id(b)] for b in boot_docs]
+
+
 def save_to_disk(boot_doc, json_obj, base_path, errors):
     """Save the provided boot report to disk.
 
@@ -152,6 +270,7 @@ def save_to_disk(boot_doc, json_obj, base_path, errors):
                 if ex.errno != errno.EEXIST:
                     raise ex
 
+        utils.remove_file_link(file_path)
         with io.open(file_path, mode="w") as write_json:
             write_json.write(
                 unicode(
@@ -298,43 +417,43 @@ def _check_for_null(board_dict):
                 .format(key, val))
 
 
-def _update_boot_doc_ids(boot_doc, database):
-    """Update boot document job and build IDs references.
+def _get_build_spec(boot_doc):
+    """Create the spec to search the build of a boot document.
 
-    :param boot_doc: The boot document to update.
+    :param boot_doc: The boot document.
     :type boot_doc: BootDocument
-    :param database: The database connection to use.
+    :return The spec as a dictionary.
     """
-    job = boot_doc.job
-    kernel = boot_doc.kernel
-    defconfig = boot_doc.defconfig
-    defconfig_full = boot_doc.defconfig_full
-    arch = boot_doc.arch
-
-    job_doc = utils.db.find_one2(
-        database[models.JOB_COLLECTION],
-        {models.JOB_KEY: job, models.KERNEL_KEY: kernel}
-    )
-
     build_spec = {
-        models.ARCHITECTURE_KEY: arch,
-        models.DEFCONFIG_KEY: defconfig,
-        models.JOB_KEY: job,
-        models.KERNEL_KEY: kernel
+        models.ARCHITECTURE_KEY: boot_doc.arch,
+        models.DEFCONFIG_KEY: boot_doc.defconfig,
+        models.JOB_KEY: boot_doc.job,
+        models.KERNEL_KEY: boot_doc.kernel
     }
 
-    if defconfig_full:
-        build_spec[models.DEFCONFIG_FULL_KEY] = defconfig_full
+    if boot_doc.defconfig_full:
+        build_spec[models.DEFCONFIG_FULL_KEY] = boot_doc.defconfig_full
+
+    return build_spec
 
-    build_doc = utils.db.find_one2(
-        database[models.BUILD_COLLECTION], build_spec)
 
+def _set_boot_doc_ids(boot_doc, job_doc, build_doc):
+    """Set the job and build references of a boot document.
+
+    :param boot_doc: The boot document to update.
+    :type boot_doc: BootDocument
+    :param job_doc: The job document of the boot, or None.
+    :type job_doc: dict
+    :param build_doc: The build document of the boot, or None.
+    :type build_doc: dict
+    """
     if job_doc:
         boot_doc.job_id = job_doc.get(models.ID_KEY, None)
     else:
         utils.LOG.warn(
             "No job document found for boot %s-%s-%s (%s)",
-            job, kernel, defconfig_full, arch)
+            boot_doc.job,
+            boot_doc.kernel, boot_doc.defconfig_full, boot_doc.arch)
 
     if build_doc:
         doc_get = build_doc.get
@@ -372,7 +491,86 @@ def _update_boot_doc_ids(boot_doc, database):
     else:
         utils.LOG.warn(
             "No build document found for boot %s-%s-%s (%s)",
-            job, kernel, defconfig_full, arch)
+            boot_doc.job,
+            boot_doc.kernel, boot_doc.defconfig_full, boot_doc.arch)
+
+
+def _update_boot_doc_ids(boot_doc, database):
+    """Update boot document job and build IDs references.
+
+    :param boot_doc: The boot document to update.
+    :type boot_doc: BootDocument
+    :param database: The database connection to use.
+    """
+    job_doc = utils.db.find_one2(
+        database[models.JOB_COLLECTION],
+        {models.JOB_KEY: boot_doc.job, models.KERNEL_KEY: boot_doc.kernel}
+    )
+
+    build_doc = utils.db.find_one2(
+        database[models.BUILD_COLLECTION], _get_build_spec(boot_doc))
+
+    _set_boot_doc_ids(boot_doc, job_doc, build_doc)
+
+
+def _get_ref_cache_key(boot_doc):
+    """The key used to store job and build references in the local cache.
+
+    :param boot_doc: The boot document.
+    :type boot_doc: BootDocument
+    :return A 4-tuple: job, kernel, arch and defconfig_full values.
+    """
+    return (
+        boot_doc.job,
+        boot_doc.kernel, boot_doc.arch, boot_doc.defconfig_full)
+
+
+def _update_boot_docs_ids(boot_docs, database):
+    """Update the job and build IDs references of many boot documents.
+
+    The references are first looked up in a short-lived in-process cache,
+    then all the missing jobs and builds are searched with one query each.
+
+    :param boot_docs: The boot documents to update.
+    :type boot_docs: list
+    :param database: The database connection to use.
+    """
+    to_search = []
+    for boot_doc in boot_docs:
+        cached = REF_CACHE.get(_get_ref_cache_key(boot_doc))
+        if cached:
+            _set_boot_doc_ids(boot_doc, cached[0], cached[1])
+        else:
+            to_search.append(boot_doc)
+
+    if to_search:
+        jobs = set((b.job, b.kernel) for b in to_search)
+        job_docs = {}
+        for doc in utils.db.find(
+                database[models.JOB_COLLECTION],
+                0,
+                0,
+                spec={
+                    models.JOB_KEY: {"$in": list(set(j[0] for j in jobs))},
+                    models.KERNEL_KEY: {"$in": list(set(j[1] for j in jobs))}
+                },
+                fields=[models.ID_KEY, models.JOB_KEY, models.KERNEL_KEY]):
+            job_docs.setdefault(
+                (doc[models.JOB_KEY], doc[models.KERNEL_KEY]), doc)
+
+        build_docs = utils.db.find_by_specs(
+            database[models.BUILD_COLLECTION],
+            [_get_build_spec(b) for b in to_search], fields=BUILD_REF_FIELDS)
+
+        for boot_doc, build_doc in zip(to_search, build_docs):
+            job_doc = job_docs.get((boot_doc.job, boot_doc.kernel), None)
+            _set_boot_doc_ids(boot_doc, job_doc, build_doc)
+
+            # Cache only what has been found: missing documents might be
+            # imported in the meantime.
+            if all([job_doc, build_doc]):
+                REF_CACHE.set(
+                    _get_ref_cache_key(boot_doc), (job_doc, build_doc))
 
 
 def _parse_boot_from_json(boot_json, database, errors):
@@ -386,6 +584,24 @@ def _parse_boot_from_json(boot_json, database, errors):
     :return A `models.boot.BootDocument` instance, or None if the JSON cannot
     be parsed correctly.
     """
+    boot_doc = _create_boot_doc(boot_json, errors)
+    if boot_doc:
+        _update_boot_doc_ids(boot_doc, database)
+    return boot_doc
+
+
+def _create_boot_doc(boot_json, errors):
+    """Create the boot document from a JSON object.
+
+    The job and build references of the document are not looked up.
+
+    :param boot_json: The JSON object.
+    :type boot_json: dict
+    :param errors: Where to store the errors.
+    :type errors: dict
+    :return A `models.boot.BootDocument` instance, or None if the JSON cannot
+    be parsed correctly.
+    """
     if not boot_json:
         return None
 
@@ -424,7 +640,6 @@ def _parse_boot_from_json(boot_json, database, errors):
     boot_doc.created_on = datetime.datetime.now(
         tz=bson.tz_util.utc)
     _update_boot_doc_from_json(boot_doc, boot_json, errors)
-    _update_boot_doc_ids(boot_doc, database)
     return boot_doc
 
 
@@ -461,3 +676,50 @@ def import_and_save_boot(json_obj, db_options, base_path=utils.BASE_PATH):
         ERR_ADD(errors, 500, "Error connecting to the database")
 
     return ret_code, doc_id, errors
+
+
+def import_and_save_boots(json_objs, db_options, base_path=utils.BASE_PATH):
+    """Import and save many boot reports at once.
+
+    Like `import_and_save_boot`, but the job and build references of all the
+    reports are resolved in batch, and the new boot documents are inserted
+    with bulk operations.
+
+    :param json_objs: The JSON objects of the boot reports.
+    :type json_objs: list
+    :param db_options: The mongodb database connection parameters.
+    :type db_options: dict
+    :param base_path: The base path where to store the boot reports.
+    :type base_path: str
+    :return A list of 2-tuples with the save action return code and the doc
+    ID (one for each JSON object, None values if the report is not valid),
+    and the errors.
+    """
+    results = [(None, None)] * len(json_objs)
+    errors = {}
+
+    try:
+        database = utils.db.get_db_connection(db_options)
+
+        parsed = []
+        for idx, json_obj in enumerate(json_objs):
+            doc = _create_boot_doc(copy.deepcopy(json_obj), errors)
+            if doc:
+                parsed.append((idx, doc))
+
+        if parsed:
+            boot_docs = [parsed_doc for _, parsed_doc in parsed]
+            _update_boot_docs_ids(boot_docs, database)
+
+            saved = save_or_update_all(boot_docs, database, errors)
+            for (idx, doc), result in zip(parsed, saved):
+                results[idx] = result
+                save_to_disk(doc, json_objs[idx], base_path, errors)
+        else:
+            utils.LOG.warn("No boot report imported nor saved")
+    except pymongo.errors.ConnectionFailure, ex:
+        utils.LOG.exception(ex)
+        utils.LOG.error("Error getting database connection")
+        ERR_ADD(errors, 500, "Error connecting to the database")
+
+    return results, errors
@@ -14,22 +14,49 @@
 """Logic to find regressions in boot reports."""
 
 import bson
-import redis
+import pymongo
+import time
 
 import models
 import utils
 import utils.database.redisdb as redisdb
 import utils.db
+import utils.metrics
 
-# How the key to access the regressions data structure is formatted.
-# Done in this way so that we can use mongodb dot notation to access embedded
-# documents.
+# How the key that identifies a regression is formatted.
+# Its components are, in order: lab name, architecture, board name, board
+# instance, defconfig full and compiler.
 REGRESSION_FMT = "{:s}.{:s}.{:s}.{:s}.{:s}.{:s}"
-# The real data structure is accessed with the name of the key followed by
-# the rest of the embedded document key.
-REGRESSION_DOT_FMT = "{:s}.{:s}"
-# Lock key format for the Redis lock.
-LOCK_KEY_FMT = "boot-regressions-{:s}-{:s}"
+# How many times to retry tracking a regression when another process
+# created the same regression document in the meantime.
+TRACK_RETRIES = 3
+
+# Names of the histograms with the regression tracking timings.
+TRACK_ATTEMPTS_METRIC = "boot-regressions-track-attempts"
+TRACK_HOLD_METRIC = "boot-regressions-track-time"
+TRACK_WAIT_METRIC = "boot-regressions-track-wait-time"
+TRACK_ATTEMPTS_BUCKETS = tuple(xrange(1, TRACK_RETRIES + 1))
+
+# The unique index on the regressions stored by key: the concurrent creation
+# of the same regression document relies on it.
+REGRESSIONS_BY_KEY_INDEX = [
+    (models.JOB_KEY, pymongo.ASCENDING),
+    (models.KERNEL_KEY, pymongo.DESCENDING),
+    (models.REGRESSION_KEY_KEY, pymongo.ASCENDING)
+]
+
+# The fields a previous boot report must share with a failed one.
+PREVIOUS_BOOT_KEYS = [
+    models.ARCHITECTURE_KEY,
+    models.BOARD_INSTANCE_KEY,
+    models.BOARD_KEY,
+    models.COMPILER_VERSION_EXT_KEY,
+    models.DEFCONFIG_FULL_KEY,
+    models.DEFCONFIG_KEY,
+    models.GIT_BRANCH_KEY,
+    models.JOB_KEY,
+    models.LAB_NAME_KEY
+]
 
 
 def sanitize_key(key):
@@ -120,18 +147,124 @@ def gen_regression_keys(regressions):
                             )
 
 
+def get_nested_regressions(key, regr_doc):
+    """Get the regressions list of a key from an old nested document.
+
+    :param key: The regression key.
+    :type key: str
+    :param regr_doc: The old regressions document, with the nested data
+    structure.
+    :type regr_doc: dict
+    :return list The regressions for the key, an empty list if not found.
+    """
+    regr = []
+    regressions = regr_doc.get(models.REGRESSIONS_KEY, None)
+
+    if regressions:
+        regr = get_regressions_by_key(key, regressions)
+
+    return regr
+
+
+def migrate_nested_regressions(database):
+    """Move the regressions of the old nested documents to the flat ones.
+
+    Each regression of the old documents becomes a flat document, unless one
+    with the same job, kernel and regression key already exists. The boot
+    reports indexed with an old document are then pointed to the new ones.
+    The old documents are left in place.
+
+    :param database: The database connection.
+    :return int The number of created regression documents.
+    """
+    created = 0
+    by_key = database[models.BOOT_REGRESSIONS_BY_KEY_COLLECTION]
+    by_boot = database[models.BOOT_REGRESSIONS_BY_BOOT_COLLECTION]
+
+    old_docs = utils.db.find(
+        database[models.BOOT_REGRESSIONS_COLLECTION], 0, 0)
+
+    for old_doc in old_docs:
+        regressions = old_doc.get(models.REGRESSIONS_KEY, None) or {}
+
+        for regr_key in gen_regression_keys(regressions):
+            regr_docs = get_regressions_by_key(regr_key, regressions)
+            if not regr_docs:
+                continue
+
+            spec = {
+                models.JOB_KEY: old_doc.get(models.JOB_KEY),
+                models.KERNEL_KEY: old_doc.get(models.KERNEL_KEY),
+                models.REGRESSION_KEY_KEY: regr_key
+            }
+
+            new_doc = utils.db.find_one2(by_key, spec, fields=[models.ID_KEY])
+            if new_doc:
+                doc_id = new_doc[models.ID_KEY]
+            else:
+                regr_doc = _create_regression_doc(
+                    regr_docs[-1], regr_key, regr_docs)
+                regr_doc.update(spec)
+
+                ret_val, doc_id = utils.db.save2(
+                    database, models.BOOT_REGRESSIONS_BY_KEY_COLLECTION,
+                    regr_doc)
+                if ret_val == 201:
+                    created += 1
+
+            if doc_id:
+                utils.db.update(
+                    by_boot,
+                    {
+                        models.BOOT_ID_KEY: {
+                            "$in": [
+                                regr.get(models.ID_KEY) for regr in regr_docs]
+                        },
+                        models.BOOT_REGRESSIONS_ID_KEY: old_doc[models.ID_KEY]
+                    },
+                    {models.BOOT_REGRESSIONS_ID_KEY: doc_id},
+                    multi=True
+                )
+
+    utils.LOG.info("Created %d boot regression documents", created)
+
+    return created
+
+
+def nest_regressions(regr_docs):
+    """Create the nested regressions data structure from the flat documents.
+
+    The nested keys are, in order: lab name, architecture, board name, board
+    instance, defconfig full and compiler. The regressions list is the value
+    of the compiler key.
+
+    :param regr_docs: The flat regression documents.
+    :type regr_docs: list
+    :return dict The nested regressions data structure.
+    """
+    regressions = {}
+
+    for regr_doc in regr_docs:
+        nested = regressions
+        keys = regr_doc[models.REGRESSION_KEY_KEY].split(".")
+
+        for key in keys[:-1]:
+            nested = nested.setdefault(key, {})
+        nested[keys[-1]] = regr_doc[models.REGRESSIONS_KEY]
+
+    return regressions
+
+
 def check_prev_regression(last_boot, prev_boot, db_options):
     """Check if we have a previous regression document.
 
-    Make sure that the boot we are looking for already has a key in a
-    regression document.
+    Make sure that the boot we are looking for already has a regression
+    document in the job and kernel of the previous boot report.
 
     It will return a 2-tuple:
     - (None, None) if nothing is found;
-    - (regr_doc_id, None) if we already have a regression document, but the
-      boot report is not tracked in there;
-    - (regr_doc_id, regr_list) if we have a regressions document and the boot
-      report is already tracked.
+    - (regr_doc_id, regr_list) if we have a regression document for the
+      boot report.
 
     :param last_boot: The boot we are looking at.
     :type last_boot: dict
@@ -147,30 +280,76 @@ def check_prev_regression(last_boot, prev_boot, db_options):
 
     spec = {
         models.JOB_KEY: p_get(models.JOB_KEY),
-        models.KERNEL_KEY: p_get(models.KERNEL_KEY)
+        models.KERNEL_KEY: p_get(models.KERNEL_KEY),
+        models.REGRESSION_KEY_KEY: create_regressions_key(last_boot)
     }
-    if prev_boot[models.JOB_ID_KEY]:
+    if p_get(models.JOB_ID_KEY):
         spec[models.JOB_ID_KEY] = p_get(models.JOB_ID_KEY)
 
     prev_regr_doc = utils.db.find_one3(
-        models.BOOT_REGRESSIONS_COLLECTION, spec, db_options=db_options)
+        models.BOOT_REGRESSIONS_BY_KEY_COLLECTION, spec,
+        fields=[models.ID_KEY, models.REGRESSIONS_KEY], db_options=db_options)
 
     if prev_regr_doc:
-        prev_regr = prev_regr_doc[models.REGRESSIONS_KEY]
-
-        boot_regr_key = create_regressions_key(last_boot)
-        if boot_regr_key in gen_regression_keys(prev_regr):
-            ret_val = (prev_regr_doc[models.ID_KEY], prev_regr)
-        else:
-            ret_val = (prev_regr_doc[models.ID_KEY], None)
+        ret_val = (
+            prev_regr_doc[models.ID_KEY],
+            prev_regr_doc[models.REGRESSIONS_KEY]
+        )
+    else:
+        # The regression might still be in an old nested document, if the
+        # migration did not run yet.
+        regr_key = spec.pop(models.REGRESSION_KEY_KEY)
+        prev_regr_doc = utils.db.find_one3(
+            models.BOOT_REGRESSIONS_COLLECTION, spec,
+            fields=[models.ID_KEY, models.REGRESSIONS_KEY],
+            db_options=db_options)
+
+        if prev_regr_doc:
+            regr_docs = get_nested_regressions(regr_key, prev_regr_doc)
+            if regr_docs:
+                ret_val = (prev_regr_doc[models.ID_KEY], regr_docs)
 
     return ret_val
 
 
-# pylint: disable=too-many-locals
+def _create_regression_doc(boot_doc, regr_key, regr_docs):
+    """Create the flat regression document for a boot report.
+
+    :param boot_doc: The boot document where we have a regression.
+    :type boot_doc: dict
+    :param regr_key: The regression key of the boot document.
+    :type regr_key: str
+    :param regr_docs: The boot reports tracked in the regression.
+    :type regr_docs: list
+    :return dict The regression document.
+    """
+    b_get = boot_doc.get
+
+    return {
+        models.ARCHITECTURE_KEY: b_get(models.ARCHITECTURE_KEY),
+        models.BOARD_INSTANCE_KEY: b_get(models.BOARD_INSTANCE_KEY),
+        models.BOARD_KEY: b_get(models.BOARD_KEY),
+        models.COMPILER_VERSION_EXT_KEY:
+            b_get(models.COMPILER_VERSION_EXT_KEY),
+        models.CREATED_KEY: b_get(models.CREATED_KEY),
+        models.DEFCONFIG_FULL_KEY: b_get(models.DEFCONFIG_FULL_KEY),
+        models.JOB_ID_KEY: b_get(models.JOB_ID_KEY),
+        models.JOB_KEY: b_get(models.JOB_KEY),
+        models.KERNEL_KEY: b_get(models.KERNEL_KEY),
+        models.LAB_NAME_KEY: b_get(models.LAB_NAME_KEY),
+        models.REGRESSION_KEY_KEY: regr_key,
+        models.REGRESSIONS_KEY: regr_docs
+    }
+
+
 def track_regression(boot_doc, pass_doc, old_regr, db_options):
     """Track the regression for the provided boot report.
 
+    Each regression is stored in its own document, identified by the job,
+    kernel and regression key values: there is no need to lock anything
+    since the update is done atomically on a single document, and the
+    creation is guarded by a unique index.
+
     :param boot_doc: The actual boot document where we have a regression.
     :type boot_doc: dict
     :param pass_doc: The previous boot document, when we start tracking a
@@ -183,124 +362,166 @@ def track_regression(boot_doc, pass_doc, old_regr, db_options):
     :return tuple The status code (200, 201, 500); and the regression
     document id.
     """
-    ret_val = 201
+    ret_val = 500
     doc_id = None
 
     regr_key = create_regressions_key(boot_doc)
 
     b_get = boot_doc.get
     boot_id = b_get(models.ID_KEY)
-    arch = b_get(models.ARCHITECTURE_KEY)
-    b_instance = sanitize_key(str(b_get(models.BOARD_INSTANCE_KEY)).lower())
-    board = sanitize_key(b_get(models.BOARD_KEY))
-    compiler = sanitize_key(str(b_get(models.COMPILER_VERSION_EXT_KEY)))
-    defconfig = sanitize_key(b_get(models.DEFCONFIG_FULL_KEY))
-    job = b_get(models.JOB_KEY)
-    job_id = b_get(models.JOB_ID_KEY)
-    kernel = b_get(models.KERNEL_KEY)
-    lab = b_get(models.LAB_NAME_KEY)
     created_on = b_get(models.CREATED_KEY)
 
-    # We might be importing boot in parallel through multi-processes.
-    # Keep a lock here when looking for the previous regressions or we might
-    # end up with multiple boot regression creations.
-    redis_conn = redisdb.get_db_connection(db_options)
-    lock_key = LOCK_KEY_FMT.format(job, kernel)
-
-    with redis.lock.Lock(redis_conn, lock_key, timeout=5):
-        # Do we have "old" regressions?
-        regr_docs = []
-        if all([old_regr, old_regr[0]]):
-            regr_docs = get_regressions_by_key(
-                regr_key, old_regr[1])
-
-        if pass_doc:
-            regr_docs.append(pass_doc)
-
-        # Append the actual fail boot report to the list.
-        regr_docs.append(boot_doc)
-
-        # Do we have already a regression registered for this job_id,
-        # job, kernel?
-        prev_reg_doc = check_prev_regression(boot_doc, boot_doc, db_options)
-        if prev_reg_doc[0]:
-            doc_id = prev_reg_doc[0]
-
-            regr_data_key = \
-                REGRESSION_DOT_FMT.format(models.REGRESSIONS_KEY, regr_key)
-
-            if prev_reg_doc[1]:
-                # If we also have the same key in the document, append the
-                # new boot report.
-                document = {"$addToSet": {regr_data_key: boot_doc}}
-            else:
-                # Otherwise just set the new key.
-                document = {"$set": {regr_data_key: regr_docs}}
-
-            ret_val = utils.db.update3(
-                models.BOOT_REGRESSIONS_COLLECTION,
-                {models.ID_KEY: prev_reg_doc[0]},
-                document,
-                db_options=db_options
-            )
-        else:
-            regression_doc = {
-                models.CREATED_KEY: created_on,
-                models.JOB_ID_KEY: job_id,
-                models.JOB_KEY: job,
-                models.KERNEL_KEY: kernel
-            }
+    spec = {
+        models.JOB_KEY: b_get(models.JOB_KEY),
+        models.KERNEL_KEY: b_get(models.KERNEL_KEY),
+        models.REGRESSION_KEY_KEY: regr_key
+    }
 
-            # The regression data structure.
-            # A dictionary with nested keys, whose keys in nested order are:
-            # lab name
-            # architecture type
-            # board name
-            # board instance or the string "none"
-            # defconfig full string
-            # compiler string (just compiler + version)
-            # The regressions are stored in a list as the value of the
-            # "compiler" key.
-            regression_doc[models.REGRESSIONS_KEY] = {
-                lab: {
-                    arch: {
-                        board: {
-                            b_instance: {
-                                defconfig: {
-                                    compiler: regr_docs
-                                }
-                            }
-                        }
-                    }
-                }
-            }
+    # Do we have "old" regressions?
+    regr_docs = []
+    if all([old_regr, old_regr[1]]):
+        regr_docs.extend(old_regr[1])
 
-            ret_val, doc_id = \
-                utils.db.save3(
-                    models.BOOT_REGRESSIONS_COLLECTION, regression_doc,
-                    db_options=db_options)
+    if pass_doc:
+        regr_docs.append(pass_doc)
 
-        # Save the regressions id and boot id in an index collection.
-        if all([any([ret_val == 201, ret_val == 200]), doc_id]):
-            utils.db.save3(
-                models.BOOT_REGRESSIONS_BY_BOOT_COLLECTION,
-                {
-                    models.BOOT_ID_KEY: boot_id,
-                    models.BOOT_REGRESSIONS_ID_KEY: doc_id,
-                    models.CREATED_KEY: created_on
-                },
-                db_options=db_options
+    # Append the actual fail boot report to the list.
+    regr_docs.append(boot_doc)
+
+    collection = utils.db.get_db_connection2(db_options)[
+        models.BOOT_REGRESSIONS_BY_KEY_COLLECTION]
+    # Cached by the driver: it reaches the database only once in a while,
+    # and makes sure the index exists even if the migrations did not run.
+    collection.ensure_index(
+        REGRESSIONS_BY_KEY_INDEX, unique=True, background=True)
+
+    start = time.time()
+    attempt_start = start
+    attempts = 0
+
+    try:
+        for attempts in xrange(1, TRACK_RETRIES + 1):
+            attempt_start = time.time()
+            # Do we have already a regression registered for this job,
+            # kernel and key? If so, just add the new boot report.
+            prev_regr_doc = utils.db.find_and_modify(
+                collection,
+                spec,
+                {"$addToSet": {models.REGRESSIONS_KEY: boot_doc}},
+                fields=[models.ID_KEY]
             )
 
+            if prev_regr_doc:
+                ret_val = 200
+                doc_id = prev_regr_doc[models.ID_KEY]
+                break
+
+            try:
+                doc_id = utils.db.insert(
+                    collection,
+                    _create_regression_doc(boot_doc, regr_key, regr_docs))
+                ret_val = 201
+                break
+            except pymongo.errors.DuplicateKeyError:
+                # Created by someone else in the meantime: update it.
+                utils.LOG.info("Regression document created meanwhile")
+    except pymongo.errors.OperationFailure, ex:
+        utils.LOG.error("Error tracking boot regression")
+        utils.LOG.exception(ex)
+        ret_val = 500
+        doc_id = None
+
+    end = time.time()
+    redis_conn = redisdb.get_db_connection(db_options)
+    # The time spent on the attempts that lost the race with another process,
+    # and the time spent on the last one.
+    utils.metrics.observe(
+        redis_conn, TRACK_WAIT_METRIC, attempt_start - start)
+    utils.metrics.observe(redis_conn, TRACK_HOLD_METRIC, end - attempt_start)
+    utils.metrics.observe(
+        redis_conn,
+        TRACK_ATTEMPTS_METRIC, attempts, buckets=TRACK_ATTEMPTS_BUCKETS)
+
+    # Save the regressions id and boot id in an index collection.
+    if all([any([ret_val == 201, ret_val == 200]), doc_id]):
+        utils.db.save3(
+            models.BOOT_REGRESSIONS_BY_BOOT_COLLECTION,
+            {
+                models.BOOT_ID_KEY: boot_id,
+                models.BOOT_REGRESSIONS_ID_KEY: doc_id,
+                models.CREATED_KEY: created_on
+            },
+            db_options=db_options
+        )
+
     return ret_val, doc_id
 
 
-def check_and_track(boot_doc, db_options):
-    """Check previous boot report and start tracking regressions.
+def _get_previous_boot_identity(boot_doc):
+    """The values a previous boot report must share with a boot report.
+
+    :param boot_doc: The boot document.
+    :type boot_doc: dict
+    :return tuple The values of the `PREVIOUS_BOOT_KEYS` fields.
+    """
+    return tuple(boot_doc.get(key) for key in PREVIOUS_BOOT_KEYS)
+
+
+def _find_previous_boot(boot_doc, exclude_ids=None):
+    """Find the latest passed or failed boot report before a boot report.
+
+    :param boot_doc: The boot document.
+    :type boot_doc: dict
+    :param exclude_ids: The IDs of the boot reports to ignore.
+    :type exclude_ids: list
+    :return dict The previous boot document, or None.
+    """
+    spec = dict((key, boot_doc.get(key)) for key in PREVIOUS_BOOT_KEYS)
+    spec[models.CREATED_KEY] = {"$lt": boot_doc.get(models.CREATED_KEY)}
+    spec[models.STATUS_KEY] = {
+        "$in": [models.PASS_STATUS, models.FAIL_STATUS]}
+    if exclude_ids:
+        spec[models.ID_KEY] = {"$nin": exclude_ids}
+
+    return utils.db.find_one3(
+        models.BOOT_COLLECTION, spec, sort=[(models.CREATED_KEY, -1)])
+
+
+def _is_later(doc, other_doc):
+    """Check if a document was created after another one.
+
+    :param doc: The document.
+    :type doc: dict
+    :param other_doc: The other document, or None.
+    :type other_doc: dict
+    :return True if there is no other document or if the document is more
+    recent, False otherwise.
+    """
+    return other_doc is None or \
+        doc[models.CREATED_KEY] > other_doc[models.CREATED_KEY]
+
+
+def _is_failed(boot_doc):
+    """Check if there is a boot document, and if it failed.
+
+    :param boot_doc: The boot document, or None.
+    :type boot_doc: dict
+    :return True or False.
+    """
+    return boot_doc is not None and \
+        boot_doc[models.STATUS_KEY] == models.FAIL_STATUS
+
+
+def _track_from_previous(boot_doc, old_doc, prev_reg, db_options):
+    """Start or keep tracking a regression from the previous boot report.
 
     :param boot_doc: The boot document we are working on.
     :type boot_doc: dict
-    :param conn: The database connection.
+    :param old_doc: The previous boot report, or None.
+    :type old_doc: dict
+    :param prev_reg: The previous regression, as returned by
+    `check_prev_regression`, when the previous boot report failed.
+    :type prev_reg: 2-tuple
     :param db_options: The database connection parameters.
     :type db_options: dict
     :return tuple The return value; and the regression document id.
@@ -308,41 +529,13 @@ def check_and_track(boot_doc, db_options):
     ret_val = None
     doc_id = None
 
-    b_get = boot_doc.get
-    # Look for an older and as much similar as possible boot report.
-    # In case the boot report we are analyzing is FAIL and the old one is PASS
-    # it's a new regression that we need to track.
-    spec = {
-        models.ARCHITECTURE_KEY: b_get(models.ARCHITECTURE_KEY),
-        models.BOARD_INSTANCE_KEY: b_get(models.BOARD_INSTANCE_KEY),
-        models.BOARD_KEY: b_get(models.BOARD_KEY),
-        models.COMPILER_VERSION_EXT_KEY:
-            b_get(models.COMPILER_VERSION_EXT_KEY),
-        models.CREATED_KEY: {"$lt": b_get(models.CREATED_KEY)},
-        models.DEFCONFIG_FULL_KEY: b_get(models.DEFCONFIG_FULL_KEY),
-        models.DEFCONFIG_KEY: b_get(models.DEFCONFIG_KEY),
-        models.GIT_BRANCH_KEY: b_get(models.GIT_BRANCH_KEY),
-        models.JOB_KEY: b_get(models.JOB_KEY),
-        models.LAB_NAME_KEY: b_get(models.LAB_NAME_KEY),
-        models.STATUS_KEY: {"$in": [models.PASS_STATUS, models.FAIL_STATUS]}
-    }
-
-    old_doc = utils.db.find_one3(
-        models.BOOT_COLLECTION, spec, sort=[(models.CREATED_KEY, -1)])
-
     if old_doc:
         old_status = old_doc[models.STATUS_KEY]
         if old_status == "FAIL":
             # "Old" regression case, we might have to keep track of it.
-            utils.LOG.info(
-                "Previous boot report failed, checking previous regressions")
-
-            # Check if we have old regressions first.
-            # If not, we don't track it since it's the first time we
-            # know about it.
-            prev_reg = check_prev_regression(boot_doc, old_doc, db_options)
-
-            if all([prev_reg[0], prev_reg[1]]):
+            # If we don't have old regressions, we don't track it since it's
+            # the first time we know about it.
+            if all([prev_reg, prev_reg[0], prev_reg[1]]):
                 utils.LOG.info("Found previous regressions, keep tracking")
                 ret_val, doc_id = track_regression(
                     boot_doc, None, prev_reg, db_options)
@@ -359,6 +552,165 @@ def check_and_track(boot_doc, db_options):
     return ret_val, doc_id
 
 
+def check_and_track(boot_doc, db_options):
+    """Check previous boot report and start tracking regressions.
+
+    :param boot_doc: The boot document we are working on.
+    :type boot_doc: dict
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :return tuple The return value; and the regression document id.
+    """
+    prev_reg = None
+
+    # Look for an older and as much similar as possible boot report.
+    # In case the boot report we are analyzing is FAIL and the old one is PASS
+    # it's a new regression that we need to track.
+    old_doc = _find_previous_boot(boot_doc)
+
+    if _is_failed(old_doc):
+        utils.LOG.info(
+            "Previous boot report failed, checking previous regressions")
+        prev_reg = check_prev_regression(boot_doc, old_doc, db_options)
+
+    return _track_from_previous(boot_doc, old_doc, prev_reg, db_options)
+
+
+def _find_previous_boots(boot_docs):
+    """Find the previous boot reports of many failed ones.
+
+    The boot reports are grouped by their `PREVIOUS_BOOT_KEYS` values: for
+    each group, the latest passed or failed boot report created before the
+    last one of the group is searched, with the same indexed query of
+    `check_and_track`. The boot reports themselves are excluded.
+
+    :param boot_docs: The failed boot documents.
+    :type boot_docs: list
+    :return dict The previous boot documents, by their `PREVIOUS_BOOT_KEYS`
+    values.
+    """
+    last_docs = {}
+    for boot_doc in boot_docs:
+        identity = _get_previous_boot_identity(boot_doc)
+        if _is_later(boot_doc, last_docs.get(identity, None)):
+            last_docs[identity] = boot_doc
+
+    exclude_ids = [failed_doc[models.ID_KEY] for failed_doc in boot_docs]
+
+    previous = {}
+    for identity, last_doc in last_docs.iteritems():
+        prev_doc = _find_previous_boot(last_doc, exclude_ids=exclude_ids)
+        if prev_doc:
+            previous[identity] = prev_doc
+
+    return previous
+
+
+def _find_prev_regressions(database, pairs):
+    """Find the previous regressions of many failed boot reports.
+
+    The same as `check_prev_regression`, with a single query for all the
+    boot reports, and another one on the old nested documents for the
+    regressions not found.
+
+    :param database: The database connection.
+    :param pairs: The failed boot documents of the same job, each with its
+    failed previous boot document.
+    :type pairs: list
+    :return list The 2-tuples as returned by `check_prev_regression`, one
+    for each pair.
+    """
+    results = [(None, None)] * len(pairs)
+    job = pairs[0][1][models.JOB_KEY]
+
+    by_key = {}
+    for regr_doc in utils.db.find(
+            database[models.BOOT_REGRESSIONS_BY_KEY_COLLECTION],
+            0,
+            0,
+            spec={
+                models.JOB_KEY: job,
+                models.KERNEL_KEY: {
+                    "$in": sorted(set(
+                        old_doc[models.KERNEL_KEY]
+                        for _, old_doc in pairs))
+                },
+                models.REGRESSION_KEY_KEY: {
+                    "$in": sorted(set(
+                        create_regressions_key(boot_doc)
+                        for boot_doc, _ in pairs))
+                }
+            },
+            fields=[
+                models.ID_KEY,
+                models.JOB_ID_KEY,
+                models.KERNEL_KEY,
+                models.REGRESSION_KEY_KEY, models.REGRESSIONS_KEY]):
+        by_key.setdefault(
+            (regr_doc[models.KERNEL_KEY], regr_doc[models.REGRESSION_KEY_KEY]),
+            []).append(regr_doc)
+
+    def _same_job_id(old_doc, regr_doc):
+        job_id = old_doc.get(models.JOB_ID_KEY)
+        return not job_id or regr_doc.get(models.JOB_ID_KEY) == job_id
+
+    missing = []
+    for idx, (boot_doc, old_doc) in enumerate(pairs):
+        regr_docs = [
+            regr_doc
+            for regr_doc in by_key.get(
+                (old_doc[models.KERNEL_KEY], create_regressions_key(boot_doc)),
+                [])
+            if _same_job_id(old_doc, regr_doc)
+        ]
+
+        if regr_docs:
+            results[idx] = (
+                regr_docs[0][models.ID_KEY],
+                regr_docs[0][models.REGRESSIONS_KEY])
+        else:
+            missing.append(idx)
+
+    if missing:
+        # The regressions might still be in the old nested documents, if the
+        # migration did not run yet.
+        nested = {}
+        for regr_doc in utils.db.find(
+                database[models.BOOT_REGRESSIONS_COLLECTION],
+                0,
+                0,
+                spec={
+                    models.JOB_KEY: job,
+                    models.KERNEL_KEY: {
+                        "$in": sorted(set(
+                            pairs[idx][1][models.KERNEL_KEY]
+                            for idx in missing))
+                    }
+                },
+                fields=[
+                    models.ID_KEY,
+                    models.JOB_ID_KEY,
+                    models.KERNEL_KEY, models.REGRESSIONS_KEY]):
+            nested.setdefault(
+                regr_doc[models.KERNEL_KEY], []).append(regr_doc)
+
+        for idx in missing:
+            boot_doc, old_doc = pairs[idx]
+            regr_docs = [
+                regr_doc
+                for regr_doc in nested.get(old_doc[models.KERNEL_KEY], [])
+                if _same_job_id(old_doc, regr_doc)
+            ]
+
+            if regr_docs:
+                regressions = get_nested_regressions(
+                    create_regressions_key(boot_doc), regr_docs[0])
+                if regressions:
+                    results[idx] = (regr_docs[0][models.ID_KEY], regressions)
+
+    return results
+
+
 def find(boot_id, db_options):
     """Find the regression starting from a single boot report.
 
@@ -398,3 +750,150 @@ def find(boot_id, db_options):
             utils.LOG.info("No boot doc or not failed boot report")
 
     return results
+
+
+def _track_group(database, boot_docs, db_options):
+    """Find the regressions of the failed boot reports of a job and kernel.
+
+    The previous boot reports are searched once for all the boot reports
+    with the same `PREVIOUS_BOOT_KEYS` values, and their regressions with a
+    single query. The single queries of `check_and_track` are used only
+    when a boot report of the group, or another one created after it, gets
+    in the way.
+
+    :param database: The database connection.
+    :param boot_docs: The failed boot documents, sorted by creation date.
+    :type boot_docs: list
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :return list The 2-tuples as returned by `check_and_track`.
+    """
+    results = []
+    previous = _find_previous_boots(boot_docs)
+    group_ids = set(boot_doc[models.ID_KEY] for boot_doc in boot_docs)
+
+    old_docs = []
+    for idx, boot_doc in enumerate(boot_docs):
+        identity = _get_previous_boot_identity(boot_doc)
+        created_on = boot_doc[models.CREATED_KEY]
+
+        old_doc = previous.get(identity, None)
+        if old_doc and old_doc[models.CREATED_KEY] >= created_on:
+            old_doc = _find_previous_boot(boot_doc)
+        else:
+            # The boot reports of the group are not in the lookup.
+            for group_doc in boot_docs[:idx]:
+                if all([
+                        _get_previous_boot_identity(group_doc) == identity,
+                        group_doc[models.CREATED_KEY] < created_on,
+                        _is_later(group_doc, old_doc)]):
+                    old_doc = group_doc
+
+        old_docs.append(old_doc)
+
+    # The regressions of a previous boot report of the group are tracked
+    # while going through the group: they are looked up one by one.
+    pairs = [
+        (pair_idx, pair_doc, old_docs[pair_idx])
+        for pair_idx, pair_doc in enumerate(boot_docs)
+        if _is_failed(old_docs[pair_idx]) and
+        old_docs[pair_idx][models.ID_KEY] not in group_ids
+    ]
+
+    prev_regs = [None] * len(boot_docs)
+    if pairs:
+        for (idx, _, _), prev_reg in zip(
+                pairs,
+                _find_prev_regressions(
+                    database,
+                    [(pair[1], pair[2]) for pair in pairs])):
+            prev_regs[idx] = prev_reg
+
+    for idx, boot_doc in enumerate(boot_docs):
+        old_doc = old_docs[idx]
+        prev_reg = prev_regs[idx]
+
+        if prev_reg is None and _is_failed(old_doc):
+            prev_reg = check_prev_regression(boot_doc, old_doc, db_options)
+
+        results.append(
+            _track_from_previous(boot_doc, old_doc, prev_reg, db_options))
+
+    return results
+
+
+def find_many(boot_ids, db_options):
+    """Find the regressions starting from many boot reports.
+
+    The boot documents, and the ones whose regressions are already tracked,
+    are searched with a single query each. The failed boot reports are then
+    analyzed grouped by job and kernel, in the order they were created: the
+    previous boot reports and regressions of each group are searched
+    together.
+
+    :param boot_ids: The ids of the boot documents.
+    :type boot_ids: list
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :return list A list of 2-tuples: the return value that can be 200, 201
+    or 500; the Id of the regression document or None. One for each
+    analyzed failed boot report.
+    """
+    results = []
+    obj_ids = []
+
+    for boot_id in boot_ids:
+        if not isinstance(boot_id, bson.objectid.ObjectId):
+            try:
+                boot_id = bson.objectid.ObjectId(boot_id)
+            except (bson.errors.InvalidId, TypeError):
+                utils.LOG.info("Error converting boot id '%s'", str(boot_id))
+                boot_id = None
+
+        if boot_id:
+            obj_ids.append(boot_id)
+
+    if obj_ids:
+        utils.LOG.info("Searching boot regressions for %d boots", len(obj_ids))
+        database = utils.db.get_db_connection(db_options)
+
+        tracked = set(
+            doc[models.BOOT_ID_KEY]
+            for doc in utils.db.find(
+                database[models.BOOT_REGRESSIONS_BY_BOOT_COLLECTION],
+                0,
+                0,
+                spec={models.BOOT_ID_KEY: {"$in": obj_ids}},
+                fields=[models.BOOT_ID_KEY])
+        )
+
+        boot_docs = utils.db.find(
+            database[models.BOOT_COLLECTION],
+            0,
+            0,
+            spec={
+                models.ID_KEY: {"$in": obj_ids},
+                models.STATUS_KEY: models.FAIL_STATUS
+            },
+            sort=[(models.CREATED_KEY, 1)]
+        )
+
+        groups = {}
+        for boot_doc in boot_docs:
+            if boot_doc[models.ID_KEY] in tracked:
+                utils.LOG.info("Boot regressions already tracked")
+            else:
+                groups.setdefault(
+                    (boot_doc[models.JOB_KEY], boot_doc[models.KERNEL_KEY]),
+                    []).append(boot_doc)
+
+        for job_kernel in sorted(groups.iterkeys()):
+            utils.LOG.info(
+                "Searching boot regressions for %s-%s (%d failed boots)",
+                job_kernel[0], job_kernel[1], len(groups[job_kernel]))
+
+            results.extend(
+                _track_group(
+                    database, groups[job_kernel], db_options))
+
+    return results
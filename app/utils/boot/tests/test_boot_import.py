@@ -28,8 +28,10 @@ import unittest
 import models.boot as mboot
 import utils.boot as bimport
 
+from tests.helpers import QueryBudgetMixin
 
-class TestParseBoot(unittest.TestCase):
+
+class TestParseBoot(unittest.TestCase, QueryBudgetMixin):
 
     def setUp(self):
         logging.disable(logging.CRITICAL)
@@ -453,3 +455,150 @@ class TestParseBoot(unittest.TestCase):
         doc = bimport._parse_boot_from_json(boot_json, self.db, {})
 
         self.assertEqual(doc.mach, "mach-alias")
+
+    @mock.patch("utils.db.get_db_connection")
+    def test_import_and_save_boots(self, mock_db):
+        mock_db.return_value = self.db
+        bimport.REF_CACHE.clear()
+
+        job_id = self.db["job"].insert({"job": "job", "kernel": "kernel"})
+        build_id = self.db["build"].insert(
+            {
+                "job": "job",
+                "kernel": "kernel",
+                "defconfig": "defconfig",
+                "defconfig_full": "defconfig",
+                "arch": "arm",
+                "job_id": job_id,
+                "git_branch": "master"
+            }
+        )
+
+        other_report = dict(self.boot_report, board="other-board")
+        wrong_report = {"board": "null"}
+        base_path = tempfile.mkdtemp()
+
+        try:
+            results, errors = bimport.import_and_save_boots(
+                [self.boot_report, wrong_report, other_report],
+                {}, base_path=base_path)
+
+            self.assertEqual(3, len(results))
+            self.assertEqual(201, results[0][0])
+            self.assertEqual((None, None), results[1])
+            self.assertEqual(201, results[2][0])
+            self.assertListEqual([400], errors.keys())
+
+            boot_doc = self.db["boot"].find_one({"_id": results[2][1]})
+            self.assertEqual("other-board", boot_doc["board"])
+            self.assertEqual(job_id, boot_doc["job_id"])
+            self.assertEqual(build_id, boot_doc["build_id"])
+            self.assertEqual("master", boot_doc["git_branch"])
+            self.assertTrue(
+                os.path.isfile(
+                    os.path.join(
+                        base_path,
+                        "job",
+                        "kernel",
+                        "arm-defconfig",
+                        "lab_name", "boot-other-board.json")))
+        finally:
+            shutil.rmtree(base_path, ignore_errors=True)
+
+    @mock.patch("utils.db.get_db_connection")
+    def test_import_and_save_boots_update(self, mock_db):
+        mock_db.return_value = self.db
+        base_path = tempfile.mkdtemp()
+
+        try:
+            results, _ = bimport.import_and_save_boots(
+                [self.boot_report], {}, base_path=base_path)
+            doc_id = results[0][1]
+
+            # The same boot sent again, twice in the same batch.
+            results, errors = bimport.import_and_save_boots(
+                [self.boot_report, self.boot_report], {},
+                base_path=base_path)
+
+            self.assertDictEqual({}, errors)
+            self.assertEqual([(201, doc_id), (201, doc_id)], results)
+            self.assertEqual(1, self.db["boot"].count())
+        finally:
+            shutil.rmtree(base_path, ignore_errors=True)
+
+    @mock.patch("utils.db.get_db_connection")
+    def test_import_and_save_boots_duplicate_in_batch(self, mock_db):
+        mock_db.return_value = self.db
+        base_path = tempfile.mkdtemp()
+
+        try:
+            results, errors = bimport.import_and_save_boots(
+                [self.boot_report, self.boot_report], {},
+                base_path=base_path)
+
+            self.assertDictEqual({}, errors)
+            self.assertEqual(201, results[0][0])
+            self.assertEqual(results[0][1], results[1][1])
+            self.assertEqual(1, self.db["boot"].count())
+        finally:
+            shutil.rmtree(base_path, ignore_errors=True)
+
+    @mock.patch("utils.db.get_db_connection")
+    def test_import_and_save_boots_query_budget(self, mock_db):
+        mock_db.return_value = self.db
+        bimport.REF_CACHE.clear()
+
+        job_id = self.db["job"].insert({"job": "job", "kernel": "kernel"})
+        self.db["build"].insert(
+            {
+                "job": "job",
+                "kernel": "kernel",
+                "defconfig": "defconfig",
+                "defconfig_full": "defconfig",
+                "arch": "arm",
+                "job_id": job_id
+            }
+        )
+        boot_reports = [
+            dict(self.boot_report, board="board-%d" % idx)
+            for idx in range(20)
+        ]
+        base_path = tempfile.mkdtemp()
+
+        try:
+            # The job and the build, the previous boots, the bulk insert.
+            with self.assertMaxQueries(4):
+                results, errors = bimport.import_and_save_boots(
+                    boot_reports, {}, base_path=base_path)
+
+            self.assertDictEqual({}, errors)
+            self.assertListEqual(
+                [201] * 20, [ret_val for ret_val, _ in results])
+        finally:
+            shutil.rmtree(base_path, ignore_errors=True)
+
+    def test_update_boot_docs_ids_cached(self):
+        bimport.REF_CACHE.clear()
+        self.db["job"].insert({"job": "job", "kernel": "kernel"})
+        self.db["build"].insert(
+            {
+                "job": "job",
+                "kernel": "kernel",
+                "defconfig": "defconfig",
+                "defconfig_full": "defconfig",
+                "arch": "arm"
+            }
+        )
+
+        docs = [
+            bimport._create_boot_doc(dict(self.boot_report), {})
+            for _ in range(2)
+        ]
+        bimport._update_boot_docs_ids(docs[:1], self.db)
+
+        with mock.patch("utils.db.find") as mock_find:
+            bimport._update_boot_docs_ids(docs[1:], self.db)
+            self.assertFalse(mock_find.called)
+
+        self.assertIsNotNone(docs[1].build_id)
+        self.assertEqual(docs[0].job_id, docs[1].job_id)
@@ -11,6 +11,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import fakeredis
 import logging
 import mock
 import mongomock
@@ -19,6 +20,7 @@ import string
 import unittest
 
 import utils.boot.regressions as boot_regressions
+import utils.metrics
 
 
 class TestBootRegressions(unittest.TestCase):
@@ -172,6 +174,278 @@ class TestBootRegressions(unittest.TestCase):
         results = boot_regressions.find(self.boot_id, {})
         self.assertTupleEqual((None, None), results)
 
+    @mock.patch("utils.boot.regressions.track_regression")
+    @mock.patch("utils.db.get_db_connection2")
+    @mock.patch("utils.db.get_db_connection")
+    def test_find_many(self, mock_db, mock_db2, mock_track):
+        # mongomock does not match the missing fields with None.
+        for boot_doc in [self.fail_boot, self.pass_boot]:
+            boot_doc.update({"board_instance": "0", "git_branch": "master"})
+        mock_db.return_value = self.db
+        mock_db2.return_value = self.db
+        mock_track.return_value = (201, "regression-id")
+
+        # A new regression, and a failure that follows a tracked one.
+        fail_id = self.db["boot"].insert(dict(self.fail_boot))
+        other_fail = dict(
+            self.fail_boot, board="other-board", created_on="2016-06-29")
+        other_id = self.db["boot"].insert(dict(other_fail))
+        tracked_id = self.db["boot"].insert(dict(self.fail_boot))
+        pass_id = self.db["boot"].insert(dict(self.pass_boot))
+        # No previous boot report.
+        new_id = self.db["boot"].insert(
+            dict(self.fail_boot, kernel="kernel2", board="new-board"))
+        self.db["boot_regressions_by_boot_id"].insert({"boot_id": tracked_id})
+
+        prev_fail = dict(
+            other_fail, _id="prev-fail", kernel="kernel0",
+            created_on="2016-06-27")
+        prev_pass = dict(
+            self.pass_boot, _id="prev-pass", kernel="kernel0",
+            created_on="2016-06-27")
+        self.db["boot"].insert(dict(prev_fail))
+        self.db["boot"].insert(dict(prev_pass))
+        regr_id = self.db["boot_regressions_by_key"].insert(
+            {
+                "job": "job",
+                "kernel": "kernel0",
+                "regression_key": boot_regressions.create_regressions_key(
+                    other_fail),
+                "regressions": [prev_fail]
+            }
+        )
+
+        with mock.patch(
+                "utils.db.find_one3",
+                wraps=boot_regressions.utils.db.find_one3) as mock_find:
+            results = boot_regressions.find_many(
+                [str(fail_id), other_id, tracked_id, pass_id, new_id, "foo"],
+                {})
+
+        self.assertListEqual(
+            [(201, "regression-id"), (201, "regression-id"), (None, None)],
+            results)
+        # One lookup for each board.
+        self.assertEqual(3, mock_find.call_count)
+
+        calls = mock_track.call_args_list
+        self.assertEqual(2, len(calls))
+        self.assertEqual(fail_id, calls[0][0][0]["_id"])
+        self.assertEqual(prev_pass, calls[0][0][1])
+        self.assertEqual(other_id, calls[1][0][0]["_id"])
+        self.assertIsNone(calls[1][0][1])
+        self.assertTupleEqual((regr_id, [prev_fail]), calls[1][0][2])
+
+    @mock.patch("utils.boot.regressions.track_regression")
+    @mock.patch("utils.db.get_db_connection2")
+    @mock.patch("utils.db.get_db_connection")
+    def test_find_many_same_group(self, mock_db, mock_db2, mock_track):
+        # mongomock does not match the missing fields with None.
+        for boot_doc in [self.fail_boot, self.pass_boot]:
+            boot_doc.update({"board_instance": "0", "git_branch": "master"})
+        mock_db.return_value = self.db
+        mock_db2.return_value = self.db
+        mock_track.return_value = (201, "regression-id")
+
+        first_id = self.db["boot"].insert(
+            dict(self.fail_boot, created_on="2016-06-28"))
+        second_id = self.db["boot"].insert(
+            dict(self.fail_boot, created_on="2016-06-30"))
+        # Created between the two failed boot reports.
+        later_pass = self.db["boot"].find_one(
+            self.db["boot"].insert(
+                dict(self.pass_boot, kernel="kernel1", created_on="2016-06-29")
+            )
+        )
+
+        boot_regressions.find_many([first_id, second_id], {})
+
+        calls = mock_track.call_args_list
+        self.assertEqual(1, len(calls))
+        self.assertEqual(second_id, calls[0][0][0]["_id"])
+        self.assertEqual(later_pass, calls[0][0][1])
+
+    @mock.patch("utils.db.get_db_connection")
+    def test_find_many_no_ids(self, mock_db):
+        self.assertListEqual([], boot_regressions.find_many(["foo"], {}))
+        self.assertFalse(mock_db.called)
+
+    @mock.patch("utils.database.redisdb.get_db_connection")
+    @mock.patch("utils.db.get_db_connection2")
+    def test_track_regression(self, mock_db, mock_redis):
+        mock_db.return_value = self.db
+        mock_redis.return_value = fakeredis.FakeStrictRedis()
+        self.fail_boot["_id"] = "fail-id"
+        self.fail_boot["job_id"] = "job-id"
+
+        ret_val, doc_id = boot_regressions.track_regression(
+            self.fail_boot, self.pass_boot, (None, None), {})
+
+        self.assertEqual(201, ret_val)
+        regr_doc = self.db["boot_regressions_by_key"].find_one(doc_id)
+        self.assertEqual(
+            "boot-lab.arm.arm-board.none.defconfig-full.gcc5:1:1",
+            regr_doc["regression_key"])
+        self.assertEqual("arm-board", regr_doc["board"])
+        self.assertEqual(2, len(regr_doc["regressions"]))
+
+        new_fail = dict(self.fail_boot, _id="new-fail-id")
+        ret_val, new_doc_id = boot_regressions.track_regression(
+            new_fail, None, (None, None), {})
+
+        self.assertEqual(200, ret_val)
+        self.assertEqual(doc_id, new_doc_id)
+        regr_doc = self.db["boot_regressions_by_key"].find_one(doc_id)
+        self.assertEqual(3, len(regr_doc["regressions"]))
+        self.assertEqual(
+            2,
+            self.db["boot_regressions_by_boot_id"].find(
+                {"boot_regressions_id": doc_id}).count())
+
+        attempts = utils.metrics.get_histogram(
+            mock_redis.return_value,
+            boot_regressions.TRACK_ATTEMPTS_METRIC,
+            buckets=boot_regressions.TRACK_ATTEMPTS_BUCKETS)
+        self.assertEqual(2, attempts["count"])
+        self.assertEqual((1, 2), attempts["buckets"][0])
+
+    @mock.patch("utils.db.get_db_connection2")
+    def test_check_prev_regression(self, mock_db):
+        mock_db.return_value = self.db
+        self.fail_boot["job_id"] = None
+
+        self.assertTupleEqual(
+            (None, None),
+            boot_regressions.check_prev_regression(
+                self.fail_boot, self.fail_boot, {}))
+
+        doc_id = self.db["boot_regressions_by_key"].insert(
+            {
+                "job": "job",
+                "kernel": "kernel1",
+                "regression_key": boot_regressions.create_regressions_key(
+                    self.fail_boot),
+                "regressions": [self.fail_boot]
+            }
+        )
+
+        self.assertTupleEqual(
+            (doc_id, [self.fail_boot]),
+            boot_regressions.check_prev_regression(
+                self.fail_boot, self.fail_boot, {}))
+
+    @mock.patch("utils.db.get_db_connection2")
+    def test_check_prev_regression_nested(self, mock_db):
+        mock_db.return_value = self.db
+        self.fail_boot["job_id"] = None
+        regr_key = boot_regressions.create_regressions_key(self.fail_boot)
+
+        doc_id = self.db["boot_regressions"].insert(
+            {
+                "job": "job",
+                "kernel": "kernel1",
+                "regressions": boot_regressions.nest_regressions(
+                    [
+                        {
+                            "regression_key": regr_key,
+                            "regressions": [self.pass_boot, self.fail_boot]
+                        }
+                    ]
+                )
+            }
+        )
+
+        self.assertTupleEqual(
+            (doc_id, [self.pass_boot, self.fail_boot]),
+            boot_regressions.check_prev_regression(
+                self.fail_boot, self.fail_boot, {}))
+
+    @mock.patch("utils.db.get_db_connection2")
+    def test_migrate_nested_regressions(self, mock_db):
+        mock_db.return_value = self.db
+        self.pass_boot["_id"] = "pass-id"
+        self.fail_boot["_id"] = "fail-id"
+        other_fail = dict(self.fail_boot, _id="other-id", board="other")
+        regr_key = boot_regressions.create_regressions_key(self.fail_boot)
+        other_key = boot_regressions.create_regressions_key(other_fail)
+
+        old_id = self.db["boot_regressions"].insert(
+            {
+                "job": "job",
+                "kernel": "kernel1",
+                "regressions": boot_regressions.nest_regressions(
+                    [
+                        {
+                            "regression_key": regr_key,
+                            "regressions": [self.pass_boot, self.fail_boot]
+                        },
+                        {
+                            "regression_key": other_key,
+                            "regressions": [other_fail]
+                        }
+                    ]
+                )
+            }
+        )
+        self.db["boot_regressions_by_boot_id"].insert(
+            {"boot_id": "fail-id", "boot_regressions_id": old_id})
+        existing_id = self.db["boot_regressions_by_key"].insert(
+            {"job": "job", "kernel": "kernel1", "regression_key": other_key})
+
+        self.assertEqual(
+            1, boot_regressions.migrate_nested_regressions(self.db))
+
+        regr_doc = self.db["boot_regressions_by_key"].find_one(
+            {"regression_key": regr_key})
+        self.assertEqual("kernel1", regr_doc["kernel"])
+        self.assertEqual("arm-board", regr_doc["board"])
+        self.assertListEqual(
+            [self.pass_boot, self.fail_boot], regr_doc["regressions"])
+        self.assertEqual(
+            regr_doc["_id"],
+            self.db["boot_regressions_by_boot_id"].find_one(
+                {"boot_id": "fail-id"})["boot_regressions_id"])
+        self.assertNotIn(
+            "regressions",
+            self.db["boot_regressions_by_key"].find_one(existing_id))
+
+        # Running it again does not create anything.
+        self.assertEqual(
+            0, boot_regressions.migrate_nested_regressions(self.db))
+
+    def test_nest_regressions(self):
+        regr_docs = [
+            {
+                "regression_key": "lab.arm.board.none.defconfig.gcc",
+                "regressions": [1]
+            },
+            {
+                "regression_key": "lab.arm.board.none.defconfig.clang",
+                "regressions": [2]
+            },
+            {
+                "regression_key": "lab.x86.board.none.defconfig.gcc",
+                "regressions": [3]
+            }
+        ]
+
+        expected = {
+            "lab": {
+                "arm": {
+                    "board": {
+                        "none": {
+                            "defconfig": {"gcc": [1], "clang": [2]}
+                        }
+                    }
+                },
+                "x86": {
+                    "board": {"none": {"defconfig": {"gcc": [3]}}}
+                }
+            }
+        }
+        self.assertDictEqual(
+            expected, boot_regressions.nest_regressions(regr_docs))
+
     def test_create_regressions_key(self):
         expected = "boot-lab.arm.arm-board.none.defconfig-full.gcc5:1:1"
         self.assertEqual(
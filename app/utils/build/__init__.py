@@ -36,6 +36,7 @@ import models
 import models.build as mbuild
 import models.job as mjob
 import utils
+import utils.compare.common
 import utils.database.redisdb as redisdb
 import utils.db
 import utils.elf as elf
@@ -672,6 +673,8 @@ def import_multiple_builds(json_obj, db_options, base_path=utils.BASE_PATH):
                 ERR_ADD(
                     errors, ret_val,
                     "Error saving builds with job ID '%s'" % job_id)
+            # New builds: previous comparisons with this job are not valid.
+            utils.compare.common.invalidate_delta_docs(job_id, database)
         except pymongo.errors.ConnectionFailure, ex:
             utils.LOG.exception(ex)
             utils.LOG.error("Error getting database connection")
@@ -788,6 +791,10 @@ def import_single_build(json_obj, db_options, base_path=utils.BASE_PATH):
                 if build_doc:
                     ret_val, build_id = utils.db.save(
                         database, build_doc, manipulate=True)
+                    # New build: previous comparisons with this job are not
+                    # valid anymore.
+                    utils.compare.common.invalidate_delta_docs(
+                        job_id, database)
                 if ret_val != 201:
                     err_msg = "Error saving build document '%s-%s-%s-%s'"
                     utils.LOG.error(err_msg, job, kernel, arch, defconfig)
@@ -0,0 +1,206 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A simple in-process cache with expiring entries.
+
+The hits and misses of the named caches are periodically added to the
+counters in Redis with `publish_stats`, as the "cache-{name}-hits" and
+"cache-{name}-misses" counters: see `utils.metrics`.
+"""
+
+import re
+import threading
+import time
+
+import utils.metrics
+
+# The Redis counters of the caches hits and misses.
+HITS_COUNTER_FMT = "cache-{:s}-hits"
+MISSES_COUNTER_FMT = "cache-{:s}-misses"
+COUNTER_RE = re.compile(r"^cache-(.+)-(hits|misses)$")
+
+# How often, in seconds, the caches statistics are published at most.
+PUBLISH_INTERVAL = 60
+
+# The named caches of this process.
+CACHES = []
+
+_PUBLISH_LOCK = threading.Lock()
+_LAST_PUBLISHED = [0.0]
+
+
+class TTLCache(object):
+    """A thread-safe cache whose entries expire after some time.
+
+    The cache is local to the process: each server process or Celery worker
+    has its own. It also counts its hits and misses.
+    """
+
+    def __init__(self, ttl, max_size, name=None):
+        """Create a new cache.
+
+        :param ttl: How long, in seconds, an entry is valid. If None, the
+        entries never expire.
+        :type ttl: int
+        :param max_size: The maximum number of entries: the cache is emptied
+        when it grows bigger.
+        :type max_size: int
+        :param name: The name of the cache: the statistics of the named
+        caches are published.
+        :type name: str
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._published = (0, 0)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+        if name is not None:
+            CACHES.append(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Retrieve a value from the cache.
+
+        :param key: The key of the value.
+        :return The cached value, or None if not found or expired.
+        """
+        value = None
+
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None:
+                if entry[0] is None or entry[0] > time.time():
+                    value = entry[1]
+                else:
+                    del self._entries[key]
+
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return value
+
+    def set(self, key, value):
+        """Store a value in the cache.
+
+        :param key: The key of the value.
+        :param value: The value to store, None values are not stored.
+        """
+        if value is not None:
+            expires = None
+            if self.ttl is not None:
+                expires = time.time() + self.ttl
+
+            with self._lock:
+                if len(self._entries) >= self.max_size:
+                    self._entries.clear()
+                self._entries[key] = (expires, value)
+
+    def clear(self):
+        """Remove all the entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self._published = (0, 0)
+
+    def pop_counts(self):
+        """The hits and misses since the last call.
+
+        :return A 2-tuple: the number of hits; the number of misses.
+        """
+        with self._lock:
+            hits, misses = self._published
+            self._published = (self.hits, self.misses)
+
+        return self.hits - hits, self.misses - misses
+
+    def stats(self):
+        """The cache hit-rate statistics.
+
+        :return dict A dictionary with the "hits", "misses", "hit_rate" and
+        "size" keys.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+                "size": len(self._entries)
+            }
+
+        return stats
+
+
+def publish_stats(redis_conn, force=False):
+    """Add the hits and misses of the named caches to the Redis counters.
+
+    Nothing is done if the statistics have been published less than
+    `PUBLISH_INTERVAL` seconds ago. Errors are logged and ignored.
+
+    :param redis_conn: The Redis connection.
+    :param force: Publish the statistics anyway.
+    :type force: bool
+    """
+    now = time.time()
+
+    with _PUBLISH_LOCK:
+        if not force and now - _LAST_PUBLISHED[0] < PUBLISH_INTERVAL:
+            return
+        _LAST_PUBLISHED[0] = now
+
+    counts = {}
+    for cache in CACHES:
+        hits, misses = cache.pop_counts()
+        if hits:
+            counts[HITS_COUNTER_FMT.format(cache.name)] = hits
+        if misses:
+            counts[MISSES_COUNTER_FMT.format(cache.name)] = misses
+
+    if counts:
+        utils.metrics.add_to_counters(redis_conn, counts)
+
+
+def get_published_stats(counters):
+    """Compute the statistics of the caches from the Redis counters.
+
+    The caches of all the processes are included, even the ones not used by
+    this one.
+
+    :param counters: The counters, as returned by `utils.metrics`.
+    :type counters: dict
+    :return dict For each cache name, a dictionary with the "hits", "misses"
+    and "hit_rate" keys.
+    """
+    stats = {}
+    for counter, value in counters.iteritems():
+        match = COUNTER_RE.match(counter)
+        if match:
+            cache_stats = stats.setdefault(
+                match.group(1), {"hits": 0, "misses": 0})
+            cache_stats[match.group(2)] = value
+
+    for cache_stats in stats.itervalues():
+        lookups = cache_stats["hits"] + cache_stats["misses"]
+        cache_stats["hit_rate"] = \
+            float(cache_stats["hits"]) / lookups if lookups else 0.0
+
+    return stats
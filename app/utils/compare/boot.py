@@ -37,6 +37,9 @@ def search_and_compare(json_obj, compare_to, errors, db_options):
     Execute any comparison function available and return the results in a new
     data structure.
 
+    The baseline and all the compare targets are retrieved with a single
+    database query and then matched back to their search data.
+
     :param json_obj: The document with the comparison data.
     :type json_obj: dict
     :param errors: The errors data structure.
@@ -52,19 +55,16 @@ def search_and_compare(json_obj, compare_to, errors, db_options):
     result = []
     status = 200
 
-    def _find(to_search):
-        """Internally used to search and update the document.
-
-        Special case of a comparison since we only need to extract all the
-        documents and provide them as is, except for some minor updates.
+    def _get_spec(to_search):
+        """Internally used to create the search spec of a document.
 
         :param to_search: The data to search for.
         :type to_search: dict
-        :return A 2-tuple: the status code and the found document.
+        :return A 2-tuple: the search spec and a 2-tuple with the error code
+        and message, or None.
         """
-        doc = {}
         spec = {}
-        status_code = 200
+        error = None
 
         t_get = to_search.get
         build_id = t_get(models.BOOT_ID_KEY, None)
@@ -74,8 +74,7 @@ def search_and_compare(json_obj, compare_to, errors, db_options):
                 doc_id = bson.objectid.ObjectId(build_id)
                 spec = {models.ID_KEY: doc_id}
             except bson.errors.InvalidId:
-                status_code = 400
-                ADD_ERR(errors, 400, "Provided build ID value is not valid")
+                error = (400, "Provided build ID value is not valid")
         else:
             spec = {
                 models.ARCHITECTURE_KEY: t_get(models.ARCHITECTURE_KEY),
@@ -86,39 +85,55 @@ def search_and_compare(json_obj, compare_to, errors, db_options):
                 models.LAB_NAME_KEY: t_get(models.LAB_NAME_KEY)
             }
 
-        if spec:
-            doc = database[models.BOOT_COLLECTION].find_one(spec)
-
-            if not doc:
-                status_code = 404
-                ADD_ERR(errors, 404, "No data found")
-
-        return status_code, doc
+        return spec, error
 
-    status, baseline = _find(json_obj)
-    if all([status == 200, baseline]):
-        compare_data[models.BASELINE_KEY] = baseline
-
-        compare_result = []
+    base_spec, error = _get_spec(json_obj)
+    if error:
+        status = error[0]
+        ADD_ERR(errors, error[0], error[1])
+    else:
+        # Collect the search specs up to the first invalid compare target:
+        # errors are then reported in the same order the targets have been
+        # provided.
+        specs = [base_spec]
         for compare_doc in compare_to:
             is_valid, err_msg = utils.validator.is_valid_json(
                 compare_doc, models.compare.BOOT_COMPARE_VALID_KEYS)
 
             if is_valid:
-                status, compared = _find(compare_doc)
+                spec, error = _get_spec(compare_doc)
+            else:
+                error = (400, err_msg)
 
-                if all([status == 200, compared]):
+            if error:
+                break
+            specs.append(spec)
+
+        found = utils.db.find_by_specs(
+            database[models.BOOT_COLLECTION], specs)
+
+        baseline = found[0]
+        if baseline:
+            compare_data[models.BASELINE_KEY] = baseline
+
+            compare_result = []
+            for compared in found[1:]:
+                if compared:
                     compare_result.append(compared)
                 else:
+                    status = 404
+                    ADD_ERR(errors, 404, "No data found")
                     break
             else:
-                status = 400
-                ADD_ERR(errors, 400, err_msg)
-                break
+                if error:
+                    status = error[0]
+                    ADD_ERR(errors, error[0], error[1])
+                else:
+                    compare_data[models.COMPARE_TO_KEY] = compare_result
+                    result.append(compare_data)
         else:
-            status = 200
-            compare_data[models.COMPARE_TO_KEY] = compare_result
-            result.append(compare_data)
+            status = 404
+            ADD_ERR(errors, 404, "No data found")
 
     return status, result
 
@@ -163,6 +178,10 @@ def execute_delta(json_obj, db_options=None):
         status = 400
         ADD_ERR(errors, 400, "No data provided to compare to")
     else:
+        # The hash is calculated on the request as received: it does not
+        # depend on the order of the keys.
+        request_hash = utils.compare.common.get_request_hash(json_obj)
+
         # Need to make sure that when the compare_to dictionaries come in they
         # have determined sorting, or we might have POST requests with exactly
         # the same data that create multiple identical results (due to the
@@ -178,7 +197,7 @@ def execute_delta(json_obj, db_options=None):
 
         # First search for any saved results.
         saved = utils.compare.common.search_saved_delta_doc(
-            json_obj, models.BOOT_DELTA_COLLECTION, db_options)
+            request_hash, models.BOOT_DELTA_COLLECTION, db_options)
 
         if saved:
             result, doc_id = saved[0], saved[1]
@@ -189,6 +208,7 @@ def execute_delta(json_obj, db_options=None):
             if any([status == 201, status == 200]):
                 doc_id = utils.compare.common.save_delta_doc(
                     json_obj,
-                    result, models.BOOT_DELTA_COLLECTION, db_options)
+                    result,
+                    models.BOOT_DELTA_COLLECTION, db_options, request_hash)
 
     return status, result, doc_id, errors
@@ -13,16 +13,111 @@
 
 """Common compare methods/functions."""
 
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import bson
+import datetime
+import hashlib
 import pymongo
+import types
 
 import models
+import models.compare
 import utils
 import utils.db
 
+# All the collections where delta documents are saved.
+DELTA_COLLECTIONS = [
+    models.BOOT_DELTA_COLLECTION,
+    models.BUILD_DELTA_COLLECTION,
+    models.JOB_DELTA_COLLECTION
+]
+
+
+def _normalize_request(value):
+    """Normalize the value of a comparison request.
+
+    Dictionaries are stripped of their None values, strings are converted
+    into unicode ones and ObjectId values into their string representation.
+
+    :param value: The value to normalize.
+    :return The normalized value.
+    """
+    if isinstance(value, types.DictionaryType):
+        normalized = {}
+        for key, val in value.iteritems():
+            if val is not None:
+                normalized[unicode(key)] = _normalize_request(val)
+    elif isinstance(value, (types.ListType, types.TupleType)):
+        normalized = [_normalize_request(val) for val in value]
+    elif isinstance(value, types.StringType):
+        normalized = value.decode("utf-8")
+    elif isinstance(value, bson.objectid.ObjectId):
+        normalized = unicode(value)
+    else:
+        normalized = value
+
+    return normalized
+
+
+def get_request_hash(json_obj):
+    """Calculate the canonical hash of a comparison request.
+
+    The hash does not depend on the order of the keys in the request nor on
+    the type of the string and ID values. The order of the compare targets is
+    relevant, since it defines the order of the results.
 
-def save_delta_doc(json_obj, result, collection, db_options):
+    Any previously calculated hash or result stored in the request is not
+    considered.
+
+    :param json_obj: The comparison request as received.
+    :type json_obj: dict
+    :return The hex digest of the hash as a string.
+    """
+    to_hash = {
+        k: v for k, v in json_obj.iteritems()
+        if k not in [models.REQUEST_HASH_KEY, "data"]
+    }
+
+    return hashlib.sha1(
+        json.dumps(
+            _normalize_request(to_hash),
+            sort_keys=True, separators=(",", ":"))).hexdigest()
+
+
+def _get_referenced_jobs(result):
+    """Extract the job IDs referenced in a delta result.
+
+    :param result: The result of the delta calculation.
+    :type result: list
+    :return A list with the referenced job IDs.
+    """
+    job_ids = []
+
+    def _add_job_id(doc):
+        if isinstance(doc, types.DictionaryType):
+            job_id = doc.get(models.JOB_ID_KEY, None)
+            if job_id and job_id not in job_ids:
+                job_ids.append(job_id)
+
+    for res in result or []:
+        _add_job_id(res.get(models.BASELINE_KEY, None))
+        for doc in res.get(models.COMPARE_TO_KEY, None) or []:
+            _add_job_id(doc)
+
+    return job_ids
+
+
+def save_delta_doc(json_obj, result, collection, db_options, request_hash):
     """Save the results of a delta calculation.
 
+    The saved document will also store the canonical hash of the request, its
+    creation date and the job IDs referenced in the result: they are used to
+    serve, expire and invalidate the saved results.
+
     :param json_obj: The JSON data used to perform the delta calculation. This
     will be the same data used to perform the search.
     :type json_obj: dict
@@ -32,46 +127,155 @@ def save_delta_doc(json_obj, result, collection, db_options):
     :type collection: str
     :param db_options: The database connection parameters.
     :type db_options: dict
+    :param request_hash: The canonical hash of the request.
+    :type request_hash: str
     """
     # Store the entire result from the comparison into a dedicated key.
     # When searching with the comparison ID, we just extract the "data" key
     # and return whatever has been saved there.
     json_obj["data"] = result
+    json_obj[models.REQUEST_HASH_KEY] = request_hash
+    json_obj[models.REFERENCED_JOBS_KEY] = _get_referenced_jobs(result)
+    json_obj[models.CREATED_KEY] = datetime.datetime.now(tz=bson.tz_util.utc)
 
     database = utils.db.get_db_connection(db_options)
     doc_id = None
 
     try:
-        doc_id = database[collection].save(json_obj, manipulate=True)
+        doc_id = utils.db.insert(database[collection], json_obj)
+    except pymongo.errors.DuplicateKeyError:
+        # The same request has been saved in the meantime.
+        saved = get_saved_delta_doc(database[collection], request_hash)
+        if saved:
+            doc_id = saved[1]
     except pymongo.errors.OperationFailure:
         utils.LOG.error("Error saving delta doc for %s", collection)
 
     return doc_id
 
 
-def search_saved_delta_doc(json_obj, collection, db_options):
+def get_saved_delta_doc(collection, request_hash):
+    """Search for a previously saved delta document by its request hash.
+
+    :param collection: The collection where to look.
+    :param request_hash: The canonical hash of the request.
+    :type request_hash: str
+    :return None or a 2-tuple: the real result, its ID.
+    """
+    result = utils.db.find_one2(
+        collection, {models.REQUEST_HASH_KEY: request_hash})
+
+    if result:
+        data_result = result["data"]
+        # Inject the _id field.
+        data_result[0][models.ID_KEY] = result[models.ID_KEY]
+        result = (data_result, result[models.ID_KEY])
+
+    return result
+
+
+def create_pending_delta_doc(collection):
+    """Create the document of a delta calculation requested asynchronously.
+
+    The document tracks the status of the calculation and, once completed,
+    references the delta document with the result.
+
+    :param collection: The collection where to save the document.
+    :return The ID of the document, or None in case of errors.
+    """
+    doc_id = None
+    document = {
+        models.CREATED_KEY: datetime.datetime.now(tz=bson.tz_util.utc),
+        models.STATUS_KEY: models.compare.COMPARE_PENDING_STATUS
+    }
+
+    try:
+        doc_id = utils.db.insert(collection, document)
+    except pymongo.errors.OperationFailure, ex:
+        utils.LOG.error("Error creating pending delta doc")
+        utils.LOG.exception(ex)
+
+    return doc_id
+
+
+def complete_pending_delta_doc(
+        pending_id, delta_result, collection, db_options):
+    """Store the outcome of a delta calculation requested asynchronously.
+
+    :param pending_id: The ID of the document that tracks the calculation.
+    :type pending_id: bson.objectid.ObjectId
+    :param delta_result: The 4-tuple returned by the delta calculation: status
+    code, result, doc_id and errors.
+    :type delta_result: tuple
+    :param collection: The name of the collection of the document.
+    :type collection: str
+    :param db_options: The database connection parameters.
+    :type db_options: dict
+    :return 200 if OK, 500 in case of errors.
+    """
+    status_code, _, doc_id, errors = delta_result
+    database = utils.db.get_db_connection(db_options)
+
+    # The errors are stored as a list of messages: the keys of the errors
+    # data structure are the error codes.
+    messages = []
+    for err_msgs in (errors or {}).itervalues():
+        messages.extend(err_msgs)
+
+    return utils.db.update(
+        database[collection],
+        {models.ID_KEY: pending_id},
+        {
+            models.DELTA_ID_KEY: doc_id,
+            models.ERRORS_KEY: messages,
+            models.STATUS_CODE_KEY: status_code,
+            models.STATUS_KEY: models.compare.COMPARE_COMPLETE_STATUS
+        }
+    )
+
+
+def search_saved_delta_doc(request_hash, collection, db_options):
     """Search for a previously saved delta document.
 
-    The search is performed based on the JSON data passed in the request.
-    ID fields are not converted into their ObjectId form.
+    The search is performed on the canonical hash of the request.
 
-    :param json_obj: The JSON data to use as a search.
-    :type json_obj: dict
+    :param request_hash: The canonical hash of the request.
+    :type request_hash: str
     :param collection: The name of the collection where to look.
     :type collection: str
     :param db_options: The databse connection parameters.
     :type db_options: dict
     :return A 2-tuple: the real result, its ID.
     """
-    result = None
-
     database = utils.db.get_db_connection(db_options)
-    result = utils.db.find_one2(database[collection], json_obj)
+    return get_saved_delta_doc(database[collection], request_hash)
 
-    if result:
-        data_result = result["data"]
-        # Inject the _id field.
-        data_result[0][models.ID_KEY] = result[models.ID_KEY]
-        result = (data_result, result[models.ID_KEY])
 
-    return result
+def invalidate_delta_docs(job_id, database):
+    """Invalidate the saved delta documents that reference a job.
+
+    The documents are not removed, but they will not be used anymore to serve
+    new comparison requests.
+
+    :param job_id: The ID of the job.
+    :type job_id: bson.objectid.ObjectId
+    :param database: The database connection.
+    :return 200 if OK, 500 in case of errors.
+    """
+    ret_val = 200
+
+    if job_id:
+        spec = {models.REFERENCED_JOBS_KEY: {"$in": [job_id]}}
+
+        for collection in DELTA_COLLECTIONS:
+            if utils.db.update(
+                    database[collection],
+                    spec,
+                    {models.REQUEST_HASH_KEY: ""},
+                    operation="$unset", multi=True) != 200:
+                utils.LOG.error(
+                    "Error invalidating delta docs for job '%s'", job_id)
+                ret_val = 500
+
+    return ret_val
+
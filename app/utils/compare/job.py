@@ -49,6 +49,9 @@ BUILD_DOC_FIELDS = [
 
 BUILD_DOC_SORT = [(models.DEFCONFIG_KEY, pymongo.ASCENDING)]
 
+# Marker for a build not available in one of the compared jobs.
+MISSING_BUILD = object()
+
 
 # pylint: disable=too-many-instance-attributes
 class CompareJob(object):
@@ -146,12 +149,17 @@ class CompareJob(object):
             self.job_id = d_get(models.JOB_ID_KEY, None)
             self.kernel = d_get(models.KERNEL_KEY, None)
 
+            defconfig_idx = self.defconfig
+            defconfig_status_idx = self.defconfig_status
+
             for idx, doc in enumerate(self.docs):
                 d_get = doc.get
-                defconfig = d_get(models.DEFCONFIG_KEY, None)
-                defconfig_full = d_get(models.DEFCONFIG_FULL_KEY, None)
                 status = d_get(models.STATUS_KEY, None)
-                arch = d_get(models.ARCHITECTURE_KEY, None)
+                key = (
+                    d_get(models.DEFCONFIG_KEY, None),
+                    d_get(models.DEFCONFIG_FULL_KEY, None),
+                    d_get(models.ARCHITECTURE_KEY, None)
+                )
 
                 if status == models.PASS_STATUS:
                     self.passed += 1
@@ -160,14 +168,45 @@ class CompareJob(object):
                 else:
                     self.other += 1
 
-                self.defconfig[(defconfig, defconfig_full, arch)] = idx
-                self.defconfig_status[
-                    (defconfig, defconfig_full, arch, status)] = idx
+                defconfig_idx[key] = idx
+                defconfig_status_idx[key + (status,)] = idx
+
+    def status_of(self, key, default=None):
+        """Get the status of the build indexed with the provided key.
+
+        :param key: The (defconfig, defconfig_full, arch) key.
+        :type key: tuple
+        :param default: The value to return if the build is not available.
+        :return The build status or the default value.
+        """
+        idx = self.defconfig.get(key, None)
+        if idx is None:
+            return default
+        return self.docs[idx].get(models.STATUS_KEY, None)
+
+    def delta_of(self, key):
+        """Get the delta value of the build indexed with the provided key.
+
+        :param key: The (defconfig, defconfig_full, arch) key.
+        :type key: tuple
+        :return A 2-tuple (status, build ID) or None if the build is not
+        available.
+        """
+        idx = self.defconfig.get(key, None)
+        if idx is None:
+            return None
+        doc = self.docs[idx]
+        return (doc[models.STATUS_KEY], doc[models.ID_KEY])
 
 
 def _n_way_compare(baseline, compare_to):
     """Perform a n-way comparison with the baseline point and all the others.
 
+    All the indexed keys of the baseline and of the compared jobs are walked
+    only once: for each key, the status of the indexed build in every job is
+    collected and the row is kept if any of the compared jobs differs from the
+    baseline one.
+
     :param baseline: The comparison starting point.
     :type baseline: CompareJob
     :param compare_to: List of CompareJob documents to compare against.
@@ -185,65 +224,25 @@ def _n_way_compare(baseline, compare_to):
     delta_result = []
 
     if compare_to:
-        # Hold the sets of (defconfig, defconfig_full, status) keys for
-        # each parsed document.
-        other_sets = []
-        # Hold all the symmetric differences we find in the parsed docs.
-        other_diff = set()
-        # Locally store baseline attributes.
-        base_defconf_view = baseline.defconfig_view
-        base_status_view = set(baseline.defconfig_status_view)
-
-        # Go through the documents we have to compare against, and for each
-        # extract the necessary data and compare it with baseline.
-        # We perform a symmetric difference finding all the docs that are
-        # either in baseline or the compared one, but not in both.
-        comp_set = None
+        compared_data = [obj.job_data for obj in compare_to]
+
+        # All the jobs, with the baseline always at position 0.
+        all_jobs = [baseline]
+        all_jobs.extend(compare_to)
+
+        # The union of all the indexed keys.
+        all_keys = set(baseline.defconfig)
         for obj in compare_to:
-            compared_data.append(obj.job_data)
-            comp_set = set(obj.defconfig_status_view)
-            other_sets.append(comp_set)
-            other_diff.update(base_status_view.symmetric_difference(comp_set))
-
-        other_diff = list(other_diff)
-
-        # Store the elements we parse, so that we do not go through them more
-        # than once.
-        parsed_el = []
-        parsed_append = parsed_el.append
-
-        # Hold the real result of the comparison.
-        # Keys are (defconfig, defconfig_full, arch), values are a list of the
-        # build status with None in case of missing build.
-        delta_data = {}
-
-        for diff in other_diff:
-            d_el = (diff[0], diff[1], diff[2])
-
-            if d_el not in parsed_el:
-                parsed_append(d_el)
-                delta_data[d_el] = []
-                status_append = delta_data[d_el].append
-
-                # First consider the baseline point that should always be
-                # at position 0.
-                if d_el in base_defconf_view:
-                    doc = baseline.docs[baseline.defconfig[d_el]]
-                    status_append(
-                        (doc[models.STATUS_KEY], doc[models.ID_KEY]))
-                else:
-                    status_append(None)
-
-                # Then go through all the compared objects.
-                for obj in compare_to:
-                    if d_el in obj.defconfig_view:
-                        doc = obj.docs[obj.defconfig[d_el]]
-                        status_append(
-                            (doc[models.STATUS_KEY], doc[models.ID_KEY]))
-                    else:
-                        status_append(None)
-
-        delta_result = delta_data.items()
+            all_keys.update(obj.defconfig)
+
+        delta_append = delta_result.append
+        for d_el in all_keys:
+            statuses = [obj.status_of(d_el, MISSING_BUILD) for obj in all_jobs]
+
+            base_status = statuses[0]
+            if any(status != base_status for status in statuses[1:]):
+                delta_append((d_el, [obj.delta_of(d_el) for obj in all_jobs]))
+
         delta_result.sort()
 
     return compared_data, delta_result
@@ -398,6 +397,10 @@ def execute_job_delta(json_obj, db_options=None):
         status_code = 400
         ADD_ERR(errors, 400, "No data provided to compare to")
     else:
+        # The hash is calculated on the request as received: it does not
+        # depend on the order of the keys.
+        request_hash = utils.compare.common.get_request_hash(json_obj)
+
         # Need to make sure that when the compare_to dictionaries come in they
         # have determined sorting, or we might have POST requests with exactly
         # the same data that create multiple identical results (due to the
@@ -413,7 +416,7 @@ def execute_job_delta(json_obj, db_options=None):
 
         # First search for any saved results.
         saved = utils.compare.common.search_saved_delta_doc(
-            json_obj, models.JOB_DELTA_COLLECTION, db_options)
+            request_hash, models.JOB_DELTA_COLLECTION, db_options)
 
         if saved:
             result, doc_id = saved[0], saved[1]
@@ -424,6 +427,7 @@ def execute_job_delta(json_obj, db_options=None):
             if status_code == 201:
                 doc_id = utils.compare.common.save_delta_doc(
                     json_obj,
-                    result, models.JOB_DELTA_COLLECTION, db_options)
+                    result,
+                    models.JOB_DELTA_COLLECTION, db_options, request_hash)
 
     return status_code, result, doc_id, errors
@@ -130,9 +130,7 @@ class TestBootCompare(unittest.TestCase):
     def test_execute_boot_delta_wrong_compare_to(self, mock_search):
         mock_search.return_value = None
 
-        collection = self.db["boot"]
-        collection.find_one = mock.MagicMock()
-        collection.find_one.return_value = self.baseline_return
+        self.db["boot"].insert(self.baseline_return)
 
         json_obj = self.baseline
 
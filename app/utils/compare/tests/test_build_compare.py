@@ -18,6 +18,7 @@ import mongomock
 import unittest
 
 import utils.compare.build
+import utils.db
 
 
 class TestBuildCompare(unittest.TestCase):
@@ -131,9 +132,7 @@ class TestBuildCompare(unittest.TestCase):
     def test_execute_build_delta_wrong_compare_to(self, mock_search):
         mock_search.return_value = None
 
-        collection = self.db["build"]
-        collection.find_one = mock.MagicMock()
-        collection.find_one.return_value = self.baseline_return
+        self.db["build"].insert(self.baseline_return)
 
         json_obj = self.baseline
 
@@ -159,10 +158,11 @@ class TestBuildCompare(unittest.TestCase):
         mock_search.return_value = None
         mock_save.return_value = "1234567890"
 
-        collection = self.db["build"]
-        collection.find_one = mock.MagicMock()
-        collection.find_one.side_effect = [
-            self.baseline_return, self.compare_return]
+        self.compare_to[0]["kernel"] = "kernel1"
+        self.compare_return["kernel"] = "kernel1"
+
+        self.db["build"].insert(self.baseline_return)
+        self.db["build"].insert(self.compare_return)
 
         json_obj = self.baseline
         json_obj["compare_to"] = self.compare_to
@@ -185,3 +185,54 @@ class TestBuildCompare(unittest.TestCase):
 
         self.assertEqual(201, status)
         self.assertListEqual(expected, result)
+
+    @mock.patch("utils.compare.common.save_delta_doc")
+    @mock.patch("utils.compare.common.search_saved_delta_doc")
+    def test_execute_build_delta_single_query(self, mock_search, mock_save):
+        mock_search.return_value = None
+        mock_save.return_value = "1234567890"
+
+        self.db["build"].insert(self.baseline_return)
+        compare_to = []
+        for idx in range(1, 4):
+            compare_return = copy.deepcopy(self.compare_return)
+            compare_return["kernel"] = "kernel%d" % idx
+            self.db["build"].insert(compare_return)
+
+            compare_spec = copy.deepcopy(self.compare_to[0])
+            compare_spec["kernel"] = "kernel%d" % idx
+            compare_to.append(compare_spec)
+
+        json_obj = self.baseline
+        json_obj["compare_to"] = compare_to
+
+        with mock.patch("utils.db.find", wraps=utils.db.find) as mock_find:
+            status, result, doc_id, errors = \
+                utils.compare.build.execute_delta(json_obj, db_options={})
+
+            self.assertEqual(1, mock_find.call_count)
+
+        self.assertEqual(201, status)
+        self.assertEqual(3, len(result[0]["compare_to"]))
+        self.assertListEqual(
+            ["kernel1", "kernel2", "kernel3"],
+            [x["kernel"] for x in result[0]["compare_to"]])
+        self.assertEqual(3, result[0]["baseline"]["dtb_dir_data"])
+
+    @mock.patch("utils.compare.common.search_saved_delta_doc")
+    def test_execute_build_delta_compare_not_found(self, mock_search):
+        mock_search.return_value = None
+
+        self.db["build"].insert(self.baseline_return)
+        self.compare_to[0]["kernel"] = "kernel1"
+
+        json_obj = self.baseline
+        json_obj["compare_to"] = self.compare_to
+
+        status, result, doc_id, errors = utils.compare.build.execute_delta(
+            json_obj, db_options={})
+
+        self.assertEqual(404, status)
+        self.assertListEqual([], result)
+        self.assertIsNone(doc_id)
+        self.assertListEqual([404], errors.keys())
@@ -0,0 +1,147 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bson
+import logging
+import mock
+import mongomock
+import unittest
+
+import utils.compare.common
+
+
+class TestCompareCommon(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.db = mongomock.Database(mongomock.Connection(), "kernel-ci")
+
+        patcher = mock.patch("utils.db.get_db_connection")
+        mock_db = patcher.start()
+        mock_db.return_value = self.db
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_request_hash_key_order(self):
+        json_obj0 = {
+            "job": "job",
+            "kernel": "kernel",
+            "compare_to": [{"job": "job", "kernel": "kernel1"}]
+        }
+        json_obj1 = {
+            "compare_to": [{"kernel": u"kernel1", "job": u"job"}],
+            "kernel": u"kernel",
+            "job": "job",
+            "job_id": None
+        }
+
+        self.assertEqual(
+            utils.compare.common.get_request_hash(json_obj0),
+            utils.compare.common.get_request_hash(json_obj1))
+
+    def test_request_hash_compare_to_order(self):
+        json_obj0 = {
+            "job": "job",
+            "kernel": "kernel",
+            "compare_to": [
+                {"job": "job", "kernel": "kernel1"},
+                {"job": "job", "kernel": "kernel2"}
+            ]
+        }
+        json_obj1 = {
+            "job": "job",
+            "kernel": "kernel",
+            "compare_to": [
+                {"job": "job", "kernel": "kernel2"},
+                {"job": "job", "kernel": "kernel1"}
+            ]
+        }
+
+        self.assertNotEqual(
+            utils.compare.common.get_request_hash(json_obj0),
+            utils.compare.common.get_request_hash(json_obj1))
+
+    def test_save_and_search(self):
+        job_id = bson.objectid.ObjectId()
+        json_obj = {
+            "job": "job",
+            "kernel": "kernel",
+            "compare_to": [{"job": "job", "kernel": "kernel1"}]
+        }
+        result = [
+            {
+                "baseline": {"job_id": job_id},
+                "compare_to": [{"job_id": job_id}]
+            }
+        ]
+        request_hash = utils.compare.common.get_request_hash(json_obj)
+
+        doc_id = utils.compare.common.save_delta_doc(
+            json_obj, result, "job_delta", {}, request_hash)
+        saved = self.db["job_delta"].find_one({"_id": doc_id})
+
+        self.assertEqual(request_hash, saved["request_hash"])
+        self.assertListEqual([job_id], saved["referenced_jobs"])
+        self.assertIsNotNone(saved["created_on"])
+
+        found = utils.compare.common.search_saved_delta_doc(
+            request_hash, "job_delta", {})
+        self.assertEqual(doc_id, found[1])
+
+    def test_invalidate_delta_docs(self):
+        job_id = bson.objectid.ObjectId()
+        other_job_id = bson.objectid.ObjectId()
+
+        self.db["build_delta"].insert(
+            {"_id": "0", "request_hash": "0", "referenced_jobs": [job_id]})
+        self.db["build_delta"].insert(
+            {"_id": "1", "request_hash": "1", "referenced_jobs": [job_id]})
+        self.db["boot_delta"].insert(
+            {
+                "_id": "2",
+                "request_hash": "2", "referenced_jobs": [other_job_id]
+            }
+        )
+
+        ret_val = utils.compare.common.invalidate_delta_docs(job_id, self.db)
+
+        self.assertEqual(200, ret_val)
+        self.assertIsNone(
+            utils.compare.common.search_saved_delta_doc(
+                "0", "build_delta", {}))
+        self.assertIsNone(
+            utils.compare.common.search_saved_delta_doc(
+                "1", "build_delta", {}))
+        self.assertEqual(2, self.db["build_delta"].count())
+        self.assertIsNotNone(
+            self.db["boot_delta"].find_one({"request_hash": "2"}))
+
+
+    def test_pending_delta_doc(self):
+        pending_id = utils.compare.common.create_pending_delta_doc(
+            self.db["job_delta"])
+        self.assertEqual(
+            "PENDING", self.db["job_delta"].find_one(pending_id)["status"])
+
+        ret_val = utils.compare.common.complete_pending_delta_doc(
+            pending_id,
+            (400, [], None, {400: ["Missing data"]}), "job_delta", {})
+        pending = self.db["job_delta"].find_one(pending_id)
+
+        self.assertEqual(200, ret_val)
+        self.assertEqual("COMPLETE", pending["status"])
+        self.assertEqual(400, pending["status_code"])
+        self.assertEqual(["Missing data"], pending["errors"])
+        self.assertIsNone(pending["delta_id"])
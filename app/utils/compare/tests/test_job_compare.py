@@ -808,3 +808,50 @@ class TestJobCompare(unittest.TestCase):
 
         self.assertEqual(3, len(compare_data))
         self.assertListEqual(exp_delta_data, delta_data)
+
+    def test_n_way_compare_same_status(self):
+        baseline_docs = [
+            {
+                "arch": "arch",
+                "defconfig": "defconfig0",
+                "defconfig_full": "defconfig_full0",
+                "job": "job",
+                "kernel": "kernel",
+                "status": "PASS",
+                "_id": "0"
+            },
+            {
+                "arch": "arch",
+                "defconfig": "defconfig1",
+                "defconfig_full": "defconfig_full1",
+                "job": "job",
+                "kernel": "kernel",
+                "status": None,
+                "_id": "1"
+            }
+        ]
+
+        compare_docs = [
+            {
+                "arch": "arch",
+                "defconfig": "defconfig0",
+                "defconfig_full": "defconfig_full0",
+                "job": "compare_job",
+                "kernel": "compare_kernel",
+                "status": "PASS",
+                "_id": "2"
+            }
+        ]
+
+        exp_delta_data = [
+            (("defconfig1", "defconfig_full1", "arch"), [(None, "1"), None])
+        ]
+
+        baseline = utils.compare.job.CompareJob(baseline_docs)
+        compare_to = utils.compare.job.CompareJob(compare_docs)
+
+        compare_data, delta_data = utils.compare.job._n_way_compare(
+            baseline, [compare_to])
+
+        self.assertEqual(1, len(compare_data))
+        self.assertListEqual(exp_delta_data, delta_data)
@@ -13,16 +13,242 @@
 
 """Collection of mongodb database operations."""
 
+import contextlib
+import os
 import pymongo
 import pymongo.errors
+import time
+import tornado.options
 import types
 
 import models
 import models.base as mbase
 import utils
+import utils.instrumentation
 
 CLIENT = None
 
+# How many documents are inserted with a single bulk operation.
+BULK_CHUNK_SIZE = 1000
+
+# The configuration file of the server.
+CONFIG_FILE = "/etc/linaro/kernelci-backend.cfg"
+
+# The connection parameters the scripts can read from the configuration file
+# of the server: (name, type, default value).
+DB_OPTIONS = [
+    ("mongodb_host", str, "localhost"),
+    ("mongodb_port", int, 27017),
+    ("mongodb_user", str, ""),
+    ("mongodb_password", str, ""),
+    ("redis_host", str, "localhost"),
+    ("redis_port", int, 6379),
+    ("redis_db", int, 0),
+    ("redis_password", str, "")
+]
+
+
+class TimedMongoClient(pymongo.MongoClient):
+    """A MongoClient that times the messages exchanged with the server.
+
+    The time is added to the request timer bound to the current thread, if
+    any: see `utils.instrumentation`. Both the operations and the retrieval
+    of the cursor batches are accounted for.
+    """
+
+    def _send_message(self, *args, **kwargs):
+        start = time.time()
+        try:
+            result = super(TimedMongoClient, self)._send_message(
+                *args, **kwargs)
+        finally:
+            utils.instrumentation.add_time(
+                utils.instrumentation.DB_PHASE, time.time() - start)
+
+        return result
+
+    def _send_message_with_response(self, *args, **kwargs):
+        start = time.time()
+        try:
+            result = super(
+                TimedMongoClient, self)._send_message_with_response(
+                    *args, **kwargs)
+        finally:
+            utils.instrumentation.add_time(
+                utils.instrumentation.DB_PHASE, time.time() - start)
+
+        return result
+
+
+@contextlib.contextmanager
+def _recorded(collection, operation, spec=None, sort=None):
+    """Record the query performed in the context.
+
+    The query is added to the query recorder bound to the current thread, if
+    any, and notified to the query listeners: see `utils.instrumentation`.
+
+    :param collection: The collection, or its name.
+    :param operation: The name of the operation.
+    :type operation: str
+    :param spec: The spec of the query.
+    :param sort: The sort of the query.
+    :type sort: list
+    """
+    name = getattr(collection, "name", collection)
+    start = time.time()
+    try:
+        yield
+    finally:
+        utils.instrumentation.record_query(
+            name, operation, spec, time.time() - start)
+
+    _notify(name, spec, sort)
+
+
+def _notify(name, spec, sort):
+    """Notify a query to the query listeners, if any.
+
+    :param name: The name of the collection.
+    :type name: str
+    :param spec: The spec of the query.
+    :param sort: The sort of the query.
+    :type sort: list
+    """
+    if utils.instrumentation.QUERY_LISTENERS and any([spec, sort]):
+        utils.instrumentation.notify_query(name, spec, sort)
+
+
+class RecordedCursor(object):
+    """Wrap a cursor to record its query when the documents are fetched.
+
+    The documents of a cursor are fetched lazily while it is iterated: the
+    query is recorded, with the time spent fetching them, once the cursor is
+    exhausted, closed or discarded. It is recorded with the query recorder of
+    the thread that created the cursor, even if it is iterated by another one.
+
+    When iterated by a thread without a request timer, like while a response
+    is serialized, the fetch time is added to the DB phase of the timer of
+    the thread that created the cursor.
+
+    All the other attributes are the ones of the wrapped cursor.
+    """
+
+    def __init__(self, cursor, collection, operation, spec):
+        """Wrap a cursor.
+
+        :param cursor: The cursor to wrap.
+        :param collection: The collection, or its name.
+        :param operation: The name of the operation.
+        :type operation: str
+        :param spec: The spec of the query.
+        """
+        self._cursor = cursor
+        self._name = getattr(collection, "name", collection)
+        self._operation = operation
+        self._spec = spec
+        self._recorder = utils.instrumentation.get_recorder()
+        self._timer = utils.instrumentation.get_timer()
+        self._duration = 0.0
+        self._recorded = False
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return self
+
+    def __del__(self):
+        self._record()
+
+    def next(self):
+        """Fetch the next document.
+
+        :return The document.
+        """
+        start = time.time()
+        try:
+            doc = self._cursor.next()
+        except StopIteration:
+            self._add_duration(time.time() - start)
+            self._record()
+            raise
+
+        self._add_duration(time.time() - start)
+        return doc
+
+    def close(self):
+        """Close the wrapped cursor."""
+        self._record()
+        self._cursor.close()
+
+    def _add_duration(self, duration):
+        """Add the time spent fetching documents.
+
+        :param duration: The time in seconds.
+        :type duration: float
+        """
+        self._duration += duration
+        # Otherwise the client already added it to the bound timer.
+        if all([
+                self._timer is not None,
+                utils.instrumentation.get_timer() is None]):
+            self._timer.add(utils.instrumentation.DB_PHASE, duration)
+
+    def _record(self):
+        """Record the query, only once."""
+        if not self._recorded:
+            self._recorded = True
+            utils.instrumentation.record_query(
+                self._name,
+                self._operation,
+                self._spec, self._duration, recorder=self._recorder)
+
+
+def add_db_arguments(parser):
+    """Add the database connection arguments to a command line parser.
+
+    To be used by the scripts with `get_db_options`.
+
+    :param parser: The command line parser.
+    :type parser: argparse.ArgumentParser
+    """
+    parser.add_argument(
+        "--config",
+        default=CONFIG_FILE,
+        help="The server configuration file with the connection parameters")
+    for name, option_type, _ in DB_OPTIONS:
+        parser.add_argument(
+            "--" + name.replace("_", "-"),
+            dest=name,
+            type=option_type,
+            default=None, help="Override the %s configuration value" % name)
+
+
+def get_db_options(args):
+    """Get the database connection parameters for a script.
+
+    The parameters are read from the configuration file of the server, if it
+    exists, and overridden by the ones on the command line.
+
+    :param args: The parsed command line arguments: see `add_db_arguments`.
+    :return dict The connection parameters.
+    """
+    options = tornado.options.OptionParser()
+    for name, option_type, default in DB_OPTIONS:
+        options.define(name, default=default, type=option_type)
+
+    if os.path.isfile(args.config):
+        options.parse_config_file(args.config, final=False)
+
+    db_options = {}
+    for name, _, _ in DB_OPTIONS:
+        value = getattr(args, name, None)
+        if value is None:
+            value = options[name]
+        db_options[name] = value
+
+    return db_options
+
 
 def get_db_client(db_options):
     """Create a MongoDB connection.
@@ -42,7 +268,7 @@ def get_db_client(db_options):
         db_port = db_options_get("mongodb_port", 27017)
         db_pool = db_options_get("mongodb_pool", 100)
 
-        CLIENT = pymongo.MongoClient(
+        CLIENT = TimedMongoClient(
             host=db_host, port=db_port, max_pool_size=db_pool, w="majority")
 
     return CLIENT
@@ -95,7 +321,7 @@ def get_db_connection(db_options, db_name=models.DB_NAME):
     db_user = db_options_get("mongodb_user", "")
     db_pwd = db_options_get("mongodb_password", "")
 
-    connection = pymongo.MongoClient(
+    connection = TimedMongoClient(
         host=db_host, port=db_port, max_pool_size=db_pool, w="majority"
     )[db_name]
 
@@ -133,12 +359,9 @@ def find_one(collection, value, field="_id", operator="$in", fields=None):
             type(value)
         )
     else:
-        result = collection.find_one(
-            {
-                field: {operator: value}
-            },
-            fields=fields,
-        )
+        spec = {field: {operator: value}}
+        with _recorded(collection, "find_one", spec):
+            result = collection.find_one(spec, fields=fields)
 
     return result
 
@@ -155,7 +378,10 @@ def find_one2(collection, spec_or_id, fields=None):
     result.
     :return None or the search result as a dictionary.
     """
-    return collection.find_one(spec_or_id, fields=fields)
+    with _recorded(collection, "find_one", spec_or_id):
+        result = collection.find_one(spec_or_id, fields=fields)
+
+    return result
 
 
 def find_one3(
@@ -176,7 +402,10 @@ def find_one3(
     :return None or the search result as a dictionary.
     """
     db = get_db_connection2(db_options)
-    return db[collection].find_one(spec_or_id, fields=fields, sort=sort)
+    with _recorded(collection, "find_one", spec_or_id, sort=sort):
+        result = db[collection].find_one(spec_or_id, fields=fields, sort=sort)
+
+    return result
 
 
 def find(collection, limit, skip, spec=None, fields=None, sort=None):
@@ -200,8 +429,78 @@ def find(collection, limit, skip, spec=None, fields=None, sort=None):
     :type list
     :return A list of documents matching the specified values.
     """
-    return collection.find(
-        limit=limit, skip=skip, fields=fields, sort=sort, spec=spec)
+    result = RecordedCursor(
+        collection.find(
+            limit=limit, skip=skip, fields=fields, sort=sort, spec=spec),
+        collection, "find", spec)
+    _notify(getattr(collection, "name", collection), spec, sort)
+
+    return result
+
+
+def _match_spec(doc, spec):
+    """Check if a document matches all the key-value pairs of a spec.
+
+    Missing keys in the document are considered as None, as a MongoDB query
+    would.
+
+    :param doc: The document to check.
+    :type doc: dict
+    :param spec: The simple equality spec to match.
+    :type spec: dict
+    :return True or False.
+    """
+    d_get = doc.get
+    return all(d_get(key, None) == value for key, value in spec.iteritems())
+
+
+def find_by_specs(collection, specs, fields=None):
+    """Search the documents matching a list of specs with a single query.
+
+    All the specs are combined with an `$or` operator and the retrieved
+    documents are then matched back to each spec. Only simple equality specs
+    are supported.
+
+    :param collection: The collection where to search.
+    :param specs: The list of specs to search.
+    :type specs: list
+    :param fields: The fields that should be returned. The keys used in the
+    specs are always returned.
+    :type fields: list
+    :return A list with, for each spec in the same position, a copy of the
+    first document matching it or None.
+    """
+    found = [None] * len(specs)
+
+    if specs:
+        unique_specs = []
+        for spec in specs:
+            if spec not in unique_specs:
+                unique_specs.append(spec)
+
+        if len(unique_specs) == 1:
+            query = unique_specs[0]
+        else:
+            query = {"$or": unique_specs}
+
+        if fields:
+            fields = list(fields)
+            for spec in unique_specs:
+                fields.extend(k for k in spec.iterkeys() if k not in fields)
+
+        docs = find(collection, 0, 0, spec=query, fields=fields)
+        if docs:
+            missing = set(range(len(specs)))
+            for doc in docs:
+                for idx in list(missing):
+                    if _match_spec(doc, specs[idx]):
+                        found[idx] = dict(doc)
+                        missing.discard(idx)
+
+                if not missing:
+                    break
+
+    return found
 
 
 def find_and_count(collection, limit, skip, spec=None, fields=None, sort=None):
@@ -228,10 +527,123 @@ def find_and_count(collection, limit, skip, spec=None, fields=None, sort=None):
     :type list
     :return The search result and the total count.
     """
-    db_result = collection.find(
-        spec=spec, limit=limit, skip=skip, fields=fields, sort=sort)
+    db_result = RecordedCursor(
+        collection.find(
+            spec=spec, limit=limit, skip=skip, fields=fields, sort=sort),
+        collection, "find", spec)
+    _notify(getattr(collection, "name", collection), spec, sort)
+    with _recorded(collection, "count", spec):
+        db_count = db_result.count()
+
+    return db_result, db_count
 
-    return db_result, db_result.count()
+
+def _find_index_name(stage):
+    """Search the name of the index used by a query plan stage.
+
+    :param stage: The stage of the query plan, as returned by MongoDB 3.0 or
+    later.
+    :type stage: dict
+    :return The index name or None if the stage does not use an index.
+    """
+    index_name = stage.get("indexName", None)
+
+    if index_name is None:
+        stages = list(stage.get("inputStages", []))
+        if "inputStage" in stage:
+            stages.append(stage["inputStage"])
+
+        for input_stage in stages:
+            index_name = _find_index_name(input_stage)
+            if index_name is not None:
+                break
+
+    return index_name
+
+
+def get_explain_summary(explain):
+    """Summarize the output of a query `explain`.
+
+    Both the MongoDB 3.0 and later output and the older one are supported.
+
+    :param explain: The output of the `explain` command.
+    :type explain: dict
+    :return dict A dictionary with the "index" used (None for a collection
+    scan), the number of "docs_examined", "keys_examined" and
+    "docs_returned", the "execution_time" in milliseconds, and the winning
+    "plan".
+    """
+    if "queryPlanner" in explain:
+        plan = explain["queryPlanner"].get("winningPlan", {})
+        stats = explain.get("executionStats", {})
+        stats_get = stats.get
+
+        summary = {
+            "index": _find_index_name(plan),
+            "docs_examined": stats_get("totalDocsExamined", None),
+            "keys_examined": stats_get("totalKeysExamined", None),
+            "docs_returned": stats_get("nReturned", None),
+            "execution_time": stats_get("executionTimeMillis", None),
+            "plan": plan
+        }
+    else:
+        explain_get = explain.get
+        cursor = explain_get("cursor", "")
+        index = None
+        if cursor.startswith("BtreeCursor "):
+            index = cursor.split(" ", 1)[1]
+
+        summary = {
+            "index": index,
+            "docs_examined": explain_get("nscannedObjects", None),
+            "keys_examined": explain_get("nscanned", None),
+            "docs_returned": explain_get("n", None),
+            "execution_time": explain_get("millis", None),
+            "plan": {
+                "cursor": cursor,
+                "indexBounds": explain_get("indexBounds", None),
+                "scanAndOrder": explain_get("scanAndOrder", None)
+            }
+        }
+
+    return summary
+
+
+def explain(collection, spec=None, fields=None, sort=None, skip=0, limit=0):
+    """Explain how a `find` query is executed.
+
+    The query is run by the database to collect the execution statistics.
+
+    :param collection: The collection where to search.
+    :param spec: A dictionary object with key-value fields to be matched.
+    :type spec: dict
+    :param fields: The fields that should be returned or excluded from the
+        result.
+    :type str, list, dict
+    :param sort: Whose fields the result should be sorted on.
+    :type list
+    :param skip: How many document to skip from the result.
+    :type skip: int
+    :param limit: How many documents to return.
+    :type limit: int
+    :return dict The summary of the query plan, see `get_explain_summary`,
+    with the "query" that has been explained.
+    """
+    with _recorded(collection, "explain", spec):
+        result = collection.find(
+            spec=spec,
+            fields=fields, sort=sort, skip=skip, limit=limit).explain()
+
+    summary = get_explain_summary(result)
+    summary["query"] = {
+        "spec": spec,
+        "fields": fields,
+        "sort": sort,
+        "skip": skip,
+        "limit": limit
+    }
+
+    return summary
 
 
 def count(collection):
@@ -240,7 +652,10 @@ def count(collection):
     :param collection: The collection whose documents should be counted.
     :return The number of documents in the collection.
     """
-    return collection.count()
+    with _recorded(collection, "count"):
+        result = collection.count()
+
+    return result
 
 
 def save(database, document, manipulate=False):
@@ -262,8 +677,9 @@ def save(database, document, manipulate=False):
 
     if isinstance(document, mbase.BaseDocument):
         try:
-            doc_id = database[document.collection].save(
-                document.to_dict(), manipulate=manipulate)
+            with _recorded(document.collection, "save"):
+                doc_id = database[document.collection].save(
+                    document.to_dict(), manipulate=manipulate)
             ret_value = 201
         except pymongo.errors.OperationFailure, ex:
             utils.LOG.error(
@@ -299,7 +715,8 @@ def save3(collection, document, manipulate=True, db_options=None):
 
     if isinstance(document, types.DictionaryType):
         try:
-            doc_id = db[collection].save(document, manipulate=manipulate)
+            with _recorded(collection, "save"):
+                doc_id = db[collection].save(document, manipulate=manipulate)
             ret_val = 201
         except pymongo.errors.OperationFailure as ex:
             utils.LOG.error("Error saving document into '%s'", collection)
@@ -331,8 +748,9 @@ def save2(connection, collection, document, manipulate=True):
 
     if isinstance(document, types.DictionaryType):
         try:
-            doc_id = \
-                connection[collection].save(document, manipulate=manipulate)
+            with _recorded(collection, "save"):
+                doc_id = connection[collection].save(
+                    document, manipulate=manipulate)
             ret_val = 201
         except pymongo.errors.OperationFailure as ex:
             utils.LOG.error("Error saving document into '%s'", collection)
@@ -389,7 +807,59 @@ def save_all(database, documents, manipulate=False, fail_on_err=False):
     return ret_value, doc_id
 
 
-def update(collection, spec, document, operation="$set"):
+def insert_all(database, documents, chunk_size=BULK_CHUNK_SIZE):
+    """Insert a list of new documents with bulk operations.
+
+    Differently from `save_all`, the documents are sent to the database in
+    chunks of `chunk_size` documents, with one round-trip for each chunk.
+    The documents must not be already in the database.
+
+    :param database: The database where to save.
+    :param documents: The list of `BaseDocument` documents.
+    :type documents: list
+    :param chunk_size: How many documents to insert with a single operation.
+    :type chunk_size: int
+    :return A tuple: first element is the operation code (201 if the insert
+    has success, 500 in case of an error), second element is the list of the
+    mongodb created `_id` values, in the same order of the documents. None
+    is used for the documents that have not been saved.
+    """
+    ret_value = 201
+    doc_ids = [None] * len(documents)
+
+    # Group the documents by their collection, keeping their position.
+    by_collection = {}
+    for idx, document in enumerate(documents):
+        if isinstance(document, mbase.BaseDocument):
+            by_collection.setdefault(document.collection, []).append(
+                (idx, document.to_dict()))
+        else:
+            utils.LOG.error(
+                "Cannot save document, it is not of type BaseDocument, got %s",
+                type(document))
+            ret_value = 500
+
+    for collection, to_insert in by_collection.iteritems():
+        for start in xrange(0, len(to_insert), chunk_size):
+            chunk = to_insert[start:start + chunk_size]
+            try:
+                with _recorded(collection, "insert"):
+                    inserted = database[collection].insert(
+                        [doc for _, doc in chunk])
+                for (idx, _), doc_id in zip(chunk, inserted):
+                    doc_ids[idx] = doc_id
+            except pymongo.errors.OperationFailure, ex:
+                utils.LOG.error(
+                    "Error inserting documents into '%s'", collection)
+                utils.LOG.exception(ex)
+                ret_value = 500
+
+    return ret_value, doc_ids
+
+
+def update(
+        collection, spec, document, operation="$set", upsert=False,
+        multi=False):
     """Update a document with the provided values.
 
     The operation is performed on the collection based on the `spec` provided.
@@ -404,12 +874,18 @@ def update(collection, spec, document, operation="$set"):
     :type dict
     :param operation: The operation to perform. By default is `$set`.
     :type str
+    :param upsert: If the document should be created when not found.
+    :type bool
+    :param multi: If all the matching documents should be updated.
+    :type bool
     :return 200 if the update has success, 500 in case of an error.
     """
     ret_val = 200
 
     try:
-        collection.update(spec, {operation: document})
+        with _recorded(collection, "update", spec):
+            collection.update(
+                spec, {operation: document}, upsert=upsert, multi=multi)
     except pymongo.errors.OperationFailure, ex:
         utils.LOG.exception(str(ex))
         ret_val = 500
@@ -417,6 +893,67 @@ def update(collection, spec, document, operation="$set"):
     return ret_val
 
 
+def insert(collection, document):
+    """Insert a new document.
+
+    Differently from the `save` functions, the errors are not handled: a
+    `pymongo.errors.DuplicateKeyError` tells the caller that a document with
+    the same unique keys already exists.
+
+    :param collection: The collection where to insert the document.
+    :param document: The document to insert.
+    :type document: dict
+    :return The ID of the inserted document.
+    """
+    with _recorded(collection, "insert"):
+        doc_id = collection.insert(document)
+
+    return doc_id
+
+
+def find_and_modify(collection, spec, document, fields=None, upsert=False):
+    """Atomically update a document and return it as it was before.
+
+    The errors are not handled.
+
+    :param collection: The collection where to search.
+    :param spec: The spec of the document to update.
+    :type spec: dict
+    :param document: The update document with the operations to perform.
+    :type document: dict
+    :param fields: The fields of the document to return.
+    :type fields: list
+    :param upsert: If the document should be created when not found.
+    :type upsert: bool
+    :return The document before the update, or None if not found.
+    """
+    with _recorded(collection, "find_and_modify", spec):
+        result = collection.find_and_modify(
+            spec, document, fields=fields, upsert=upsert)
+
+    return result
+
+
+def aggregate_pipeline(collection, pipeline):
+    """Run an aggregation pipeline.
+
+    The errors are not handled.
+
+    :param collection: The collection to aggregate.
+    :param pipeline: The aggregation stages.
+    :type pipeline: list
+    :return list The resulting documents.
+    """
+    match = None
+    if pipeline:
+        match = pipeline[0].get("$match", None)
+
+    with _recorded(collection, "aggregate", match):
+        result = collection.aggregate(pipeline)
+
+    return result["result"]
+
+
 def update2(connection, collection, search, document):
     """Update a document in the database.
 
@@ -432,7 +969,8 @@ def update2(connection, collection, search, document):
     """
     ret_val = 200
     try:
-        connection[collection].update(search, document)
+        with _recorded(collection, "update", search):
+            connection[collection].update(search, document)
     except pymongo.errors.OperationFailure, ex:
         utils.LOG.exception(str(ex))
         ret_val = 500
@@ -457,7 +995,8 @@ def update3(collection, search, document, db_options=None):
     ret_val = 200
     db = get_db_connection2(db_options)
     try:
-        db[collection].update(search, document)
+        with _recorded(collection, "update", search):
+            db[collection].update(search, document)
     except pymongo.errors.OperationFailure, ex:
         utils.LOG.exception(str(ex))
         ret_val = 500
@@ -480,11 +1019,12 @@ def find_and_update(collection, query, document, operation="$set"):
     ret_val = 200
 
     try:
-        result = collection.find_and_modify(
-            query,
-            {operation: document},
-            fields=[models.ID_KEY]
-        )
+        with _recorded(collection, "find_and_modify", query):
+            result = collection.find_and_modify(
+                query,
+                {operation: document},
+                fields=[models.ID_KEY]
+            )
         if not result:
             utils.LOG.error("Document with query '%s' not found", query)
             ret_val = 404
@@ -510,7 +1050,8 @@ def delete(collection, spec_or_id):
     ret_val = 200
 
     try:
-        collection.remove(spec_or_id)
+        with _recorded(collection, "remove", spec_or_id):
+            collection.remove(spec_or_id)
     except pymongo.errors.OperationFailure, ex:
         utils.LOG.error(
             "Error removing the following document: %s", str(spec_or_id))
@@ -611,7 +1152,8 @@ def aggregate(
     if all([limit is not None, limit > 0]):
         pipeline.append({"$limit": limit})
 
-    result = collection.aggregate(pipeline)
+    with _recorded(collection, "aggregate", match):
+        result = collection.aggregate(pipeline)
 
     if result and isinstance(result, types.DictionaryType):
         p_results = result.get("result", None)
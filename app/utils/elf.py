@@ -16,9 +16,13 @@
 import elftools.elf.constants as elfconst
 import elftools.elf.elffile as elffile
 import io
+import mmap
 import os
+import struct
 
 import models
+import utils
+import utils.cache
 
 
 # Default section names and their build document keys to look in the ELF file.
@@ -32,6 +36,42 @@ DEFAULT_ELF_SECTIONS = [
 ELF_WA_FLAG = elfconst.SH_FLAGS.SHF_WRITE | elfconst.SH_FLAGS.SHF_ALLOC
 ELF_A_FLAG = elfconst.SH_FLAGS.SHF_ALLOC
 
+SHT_PROGBITS = 1
+# Section index values.
+SHN_UNDEF = 0
+SHN_XINDEX = 0xffff
+
+ELF_MAGIC = b"\x7fELF"
+# The ELF class and data encoding values from the identification bytes.
+ELF_CLASS_32 = 1
+ELF_CLASS_64 = 2
+ELF_DATA_LSB = 1
+ELF_DATA_MSB = 2
+
+# The struct formats, without the byte order, of the ELF header fields after
+# the identification bytes (e_type up to e_shstrndx), and of the section
+# header (sh_name, sh_type, sh_flags, sh_addr, sh_offset and sh_size, the
+# other fields are not needed).
+ELF_HEADER_FMT = {
+    ELF_CLASS_32: "HHIIIIIHHHHHH",
+    ELF_CLASS_64: "HHIQQQIHHHHHH"
+}
+SECTION_HEADER_FMT = {
+    ELF_CLASS_32: "IIIIII",
+    ELF_CLASS_64: "IIQQQQ"
+}
+ELF_BYTE_ORDER = {
+    ELF_DATA_LSB: "<",
+    ELF_DATA_MSB: ">"
+}
+ELF_IDENT_SIZE = 16
+
+# The extracted values, keyed by file path, modification time and size.
+# Maximum number of entries: the cache is emptied when it grows bigger.
+ELF_CACHE_SIZE = 1024
+# The entries never expire: a modified file has a different key.
+ELF_CACHE = utils.cache.TTLCache(None, ELF_CACHE_SIZE, name="elf")
+
 
 def calculate_data_size(elf_file):
     """Loop through the ELF file sections and compute the .data size.
@@ -53,6 +93,132 @@ def calculate_data_size(elf_file):
     return data_size
 
 
+def _read_section_headers(elf_map):
+    """Read the section headers of an ELF file.
+
+    Only the ELF header, the section header table and the section names are
+    read.
+
+    :param elf_map: The mapped ELF file.
+    :type elf_map: mmap.mmap
+    :return A list of 4-tuples, one for each section: the name, the type, the
+    flags and the size of the section.
+    :raise ValueError if the file is not a valid ELF file.
+    """
+    ident = elf_map[:ELF_IDENT_SIZE]
+    if len(ident) < ELF_IDENT_SIZE or ident[:4] != ELF_MAGIC:
+        raise ValueError("Not an ELF file")
+
+    elf_class = ord(ident[4])
+    byte_order = ELF_BYTE_ORDER.get(ord(ident[5]), None)
+    if any([elf_class not in ELF_HEADER_FMT, byte_order is None]):
+        raise ValueError("Unknown ELF class or data encoding")
+
+    header_fmt = byte_order + ELF_HEADER_FMT[elf_class]
+    section_fmt = byte_order + SECTION_HEADER_FMT[elf_class]
+    section_size = struct.calcsize(section_fmt)
+
+    header = struct.unpack_from(header_fmt, elf_map, ELF_IDENT_SIZE)
+    sh_off, sh_entsize, sh_num, sh_strndx = \
+        header[5], header[10], header[11], header[12]
+
+    sections = []
+    if sh_off:
+        # The first section header holds the real values when they do not
+        # fit in the ELF header.
+        first = struct.unpack_from(section_fmt, elf_map, sh_off)
+        if sh_num == 0:
+            sh_num = first[5]
+        if sh_strndx == SHN_XINDEX:
+            sh_strndx = struct.unpack_from(
+                byte_order + "I", elf_map, sh_off + section_size)[0]
+
+        headers = [
+            struct.unpack_from(section_fmt, elf_map, sh_off + idx * sh_entsize)
+            for idx in xrange(sh_num)
+        ]
+
+        str_offset = 0
+        if sh_strndx != SHN_UNDEF:
+            str_offset = headers[sh_strndx][4]
+
+        for header in headers:
+            name = ""
+            if str_offset:
+                start = str_offset + header[0]
+                name = elf_map[start:elf_map.find(b"\x00", start)]
+            sections.append((name, header[1], header[2], header[5]))
+
+    return sections
+
+
+def _fast_read(path):
+    """Extract the section sizes reading only the ELF section headers.
+
+    :param path: The path to the vmlinux file.
+    :type path: str
+    :return A dictionary with the extracted values.
+    :raise ValueError if the file is not a valid ELF file.
+    """
+    extracted = {}
+    data_size = 0
+    has_data = False
+    wanted = dict(DEFAULT_ELF_SECTIONS)
+
+    with io.open(path, mode="rb") as vmlinux_strm:
+        elf_map = mmap.mmap(
+            vmlinux_strm.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            sections = _read_section_headers(elf_map)
+        except struct.error, ex:
+            raise ValueError(str(ex))
+        finally:
+            elf_map.close()
+
+    for name, sh_type, sh_flags, sh_size in sections:
+        if name in wanted and wanted[name] not in extracted:
+            extracted[wanted[name]] = sh_size
+        elif name == ".data" and not has_data:
+            has_data = True
+            extracted[models.VMLINUX_DATA_SIZE_KEY] = sh_size
+
+        if all([sh_type == SHT_PROGBITS,
+                any([sh_flags == ELF_WA_FLAG, sh_flags == ELF_A_FLAG])]):
+            data_size += sh_size
+
+    if not has_data:
+        extracted[models.VMLINUX_DATA_SIZE_KEY] = data_size
+
+    return extracted
+
+
+def _elftools_read(path):
+    """Extract the section sizes with pyelftools.
+
+    :param path: The path to the vmlinux file.
+    :type path: str
+    :return A dictionary with the extracted values.
+    """
+    extracted = {}
+
+    with io.open(path, mode="rb") as vmlinux_strm:
+        elf_file = elffile.ELFFile(vmlinux_strm)
+
+        for elf_sect in DEFAULT_ELF_SECTIONS:
+            sect = elf_file.get_section_by_name(elf_sect[0])
+            if sect:
+                extracted[elf_sect[1]] = sect["sh_size"]
+
+        data_sect = elf_file.get_section_by_name(".data")
+        if data_sect:
+            extracted[models.VMLINUX_DATA_SIZE_KEY] = data_sect["sh_size"]
+        else:
+            extracted[models.VMLINUX_DATA_SIZE_KEY] = \
+                calculate_data_size(elf_file)
+
+    return extracted
+
+
 def read(path):
     """Read a vmlinux file and extract some info from it.
 
@@ -63,6 +229,10 @@ def read(path):
         1. Size of the .data section.
         2. Size of the .bss section.
 
+    Only the section headers are read, falling back to pyelftools if they
+    cannot be parsed. The values are cached by path, modification time and
+    size of the file: the same build can be imported many times.
+
     :param path: The path to the vmlinux file.
     :type path: str
     :return A dictionary with the extracted values.
@@ -70,19 +240,20 @@ def read(path):
     extracted = {}
 
     if os.path.isfile(path):
-        with io.open(path, mode="rb") as vmlinux_strm:
-            elf_file = elffile.ELFFile(vmlinux_strm)
-
-            for elf_sect in DEFAULT_ELF_SECTIONS:
-                sect = elf_file.get_section_by_name(elf_sect[0])
-                if sect:
-                    extracted[elf_sect[1]] = sect["sh_size"]
-
-            data_sect = elf_file.get_section_by_name(".data")
-            if data_sect:
-                extracted[models.VMLINUX_DATA_SIZE_KEY] = data_sect["sh_size"]
-            else:
-                extracted[models.VMLINUX_DATA_SIZE_KEY] = \
-                    calculate_data_size(elf_file)
+        stat = os.stat(path)
+        cache_key = (path, stat.st_mtime, stat.st_size)
+
+        cached = ELF_CACHE.get(cache_key)
+        if cached is not None:
+            extracted = dict(cached)
+        else:
+            try:
+                extracted = _fast_read(path)
+            except (ValueError, EnvironmentError), ex:
+                utils.LOG.warn(
+                    "Cannot read ELF section headers of '%s': %s", path, ex)
+                extracted = _elftools_read(path)
+
+            ELF_CACHE.set(cache_key, dict(extracted))
 
     return extracted
@@ -0,0 +1,506 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Advise on the database indexes from the shapes of the queries.
+
+The shape of a query is made of the fields matched by equality, the fields
+matched with a range or any other operator, and the sort. When enabled, the
+shapes of the queries performed through `utils.db` are counted by each
+process and periodically flushed to Redis, where the shapes of all the
+processes are collected.
+
+The shapes are then compared with the indexes of a database: the shapes
+without a suitable index are reported with a suggested one, together with
+the indexes that no shape uses. See `utils/scripts/index-advisor.py`.
+"""
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import numbers
+import pymongo.errors
+import redis
+import threading
+
+import utils
+import utils.db
+import utils.instrumentation
+
+# The Redis hash with the count of each shape.
+SHAPES_KEY = "index-advisor-shapes"
+
+# The operators that select one or a few values.
+EQUALITY_OPERATORS = frozenset(["$eq", "$in"])
+
+# How many documents are sampled to estimate the fields selectivity.
+DEFAULT_SAMPLE_SIZE = 1000
+
+COVERED_STATUS = "covered"
+MISSING_STATUS = "missing"
+PARTIAL_STATUS = "partial"
+
+
+def _is_operator_dict(value):
+    """Check if a spec value is made of query operators.
+
+    :param value: The spec value.
+    :return True or False.
+    """
+    return all([
+        isinstance(value, dict),
+        value, all(key.startswith("$") for key in value)
+    ])
+
+
+def get_query_shapes(spec, sort=None):
+    """Normalize a query into its shapes.
+
+    Each branch of an `$or` operator is a different shape, since MongoDB can
+    use a different index for each of them.
+
+    :param spec: The spec of the query, or a document ID.
+    :param sort: The sort of the query.
+    :type sort: list
+    :return list The shapes: 3-tuples with the sorted equality fields, the
+    sorted range fields, and the sort as (field, direction) tuples.
+    """
+    if spec is None:
+        spec = {}
+    elif not isinstance(spec, dict):
+        spec = {"_id": spec}
+
+    branches = [spec]
+    if spec.get("$or", None):
+        branches = []
+        for branch in spec["$or"]:
+            merged = dict(
+                (key, value)
+                for key, value in spec.iteritems() if key != "$or")
+            merged.update(branch)
+            branches.append(merged)
+
+    sort_shape = tuple(
+        (field, int(direction)) for field, direction in sort or [])
+
+    shapes = []
+    for branch in branches:
+        equality = set()
+        ranges = set()
+
+        for key, value in branch.iteritems():
+            if key.startswith("$"):
+                continue
+            if _is_operator_dict(value):
+                if EQUALITY_OPERATORS.issuperset(value):
+                    equality.add(key)
+                else:
+                    ranges.add(key)
+            else:
+                equality.add(key)
+
+        shape = (
+            tuple(sorted(equality)),
+            tuple(sorted(ranges - equality)), sort_shape)
+        if any(shape) and shape not in shapes:
+            shapes.append(shape)
+
+    return shapes
+
+
+def _shape_to_json(key):
+    """Serialize a collection shape key.
+
+    :param key: The collection name followed by the shape.
+    :type key: tuple
+    :return str The JSON string.
+    """
+    collection, equality, ranges, sort = key
+    return json.dumps(
+        [collection, list(equality), list(ranges), [list(s) for s in sort]])
+
+
+def _shape_from_json(value):
+    """Deserialize a collection shape key.
+
+    :param value: The JSON string.
+    :type value: str
+    :return tuple The collection name followed by the shape.
+    """
+    collection, equality, ranges, sort = json.loads(value)
+    return (
+        collection,
+        tuple(equality),
+        tuple(ranges), tuple((field, direction) for field, direction in sort))
+
+
+class QueryShapes(object):
+    """Count the shapes of the queries performed by a process."""
+
+    def __init__(self):
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, collection, spec, sort):
+        """Count the shapes of a query.
+
+        :param collection: The name of the collection.
+        :type collection: str
+        :param spec: The spec of the query.
+        :param sort: The sort of the query.
+        :type sort: list
+        """
+        for shape in get_query_shapes(spec, sort):
+            key = (collection,) + shape
+            with self._lock:
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def flush(self, redis_conn):
+        """Add the counted shapes to the ones stored in Redis.
+
+        The counts are reset. Errors are logged and ignored.
+
+        :param redis_conn: The Redis connection.
+        """
+        with self._lock:
+            counts = self.counts
+            self.counts = {}
+
+        if counts:
+            try:
+                pipe = redis_conn.pipeline(transaction=False)
+                for key, count in counts.iteritems():
+                    pipe.hincrby(SHAPES_KEY, _shape_to_json(key), count)
+                pipe.execute()
+            except redis.exceptions.RedisError, ex:
+                utils.LOG.warn("Error storing the query shapes")
+                utils.LOG.exception(ex)
+
+
+# The shapes of this process.
+SHAPES = QueryShapes()
+
+
+def enable():
+    """Start counting the shapes of the queries in `SHAPES`."""
+    if SHAPES.record not in utils.instrumentation.QUERY_LISTENERS:
+        utils.instrumentation.QUERY_LISTENERS.append(SHAPES.record)
+
+
+def disable():
+    """Stop counting the shapes of the queries."""
+    if SHAPES.record in utils.instrumentation.QUERY_LISTENERS:
+        utils.instrumentation.QUERY_LISTENERS.remove(SHAPES.record)
+
+
+def load_shapes(redis_conn):
+    """Load the shapes stored in Redis.
+
+    :param redis_conn: The Redis connection.
+    :return dict The count of each shape: the keys are the collection name
+    followed by the shape.
+    """
+    return dict(
+        (_shape_from_json(value), int(count))
+        for value, count in (redis_conn.hgetall(SHAPES_KEY) or {}).iteritems()
+    )
+
+
+def is_comparable_index(index_keys):
+    """Check if an index can be compared with the query shapes.
+
+    Only the indexes whose keys all have an ascending or descending direction
+    can: the text, hashed and geospatial ones cannot.
+
+    :param index_keys: The keys of the index: (field, direction) tuples.
+    :type index_keys: list
+    :return True or False.
+    """
+    return all([
+        isinstance(direction, numbers.Number) for _, direction in index_keys])
+
+
+def get_index_coverage(index_keys, shape):
+    """Check how an index serves a query shape.
+
+    Following the equality, sort, range rule, an index serves the whole
+    shape if its keys start with all the equality fields, in any order,
+    followed by the sort fields, with the same or all reversed directions,
+    and then by one of the range fields.
+
+    The indexes that are not comparable, see `is_comparable_index`, are never
+    used.
+
+    :param index_keys: The keys of the index: (field, direction) tuples.
+    :type index_keys: list
+    :param shape: The query shape.
+    :type shape: tuple
+    :return A 2-tuple: how many keys of the index are used, and True if the
+    index serves the whole shape, False otherwise.
+    """
+    if not is_comparable_index(index_keys):
+        return 0, False
+
+    equality, ranges, sort = shape
+    index_keys = [(field, int(direction)) for field, direction in index_keys]
+    fields = [field for field, _ in index_keys]
+
+    used = 0
+    missing = set(equality)
+    while used < len(fields) and fields[used] in missing:
+        missing.discard(fields[used])
+        used += 1
+
+    full = not missing
+
+    sort_keys = [
+        (field, direction) for field, direction in sort
+        if field not in equality]
+    if full and sort_keys:
+        index_part = index_keys[used:used + len(sort_keys)]
+        if any([
+                index_part == sort_keys,
+                index_part == [
+                    (field, -direction) for field, direction in sort_keys]]):
+            used += len(sort_keys)
+        else:
+            full = False
+
+    if full and ranges:
+        if used < len(fields) and fields[used] in ranges:
+            used += 1
+        else:
+            full = False
+
+    return used, full
+
+
+def _get_field_value(doc, field):
+    """Get the value of a field, following the dotted notation.
+
+    :param doc: The document.
+    :type doc: dict
+    :param field: The field name.
+    :type field: str
+    :return The value, or None.
+    """
+    value = doc
+    for part in field.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, None)
+        else:
+            value = None
+            break
+
+    return value
+
+
+def _sample_documents(collection, fields, sample_size):
+    """Pick a random sample of documents.
+
+    The whole collection is returned if it is not larger than the sample.
+    The `$sample` stage needs MongoDB 3.2: with older servers the first
+    documents in natural order are used, usually the oldest ones.
+
+    :param collection: The collection.
+    :param fields: The fields to retrieve.
+    :type fields: list
+    :param sample_size: How many documents to sample.
+    :type sample_size: int
+    :return The sampled documents.
+    """
+    if collection.count() > sample_size:
+        try:
+            return utils.db.aggregate_pipeline(
+                collection,
+                [
+                    {"$sample": {"size": sample_size}},
+                    {"$project": dict((field, True) for field in fields)}
+                ]
+            )
+        except pymongo.errors.OperationFailure:
+            utils.LOG.warn(
+                "Random sampling not available, using the first %d documents "
+                "of %s", sample_size, collection.name)
+
+    return collection.find({}, fields=list(fields), limit=sample_size)
+
+
+def sample_distinct_values(collection, fields, sample_size):
+    """Count the distinct values of some fields in a sample of documents.
+
+    The documents are picked at random: see `_sample_documents`.
+
+    :param collection: The collection.
+    :param fields: The fields whose values should be counted.
+    :type fields: list
+    :param sample_size: How many documents to sample.
+    :type sample_size: int
+    :return A 2-tuple: the number of distinct values of each field, and the
+    number of sampled documents.
+    """
+    values = dict((field, set()) for field in fields)
+    sampled = 0
+
+    if fields:
+        for doc in _sample_documents(collection, fields, sample_size):
+            sampled += 1
+            for field in fields:
+                value = _get_field_value(doc, field)
+                try:
+                    values[field].add(value)
+                except TypeError:
+                    values[field].add(repr(value))
+
+    return dict(
+        (field, len(field_values))
+        for field, field_values in values.iteritems()), sampled
+
+
+def estimate_selectivity(shape, distinct):
+    """Estimate which fraction of the documents a shape matches.
+
+    Only the equality fields are considered, as if independent and with
+    evenly distributed values.
+
+    :param shape: The query shape.
+    :type shape: tuple
+    :param distinct: The number of distinct values of each field.
+    :type distinct: dict
+    :return float The estimated fraction, between 0 and 1.
+    """
+    selectivity = 1.0
+    for field in shape[0]:
+        selectivity /= max(distinct.get(field, 1), 1)
+
+    return selectivity
+
+
+def suggest_index(shape, distinct):
+    """Suggest an index for a query shape.
+
+    The equality fields come first, the most selective ones before, then
+    the sort fields and the most selective range field.
+
+    :param shape: The query shape.
+    :type shape: tuple
+    :param distinct: The number of distinct values of each field.
+    :type distinct: dict
+    :return list The keys of the index: (field, direction) tuples.
+    """
+    equality, ranges, sort = shape
+
+    def _selective_first(fields):
+        return sorted(fields, key=lambda field: -distinct.get(field, 0))
+
+    keys = [(field, 1) for field in _selective_first(equality)]
+    keys.extend(
+        (field, direction)
+        for field, direction in sort if field not in equality)
+    if ranges:
+        keys.append((_selective_first(ranges)[0], 1))
+
+    return keys
+
+
+def advise(database, shapes, sample_size=DEFAULT_SAMPLE_SIZE):
+    """Compare the query shapes with the indexes of a database.
+
+    The unique and TTL indexes are never reported as unused, since they are
+    not there only for the queries. The indexes that cannot be compared with
+    the shapes, like the text ones, are reported apart.
+
+    :param database: The database connection.
+    :param shapes: The count of each shape, as returned by `load_shapes`.
+    :type shapes: dict
+    :param sample_size: How many documents of each collection to sample to
+    estimate the fields selectivity.
+    :type sample_size: int
+    :return dict For each collection, a dictionary with the "shapes", sorted
+    by count, the "unused" and the "not_comparable" index names and the
+    number of "sampled" documents.
+    """
+    by_collection = {}
+    for key, count in shapes.iteritems():
+        by_collection.setdefault(key[0], []).append((key[1:], count))
+
+    report = {}
+    for name, collection_shapes in by_collection.iteritems():
+        collection = database[name]
+        indexes = collection.index_information()
+
+        fields = set()
+        for shape, _ in collection_shapes:
+            fields.update(shape[0])
+            fields.update(shape[1])
+        distinct, sampled = sample_distinct_values(
+            collection, sorted(fields), sample_size)
+
+        used_indexes = set()
+        entries = []
+        for shape, count in sorted(
+                collection_shapes, key=lambda item: -item[1]):
+            best = (False, 0)
+            best_index = None
+            for index_name, index_info in sorted(indexes.iteritems()):
+                used, full = get_index_coverage(index_info["key"], shape)
+                if used > 0 and (full, used) > best:
+                    best = (full, used)
+                    best_index = index_name
+
+            if best_index is not None:
+                used_indexes.add(best_index)
+
+            entry = {
+                "count": count,
+                "equality": list(shape[0]),
+                "range": list(shape[1]),
+                "sort": list(shape[2]),
+                "index": best_index,
+                "selectivity": estimate_selectivity(shape, distinct)
+            }
+
+            if best[0]:
+                entry["status"] = COVERED_STATUS
+            else:
+                if best_index is None:
+                    entry["status"] = MISSING_STATUS
+                else:
+                    entry["status"] = PARTIAL_STATUS
+                entry["suggested"] = suggest_index(shape, distinct)
+
+            entries.append(entry)
+
+        report[name] = {
+            "shapes": entries,
+            "unused": sorted(
+                index_name
+                for index_name, index_info in indexes.iteritems()
+                if all([
+                    index_name != "_id_",
+                    index_name not in used_indexes,
+                    is_comparable_index(index_info["key"]),
+                    not index_info.get("unique", False),
+                    "expireAfterSeconds" not in index_info
+                ])
+            ),
+            "not_comparable": sorted(
+                index_name
+                for index_name, index_info in indexes.iteritems()
+                if not is_comparable_index(index_info["key"])
+            ),
+            "sampled": sampled
+        }
+
+    return report
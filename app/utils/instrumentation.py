@@ -0,0 +1,336 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Timing of the phases of a request and recording of the queries.
+
+A `RequestTimer` collects how long each phase of a request takes. While a
+request is executed, its timer is bound to the thread running it: code that
+has no access to the handler, like the MongoDB client, can add its time with
+`add_time`.
+
+In the same way, a `QueryRecorder` collects the queries performed by a unit
+of work, a request or a task, through the `utils.db` functions.
+"""
+
+import contextlib
+import threading
+import time
+
+import utils
+
+# The phases of a request.
+BODY_PHASE = "body"
+DB_PHASE = "db"
+QUERY_PHASE = "query"
+QUEUE_PHASE = "queue"
+SERIALIZE_PHASE = "serialize"
+TOKEN_PHASE = "token"
+TOTAL_PHASE = "total"
+
+PHASES = (
+    QUEUE_PHASE,
+    TOKEN_PHASE,
+    BODY_PHASE,
+    QUERY_PHASE,
+    DB_PHASE,
+    SERIALIZE_PHASE,
+    TOTAL_PHASE
+)
+
+# A warning is logged when a unit of work performs more queries.
+MAX_QUERIES = 100
+
+# The functions called with the collection name, the spec and the sort of
+# every query, from any thread.
+QUERY_LISTENERS = []
+
+_LOCAL = threading.local()
+
+
+class RequestTimer(object):
+    """Collect the time, in seconds, spent in each phase of a request."""
+
+    def __init__(self):
+        self.durations = {}
+        self.submitted = None
+
+    def add(self, phase, value):
+        """Add some time to a phase.
+
+        :param phase: The name of the phase.
+        :type phase: str
+        :param value: The time in seconds.
+        :type value: float
+        """
+        self.durations[phase] = self.durations.get(phase, 0.0) + value
+
+    @contextlib.contextmanager
+    def phase(self, phase):
+        """Time the code executed in the context as part of a phase.
+
+        The time added to the DB phase while in the context is not counted
+        again in the phase.
+
+        :param phase: The name of the phase.
+        :type phase: str
+        """
+        start = time.time()
+        db_start = self.durations.get(DB_PHASE, 0.0)
+        try:
+            yield
+        finally:
+            db_time = self.durations.get(DB_PHASE, 0.0) - db_start
+            self.add(phase, max(time.time() - start - db_time, 0.0))
+
+    def server_timing(self):
+        """Format the phases durations for the `Server-Timing` header.
+
+        :return str The header value, with the durations in milliseconds.
+        """
+        return ", ".join(
+            "%s;dur=%.3f" % (phase, self.durations[phase] * 1000)
+            for phase in PHASES if phase in self.durations
+        )
+
+
+def bind(timer):
+    """Bind a timer to the current thread.
+
+    :param timer: The timer, or None to unbind the current one.
+    :type timer: RequestTimer
+    """
+    _LOCAL.timer = timer
+
+
+def get_timer():
+    """The timer bound to the current thread.
+
+    :return A `RequestTimer` object or None.
+    """
+    return getattr(_LOCAL, "timer", None)
+
+
+def add_time(phase, value):
+    """Add some time to a phase of the timer bound to the current thread.
+
+    Nothing is done if there is no timer bound.
+
+    :param phase: The name of the phase.
+    :type phase: str
+    :param value: The time in seconds.
+    :type value: float
+    """
+    timer = getattr(_LOCAL, "timer", None)
+    if timer is not None:
+        timer.add(phase, value)
+
+
+@contextlib.contextmanager
+def timed(phase):
+    """Time the code executed in the context with the bound timer.
+
+    Nothing is timed if there is no timer bound to the current thread.
+
+    :param phase: The name of the phase.
+    :type phase: str
+    """
+    timer = getattr(_LOCAL, "timer", None)
+    if timer is None:
+        yield
+    else:
+        with timer.phase(phase):
+            yield
+
+
+class QueryRecorder(object):
+    """Collect the queries performed by a unit of work.
+
+    For each collection, the number of queries, their total time and the
+    slowest one are recorded.
+    """
+
+    def __init__(self, name, max_queries=MAX_QUERIES):
+        """Create a new recorder.
+
+        :param name: The name of the unit of work, used in the warnings.
+        :type name: str
+        :param max_queries: How many queries are expected at most.
+        :type max_queries: int
+        """
+        self.name = name
+        self.max_queries = max_queries
+        self.collections = {}
+        self.previous = None
+        self._lock = threading.Lock()
+
+    @property
+    def count(self):
+        """The total number of queries."""
+        return sum(stats["count"] for stats in self.collections.itervalues())
+
+    @property
+    def time(self):
+        """The total time of the queries, in seconds."""
+        return sum(stats["time"] for stats in self.collections.itervalues())
+
+    def record(self, collection, operation, spec, duration):
+        """Record a query.
+
+        :param collection: The name of the collection.
+        :type collection: str
+        :param operation: The name of the operation.
+        :type operation: str
+        :param spec: The spec of the query.
+        :param duration: How long the query took, in seconds.
+        :type duration: float
+        """
+        with self._lock:
+            stats = self.collections.get(collection, None)
+            if stats is None:
+                stats = self.collections[collection] = {
+                    "count": 0, "time": 0.0, "slowest": None}
+
+            stats["count"] += 1
+            stats["time"] += duration
+            if stats["slowest"] is None or duration > stats["slowest"][0]:
+                stats["slowest"] = (duration, operation, spec)
+
+    def get_count(self, collection):
+        """The number of queries performed on a collection.
+
+        :param collection: The name of the collection.
+        :type collection: str
+        :return int The number of queries.
+        """
+        stats = self.collections.get(collection, None)
+        return stats["count"] if stats else 0
+
+    def check(self):
+        """Log a warning if too many queries have been performed.
+
+        :return True if the number of queries is within the limit, False
+        otherwise.
+        """
+        within_limit = True
+        count = self.count
+
+        if self.max_queries is not None and count > self.max_queries:
+            within_limit = False
+            utils.LOG.warn(
+                "%s performed %d queries (%.3f s), more than %d",
+                self.name, count, self.time, self.max_queries)
+
+            for collection, stats in self.collections.iteritems():
+                duration, operation, spec = stats["slowest"]
+                utils.LOG.warn(
+                    "%s: %d queries on %s (%.3f s), slowest %s %s (%.3f s)",
+                    self.name, stats["count"], collection, stats["time"],
+                    operation, spec, duration)
+
+        return within_limit
+
+
+def start_recording(name, max_queries=MAX_QUERIES):
+    """Start recording the queries of the current thread.
+
+    The recorder replaces the one already bound to the thread, if any, until
+    `stop_recording` is called.
+
+    :param name: The name of the unit of work.
+    :type name: str
+    :param max_queries: How many queries are expected at most.
+    :type max_queries: int
+    :return The new `QueryRecorder` object.
+    """
+    recorder = QueryRecorder(name, max_queries=max_queries)
+    recorder.previous = getattr(_LOCAL, "recorder", None)
+    _LOCAL.recorder = recorder
+
+    return recorder
+
+
+def stop_recording():
+    """Stop recording the queries of the current thread.
+
+    A warning is logged if the unit of work performed too many queries. The
+    previous recorder, if any, is bound again to the thread.
+
+    :return The `QueryRecorder` object, or None if not recording.
+    """
+    recorder = getattr(_LOCAL, "recorder", None)
+    if recorder is not None:
+        _LOCAL.recorder = recorder.previous
+        recorder.previous = None
+        recorder.check()
+
+    return recorder
+
+
+@contextlib.contextmanager
+def record_queries(name, max_queries=MAX_QUERIES):
+    """Record the queries performed by the current thread in the context.
+
+    :param name: The name of the unit of work.
+    :type name: str
+    :param max_queries: How many queries are expected at most.
+    :type max_queries: int
+    """
+    recorder = start_recording(name, max_queries=max_queries)
+    try:
+        yield recorder
+    finally:
+        stop_recording()
+
+
+def get_recorder():
+    """The query recorder bound to the current thread.
+
+    :return A `QueryRecorder` object or None.
+    """
+    return getattr(_LOCAL, "recorder", None)
+
+
+def record_query(collection, operation, spec, duration, recorder=None):
+    """Record a query with the recorder bound to the current thread.
+
+    Nothing is done if there is no recorder bound.
+
+    :param collection: The name of the collection.
+    :type collection: str
+    :param operation: The name of the operation.
+    :type operation: str
+    :param spec: The spec of the query.
+    :param duration: How long the query took, in seconds.
+    :type duration: float
+    :param recorder: The recorder to use instead of the one bound to the
+    current thread.
+    :type recorder: QueryRecorder
+    """
+    if recorder is None:
+        recorder = getattr(_LOCAL, "recorder", None)
+    if recorder is not None:
+        recorder.record(collection, operation, spec, duration)
+
+
+def notify_query(collection, spec, sort):
+    """Notify a query to the `QUERY_LISTENERS` functions.
+
+    :param collection: The name of the collection.
+    :type collection: str
+    :param spec: The spec of the query.
+    :type spec: dict
+    :param sort: The sort of the query.
+    :type sort: list
+    """
+    for listener in QUERY_LISTENERS:
+        listener(collection, spec, sort)
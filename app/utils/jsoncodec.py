@@ -0,0 +1,205 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""JSON encoding and decoding of documents with BSON types.
+
+The documents are encoded with the MongoDB extended JSON notation, as done by
+`bson.json_util`. Two codecs are available:
+- "bson" uses the `bson.json_util` functions.
+- "fast" handles the `ObjectId` and `datetime` values, the most common ones,
+  natively and falls back to `bson.json_util` for the other types. It also
+  reuses the same encoder and decoder objects.
+
+Other codecs can be added with `register_codec`.
+"""
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import bson
+import bson.json_util
+import bson.tz_util
+import datetime
+import types
+
+import utils.cache
+
+EPOCH_AWARE = datetime.datetime.fromtimestamp(0, bson.tz_util.utc)
+EPOCH_NAIVE = datetime.datetime.utcfromtimestamp(0)
+
+INT_TYPES = (types.IntType, types.LongType)
+
+# The other keys of the extended JSON notation handled by `bson.json_util`.
+BSON_KEYS = frozenset([
+    "$binary",
+    "$code",
+    "$maxKey",
+    "$minKey",
+    "$numberLong",
+    "$ref",
+    "$regex",
+    "$timestamp",
+    "$undefined",
+    "$uuid"
+])
+
+# The decoded `ObjectId` objects, and the maximum size of the cache.
+OBJECT_ID_CACHE_SIZE = 4096
+OBJECT_ID_CACHE = utils.cache.TTLCache(
+    None, OBJECT_ID_CACHE_SIZE, name="object-ids")
+
+# The codec used when none is specified.
+DEFAULT_CODEC = "fast"
+
+# The registered codecs: name => (encode function, decode function).
+CODECS = {}
+
+
+def default(obj):
+    """Convert a BSON value into its JSON notation.
+
+    :param obj: The value to convert.
+    :return The JSON notation of the value.
+    """
+    obj_type = type(obj)
+
+    if obj_type is bson.ObjectId:
+        value = {"$oid": str(obj)}
+    elif obj_type is datetime.datetime:
+        if obj.tzinfo is None:
+            delta = obj - EPOCH_NAIVE
+        else:
+            delta = obj - EPOCH_AWARE
+        value = {
+            "$date": (
+                delta.days * 86400000 +
+                delta.seconds * 1000 + delta.microseconds // 1000)
+        }
+    else:
+        value = bson.json_util.default(obj)
+
+    return value
+
+
+def _get_object_id(value):
+    """Get the `ObjectId` of an hex string.
+
+    The same IDs are repeated in the documents, like the job or test suite
+    ones: the `ObjectId` objects, that cannot be modified, are cached.
+
+    :param value: The hex string of the ID.
+    :type value: str or unicode
+    :return An `ObjectId` object.
+    """
+    object_id = OBJECT_ID_CACHE.get(value)
+    if object_id is None:
+        object_id = bson.ObjectId(str(value))
+        OBJECT_ID_CACHE.set(value, object_id)
+
+    return object_id
+
+
+def object_hook(dct):
+    """Convert a JSON object with a BSON notation into its value.
+
+    :param dct: The decoded JSON object.
+    :type dct: dict
+    :return The BSON value, or the object itself.
+    """
+    value = dct
+
+    # The extended JSON notation uses objects with at most three keys.
+    if len(dct) <= 3:
+        if "$oid" in dct:
+            value = _get_object_id(dct["$oid"])
+        elif "$date" in dct:
+            if type(dct["$date"]) in INT_TYPES:
+                value = EPOCH_AWARE + datetime.timedelta(
+                    milliseconds=dct["$date"])
+            else:
+                value = bson.json_util.object_hook(dct)
+        elif not BSON_KEYS.isdisjoint(dct):
+            value = bson.json_util.object_hook(dct)
+
+    return value
+
+
+def _bson_encode(obj):
+    return json.dumps(
+        obj,
+        default=bson.json_util.default,
+        ensure_ascii=False, separators=(",", ":"))
+
+
+def _bson_decode(obj):
+    return json.loads(obj, object_hook=bson.json_util.object_hook)
+
+
+_FAST_ENCODER = json.JSONEncoder(
+    default=default, ensure_ascii=False, separators=(",", ":"))
+_FAST_DECODER = json.JSONDecoder(object_hook=object_hook)
+
+
+def register_codec(name, encode, decode):
+    """Register a new codec.
+
+    :param name: The name of the codec.
+    :type name: str
+    :param encode: The function to encode an object into a JSON string.
+    :type encode: function
+    :param decode: The function to decode a JSON string.
+    :type decode: function
+    """
+    CODECS[name] = (encode, decode)
+
+
+def set_default_codec(name):
+    """Set the codec used when none is specified.
+
+    :param name: The name of the codec.
+    :type name: str
+    """
+    global DEFAULT_CODEC
+
+    if name not in CODECS:
+        raise ValueError("Unknown JSON codec '%s'" % name)
+    DEFAULT_CODEC = name
+
+
+def dumps(obj, codec=None):
+    """Encode an object into a JSON string.
+
+    :param obj: The object to encode.
+    :param codec: The name of the codec to use.
+    :type codec: str
+    :return A JSON string.
+    """
+    return CODECS[codec or DEFAULT_CODEC][0](obj)
+
+
+def loads(obj, codec=None):
+    """Decode a JSON string.
+
+    :param obj: The JSON string.
+    :type obj: str or unicode
+    :param codec: The name of the codec to use.
+    :type codec: str
+    :return The decoded object.
+    """
+    return CODECS[codec or DEFAULT_CODEC][1](obj)
+
+
+register_codec("bson", _bson_encode, _bson_decode)
+register_codec("fast", _FAST_ENCODER.encode, _FAST_DECODER.decode)
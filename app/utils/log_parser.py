@@ -578,6 +578,7 @@ def _parse_log(job, kernel, defconfig, log_file, build_dir, errors):
         # TODO: count the lines here.
         if not lines:
             return
+        utils.remove_file_link(filename)
         with open(filename, mode="w") as w_file:
             for line in lines:
                 w_file.write(line)
@@ -587,7 +588,7 @@ def _parse_log(job, kernel, defconfig, log_file, build_dir, errors):
         _save_lines(error_lines, errors_file)
         _save_lines(warning_lines, warnings_file)
         _save_lines(mismatch_lines, mismatches_file)
-    except IOError, ex:
+    except (IOError, OSError), ex:
         err_msg = "Error writing to errors/warnings file for %s-%s-%s"
         utils.LOG.exception(ex)
         utils.LOG.error(err_msg, job, kernel, defconfig)
@@ -50,11 +50,12 @@ def create_build_logs_summary(job, kernel, db_options):
                 utils.BASE_PATH, job, kernel, "build-logs-summary.txt")
 
             try:
+                utils.remove_file_link(file_path)
                 with io.open(file_path, mode="w") as to_write:
                     for line in itertools.chain(errors, warnings, mismatches):
                         to_write.write(
                             u"{:>4d} {:s}\n".format(line[0], line[1]))
-            except IOError, ex:
+            except (IOError, OSError), ex:
                 ret_val = 500
                 error = (
                     "Error writing logs summary for {:s}-{:s}: {:s}".format(
@@ -0,0 +1,196 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple histograms stored in Redis.
+
+Histograms are shared between the server processes and the Celery workers:
+each one is stored in a Redis hash with one field per bucket (counting the
+observed values less than or equal to the bucket upper bound), plus the
+"count" and "sum" fields.
+
+Counters are stored as the fields of a single Redis hash.
+"""
+
+import redis
+
+import utils
+
+# Default buckets, in seconds.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# The Redis key of a histogram.
+HISTOGRAM_KEY_FMT = "metrics-histogram-{:s}"
+# The names of all the available histograms.
+HISTOGRAMS_KEY = "metrics-histograms"
+# The Redis hash with all the counters.
+COUNTERS_KEY = "metrics-counters"
+
+COUNT_FIELD = "count"
+INF_FIELD = "+Inf"
+SUM_FIELD = "sum"
+
+
+def _bucket_field(bound):
+    """The name of the hash field of a bucket.
+
+    :param bound: The upper bound of the bucket.
+    :type bound: float
+    :return str The field name.
+    """
+    return repr(float(bound))
+
+
+def _add_observation(pipe, name, value, buckets):
+    """Add the commands to update a histogram to a Redis pipeline.
+
+    :param pipe: The Redis pipeline.
+    :param name: The name of the histogram.
+    :type name: str
+    :param value: The observed value.
+    :type value: int, float
+    :param buckets: The sorted upper bounds of the histogram buckets.
+    :type buckets: tuple
+    """
+    key = HISTOGRAM_KEY_FMT.format(name)
+
+    for bound in buckets:
+        if value <= bound:
+            pipe.hincrby(key, _bucket_field(bound), 1)
+    pipe.hincrby(key, INF_FIELD, 1)
+    pipe.hincrby(key, COUNT_FIELD, 1)
+    pipe.hincrbyfloat(key, SUM_FIELD, value)
+    pipe.sadd(HISTOGRAMS_KEY, name)
+
+
+def observe(redis_conn, name, value, buckets=DEFAULT_BUCKETS):
+    """Add a value to a histogram.
+
+    Errors are logged and ignored: metrics should never break the caller.
+
+    :param redis_conn: The Redis connection.
+    :param name: The name of the histogram.
+    :type name: str
+    :param value: The observed value.
+    :type value: int, float
+    :param buckets: The sorted upper bounds of the histogram buckets.
+    :type buckets: tuple
+    """
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        _add_observation(pipe, name, value, buckets)
+        pipe.execute()
+    except redis.exceptions.RedisError, ex:
+        utils.LOG.warn("Error updating histogram '%s'", name)
+        utils.LOG.exception(ex)
+
+
+def observe_many(redis_conn, values, counters=None, buckets=DEFAULT_BUCKETS):
+    """Add values to several histograms and increment counters at once.
+
+    All the updates are sent with a single Redis round-trip. Errors are
+    logged and ignored.
+
+    :param redis_conn: The Redis connection.
+    :param values: The observed values: histogram name => value.
+    :type values: dict
+    :param counters: The names of the counters to increment by one.
+    :type counters: list
+    :param buckets: The sorted upper bounds of the histogram buckets.
+    :type buckets: tuple
+    """
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        for name, value in values.iteritems():
+            _add_observation(pipe, name, value, buckets)
+        for name in counters or []:
+            pipe.hincrby(COUNTERS_KEY, name, 1)
+        pipe.execute()
+    except redis.exceptions.RedisError, ex:
+        utils.LOG.warn("Error updating metrics")
+        utils.LOG.exception(ex)
+
+
+def add_to_counters(redis_conn, counts):
+    """Add values to several counters at once.
+
+    Errors are logged and ignored.
+
+    :param redis_conn: The Redis connection.
+    :param counts: The values to add: counter name => value.
+    :type counts: dict
+    """
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        for name, value in counts.iteritems():
+            pipe.hincrby(COUNTERS_KEY, name, value)
+        pipe.execute()
+    except redis.exceptions.RedisError, ex:
+        utils.LOG.warn("Error updating counters")
+        utils.LOG.exception(ex)
+
+
+def get_counters(redis_conn):
+    """Retrieve all the counters.
+
+    :param redis_conn: The Redis connection.
+    :return dict The counters values: name => value.
+    """
+    return dict(
+        (name, int(value))
+        for name, value in (redis_conn.hgetall(COUNTERS_KEY) or {}).iteritems()
+    )
+
+
+def get_histogram_names(redis_conn):
+    """Retrieve the names of all the histograms.
+
+    :param redis_conn: The Redis connection.
+    :return list The sorted names.
+    """
+    return sorted(redis_conn.smembers(HISTOGRAMS_KEY) or [])
+
+
+def get_histogram(redis_conn, name, buckets=DEFAULT_BUCKETS):
+    """Retrieve the values of a histogram.
+
+    :param redis_conn: The Redis connection.
+    :param name: The name of the histogram.
+    :type name: str
+    :param buckets: The sorted upper bounds of the histogram buckets. If
+    None, the buckets with at least one value stored in Redis are returned.
+    :type buckets: tuple
+    :return dict A dictionary with the "buckets" (a list of 2-tuples with the
+    upper bound and the cumulative count), "count" and "sum" keys.
+    """
+    values = redis_conn.hgetall(HISTOGRAM_KEY_FMT.format(name)) or {}
+    values_get = values.get
+
+    if buckets is None:
+        buckets = sorted(
+            float(field) for field in values.iterkeys()
+            if field not in (COUNT_FIELD, INF_FIELD, SUM_FIELD)
+        )
+
+    histogram = {
+        "buckets": [
+            (bound, int(values_get(_bucket_field(bound), 0)))
+            for bound in buckets
+        ],
+        COUNT_FIELD: int(values_get(COUNT_FIELD, 0)),
+        SUM_FIELD: float(values_get(SUM_FIELD, 0))
+    }
+    histogram["buckets"].append(
+        (INF_FIELD, int(values_get(INF_FIELD, 0))))
+
+    return histogram
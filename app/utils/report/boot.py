@@ -17,6 +17,7 @@ import itertools
 import pymongo
 
 import models
+import utils.boot.regressions
 import utils.db
 import utils.report.common as rcommon
 
@@ -352,8 +353,17 @@ def create_boot_report(job,
     pass_count = total_count - fail_count - offline_count - untried_count
 
     # Get the regressions.
-    regressions = database[models.BOOT_REGRESSIONS_COLLECTION].find_one(
-        {models.JOB_KEY: job, models.KERNEL_KEY: kernel})
+    regressions = None
+    regr_docs = list(
+        utils.db.find(
+            database[models.BOOT_REGRESSIONS_BY_KEY_COLLECTION],
+            0,
+            0, spec={models.JOB_KEY: job, models.KERNEL_KEY: kernel}))
+    if regr_docs:
+        regressions = {
+            models.REGRESSIONS_KEY:
+                utils.boot.regressions.nest_regressions(regr_docs)
+        }
 
     # Fill the data structure for the email report creation.
     kwargs = {
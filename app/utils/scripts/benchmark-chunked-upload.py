@@ -0,0 +1,142 @@
+#!/usr/bin/python
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the chunked uploads against a running backend.
+
+An upload session is created for a synthetic file, its chunks are sent in
+parallel with PUT requests, then the file is verified and moved in place.
+The backend must be running, by default on localhost, and the token must be
+allowed to upload:
+
+    python utils/scripts/benchmark-chunked-upload.py \\
+        --token <token> --size 4096 --path benchmark/vmlinux
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import httplib
+import os
+import threading
+import time
+import urlparse
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+MiB = 1024 * 1024
+
+_LOCAL = threading.local()
+
+
+def _request(args, method, path, body=None, headers=None):
+    """Perform a request, with a connection for each thread.
+
+    :return A 2-tuple: the status code; the response body.
+    """
+    connection = getattr(_LOCAL, "connection", None)
+    if connection is None:
+        url = urlparse.urlsplit(args.url)
+        connection = _LOCAL.connection = httplib.HTTPConnection(url.netloc)
+
+    all_headers = {"Authorization": args.token}
+    all_headers.update(headers or {})
+
+    connection.request(method, path, body=body, headers=all_headers)
+    response = connection.getresponse()
+
+    return response.status, response.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the chunked uploads")
+    parser.add_argument(
+        "--url", default="http://localhost:8888", help="The backend URL")
+    parser.add_argument(
+        "--token", required=True, help="The token to upload the file")
+    parser.add_argument(
+        "--path", default="benchmark/vmlinux",
+        help="The destination path of the file")
+    parser.add_argument(
+        "--size", type=int, default=2048, help="File size in MiB")
+    parser.add_argument(
+        "--chunk", type=int, default=64, help="Chunk size in MiB")
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Number of parallel uploads")
+    args = parser.parse_args()
+
+    size = args.size * MiB
+    chunk_size = args.chunk * MiB
+    chunk = os.urandom(chunk_size)
+    offsets = range(0, size, chunk_size)
+    json_headers = {"Content-Type": "application/json"}
+
+    file_hash = hashlib.sha256()
+    for offset in offsets:
+        file_hash.update(chunk[:min(chunk_size, size - offset)])
+    digest = file_hash.hexdigest()
+
+    start = time.time()
+    status, body = _request(
+        args,
+        "POST",
+        "/upload/session",
+        body=json.dumps({"path": args.path, "size": size}),
+        headers=json_headers)
+    assert status == 201, body
+    session_url = "/upload/session/%s" % (
+        json.loads(body)["result"][0]["_id"]["$oid"])
+
+    def put(offset):
+        content = chunk[:min(chunk_size, size - offset)]
+        content_range = "bytes %d-%d/%d" % (
+            offset, offset + len(content) - 1, size)
+
+        status, body = _request(
+            args,
+            "PUT",
+            session_url,
+            body=content, headers={"Content-Range": content_range})
+        assert status == 200, body
+
+        return len(content)
+
+    with concurrent.futures.ThreadPoolExecutor(args.workers) as pool:
+        written = sum(pool.map(put, offsets))
+    write_time = time.time() - start
+
+    start = time.time()
+    status, body = _request(
+        args,
+        "POST",
+        session_url, body=json.dumps({"digest": digest}), headers=json_headers)
+    finalize_time = time.time() - start
+    assert status in (200, 201), body
+
+    print "%d MiB in %d chunks of %d MiB, %d workers" % (
+        args.size, len(offsets), args.chunk, args.workers)
+    print "session and chunks: %.2f s, %.1f MiB/s" % (
+        write_time, written / MiB / write_time)
+    print "verify and move: %.2f s, %.1f MiB/s" % (
+        finalize_time, size / MiB / finalize_time)
+    print "total: %.1f MiB/s" % (
+        size / MiB / (write_time + finalize_time))
+
+
+if __name__ == "__main__":
+    main()
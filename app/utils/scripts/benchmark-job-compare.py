@@ -0,0 +1,99 @@
+#!/usr/bin/python
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the n-way job comparison on synthetic build data.
+
+Run from the app/ directory:
+
+    PYTHONPATH=. python utils/scripts/benchmark-job-compare.py
+"""
+
+import argparse
+import random
+import timeit
+
+import models
+import utils.compare.job
+
+ARCH_LIST = ["arm", "arm64", "mips", "x86"]
+STATUS_LIST = [
+    models.PASS_STATUS, models.PASS_STATUS, models.PASS_STATUS,
+    models.FAIL_STATUS, models.UNKNOWN_STATUS
+]
+
+
+def create_job_docs(job_idx, builds):
+    """Create the build documents of a single job.
+
+    :param job_idx: The index of the job.
+    :type job_idx: int
+    :param builds: How many builds to create.
+    :type builds: int
+    :return A list of build documents.
+    """
+    docs = []
+    for idx in range(builds):
+        arch = ARCH_LIST[idx % len(ARCH_LIST)]
+        defconfig = "defconfig%d" % (idx // len(ARCH_LIST))
+        docs.append({
+            models.ARCHITECTURE_KEY: arch,
+            models.DEFCONFIG_FULL_KEY: defconfig + "+CONFIG_FOO=y",
+            models.DEFCONFIG_KEY: defconfig,
+            models.GIT_BRANCH_KEY: "master",
+            models.GIT_COMMIT_KEY: "%040x" % job_idx,
+            models.GIT_DESCRIBE_KEY: "v4.%d" % job_idx,
+            models.GIT_URL_KEY: "git://git.example.org/linux.git",
+            models.ID_KEY: "%024x" % (job_idx * builds + idx),
+            models.JOB_ID_KEY: "%024x" % job_idx,
+            models.JOB_KEY: "job",
+            models.KERNEL_KEY: "v4.%d" % job_idx,
+            models.STATUS_KEY: random.choice(STATUS_LIST)
+        })
+
+    return docs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the n-way job comparison")
+    parser.add_argument(
+        "--builds", type=int, default=500, help="Number of builds per job")
+    parser.add_argument(
+        "--compare", type=int, default=5, help="Number of jobs to compare")
+    parser.add_argument(
+        "--repeat", type=int, default=20, help="Number of runs")
+    args = parser.parse_args()
+
+    random.seed(0)
+    all_docs = [
+        create_job_docs(idx, args.builds) for idx in range(args.compare + 1)
+    ]
+
+    def run():
+        baseline = utils.compare.job.CompareJob(all_docs[0])
+        compare_to = [
+            utils.compare.job.CompareJob(docs) for docs in all_docs[1:]]
+        return utils.compare.job._n_way_compare(baseline, compare_to)
+
+    _, delta_result = run()
+    best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+
+    print "%d-way comparison, %d builds per job" % (args.compare, args.builds)
+    print "delta rows: %d" % len(delta_result)
+    print "best of %d: %.2f ms" % (args.repeat, best * 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the JSON codecs on boot and test suite documents.
+
+Synthetic documents shaped like the boot reports and the test suites with
+their test cases are encoded and decoded with each codec.
+
+Run from the app/ directory:
+
+    PYTHONPATH=. python utils/scripts/benchmark-json-codec.py --runs 20
+"""
+
+import argparse
+import bson
+import bson.tz_util
+import datetime
+import time
+
+import models
+import utils.jsoncodec
+
+
+def _now():
+    return datetime.datetime.now(tz=bson.tz_util.utc)
+
+
+def boot_document(job_id, build_id):
+    """A boot report document.
+
+    :param job_id: The ID of the job.
+    :type job_id: ObjectId
+    :param build_id: The ID of the build.
+    :type build_id: ObjectId
+    """
+    return {
+        models.ID_KEY: bson.ObjectId(),
+        models.CREATED_KEY: _now(),
+        models.JOB_KEY: "mainline",
+        models.JOB_ID_KEY: job_id,
+        models.KERNEL_KEY: "v4.9-rc8-1-g0123456789ab",
+        models.BUILD_ID_KEY: build_id,
+        models.BOARD_KEY: "beaglebone-black",
+        models.ARCHITECTURE_KEY: "arm",
+        models.DEFCONFIG_KEY: "multi_v7_defconfig",
+        models.DEFCONFIG_FULL_KEY: "multi_v7_defconfig",
+        models.LAB_NAME_KEY: "lab-foo",
+        models.STATUS_KEY: "PASS",
+        models.BOOT_TIME_KEY: datetime.datetime(1970, 1, 1, 0, 0, 12, 345000),
+        models.BOOT_LOG_KEY: "boot-beaglebone-black.txt",
+        models.BOOT_LOG_HTML_KEY: "boot-beaglebone-black.html",
+        models.METADATA_KEY: {
+            "dtb_append": False,
+            "fastboot": False,
+            "initrd_addr": "0x81000000",
+            "kernel_image": "zImage"
+        }
+    }
+
+
+def test_suite_document(cases):
+    """A test suite document with its test cases.
+
+    :param cases: How many test cases.
+    :type cases: int
+    """
+    suite_id = bson.ObjectId()
+    return {
+        models.ID_KEY: suite_id,
+        models.CREATED_KEY: _now(),
+        models.NAME_KEY: "kselftest",
+        models.BOARD_KEY: "juno",
+        models.LAB_NAME_KEY: "lab-foo",
+        models.TEST_CASE_KEY: [
+            {
+                models.ID_KEY: bson.ObjectId(),
+                models.CREATED_KEY: _now(),
+                models.NAME_KEY: "test-case-%d" % idx,
+                models.TEST_SUITE_ID_KEY: suite_id,
+                models.STATUS_KEY: "PASS",
+                models.MEASUREMENTS_KEY: [
+                    {"name": "duration", "value": idx * 0.5, "unit": "s"}
+                ],
+                models.VCS_COMMIT_KEY: "0123456789abcdef0123456789abcdef"
+            }
+            for idx in range(cases)
+        ]
+    }
+
+
+def _run(func, arg, runs):
+    start = time.time()
+    for _ in xrange(runs):
+        func(arg)
+    return (time.time() - start) / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the JSON codecs")
+    parser.add_argument(
+        "--runs", type=int, default=10, help="How many times to run each")
+    parser.add_argument(
+        "--boots", type=int, default=2000, help="Number of boot documents")
+    parser.add_argument(
+        "--cases", type=int, default=5000,
+        help="Number of test cases in the test suite")
+    args = parser.parse_args()
+
+    # The boots of a job, with 20 boots for each build.
+    job_id = bson.ObjectId()
+    build_ids = [bson.ObjectId() for _ in range(args.boots / 20 + 1)]
+
+    documents = {
+        "boots": [
+            boot_document(job_id, build_ids[idx / 20])
+            for idx in range(args.boots)
+        ],
+        "test suite": test_suite_document(args.cases)
+    }
+
+    for doc_name, doc in sorted(documents.iteritems()):
+        for codec in sorted(utils.jsoncodec.CODECS):
+            encoded = utils.jsoncodec.dumps(doc, codec=codec)
+            size = len(encoded.encode("utf-8")) / 1024.0 / 1024.0
+
+            encode_time = _run(
+                lambda obj: utils.jsoncodec.dumps(obj, codec=codec),
+                doc, args.runs)
+            decode_time = _run(
+                lambda obj: utils.jsoncodec.loads(obj, codec=codec),
+                encoded, args.runs)
+
+            print "%s, %s: %.2f MiB, encode %.1f MiB/s, decode %.1f MiB/s" % (
+                doc_name, codec, size,
+                size / encode_time, size / decode_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Report the indexes the recorded query shapes need, or do not use.
+
+The shapes are recorded by the servers started with the
+`--record_query_shapes` option. Run from the app/ directory:
+
+    PYTHONPATH=. python utils/scripts/index-advisor.py --sample 5000
+"""
+
+import argparse
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+import utils.database.redisdb as redisdb
+import utils.db
+import utils.indexadvisor
+
+
+def _format_keys(keys):
+    return ", ".join("%s:%d" % (field, direction) for field, direction in keys)
+
+
+def _format_shape(entry):
+    parts = []
+    if entry["equality"]:
+        parts.append("eq(%s)" % ", ".join(entry["equality"]))
+    if entry["sort"]:
+        parts.append("sort(%s)" % _format_keys(entry["sort"]))
+    if entry["range"]:
+        parts.append("range(%s)" % ", ".join(entry["range"]))
+    return " ".join(parts)
+
+
+def print_report(report):
+    for name in sorted(report):
+        collection = report[name]
+
+        print "%s (%d sampled documents)" % (name, collection["sampled"])
+        for entry in collection["shapes"]:
+            print "  %8d  %-8s %s" % (
+                entry["count"], entry["status"], _format_shape(entry))
+            print "            selectivity: %.6f" % entry["selectivity"]
+            if entry["index"]:
+                print "            index: %s" % entry["index"]
+            if "suggested" in entry:
+                print "            suggested: {%s}" % _format_keys(
+                    entry["suggested"])
+        for index_name in collection["unused"]:
+            print "  unused index: %s" % index_name
+        for index_name in collection["not_comparable"]:
+            print "  not comparable index: %s" % index_name
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Advise on the indexes from the recorded query shapes")
+    parser.add_argument(
+        "--sample", type=int, default=utils.indexadvisor.DEFAULT_SAMPLE_SIZE,
+        help="Documents sampled to estimate the fields selectivity")
+    parser.add_argument(
+        "--collection", action="append", default=[],
+        help="Report only on this collection, can be repeated")
+    parser.add_argument(
+        "--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument(
+        "--reset", action="store_true",
+        help="Remove the recorded shapes after the report")
+    utils.db.add_db_arguments(parser)
+    args = parser.parse_args()
+
+    db_options = utils.db.get_db_options(args)
+    database = utils.db.get_db_connection(db_options)
+    redis_conn = redisdb.get_db_connection(db_options)
+
+    shapes = utils.indexadvisor.load_shapes(redis_conn)
+    if args.collection:
+        shapes = dict(
+            (key, count)
+            for key, count in shapes.iteritems() if key[0] in args.collection)
+
+    report = utils.indexadvisor.advise(database, shapes, args.sample)
+
+    if args.json:
+        print json.dumps(report, indent=2, sort_keys=True)
+    else:
+        print_report(report)
+
+    if args.reset:
+        redis_conn.delete(utils.indexadvisor.SHAPES_KEY)
+
+
+if __name__ == "__main__":
+    main()
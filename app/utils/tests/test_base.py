@@ -11,7 +11,11 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import logging
+import os
+import shutil
+import tempfile
 import unittest
 
 import bson
@@ -31,6 +35,21 @@ class TestBaseUtils(unittest.TestCase):
         self.assertTrue(utils.is_hidden(".hidden"))
         self.assertFalse(utils.is_hidden("hidden"))
 
+    def test_remove_file_link(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        file_path = os.path.join(temp_dir, "file")
+        link_path = os.path.join(temp_dir, "link")
+        with io.open(file_path, mode="wb") as w_stream:
+            w_stream.write(b"foo")
+        os.link(file_path, link_path)
+
+        utils.remove_file_link(link_path)
+        utils.remove_file_link(link_path)
+
+        self.assertFalse(os.path.exists(link_path))
+        self.assertEqual(1, os.stat(file_path).st_nlink)
+
     def test_is_lab_dir(self):
         self.assertTrue(utils.is_lab_dir("lab-foo"))
         self.assertFalse(utils.is_lab_dir("foo"))
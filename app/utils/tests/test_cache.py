@@ -0,0 +1,149 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import fakeredis
+import logging
+import mock
+import unittest
+
+import utils.cache
+import utils.metrics
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = utils.cache.TTLCache(60, 10)
+
+        self.assertIsNone(cache.get("foo"))
+        cache.set("foo", {"bar": 1})
+        self.assertDictEqual({"bar": 1}, cache.get("foo"))
+
+        self.assertDictEqual(
+            {"hits": 1, "misses": 1, "hit_rate": 0.5, "size": 1},
+            cache.stats())
+
+    def test_set_none(self):
+        cache = utils.cache.TTLCache(60, 10)
+        cache.set("foo", None)
+        self.assertEqual(0, len(cache))
+
+    @mock.patch("time.time")
+    def test_expired(self, mock_time):
+        cache = utils.cache.TTLCache(60, 10)
+
+        mock_time.return_value = 1000
+        cache.set("foo", "bar")
+        mock_time.return_value = 1059
+        self.assertEqual("bar", cache.get("foo"))
+        mock_time.return_value = 1060
+        self.assertIsNone(cache.get("foo"))
+        self.assertEqual(0, len(cache))
+
+    def test_max_size(self):
+        cache = utils.cache.TTLCache(60, 2)
+
+        cache.set("foo", 1)
+        cache.set("bar", 2)
+        cache.set("baz", 3)
+
+        self.assertEqual(1, len(cache))
+        self.assertEqual(3, cache.get("baz"))
+
+    def test_clear(self):
+        cache = utils.cache.TTLCache(60, 2)
+        cache.set("foo", 1)
+        cache.get("foo")
+
+        cache.clear()
+
+        self.assertDictEqual(
+            {"hits": 0, "misses": 0, "hit_rate": 0.0, "size": 0},
+            cache.stats())
+
+    @mock.patch("time.time")
+    def test_no_ttl(self, mock_time):
+        cache = utils.cache.TTLCache(None, 10)
+        mock_time.return_value = 100
+        cache.set("foo", "bar")
+        mock_time.return_value = 100000
+
+        self.assertEqual("bar", cache.get("foo"))
+
+    def test_pop_counts(self):
+        cache = utils.cache.TTLCache(60, 10)
+        cache.set("foo", "bar")
+        cache.get("foo")
+        cache.get("baz")
+
+        self.assertTupleEqual((1, 1), cache.pop_counts())
+        self.assertTupleEqual((0, 0), cache.pop_counts())
+
+        cache.get("foo")
+        self.assertTupleEqual((1, 0), cache.pop_counts())
+
+
+class TestPublishStats(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.redis_conn = fakeredis.FakeStrictRedis()
+        self.redis_conn.flushall()
+
+        patched_caches = mock.patch("utils.cache.CACHES", [])
+        patched_caches.start()
+        self.addCleanup(patched_caches.stop)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_publish_stats(self):
+        cache = utils.cache.TTLCache(60, 10, name="foo")
+        utils.cache.TTLCache(60, 10)
+        cache.set("foo", "bar")
+        cache.get("foo")
+        cache.get("foo")
+        cache.get("baz")
+
+        self.assertListEqual([cache], utils.cache.CACHES)
+
+        utils.cache.publish_stats(self.redis_conn, force=True)
+        cache.get("foo")
+        # Too early.
+        utils.cache.publish_stats(self.redis_conn)
+
+        counters = utils.metrics.get_counters(self.redis_conn)
+        self.assertDictEqual(
+            {"cache-foo-hits": 2, "cache-foo-misses": 1}, counters)
+
+        utils.cache.publish_stats(self.redis_conn, force=True)
+
+        counters = utils.metrics.get_counters(self.redis_conn)
+        self.assertEqual(3, counters["cache-foo-hits"])
+
+    def test_get_published_stats(self):
+        stats = utils.cache.get_published_stats(
+            {
+                "cache-foo-hits": 3,
+                "cache-foo-misses": 1,
+                "cache-bar-baz-misses": 2,
+                "http-job-200": 4
+            }
+        )
+
+        self.assertDictEqual(
+            {
+                "foo": {"hits": 3, "misses": 1, "hit_rate": 0.75},
+                "bar-baz": {"hits": 0, "misses": 2, "hit_rate": 0.0}
+            },
+            stats)
@@ -0,0 +1,325 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import itertools
+import logging
+import mock
+import mongomock
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import models.boot as mboot
+import utils.db
+import utils.instrumentation
+
+from tests.helpers import QueryBudgetMixin
+
+
+class TestDbUtils(unittest.TestCase, QueryBudgetMixin):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.db = mongomock.Database(mongomock.Connection(), "kernel-ci")
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_find_by_specs(self):
+        self.db["build"].insert({"_id": "0", "job": "job", "kernel": "k0"})
+        self.db["build"].insert({"_id": "1", "job": "job", "kernel": "k1"})
+
+        found = utils.db.find_by_specs(
+            self.db["build"],
+            [
+                {"job": "job", "kernel": "k1"},
+                {"job": "job", "kernel": "k2"},
+                {"job": "job", "kernel": "k0"},
+                {"job": "job", "kernel": "k1"}
+            ]
+        )
+
+        self.assertEqual("1", found[0]["_id"])
+        self.assertIsNone(found[1])
+        self.assertEqual("0", found[2]["_id"])
+        self.assertEqual("1", found[3]["_id"])
+
+    def test_find_by_specs_queries(self):
+        specs = [{"job": "job", "kernel": "k%d" % idx} for idx in range(10)]
+
+        with self.assertMaxQueries(1, collection="build"):
+            utils.db.find_by_specs(self.db["build"], specs)
+
+    def test_find_by_specs_empty(self):
+        self.assertListEqual([], utils.db.find_by_specs(self.db["build"], []))
+
+    def test_insert_all_chunks(self):
+        docs = [
+            mboot.BootDocument(
+                "board%d" % idx, "job", "kernel", "defconfig", "lab")
+            for idx in range(5)
+        ]
+
+        with mock.patch.object(
+                self.db["boot"], "insert",
+                wraps=self.db["boot"].insert) as mock_insert:
+            ret_val, doc_ids = utils.db.insert_all(self.db, docs, chunk_size=2)
+
+            self.assertEqual(3, mock_insert.call_count)
+
+        self.assertEqual(201, ret_val)
+        self.assertEqual(5, len(doc_ids))
+        self.assertEqual(5, self.db["boot"].count())
+        self.assertEqual(
+            "board3", self.db["boot"].find_one({"_id": doc_ids[3]})["board"])
+
+    def test_insert_all_wrong_document(self):
+        ret_val, doc_ids = utils.db.insert_all(self.db, [{"foo": "bar"}])
+
+        self.assertEqual(500, ret_val)
+        self.assertListEqual([None], doc_ids)
+
+    def test_record_queries(self):
+        self.db["build"].insert({"_id": "0", "job": "job", "kernel": "k0"})
+
+        with utils.instrumentation.record_queries("test") as recorder:
+            utils.db.find_one2(self.db["build"], {"job": "job"})
+            utils.db.find_and_count(self.db["build"], 0, 0, spec={"job": "a"})
+            utils.db.update(self.db["job"], {"job": "job"}, {"status": "PASS"})
+
+        self.assertEqual(4, recorder.count)
+        self.assertEqual(3, recorder.get_count("build"))
+        self.assertEqual(1, recorder.get_count("job"))
+        self.assertEqual(0, recorder.get_count("boot"))
+        self.assertEqual(
+            ("update", {"job": "job"}),
+            recorder.collections["job"]["slowest"][1:])
+        self.assertIsNone(utils.instrumentation.get_recorder())
+
+    def test_record_queries_save_all(self):
+        docs = [
+            mboot.BootDocument(
+                "board%d" % idx, "job", "kernel", "defconfig", "lab")
+            for idx in range(3)
+        ]
+
+        with utils.instrumentation.record_queries("test") as recorder:
+            utils.db.save_all(self.db, docs)
+        self.assertEqual(3, recorder.get_count("boot"))
+
+        with utils.instrumentation.record_queries("test") as recorder:
+            utils.db.insert_all(self.db, docs)
+        self.assertEqual(1, recorder.get_count("boot"))
+
+    @mock.patch("utils.db.time.time")
+    def test_recorded_cursor(self, mock_time):
+        mock_time.side_effect = itertools.count()
+        cursor = mock.Mock()
+        cursor.next.side_effect = [{"_id": 0}, {"_id": 1}, StopIteration]
+
+        with utils.instrumentation.record_queries("test") as recorder:
+            result = utils.db.RecordedCursor(
+                cursor, self.db["build"], "find", {"job": "job"})
+
+            # The documents are fetched by another thread.
+            fetch_thread = threading.Thread(target=list, args=(result,))
+            fetch_thread.start()
+            fetch_thread.join()
+            result.close()
+
+        self.assertEqual(1, recorder.count)
+        self.assertEqual(
+            (3.0, "find", {"job": "job"}),
+            recorder.collections["build"]["slowest"])
+
+    @mock.patch("utils.db.time.time")
+    def test_recorded_cursor_timer(self, mock_time):
+        mock_time.side_effect = itertools.count()
+        timer = utils.instrumentation.RequestTimer()
+
+        utils.instrumentation.bind(timer)
+        try:
+            result = utils.db.RecordedCursor(
+                iter([{"_id": 0}]), "build", "find", None)
+            bound_result = utils.db.RecordedCursor(
+                iter([{"_id": 0}]), "build", "find", None)
+            # The client adds the time itself on a thread with a timer.
+            list(bound_result)
+        finally:
+            utils.instrumentation.bind(None)
+
+        self.assertDictEqual({}, timer.durations)
+
+        list(result)
+
+        self.assertDictEqual(
+            {utils.instrumentation.DB_PHASE: 2.0}, timer.durations)
+
+    def test_recorded_cursor_not_exhausted(self):
+        for idx in range(3):
+            self.db["build"].insert({"_id": idx})
+
+        with utils.instrumentation.record_queries("test") as recorder:
+            result = utils.db.find(self.db["build"], 0, 0)
+            result.next()
+            self.assertEqual(0, recorder.count)
+
+            del result
+
+        self.assertEqual(1, recorder.count)
+
+    def test_record_queries_helpers(self):
+        collection = mock.MagicMock()
+        collection.name = "boot"
+        collection.aggregate.return_value = {"result": [{"count": 1}]}
+
+        with utils.instrumentation.record_queries("test") as recorder:
+            utils.db.insert(collection, {"job": "job"})
+            utils.db.find_and_modify(
+                collection, {"job": "job"}, {"$set": {"kernel": "kernel"}})
+            self.assertListEqual(
+                [{"count": 1}],
+                utils.db.aggregate_pipeline(
+                    collection, [{"$match": {"job": "job"}}]))
+
+        self.assertEqual(3, recorder.get_count("boot"))
+        collection.aggregate.assert_called_once_with(
+            [{"$match": {"job": "job"}}])
+
+    def test_assert_max_queries_fail(self):
+        def _find_each():
+            with self.assertMaxQueries(2):
+                for idx in range(3):
+                    utils.db.find_one2(self.db["build"], {"kernel": idx})
+
+        self.assertRaises(AssertionError, _find_each)
+
+    def test_get_explain_summary(self):
+        explain = {
+            "queryPlanner": {
+                "winningPlan": {
+                    "stage": "LIMIT",
+                    "inputStage": {
+                        "stage": "FETCH",
+                        "inputStage": {
+                            "stage": "IXSCAN", "indexName": "job_1"
+                        }
+                    }
+                }
+            },
+            "executionStats": {
+                "nReturned": 10,
+                "executionTimeMillis": 4,
+                "totalKeysExamined": 12,
+                "totalDocsExamined": 11
+            }
+        }
+
+        summary = utils.db.get_explain_summary(explain)
+
+        self.assertEqual("job_1", summary["index"])
+        self.assertEqual(11, summary["docs_examined"])
+        self.assertEqual(12, summary["keys_examined"])
+        self.assertEqual(10, summary["docs_returned"])
+        self.assertEqual(4, summary["execution_time"])
+        self.assertEqual("LIMIT", summary["plan"]["stage"])
+
+    def test_get_explain_summary_collection_scan(self):
+        explain = {
+            "queryPlanner": {
+                "winningPlan": {
+                    "stage": "OR",
+                    "inputStages": [{"stage": "COLLSCAN"}]
+                }
+            },
+            "executionStats": {}
+        }
+
+        summary = utils.db.get_explain_summary(explain)
+
+        self.assertIsNone(summary["index"])
+        self.assertIsNone(summary["docs_examined"])
+
+    def test_get_explain_summary_legacy(self):
+        explain = {
+            "cursor": "BtreeCursor job_1_kernel_1",
+            "n": 2,
+            "nscannedObjects": 5,
+            "nscanned": 6,
+            "millis": 1
+        }
+
+        summary = utils.db.get_explain_summary(explain)
+
+        self.assertEqual("job_1_kernel_1", summary["index"])
+        self.assertEqual(5, summary["docs_examined"])
+        self.assertEqual(6, summary["keys_examined"])
+        self.assertEqual(2, summary["docs_returned"])
+        self.assertEqual(1, summary["execution_time"])
+
+        summary = utils.db.get_explain_summary({"cursor": "BasicCursor"})
+        self.assertIsNone(summary["index"])
+
+    def test_explain(self):
+        collection = mock.MagicMock()
+        collection.find.return_value.explain.return_value = {
+            "cursor": "BasicCursor", "n": 0}
+
+        summary = utils.db.explain(
+            collection, spec={"job": "foo"}, sort=[("job", 1)], limit=5)
+
+        collection.find.assert_called_once_with(
+            spec={"job": "foo"}, fields=None, sort=[("job", 1)], skip=0,
+            limit=5)
+        self.assertEqual(0, summary["docs_returned"])
+        self.assertDictEqual(
+            {
+                "spec": {"job": "foo"},
+                "fields": None, "sort": [("job", 1)], "skip": 0, "limit": 5
+            },
+            summary["query"])
+
+    def test_get_db_options(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        config_file = os.path.join(tmp_dir, "kernelci-backend.cfg")
+        with open(config_file, "w") as config:
+            config.write(
+                "mongodb_host = \"db.example.net\"\n"
+                "mongodb_user = \"kernelci\"\n"
+                "redis_port = 6380\n"
+                "max_workers = 10\n")
+
+        parser = argparse.ArgumentParser()
+        utils.db.add_db_arguments(parser)
+        db_options = utils.db.get_db_options(
+            parser.parse_args(
+                ["--config", config_file, "--mongodb-user", "admin"]))
+
+        self.assertEqual("db.example.net", db_options["mongodb_host"])
+        self.assertEqual(27017, db_options["mongodb_port"])
+        self.assertEqual("admin", db_options["mongodb_user"])
+        self.assertEqual(6380, db_options["redis_port"])
+        self.assertNotIn("max_workers", db_options)
+
+    def test_get_db_options_no_config(self):
+        parser = argparse.ArgumentParser()
+        utils.db.add_db_arguments(parser)
+        db_options = utils.db.get_db_options(
+            parser.parse_args(["--config", "/non/existing.cfg"]))
+
+        self.assertEqual("localhost", db_options["mongodb_host"])
+        self.assertEqual("", db_options["mongodb_password"])
@@ -0,0 +1,149 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import mock
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import models
+import utils.elf as elf
+
+SHT_NOBITS = 8
+SHT_STRTAB = 3
+
+
+def create_elf(sections, elf_class=elf.ELF_CLASS_64,
+               elf_data=elf.ELF_DATA_LSB):
+    """Create the content of an ELF file with only the section headers.
+
+    :param sections: A list of 4-tuples: name, type, flags and size.
+    :return str The ELF file content.
+    """
+    order = elf.ELF_BYTE_ORDER[elf_data]
+    if elf_class == elf.ELF_CLASS_64:
+        header_size, section_fmt = 64, order + "IIQQQQIIQQ"
+    else:
+        header_size, section_fmt = 52, order + "IIIIIIIIII"
+    section_size = struct.calcsize(section_fmt)
+
+    names = b"\x00"
+    name_offsets = []
+    for name, _, _, _ in sections + [(".shstrtab", 0, 0, 0)]:
+        name_offsets.append(len(names))
+        names += name + b"\x00"
+
+    strtab_offset = header_size
+    sh_offset = strtab_offset + len(names)
+    sh_num = len(sections) + 2
+
+    ident = elf.ELF_MAGIC + struct.pack(
+        "BBBB", elf_class, elf_data, 1, 0) + b"\x00" * 8
+    header = ident + struct.pack(
+        order + elf.ELF_HEADER_FMT[elf_class],
+        2, 0, 1, 0, 0, sh_offset, 0, header_size, 0, 0,
+        section_size, sh_num, sh_num - 1)
+
+    headers = struct.pack(section_fmt, *([0] * 10))
+    for (name, sh_type, sh_flags, size), offset in zip(
+            sections, name_offsets):
+        headers += struct.pack(
+            section_fmt, offset, sh_type, sh_flags, 0, 0, size, 0, 0, 1, 0)
+    headers += struct.pack(
+        section_fmt, name_offsets[-1], SHT_STRTAB, 0, 0, strtab_offset,
+        len(names), 0, 0, 1, 0)
+
+    return header + names + headers
+
+
+class TestElf(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.temp_dir = tempfile.mkdtemp()
+        self.vmlinux = os.path.join(self.temp_dir, "vmlinux")
+        elf.ELF_CACHE.clear()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        elf.ELF_CACHE.clear()
+
+    def _write_elf(self, content):
+        with open(self.vmlinux, "wb") as w_file:
+            w_file.write(content)
+
+    def test_read_64(self):
+        self._write_elf(create_elf([
+            (".text", elf.SHT_PROGBITS, elf.ELF_A_FLAG, 1024),
+            (".data", elf.SHT_PROGBITS, elf.ELF_WA_FLAG, 512),
+            (".bss", SHT_NOBITS, elf.ELF_WA_FLAG, 256)
+        ]))
+
+        expected = {
+            models.VMLINUX_TEXT_SIZE_KEY: 1024,
+            models.VMLINUX_DATA_SIZE_KEY: 512,
+            models.VMLINUX_BSS_SIZE_KEY: 256
+        }
+        self.assertDictEqual(expected, elf.read(self.vmlinux))
+        self.assertDictEqual(expected, elf._elftools_read(self.vmlinux))
+
+    def test_read_32_big_endian_no_data(self):
+        self._write_elf(create_elf(
+            [
+                (".text", elf.SHT_PROGBITS, elf.ELF_A_FLAG, 1024),
+                (".rodata", elf.SHT_PROGBITS, elf.ELF_A_FLAG, 100),
+                (".init.data", elf.SHT_PROGBITS, elf.ELF_WA_FLAG, 10),
+                (".bss", SHT_NOBITS, elf.ELF_WA_FLAG, 256)
+            ],
+            elf_class=elf.ELF_CLASS_32, elf_data=elf.ELF_DATA_MSB))
+
+        expected = {
+            models.VMLINUX_TEXT_SIZE_KEY: 1024,
+            models.VMLINUX_DATA_SIZE_KEY: 1134,
+            models.VMLINUX_BSS_SIZE_KEY: 256
+        }
+        self.assertDictEqual(expected, elf.read(self.vmlinux))
+        self.assertDictEqual(expected, elf._elftools_read(self.vmlinux))
+
+    def test_read_no_file(self):
+        self.assertDictEqual({}, elf.read(self.vmlinux))
+
+    @mock.patch("utils.elf._elftools_read")
+    def test_read_not_elf(self, mock_read):
+        mock_read.return_value = {}
+        self._write_elf(b"not an ELF file")
+
+        self.assertDictEqual({}, elf.read(self.vmlinux))
+        mock_read.assert_called_once_with(self.vmlinux)
+
+    @mock.patch("utils.elf._fast_read")
+    def test_read_cached(self, mock_read):
+        mock_read.return_value = {models.VMLINUX_TEXT_SIZE_KEY: 1}
+        self._write_elf(b"content")
+
+        elf.read(self.vmlinux)
+        result = elf.read(self.vmlinux)
+        result[models.VMLINUX_TEXT_SIZE_KEY] = 2
+
+        self.assertEqual(1, mock_read.call_count)
+        self.assertDictEqual(
+            {models.VMLINUX_TEXT_SIZE_KEY: 1}, elf.read(self.vmlinux))
+
+        # A new file is read again.
+        os.utime(self.vmlinux, (0, 0))
+        elf.read(self.vmlinux)
+        self.assertEqual(2, mock_read.call_count)
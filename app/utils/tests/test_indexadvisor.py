@@ -0,0 +1,252 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import fakeredis
+import logging
+import mock
+import mongomock
+import pymongo.errors
+import redis
+import unittest
+
+import utils.db
+import utils.indexadvisor
+import utils.instrumentation
+
+
+class TestIndexAdvisor(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.redis_conn = fakeredis.FakeStrictRedis()
+        self.redis_conn.flushall()
+        self.database = mongomock.Database(mongomock.Connection(), "kernel-ci")
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        utils.indexadvisor.disable()
+        utils.indexadvisor.SHAPES.counts = {}
+
+    def test_get_query_shapes(self):
+        shapes = utils.indexadvisor.get_query_shapes(
+            {
+                "job": "next",
+                "arch": {"$in": ["arm", "x86"]},
+                "created_on": {"$gte": 1, "$lt": 2},
+                "status": {"$ne": "PASS"}
+            },
+            [("created_on", -1)]
+        )
+
+        self.assertListEqual(
+            [
+                (
+                    ("arch", "job"),
+                    ("created_on", "status"), (("created_on", -1),))
+            ],
+            shapes)
+
+    def test_get_query_shapes_id(self):
+        self.assertListEqual(
+            [(("_id",), (), ())],
+            utils.indexadvisor.get_query_shapes("foo"))
+
+    def test_get_query_shapes_or(self):
+        shapes = utils.indexadvisor.get_query_shapes(
+            {"job": "next", "$or": [{"kernel": "a"}, {"board": "b"}]})
+
+        self.assertListEqual(
+            [(("job", "kernel"), (), ()), (("board", "job"), (), ())],
+            shapes)
+
+    def test_get_query_shapes_empty(self):
+        self.assertListEqual([], utils.indexadvisor.get_query_shapes({}))
+
+    def test_get_index_coverage(self):
+        shape = (("arch", "job"), ("created_on",), (("kernel", -1),))
+        get_coverage = utils.indexadvisor.get_index_coverage
+
+        self.assertEqual(
+            (4, True),
+            get_coverage(
+                [("job", 1), ("arch", 1), ("kernel", -1), ("created_on", 1)],
+                shape))
+        self.assertEqual(
+            (4, True),
+            get_coverage(
+                [("arch", 1), ("job", 1), ("kernel", 1), ("created_on", -1)],
+                shape))
+        self.assertEqual(
+            (2, False),
+            get_coverage(
+                [("job", 1), ("arch", 1), ("created_on", 1)], shape))
+        self.assertEqual((1, False), get_coverage([("job", 1)], shape))
+        self.assertEqual((0, False), get_coverage([("kernel", 1)], shape))
+
+    def test_get_index_coverage_not_comparable(self):
+        shape = (("job",), (), ())
+
+        for index_keys in [
+                [("job", "hashed")],
+                [("job", 1), ("location", "2dsphere")],
+                [("_fts", "text"), ("_ftsx", 1)]]:
+            self.assertTupleEqual(
+                (0, False),
+                utils.indexadvisor.get_index_coverage(index_keys, shape))
+
+        self.assertTupleEqual(
+            (1, True),
+            utils.indexadvisor.get_index_coverage([("job", 1.0)], shape))
+
+    def test_get_index_coverage_equality_sort(self):
+        shape = (("job",), (), (("job", 1), ("created_on", -1)))
+
+        self.assertEqual(
+            (2, True),
+            utils.indexadvisor.get_index_coverage(
+                [("job", 1), ("created_on", -1)], shape))
+
+    def test_suggest_index(self):
+        shape = (("arch", "job"), ("created_on",), (("kernel", -1),))
+
+        self.assertListEqual(
+            [("job", 1), ("arch", 1), ("kernel", -1), ("created_on", 1)],
+            utils.indexadvisor.suggest_index(shape, {"job": 10, "arch": 3}))
+
+    @mock.patch("utils.db.aggregate_pipeline")
+    def test_sample_distinct_values_random(self, mock_aggregate):
+        collection = mock.Mock()
+        collection.count.return_value = 100
+        mock_aggregate.return_value = [
+            {"job": "next", "arch": "arm"}, {"job": "next", "arch": "x86"}]
+
+        distinct, sampled = utils.indexadvisor.sample_distinct_values(
+            collection, ["arch", "job"], 2)
+
+        self.assertDictEqual({"arch": 2, "job": 1}, distinct)
+        self.assertEqual(2, sampled)
+        self.assertFalse(collection.find.called)
+        self.assertEqual(
+            {"$sample": {"size": 2}}, mock_aggregate.call_args[0][1][0])
+
+    @mock.patch("utils.db.aggregate_pipeline")
+    def test_sample_distinct_values_no_random(self, mock_aggregate):
+        for idx in range(10):
+            self.database["build"].insert({"job": "job-%d" % idx})
+        mock_aggregate.side_effect = pymongo.errors.OperationFailure("")
+
+        distinct, sampled = utils.indexadvisor.sample_distinct_values(
+            self.database["build"], ["job"], 4)
+
+        self.assertDictEqual({"job": 4}, distinct)
+        self.assertEqual(4, sampled)
+
+    def test_estimate_selectivity(self):
+        shape = (("arch", "job"), (), ())
+
+        self.assertAlmostEqual(
+            0.025,
+            utils.indexadvisor.estimate_selectivity(
+                shape, {"job": 10, "arch": 4}))
+
+    def test_record_and_flush(self):
+        shapes = utils.indexadvisor.QueryShapes()
+        shapes.record("build", {"job": "next"}, None)
+        shapes.record("build", {"job": "mainline"}, None)
+        shapes.record("boot", {"job": "next"}, [("created_on", -1)])
+        shapes.flush(self.redis_conn)
+        shapes.record("build", {"job": "next"}, None)
+        shapes.flush(self.redis_conn)
+
+        self.assertDictEqual({}, shapes.counts)
+        self.assertDictEqual(
+            {
+                ("build", ("job",), (), ()): 3,
+                ("boot", ("job",), (), (("created_on", -1),)): 1
+            },
+            utils.indexadvisor.load_shapes(self.redis_conn))
+
+    def test_flush_redis_error(self):
+        redis_conn = mock.Mock()
+        redis_conn.pipeline.return_value.execute.side_effect = \
+            redis.exceptions.ConnectionError
+
+        shapes = utils.indexadvisor.QueryShapes()
+        shapes.record("build", {"job": "next"}, None)
+        shapes.flush(redis_conn)
+
+        self.assertDictEqual({}, shapes.counts)
+
+    def test_enable(self):
+        utils.indexadvisor.enable()
+        utils.indexadvisor.enable()
+        self.assertEqual(
+            1,
+            utils.instrumentation.QUERY_LISTENERS.count(
+                utils.indexadvisor.SHAPES.record))
+
+        utils.db.find(
+            self.database["build"], 10, 0,
+            spec={"job": "next"}, sort=[("created_on", -1)])
+        utils.indexadvisor.disable()
+        utils.db.find(self.database["build"], 10, 0, spec={"job": "next"})
+
+        self.assertDictEqual(
+            {("build", ("job",), (), (("created_on", -1),)): 1},
+            utils.indexadvisor.SHAPES.counts)
+
+    def test_advise(self):
+        for idx in range(10):
+            self.database["build"].insert(
+                {"job": "job-%d" % (idx % 5), "arch": "arm"})
+
+        database = mock.MagicMock()
+        database.__getitem__.return_value.find = \
+            self.database["build"].find
+        database.__getitem__.return_value.index_information.return_value = {
+            "_id_": {"key": [("_id", 1)]},
+            "job_1": {"key": [("job", 1)]},
+            "created_on_-1": {"key": [("created_on", -1)]},
+            "kernel_1": {"key": [("kernel", 1)], "unique": True},
+            "job_text": {"key": [("_fts", "text"), ("_ftsx", 1)]}
+        }
+
+        report = utils.indexadvisor.advise(
+            database,
+            {
+                ("build", ("job",), (), ()): 5,
+                ("build", ("arch", "job"), (), (("created_on", -1),)): 10,
+                ("build", ("board",), (), ()): 1
+            }
+        )["build"]
+
+        self.assertEqual(10, report["sampled"])
+        self.assertListEqual(["created_on_-1"], report["unused"])
+        self.assertListEqual(["job_text"], report["not_comparable"])
+
+        partial, covered, missing = report["shapes"]
+        self.assertEqual(10, partial["count"])
+        self.assertEqual("partial", partial["status"])
+        self.assertEqual("job_1", partial["index"])
+        self.assertListEqual(
+            [("job", 1), ("arch", 1), ("created_on", -1)],
+            partial["suggested"])
+        self.assertAlmostEqual(0.2, partial["selectivity"])
+
+        self.assertEqual("covered", covered["status"])
+        self.assertEqual("job_1", covered["index"])
+        self.assertNotIn("suggested", covered)
+
+        self.assertEqual("missing", missing["status"])
+        self.assertIsNone(missing["index"])
+        self.assertListEqual([("board", 1)], missing["suggested"])
@@ -0,0 +1,167 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import mock
+import threading
+import unittest
+
+import utils.instrumentation as instr
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        instr.bind(None)
+        while instr.get_recorder() is not None:
+            instr.stop_recording()
+
+    def test_timer_add(self):
+        timer = instr.RequestTimer()
+        timer.add(instr.DB_PHASE, 0.5)
+        timer.add(instr.DB_PHASE, 0.25)
+
+        self.assertDictEqual({instr.DB_PHASE: 0.75}, timer.durations)
+
+    def test_timer_phase(self):
+        timer = instr.RequestTimer()
+        with timer.phase(instr.QUERY_PHASE):
+            pass
+
+        self.assertIn(instr.QUERY_PHASE, timer.durations)
+
+    def test_timer_phase_exception(self):
+        timer = instr.RequestTimer()
+
+        def _raise():
+            with timer.phase(instr.QUERY_PHASE):
+                raise ValueError()
+
+        self.assertRaises(ValueError, _raise)
+        self.assertIn(instr.QUERY_PHASE, timer.durations)
+
+    @mock.patch("utils.instrumentation.time.time")
+    def test_timer_phase_db_time(self, mock_time):
+        mock_time.side_effect = [10.0, 13.0]
+        timer = instr.RequestTimer()
+        timer.add(instr.DB_PHASE, 1.0)
+
+        with timer.phase(instr.SERIALIZE_PHASE):
+            timer.add(instr.DB_PHASE, 2.0)
+
+        self.assertDictEqual(
+            {instr.DB_PHASE: 3.0, instr.SERIALIZE_PHASE: 1.0},
+            timer.durations)
+
+    def test_timed_no_timer(self):
+        with instr.timed(instr.TOKEN_PHASE):
+            pass
+
+        self.assertIsNone(instr.get_timer())
+
+    def test_timed_bound_timer(self):
+        timer = instr.RequestTimer()
+        instr.bind(timer)
+
+        with instr.timed(instr.TOKEN_PHASE):
+            pass
+
+        self.assertIn(instr.TOKEN_PHASE, timer.durations)
+
+    def test_server_timing(self):
+        timer = instr.RequestTimer()
+        timer.add(instr.TOTAL_PHASE, 0.01)
+        timer.add(instr.DB_PHASE, 0.002)
+        timer.add(instr.QUEUE_PHASE, 0.0005)
+
+        self.assertEqual(
+            "queue;dur=0.500, db;dur=2.000, total;dur=10.000",
+            timer.server_timing())
+
+    def test_add_time_no_timer(self):
+        instr.add_time(instr.DB_PHASE, 1.0)
+        self.assertIsNone(instr.get_timer())
+
+    def test_add_time_bound_timer(self):
+        timer = instr.RequestTimer()
+        instr.bind(timer)
+        instr.add_time(instr.DB_PHASE, 1.0)
+
+        self.assertIs(timer, instr.get_timer())
+        self.assertDictEqual({instr.DB_PHASE: 1.0}, timer.durations)
+
+    def test_bind_other_thread(self):
+        timer = instr.RequestTimer()
+        instr.bind(timer)
+
+        def _add():
+            instr.add_time(instr.DB_PHASE, 1.0)
+
+        thread = threading.Thread(target=_add)
+        thread.start()
+        thread.join()
+
+        self.assertDictEqual({}, timer.durations)
+
+    def test_query_recorder(self):
+        recorder = instr.QueryRecorder("test")
+        recorder.record("boot", "find", {"job": "a"}, 0.1)
+        recorder.record("boot", "find", {"job": "b"}, 0.3)
+        recorder.record("build", "count", None, 0.2)
+
+        self.assertEqual(3, recorder.count)
+        self.assertAlmostEqual(0.6, recorder.time)
+        self.assertEqual(2, recorder.get_count("boot"))
+        self.assertEqual(
+            (0.3, "find", {"job": "b"}),
+            recorder.collections["boot"]["slowest"])
+
+    @mock.patch("utils.LOG")
+    def test_query_recorder_check(self, mock_log):
+        recorder = instr.QueryRecorder("test", max_queries=1)
+        recorder.record("boot", "find", None, 0.1)
+
+        self.assertTrue(recorder.check())
+        self.assertFalse(mock_log.warn.called)
+
+        recorder.record("boot", "find", None, 0.1)
+
+        self.assertFalse(recorder.check())
+        self.assertTrue(mock_log.warn.called)
+
+    def test_record_query_no_recorder(self):
+        instr.record_query("boot", "find", None, 0.1)
+        self.assertIsNone(instr.get_recorder())
+
+    def test_start_stop_recording_nested(self):
+        outer = instr.start_recording("outer")
+        instr.record_query("boot", "find", None, 0.1)
+
+        with instr.record_queries("inner") as inner:
+            instr.record_query("build", "find", None, 0.1)
+            self.assertIs(inner, instr.get_recorder())
+
+        instr.record_query("boot", "find", None, 0.1)
+
+        self.assertIs(outer, instr.stop_recording())
+        self.assertIsNone(instr.get_recorder())
+        self.assertEqual(2, outer.get_count("boot"))
+        self.assertEqual(0, outer.get_count("build"))
+        self.assertEqual(1, inner.get_count("build"))
+
+    def test_stop_recording_not_recording(self):
+        self.assertIsNone(instr.stop_recording())
@@ -0,0 +1,87 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import bson
+import bson.tz_util
+import datetime
+import re
+import unittest
+
+import utils.jsoncodec
+
+
+class TestJsonCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.doc = {
+            "_id": bson.ObjectId(),
+            "created_on": datetime.datetime(
+                2016, 3, 1, 10, 30, 15, 123000, tzinfo=bson.tz_util.utc),
+            "old": datetime.datetime(1969, 7, 20, 20, 17, 40, 999999),
+            "name": u"caf\xe9",
+            "values": [1, 2.5, None, True],
+            "nested": {"ids": [bson.ObjectId(), bson.ObjectId()]}
+        }
+
+    def test_dumps_same_as_bson(self):
+        self.assertEqual(
+            utils.jsoncodec.loads(
+                utils.jsoncodec.dumps(self.doc, codec="bson"), codec="bson"),
+            utils.jsoncodec.loads(
+                utils.jsoncodec.dumps(self.doc, codec="fast"), codec="bson")
+        )
+
+    def test_loads_same_as_bson(self):
+        encoded = utils.jsoncodec.dumps(self.doc, codec="bson")
+
+        self.assertEqual(
+            utils.jsoncodec.loads(encoded, codec="bson"),
+            utils.jsoncodec.loads(encoded, codec="fast"))
+
+    def test_round_trip(self):
+        decoded = utils.jsoncodec.loads(utils.jsoncodec.dumps(self.doc))
+
+        self.assertEqual(self.doc["_id"], decoded["_id"])
+        self.assertEqual(self.doc["nested"], decoded["nested"])
+        self.assertEqual(self.doc["created_on"], decoded["created_on"])
+        self.assertEqual(u"caf\xe9", decoded["name"])
+
+    def test_other_bson_types(self):
+        doc = {
+            "regex": re.compile("^foo", re.IGNORECASE),
+            "date": {"$date": "2016-03-01T10:30:15.123Z"}
+        }
+
+        decoded = utils.jsoncodec.loads(
+            utils.jsoncodec.dumps(doc, codec="fast"), codec="fast")
+
+        self.assertEqual("^foo", decoded["regex"].pattern)
+        self.assertEqual(
+            datetime.datetime(
+                2016, 3, 1, 10, 30, 15, 123000, tzinfo=bson.tz_util.utc),
+            decoded["date"])
+
+    def test_plain_objects(self):
+        self.assertEqual(
+            {"foo": {"bar": 1, "baz": "$foo"}},
+            utils.jsoncodec.loads('{"foo": {"bar": 1, "baz": "$foo"}}'))
+
+    def test_set_default_codec(self):
+        self.assertRaises(
+            ValueError, utils.jsoncodec.set_default_codec, "foo")
+
+        utils.jsoncodec.set_default_codec("bson")
+        try:
+            self.assertEqual("bson", utils.jsoncodec.DEFAULT_CODEC)
+        finally:
+            utils.jsoncodec.set_default_codec("fast")
@@ -0,0 +1,106 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import fakeredis
+import logging
+import mock
+import redis
+import unittest
+
+import utils.metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.redis_conn = fakeredis.FakeStrictRedis()
+        self.redis_conn.flushall()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_observe(self):
+        buckets = (0.1, 1.0)
+        utils.metrics.observe(self.redis_conn, "foo", 0.05, buckets=buckets)
+        utils.metrics.observe(self.redis_conn, "foo", 0.5, buckets=buckets)
+        utils.metrics.observe(self.redis_conn, "foo", 5, buckets=buckets)
+
+        histogram = utils.metrics.get_histogram(
+            self.redis_conn, "foo", buckets=buckets)
+
+        self.assertListEqual(
+            [(0.1, 1), (1.0, 2), ("+Inf", 3)], histogram["buckets"])
+        self.assertEqual(3, histogram["count"])
+        self.assertAlmostEqual(5.55, histogram["sum"])
+        self.assertSetEqual(
+            set(["foo"]), self.redis_conn.smembers("metrics-histograms"))
+
+    def test_add_to_counters(self):
+        utils.metrics.add_to_counters(self.redis_conn, {"foo": 2, "bar": 1})
+        utils.metrics.add_to_counters(self.redis_conn, {"foo": 3})
+
+        self.assertDictEqual(
+            {"foo": 5, "bar": 1}, utils.metrics.get_counters(self.redis_conn))
+
+    def test_get_histogram_empty(self):
+        histogram = utils.metrics.get_histogram(
+            self.redis_conn, "bar", buckets=(1,))
+
+        self.assertListEqual([(1, 0), ("+Inf", 0)], histogram["buckets"])
+        self.assertEqual(0, histogram["count"])
+        self.assertEqual(0, histogram["sum"])
+
+    def test_observe_redis_error(self):
+        redis_conn = mock.Mock()
+        redis_conn.pipeline.return_value.execute.side_effect = \
+            redis.exceptions.ConnectionError
+
+        utils.metrics.observe(redis_conn, "foo", 1)
+
+    def test_observe_many(self):
+        buckets = (0.1, 1.0)
+        utils.metrics.observe_many(
+            self.redis_conn,
+            {"foo": 0.05, "bar": 0.5},
+            counters=["baz", "baz", "qux"], buckets=buckets)
+
+        histogram = utils.metrics.get_histogram(
+            self.redis_conn, "bar", buckets=buckets)
+
+        self.assertListEqual(
+            [(0.1, 0), (1.0, 1), ("+Inf", 1)], histogram["buckets"])
+        self.assertListEqual(
+            ["bar", "foo"], utils.metrics.get_histogram_names(self.redis_conn))
+        self.assertDictEqual(
+            {"baz": 2, "qux": 1}, utils.metrics.get_counters(self.redis_conn))
+
+    def test_observe_many_redis_error(self):
+        redis_conn = mock.Mock()
+        redis_conn.pipeline.return_value.execute.side_effect = \
+            redis.exceptions.ConnectionError
+
+        utils.metrics.observe_many(redis_conn, {"foo": 1}, counters=["bar"])
+
+    def test_get_histogram_stored_buckets(self):
+        utils.metrics.observe(self.redis_conn, "foo", 3, buckets=(1, 5, 10))
+
+        histogram = utils.metrics.get_histogram(
+            self.redis_conn, "foo", buckets=None)
+
+        self.assertListEqual(
+            [(5.0, 1), (10.0, 1), ("+Inf", 1)], histogram["buckets"])
+        self.assertEqual(1, histogram["count"])
+
+    def test_get_counters_empty(self):
+        self.assertDictEqual({}, utils.metrics.get_counters(self.redis_conn))
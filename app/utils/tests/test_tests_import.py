@@ -18,12 +18,15 @@ import mock
 
 import utils.tests_import as tests_import
 
+from tests.helpers import QueryBudgetMixin
 
-class TestTestsImport(unittest.TestCase):
+
+class TestTestsImport(unittest.TestCase, QueryBudgetMixin):
 
     def setUp(self):
         logging.disable(logging.CRITICAL)
         self.db = mongomock.Database(mongomock.Connection(), 'kernel-ci')
+        tests_import.REF_CACHE.clear()
 
     def tearDown(self):
         logging.disable(logging.NOTSET)
@@ -47,12 +50,12 @@ class TestTestsImport(unittest.TestCase):
         self.assertListEqual([], ids)
 
     @mock.patch("utils.db.update")
-    @mock.patch("utils.db.save")
+    @mock.patch("utils.db.insert_all")
     @mock.patch("utils.db.get_db_connection")
     def test_import_multi_test_cases_simple(
-            self, mock_db, mock_save, mock_update):
+            self, mock_db, mock_insert, mock_update):
         mock_db.return_value = self.db
-        mock_save.return_value = (201, "fake-id")
+        mock_insert.return_value = (201, ["fake-id"])
         mock_update.return_value = 200
 
         case_list = [
@@ -70,12 +73,12 @@ class TestTestsImport(unittest.TestCase):
         self.assertListEqual(["fake-id"], ids)
 
     @mock.patch("utils.db.update")
-    @mock.patch("utils.db.save")
+    @mock.patch("utils.db.insert_all")
     @mock.patch("utils.db.get_db_connection")
     def test_import_multi_test_cases_complex(
-            self, mock_db, mock_save, mock_update):
+            self, mock_db, mock_insert, mock_update):
         mock_db.return_value = self.db
-        mock_save.side_effect = [(201, "id0"), (201, "id1"), (201, "id2")]
+        mock_insert.return_value = (201, ["id0", "id1", "id2"])
         mock_update.return_value = 200
 
         case_list = [
@@ -93,12 +96,33 @@ class TestTestsImport(unittest.TestCase):
 
         self.assertDictEqual({}, errors)
         self.assertListEqual(["id0", "id1", "id2"], ids)
+        # All the test cases are inserted with a single bulk operation.
+        self.assertEqual(1, mock_insert.call_count)
+        self.assertEqual(3, len(mock_insert.call_args[0][1]))
 
-    @mock.patch("utils.db.save")
     @mock.patch("utils.db.get_db_connection")
-    def test_import_multi_test_cases_with_save_error(self, mock_db, mock_save):
+    def test_import_multi_test_cases_query_budget(self, mock_db):
         mock_db.return_value = self.db
-        mock_save.return_value = (500, None)
+
+        case_list = [
+            {"name": "test-case%d" % idx, "version": "1.0"}
+            for idx in range(50)
+        ]
+
+        with self.assertMaxQueries(1):
+            ids, errors = tests_import.import_multi_test_cases(
+                case_list, "test-suite-id", "suite-name", {},
+                test_set_id="test-set-id")
+
+        self.assertDictEqual({}, errors)
+        self.assertEqual(50, len(ids))
+
+    @mock.patch("utils.db.insert_all")
+    @mock.patch("utils.db.get_db_connection")
+    def test_import_multi_test_cases_with_save_error(
+            self, mock_db, mock_insert):
+        mock_db.return_value = self.db
+        mock_insert.return_value = (500, [None])
 
         case_list = [
             {
@@ -117,12 +141,12 @@ class TestTestsImport(unittest.TestCase):
         self.assertListEqual([500], errors.keys())
         self.assertListEqual([], ids)
 
-    @mock.patch("utils.db.save")
+    @mock.patch("utils.db.insert_all")
     @mock.patch("utils.db.get_db_connection")
     def test_import_multi_test_cases_with_multi_save_error(
-            self, mock_db, mock_save):
+            self, mock_db, mock_insert):
         mock_db.return_value = self.db
-        mock_save.return_value = (500, None)
+        mock_insert.return_value = (500, [None, None])
 
         case_list = [
             {"name": "test-case0", "version": "1.0", "parameters": {"a": 1}},
@@ -137,16 +161,16 @@ class TestTestsImport(unittest.TestCase):
             case_list, test_suite_id, "suite-name", {}, **kwargs)
 
         self.assertListEqual([500], errors.keys())
-        self.assertEqual(2, len(errors[500]))
+        self.assertEqual(
+            ["Error saving 2 test objects"], list(errors[500]))
         self.assertListEqual([], ids)
 
-    @mock.patch("utils.db.save")
+    @mock.patch("utils.db.insert_all")
     @mock.patch("utils.db.get_db_connection")
     def test_import_multi_test_cases_with_multi_save_error_complex(
-            self, mock_db, mock_save):
+            self, mock_db, mock_insert):
         mock_db.return_value = self.db
-        mock_save.side_effect = [
-            (500, None), (201, "id0"), (201, "id1"), (500, None)]
+        mock_insert.return_value = (500, [None, "id0", "id1", None])
 
         case_list = [
             {"name": "test-case0", "version": "1.0", "parameters": {"a": 1}},
@@ -163,7 +187,8 @@ class TestTestsImport(unittest.TestCase):
             case_list, test_suite_id, "suite-name", {}, **kwargs)
 
         self.assertListEqual([500], errors.keys())
-        self.assertEqual(2, len(errors[500]))
+        self.assertEqual(
+            ["Error saving 2 test objects"], list(errors[500]))
         self.assertListEqual(["id0", "id1"], ids)
 
     @mock.patch("utils.db.get_db_connection")
@@ -565,3 +590,66 @@ class TestTestsImport(unittest.TestCase):
 
         self.assertEqual(500, ret_val)
         self.assertListEqual([500], errors.keys())
+
+    @mock.patch("utils.db.update")
+    @mock.patch("utils.db.get_db_connection")
+    def test_import_test_cases_from_test_set_batch(self, mock_db, mock_update):
+        mock_db.return_value = self.db
+        mock_update.return_value = 200
+        set_id = self.db["test_set"].insert(
+            {"name": "test-set", "test_case": []})
+
+        case_list = [
+            {"name": "test-case%d" % idx, "version": "1.0"}
+            for idx in range(5)
+        ]
+        case_list.append({"version": "1.0"})
+
+        with mock.patch("utils.tests_import.TESTS_CHUNK_SIZE", 2):
+            ret_val, errors = tests_import.import_test_cases_from_test_set(
+                set_id, "test-suite-id", "suite-name", case_list, {})
+
+        self.assertEqual(200, ret_val)
+        self.assertListEqual([400], errors.keys())
+
+        # mongomock does not support $addToSet with $each.
+        case_ids = sorted(doc["_id"] for doc in self.db["test_case"].find())
+        self.assertEqual(5, len(case_ids))
+        mock_update.assert_called_once_with(
+            self.db["test_set"],
+            {"_id": set_id},
+            {"test_case": {"$each": case_ids}}, operation="$addToSet")
+        self.assertEqual(
+            5, self.db["test_case"].find({"test_set_id": set_id}).count())
+
+    @mock.patch("utils.db.get_db_connection")
+    def test_parse_test_suite_cached_references(self, mock_db):
+        mock_db.return_value = self.db
+        build_id = self.db["build"].insert(
+            {"job": "job", "kernel": "kernel", "defconfig": "defconfig"})
+
+        def _suite_json():
+            return {"build_id": str(build_id), "name": "test-suite"}
+
+        expected = {
+            "build_id": build_id,
+            "defconfig": "defconfig",
+            "job": "job",
+            "kernel": "kernel"
+        }
+
+        find_one2 = tests_import.utils.db.find_one2
+        with mock.patch("utils.db.find_one2", wraps=find_one2) as mock_find:
+            self.assertDictEqual(
+                expected, tests_import.parse_test_suite(_suite_json(), {}))
+
+            with self.assertMaxQueries(0):
+                self.assertDictEqual(
+                    expected,
+                    tests_import.parse_test_suite(_suite_json(), {}))
+
+            self.assertEqual(1, mock_find.call_count)
+
+        stats = tests_import.REF_CACHE.stats()
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual(1, stats["misses"])
@@ -11,6 +11,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import errno
 import io
 import logging
 import mock
@@ -37,6 +38,13 @@ class TestUpload(unittest.TestCase):
         if os.path.exists(self.temp_dir):
             shutil.rmtree(self.temp_dir, ignore_errors=True)
 
+    def _write_temp_file(self, content):
+        fd, tmp_path = tempfile.mkstemp(dir=self.temp_dir)
+        with io.open(fd, mode="wb") as tmp_file:
+            tmp_file.write(content)
+
+        return tmp_path
+
     def test_is_valid_dir_path_valid(self):
         self.assertTrue(
             upload.is_valid_dir_path("foo-path", base_path=self.temp_dir))
@@ -227,3 +235,260 @@ class TestUpload(unittest.TestCase):
         self.assertEqual(ret_dict["status"], 200)
         self.assertEqual(ret_dict["filename"], filename)
         self.assertIsNone(ret_dict["error"])
+
+    def test_normalize_upload_path(self):
+        normalize = upload.normalize_upload_path
+
+        self.assertEqual(
+            "path/to/file",
+            normalize("/path//to/./file/", base_path=self.temp_dir))
+        self.assertEqual(
+            "path/to/..file", normalize("path/to/..file", base_path="/base"))
+
+        for path in [
+                None, "", "/", ".", "..", "../file", "path/../../file",
+                "path/../file", ".objects/ab/cd", ".upload-tmp/file.part"]:
+            self.assertIsNone(normalize(path, base_path=self.temp_dir))
+
+    def test_normalize_upload_path_symlink(self):
+        os.symlink("/", os.path.join(self.temp_dir, "root"))
+
+        self.assertIsNone(
+            upload.normalize_upload_path(
+                "root/etc/file", base_path=self.temp_dir))
+
+    def test_move_temp_file(self):
+        tmp_path = self._write_temp_file(b"foo")
+
+        path = "dest-path/"
+        filename = "subdir/foo-file.txt"
+        file_path = os.path.join(self.temp_dir, path, filename)
+
+        ret_dict = upload.move_temp_file(
+            tmp_path, path, filename, base_path=self.temp_dir)
+
+        self.assertEqual(201, ret_dict["status"])
+        self.assertEqual(3, ret_dict["bytes"])
+        self.assertIsNone(ret_dict["error"])
+        self.assertTrue(os.path.isfile(file_path))
+        self.assertFalse(os.path.exists(tmp_path))
+
+        tmp_path = self._write_temp_file(b"foobar")
+
+        ret_dict = upload.move_temp_file(
+            tmp_path, path, filename, base_path=self.temp_dir)
+
+        self.assertEqual(200, ret_dict["status"])
+        with io.open(file_path, mode="rb") as r_file:
+            self.assertEqual(b"foobar", r_file.read())
+
+    @mock.patch("utils.upload.check_or_create_upload_dir")
+    def test_move_temp_file_dir_error(self, mock_check):
+        mock_check.return_value = (500, "error")
+        tmp_path = self._write_temp_file(b"")
+
+        ret_dict = upload.move_temp_file(
+            tmp_path, "dest-path/", "subdir/foo", base_path=self.temp_dir)
+
+        self.assertEqual(500, ret_dict["status"])
+        self.assertIsNotNone(ret_dict["error"])
+        self.assertFalse(os.path.exists(tmp_path))
+
+    def test_create_or_update_no_temp_left(self):
+        ret_dict = upload.create_or_update_file(
+            "", "foo-file.txt", None, b"foo", base_path=self.temp_dir)
+
+        self.assertEqual(201, ret_dict["status"])
+        self.assertEqual(3, ret_dict["bytes"])
+        self.assertListEqual(["foo-file.txt"], os.listdir(self.temp_dir))
+
+    def test_create_or_update_dedup(self):
+        digest = upload.get_digest(b"foo")
+        os.makedirs(os.path.join(self.temp_dir, "path-a"))
+        os.makedirs(os.path.join(self.temp_dir, "path-b"))
+
+        ret_dict = upload.create_or_update_file(
+            "path-a/", "foo.txt", None, b"foo",
+            base_path=self.temp_dir, dedup=True)
+        self.assertEqual(201, ret_dict["status"])
+        self.assertEqual(digest, ret_dict["digest"])
+
+        ret_dict = upload.create_or_update_file(
+            "path-b/", "bar.txt", None, b"foo",
+            base_path=self.temp_dir, dedup=True)
+        self.assertEqual(201, ret_dict["status"])
+        self.assertEqual(3, ret_dict["bytes"])
+
+        obj_path = upload.get_object_path(digest, base_path=self.temp_dir)
+        self.assertTrue(os.path.isfile(obj_path))
+        self.assertEqual(3, os.stat(obj_path).st_nlink)
+        self.assertTrue(
+            os.path.samefile(
+                obj_path, os.path.join(self.temp_dir, "path-b/bar.txt")))
+        self.assertListEqual(
+            ["foo.txt"], os.listdir(os.path.join(self.temp_dir, "path-a")))
+
+    def test_move_temp_file_dedup(self):
+        digest = upload.get_digest(b"foo")
+        os.makedirs(os.path.join(self.temp_dir, "path"))
+
+        for filename in ["foo", "bar"]:
+            tmp_path = self._write_temp_file(b"foo")
+
+            ret_dict = upload.move_temp_file(
+                tmp_path, "path/", filename,
+                base_path=self.temp_dir, digest=digest)
+
+            self.assertEqual(201, ret_dict["status"])
+            self.assertEqual(digest, ret_dict["digest"])
+            self.assertFalse(os.path.exists(tmp_path))
+
+        self.assertTrue(
+            os.path.samefile(
+                os.path.join(self.temp_dir, "path/foo"),
+                os.path.join(self.temp_dir, "path/bar")))
+
+    def test_link_object_file(self):
+        digest = upload.get_digest(b"foo")
+        os.makedirs(os.path.join(self.temp_dir, "path"))
+        os.makedirs(os.path.join(self.temp_dir, "other-path"))
+
+        ret_dict = upload.link_object_file(
+            digest, "path/", "foo", base_path=self.temp_dir)
+        self.assertEqual(404, ret_dict["status"])
+
+        upload.create_or_update_file(
+            "path/", "foo", None, b"foo", base_path=self.temp_dir, dedup=True)
+        ret_dict = upload.link_object_file(
+            digest, "other-path/", "foo", base_path=self.temp_dir)
+
+        self.assertEqual(201, ret_dict["status"])
+        self.assertEqual(3, ret_dict["bytes"])
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.temp_dir, "other-path/foo")))
+
+    def test_object_read_only(self):
+        os.makedirs(os.path.join(self.temp_dir, "path"))
+
+        ret_dict = upload.create_or_update_file(
+            "path/", "foo", None, b"foo", base_path=self.temp_dir, dedup=True)
+
+        obj_path = upload.get_object_path(
+            ret_dict["digest"], base_path=self.temp_dir)
+        self.assertEqual(upload.OBJECT_MODE, os.stat(obj_path).st_mode & 0777)
+
+    @mock.patch("os.link")
+    def test_link_object_copy(self, mock_link):
+        mock_link.side_effect = OSError(errno.EXDEV, "Cross-device link")
+        os.makedirs(os.path.join(self.temp_dir, "path"))
+
+        ret_dict = upload.create_or_update_file(
+            "path/", "foo", None, b"foo", base_path=self.temp_dir, dedup=True)
+
+        file_path = os.path.join(self.temp_dir, "path/foo")
+        self.assertEqual(201, ret_dict["status"])
+        self.assertFalse(os.path.islink(file_path))
+        self.assertEqual(upload.FILE_MODE, os.stat(file_path).st_mode & 0777)
+        with io.open(file_path, mode="rb") as r_stream:
+            self.assertEqual(b"foo", r_stream.read())
+
+    def test_collect_objects(self):
+        os.makedirs(os.path.join(self.temp_dir, "path"))
+        for content in [b"foo", b"bar", b"baz"]:
+            upload.create_or_update_file(
+                "path/", content, None, content,
+                base_path=self.temp_dir, dedup=True)
+        # Replaced: its object is not linked anymore.
+        upload.create_or_update_file(
+            "path/", "foo", None, b"qux", base_path=self.temp_dir, dedup=True)
+        # Removed, but its object is too recent.
+        os.unlink(os.path.join(self.temp_dir, "path/baz"))
+
+        obj_paths = dict(
+            (content,
+                upload.get_object_path(
+                    upload.get_digest(content), base_path=self.temp_dir))
+            for content in [b"foo", b"bar", b"baz", b"qux"])
+        for content in [b"foo", b"bar", b"qux"]:
+            os.utime(obj_paths[content], (0, 0))
+
+        removed = upload.collect_objects(base_path=self.temp_dir)
+
+        self.assertEqual(1, removed)
+        self.assertFalse(os.path.exists(obj_paths[b"foo"]))
+        self.assertTrue(os.path.exists(obj_paths[b"bar"]))
+        self.assertTrue(os.path.exists(obj_paths[b"baz"]))
+        self.assertTrue(os.path.exists(obj_paths[b"qux"]))
+
+    def test_collect_objects_no_store(self):
+        self.assertEqual(0, upload.collect_objects(base_path=self.temp_dir))
+
+    def test_is_valid_digest(self):
+        self.assertTrue(upload.is_valid_digest(upload.get_digest(b"foo")))
+        self.assertFalse(upload.is_valid_digest("../../etc/passwd"))
+        self.assertFalse(upload.is_valid_digest(None))
+
+    def test_write_chunks(self):
+        part_path = upload.create_part_file(
+            "session", 10, base_path=self.temp_dir)
+        self.assertEqual(10, os.path.getsize(part_path))
+
+        upload.write_chunk("session", 6, b"6789", base_path=self.temp_dir)
+        upload.write_chunk("session", 0, b"012345", base_path=self.temp_dir)
+
+        with io.open(part_path, mode="rb") as r_stream:
+            self.assertEqual(b"0123456789", r_stream.read())
+        self.assertEqual(
+            upload.get_digest(b"0123456789"),
+            upload.get_file_digest(part_path, block_size=3))
+
+        upload.remove_part_file("session", base_path=self.temp_dir)
+        self.assertFalse(os.path.exists(part_path))
+
+    def test_merge_ranges(self):
+        self.assertEqual(
+            [[0, 10], [12, 20]],
+            upload.merge_ranges([[12, 20], [4, 10], [0, 4], [2, 6]]))
+
+    def test_missing_ranges(self):
+        self.assertEqual(
+            [[0, 2], [10, 12], [20, 25]],
+            upload.missing_ranges([[12, 20], [4, 10], [2, 6]], 25))
+        self.assertEqual([], upload.missing_ranges([[0, 25]], 25))
+        self.assertEqual([[0, 25]], upload.missing_ranges([], 25))
+
+    def test_remove_stale_part_files(self):
+        part_path = upload.create_part_file(
+            "session", 10, base_path=self.temp_dir)
+        os.utime(part_path, (0, 0))
+        new_path = upload.create_part_file(
+            "other", 10, base_path=self.temp_dir)
+
+        upload.remove_stale_part_files(60, base_path=self.temp_dir)
+
+        self.assertFalse(os.path.exists(part_path))
+        self.assertTrue(os.path.exists(new_path))
+
+    @mock.patch("utils.upload.check_or_create_upload_dir")
+    def test_create_file_dirs(self, mock_check):
+        mock_check.return_value = (200, None)
+
+        dirs_status = upload.create_file_dirs(
+            "path/", ["file0", "sub/file1", "sub/file2", "other/file3"],
+            base_path=self.temp_dir)
+
+        self.assertEqual(
+            {"path/": 200, "path/sub/": 200, "path/other/": 200},
+            dirs_status)
+        self.assertEqual(2, mock_check.call_count)
+
+    def test_create_or_update_no_check_dir(self):
+        os.makedirs(os.path.join(self.temp_dir, "path", "sub"))
+
+        ret_dict = upload.create_or_update_file(
+            "path/", "sub/file", None, "content",
+            base_path=self.temp_dir, check_dir=False)
+
+        self.assertEqual(201, ret_dict["status"])
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.temp_dir, "path/sub/file")))
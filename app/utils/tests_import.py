@@ -22,18 +22,66 @@ import models
 import models.test_case as mtcase
 import models.test_set as mtset
 import utils
+import utils.cache
 import utils.db
 import utils.errors
 
 ADD_ERR = utils.errors.add_error
 UPDATE_ERR = utils.errors.update_errors
 
+# How many test objects are inserted with a single bulk operation.
+TESTS_CHUNK_SIZE = 1000
+
+# The values a test suite takes from its job, build and boot documents.
+SUITE_REFERENCE_KEYS = [
+    models.ARCHITECTURE_KEY,
+    models.BOARD_INSTANCE_KEY,
+    models.BOARD_KEY,
+    models.BOOT_ID_KEY,
+    models.BUILD_ID_KEY,
+    models.DEFCONFIG_FULL_KEY,
+    models.DEFCONFIG_KEY,
+    models.JOB_ID_KEY,
+    models.JOB_KEY,
+    models.KERNEL_KEY
+]
+
+# Cache of the job, build and boot documents referenced by the test suites:
+# a lab usually sends many test suites for the same boot.
+REF_CACHE_TTL = 60
+REF_CACHE_SIZE = 4096
+REF_CACHE = utils.cache.TTLCache(
+    REF_CACHE_TTL, REF_CACHE_SIZE, name="test-references")
+
+
+def find_reference(collection, oid):
+    """Find a document referenced by a test suite.
+
+    Only the fields a test suite can take from the document are retrieved.
+    Found documents are cached.
+
+    :param collection: The database collection where to search.
+    :type collection: pymongo.collection.Collection
+    :param oid: The ID of the document.
+    :type oid: bson.objectid.ObjectId
+    :return The document or None.
+    """
+    cache_key = (collection.name, oid)
+
+    doc = REF_CACHE.get(cache_key)
+    if doc is None:
+        doc = utils.db.find_one2(
+            collection, oid, fields=SUITE_REFERENCE_KEYS)
+        REF_CACHE.set(cache_key, doc)
+
+    return doc
+
 
 def _get_document_and_update(oid, collection, fields, up_doc, validate_func):
     """Get the document and update the provided data structure.
 
-    Perform a database search on the provided collection, searching for the
-    passed `oid` retrieving the provided fields list.
+    Perform a (cached) database search on the provided collection, searching
+    for the passed `oid` retrieving the provided fields list.
 
     :param oid: The ID to search.
     :type oid: bson.objectid.ObjectId
@@ -46,13 +94,13 @@ def _get_document_and_update(oid, collection, fields, up_doc, validate_func):
     :param validate_func: A function used to validate the retrieved values.
     :type validate_func: function
     """
-    doc = utils.db.find_one2(collection, oid, fields=fields)
+    doc = find_reference(collection, oid)
     if doc:
         up_doc.update(
             {
                 k: v
                 for k, v in doc.iteritems()
-                if validate_func(k, v)
+                if k in fields and validate_func(k, v)
             }
         )
 
@@ -86,18 +134,7 @@ def parse_test_suite(suite_json, db_options):
 
     # The set of keys we need to update a test suite with to provide search
     # capabilities based on the values of the job, build and/or boot used.
-    all_keys = set([
-        models.ARCHITECTURE_KEY,
-        models.BOARD_INSTANCE_KEY,
-        models.BOARD_KEY,
-        models.BOOT_ID_KEY,
-        models.BUILD_ID_KEY,
-        models.DEFCONFIG_FULL_KEY,
-        models.DEFCONFIG_KEY,
-        models.JOB_ID_KEY,
-        models.JOB_KEY,
-        models.KERNEL_KEY
-    ])
+    all_keys = set(SUITE_REFERENCE_KEYS)
 
     def _get_valid_keys():
         """Parse the test suite JSON object and yield its keys.
@@ -215,7 +252,8 @@ def update_test_suite(suite_json, test_suite_id, db_options):
 
 
 def import_multi_base(
-        import_func, tests_list, suite_id, suite_name, db_options, **kwargs):
+        import_func, tests_list, suite_id, suite_name, db_options,
+        parse_func=None, **kwargs):
     """Generic function to import a test sets or test cases list.
 
     The passed import function must be a function that is able to parse the
@@ -225,6 +263,13 @@ def import_multi_base(
     1. The ID of the saved document, or None if it has not been saved.
     2. An error message if an error occurred, or None.
 
+    If a parse function is passed, the tests are imported in batch: they are
+    all parsed first, and then inserted with bulk operations. The parse
+    function must accept the same arguments of the import function, without
+    the database ones, and return a 2 values tuple as follows:
+    0. The document to save, or None if not valid.
+    1. A dictionary with the errors.
+
     Additional named arguments passed might be (with the exact following
     names):
     * test_set_id
@@ -251,6 +296,9 @@ def import_multi_base(
     :type suite_name: str
     :param db_options: Options for connecting to the database.
     :type db_options: dict
+    :param parse_func: The function that will be used to parse each test
+    object when importing them in batch.
+    :type parse_func: function
     :return A list with the saved test objects IDs or an empty list; a
     dictionary with keys the error codes and value a list of error messages,
     or an empty dictionary.
@@ -283,8 +331,56 @@ def import_multi_base(
             yield import_func(
                 test, suite_id, suite_name, database, db_options, **kwargs)
 
-    for ret_val, doc_id, imp_errors in _yield_tests_import():
-        _parse_result(ret_val, doc_id, imp_errors)
+    if parse_func:
+        test_ids, errors = _import_multi_batch(
+            parse_func, tests_list, suite_id, suite_name, database, **kwargs)
+    else:
+        for ret_val, doc_id, imp_errors in _yield_tests_import():
+            _parse_result(ret_val, doc_id, imp_errors)
+
+    return test_ids, errors
+
+
+def _import_multi_batch(
+        parse_func, tests_list, suite_id, suite_name, database, **kwargs):
+    """Parse all the test objects and insert them with bulk operations.
+
+    :param parse_func: The function that will be used to parse each test
+    object.
+    :type parse_func: function
+    :param tests_list: The list with the test sets or cases to import.
+    :type tests_list: list
+    :param suite_id: The ID of the test suite these test objects belong to.
+    :type suite_id: str
+    :param suite_name: The name of the test suite.
+    :type suite_name: str
+    :param database: The database connection.
+    :return A list with the saved test objects IDs or an empty list; a
+    dictionary with keys the error codes and value a list of error messages,
+    or an empty dictionary.
+    """
+    errors = {}
+    test_ids = []
+    documents = []
+
+    for test in tests_list:
+        document, parse_errors = parse_func(
+            test, suite_id, suite_name, **kwargs)
+        if document:
+            documents.append(document)
+        else:
+            UPDATE_ERR(errors, parse_errors)
+
+    if documents:
+        ret_val, doc_ids = utils.db.insert_all(
+            database, documents, chunk_size=TESTS_CHUNK_SIZE)
+        test_ids = [doc_id for doc_id in doc_ids if doc_id]
+
+        if ret_val != 201:
+            err_msg = "Error saving %d test objects" % (
+                len(documents) - len(test_ids))
+            utils.LOG.error(err_msg)
+            ADD_ERR(errors, 500, err_msg)
 
     return test_ids, errors
 
@@ -413,23 +509,11 @@ def import_multi_test_sets(
         import_test_set, set_list, suite_id, suite_name, db_options, **kwargs)
 
 
-def import_test_case(
-        json_obj, suite_id, suite_name, database, db_options, **kwargs):
-    """Parse and save a test case.
+def _parse_test_case(json_obj, suite_id, suite_name, **kwargs):
+    """Parse a test case.
 
-    Additional named arguments passed might be (with the exact following
-    names):
-    * test_set_id
-    * build_id
-    * job_id
-    * job
-    * kernel
-    * defconfig
-    * defconfig_full
-    * lab_name
-    * board
-    * board_instance
-    * mail_options
+    Additional named arguments passed might be the same of
+    `import_test_case`.
 
     :param json_obj: The JSON data structure of the test case to import.
     :type json_obj: dict
@@ -437,15 +521,11 @@ def import_test_case(
     :type suite_id: bson.objectid.ObjectId
     :param suite_name: The name of the test suite.
     :type suite_name: str
-    :param database: The database connection.
-    :param db_options: The database connection options.
-    :type db_options: dict
-    :return 200 if OK, 500 in case of errors; the saved document ID or None;
-    a dictionary with error codes and messages.
+    :return The `TestCaseDocument` or None if not valid; a dictionary with
+    error codes and messages.
     """
-    ret_val = 400
     errors = {}
-    doc_id = None
+    test_case = None
 
     if isinstance(json_obj, types.DictionaryType):
         j_get = json_obj.get
@@ -469,22 +549,14 @@ def import_test_case(
             test_case = mtcase.TestCaseDocument.from_json(json_obj)
 
             if test_case:
-                k_get = kwargs.get
-
                 test_case.created_on = datetime.datetime.now(
                     tz=bson.tz_util.utc)
-                test_case.test_set_id = k_get(models.TEST_SET_ID_KEY, None)
-
-                ret_val, doc_id = utils.db.save(
-                    database, test_case, manipulate=True)
-
-                if ret_val != 201:
-                    err_msg = "Error saving test case '%s'" % test_name
-                    utils.LOG.error(err_msg)
-                    ADD_ERR(errors, 500, err_msg)
+                test_case.test_set_id = kwargs.get(
+                    models.TEST_SET_ID_KEY, None)
             else:
                 ADD_ERR(errors, 400, "Missing mandatory key in JSON data")
         except ValueError, ex:
+            test_case = None
             ADD_ERR(errors, 400, "Error parsing test case '%s'" % test_name)
             error = (
                 "Error parsing test case '%s': %s" % (test_name, ex.message))
@@ -492,6 +564,53 @@ def import_test_case(
     else:
         ADD_ERR(errors, 400, "Test case is not valid JSON data")
 
+    return test_case, errors
+
+
+def import_test_case(
+        json_obj, suite_id, suite_name, database, db_options, **kwargs):
+    """Parse and save a test case.
+
+    Additional named arguments passed might be (with the exact following
+    names):
+    * test_set_id
+    * build_id
+    * job_id
+    * job
+    * kernel
+    * defconfig
+    * defconfig_full
+    * lab_name
+    * board
+    * board_instance
+    * mail_options
+
+    :param json_obj: The JSON data structure of the test case to import.
+    :type json_obj: dict
+    :param suite_id: The ID of the test suite the test case belongs to.
+    :type suite_id: bson.objectid.ObjectId
+    :param suite_name: The name of the test suite.
+    :type suite_name: str
+    :param database: The database connection.
+    :param db_options: The database connection options.
+    :type db_options: dict
+    :return 200 if OK, 500 in case of errors; the saved document ID or None;
+    a dictionary with error codes and messages.
+    """
+    ret_val = 400
+    doc_id = None
+
+    test_case, errors = _parse_test_case(
+        json_obj, suite_id, suite_name, **kwargs)
+
+    if test_case:
+        ret_val, doc_id = utils.db.save(database, test_case, manipulate=True)
+
+        if ret_val != 201:
+            err_msg = "Error saving test case '%s'" % test_case.name
+            utils.LOG.error(err_msg)
+            ADD_ERR(errors, 500, err_msg)
+
     return ret_val, doc_id, errors
 
 
@@ -523,9 +642,13 @@ def import_multi_test_cases(
     with keys the error codes and value a list of error messages, or an empty
     dictionary.
     """
+    # Test suites can have tens of thousands of test cases: import them in
+    # batch.
     return import_multi_base(
         import_test_case,
-        case_list, suite_id, suite_name, db_options, **kwargs)
+        case_list,
+        suite_id,
+        suite_name, db_options, parse_func=_parse_test_case, **kwargs)
 
 
 def import_test_cases_from_test_set(
@@ -560,7 +683,8 @@ def import_test_cases_from_test_set(
         ret_val = utils.db.update(
             database[models.TEST_SET_COLLECTION],
             {models.ID_KEY: test_set_id},
-            {models.TEST_CASE_KEY: case_ids}
+            {models.TEST_CASE_KEY: {"$each": case_ids}},
+            operation="$addToSet"
         )
         if ret_val != 200:
             error_msg = (
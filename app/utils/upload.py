@@ -14,11 +14,75 @@
 """Utility functions to handle file uploads."""
 
 import errno
+import hashlib
 import io
 import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
 
 import utils
 
+# Where the part files of the upload sessions are written before being moved
+# in place: it is inside the base path so that the final rename is atomic.
+UPLOAD_TMP_DIR = ".upload-tmp"
+# The permissions of the uploaded files.
+FILE_MODE = 0664
+# Where the content-addressed objects are stored, inside the base path.
+OBJECTS_DIR = ".objects"
+# The permissions of the stored objects: they are shared by all the files
+# linking them and must never be written in place.
+OBJECT_MODE = 0444
+# How old, in seconds, an object must be before it can be collected.
+OBJECT_MIN_AGE = 24 * 60 * 60
+# A valid object digest: an hex SHA-256 string.
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def get_digest(content):
+    """Calculate the digest of a content, as used for the stored objects.
+
+    :param content: The content.
+    :type content: str
+    :return str The hex digest.
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def is_valid_digest(digest):
+    """Verify that a string is a valid object digest.
+
+    :param digest: The digest to verify.
+    :type digest: str
+    :return True or False.
+    """
+    return bool(digest and DIGEST_RE.match(digest))
+
+
+def get_object_path(digest, base_path=utils.BASE_PATH):
+    """The path where the object with the provided digest is stored.
+
+    :param digest: The hex digest of the object.
+    :type digest: str
+    :return str The object path.
+    """
+    return os.path.join(base_path, OBJECTS_DIR, digest[:2], digest)
+
+
+def object_exists(digest, base_path=utils.BASE_PATH):
+    """Verify if an object with the provided digest is already stored.
+
+    :param digest: The hex digest of the object.
+    :type digest: str
+    :return True or False.
+    """
+    return all([
+        is_valid_digest(digest),
+        os.path.isfile(get_object_path(digest, base_path=base_path))
+    ])
+
 
 def is_valid_dir_path(path, base_path=utils.BASE_PATH):
     """Verify if the provided path is a valid directory.
@@ -37,6 +101,36 @@ def is_valid_dir_path(path, base_path=utils.BASE_PATH):
     return is_valid
 
 
+def normalize_upload_path(path, base_path=utils.BASE_PATH):
+    """Normalize the destination path of an uploaded file.
+
+    The leading and trailing slashes are removed. The path must resolve
+    inside the base path: the `..` components are rejected, as are the
+    internal directories of the uploads.
+
+    :param path: The path to normalize, relative to the base path.
+    :type path: str
+    :param base_path: The base path of the uploaded files.
+    :type base_path: str
+    :return The normalized path, or None if it is not valid.
+    """
+    norm_path = None
+
+    if all([path, ".." not in (path or "").split("/")]):
+        norm_path = os.path.normpath(path.strip("/"))
+
+        real_base = os.path.realpath(base_path)
+        real_path = os.path.realpath(os.path.join(real_base, norm_path))
+
+        if any([
+                norm_path == ".",
+                not real_path.startswith(real_base + os.sep),
+                norm_path.split("/")[0] in (OBJECTS_DIR, UPLOAD_TMP_DIR)]):
+            norm_path = None
+
+    return norm_path
+
+
 def file_exists(path, base_path=utils.BASE_PATH):
     """Verify if the path exists and is a file.
 
@@ -95,11 +189,267 @@ def check_or_create_upload_dir(path, base_path=utils.BASE_PATH):
     return ret_val, error
 
 
+def _remove_file(path):
+    """Remove a file ignoring errors.
+
+    :param path: The path of the file to remove.
+    :type path: str
+    """
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _move_file(src_path, dst_path, mode=FILE_MODE):
+    """Move a file in place, atomically when possible.
+
+    :param src_path: The path of the file to move.
+    :type src_path: str
+    :param dst_path: The destination path.
+    :type dst_path: str
+    :param mode: The permissions of the moved file.
+    :type mode: int
+    """
+    os.chmod(src_path, mode)
+
+    try:
+        os.rename(src_path, dst_path)
+    except OSError, ex:
+        # Not on the same file system, cannot be atomic.
+        if ex.errno == errno.EXDEV:
+            shutil.move(src_path, dst_path)
+        else:
+            raise
+
+
+def _store_object(tmp_path, digest, base_path):
+    """Store a temporary file as the object with the provided digest.
+
+    If the object is already stored, the temporary file is just removed.
+    The object is read-only.
+
+    :param tmp_path: The path of the temporary file.
+    :type tmp_path: str
+    :param digest: The hex digest of the file content.
+    :type digest: str
+    :param base_path: The base path where the objects are stored.
+    :type base_path: str
+    :return str The path of the stored object.
+    """
+    obj_path = get_object_path(digest, base_path=base_path)
+
+    if os.path.isfile(obj_path):
+        _remove_file(tmp_path)
+    else:
+        try:
+            os.makedirs(os.path.dirname(obj_path), mode=0775)
+        except OSError, ex:
+            if ex.errno != errno.EEXIST:
+                raise
+        _move_file(tmp_path, obj_path, mode=OBJECT_MODE)
+
+    return obj_path
+
+
+def _link_object(obj_path, dst_path):
+    """Link a stored object to its destination, replacing it atomically.
+
+    A hard link is used, falling back to a copy when the object and the
+    destination are not on the same file system or cannot be linked: a
+    symbolic link would not count as a link of the object, see
+    `collect_objects`.
+
+    :param obj_path: The path of the stored object.
+    :type obj_path: str
+    :param dst_path: The destination path.
+    :type dst_path: str
+    """
+    tmp_path = os.path.join(
+        os.path.dirname(dst_path),
+        ".%s.%s" % (os.path.basename(dst_path), uuid.uuid4().hex))
+
+    try:
+        os.link(obj_path, tmp_path)
+    except OSError, ex:
+        if ex.errno in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            shutil.copyfile(obj_path, tmp_path)
+            os.chmod(tmp_path, FILE_MODE)
+        else:
+            raise
+
+    try:
+        os.rename(tmp_path, dst_path)
+    except OSError:
+        _remove_file(tmp_path)
+        raise
+
+
+def collect_objects(min_age=OBJECT_MIN_AGE, base_path=utils.BASE_PATH):
+    """Remove the stored objects that no file links anymore.
+
+    An object with a single link is only in the store: all the files that
+    linked it have been removed or replaced. The objects stored in the last
+    `min_age` seconds are kept, since they might be about to be linked.
+
+    :param min_age: How old, in seconds, an object must be to be removed.
+    :type min_age: int
+    :return int The number of removed objects.
+    """
+    removed = 0
+    limit = time.time() - min_age
+    objects_dir = os.path.join(base_path, OBJECTS_DIR)
+
+    for dir_path, _, filenames in os.walk(objects_dir):
+        for filename in filenames:
+            obj_path = os.path.join(dir_path, filename)
+            try:
+                obj_stat = os.lstat(obj_path)
+                if all([obj_stat.st_nlink == 1, obj_stat.st_mtime < limit]):
+                    os.unlink(obj_path)
+                    removed += 1
+            except OSError, ex:
+                utils.LOG.exception(ex)
+                utils.LOG.error("Unable to collect object '%s'", obj_path)
+
+    return removed
+
+
+def get_file_dir(path, filename):
+    """The directory of a file, relative to the base path.
+
+    The file name can contain a subdirectory of the provided path.
+
+    :param path: The path where the file should be saved.
+    :type path: str
+    :param filename: The name of the file to save.
+    :type filename: str
+    :return str The file directory.
+    """
+    file_dir = os.path.dirname(os.path.join(path, filename))
+
+    if path and all([path[-1] == "/", file_dir[-1] != "/"]):
+        file_dir += "/"
+
+    return file_dir
+
+
+def _prepare_file_dir(path, filename, base_path):
+    """Make sure the destination directory of a file exists.
+
+    :param path: The path where the file should be saved.
+    :type path: str
+    :param filename: The name of the file to save.
+    :type filename: str
+    :param base_path: The base path where to save the file.
+    :type base_path: str
+    :return A 2-tuple: the status code (200 or 500), and the file directory
+    relative to the base path.
+    """
+    file_dir = get_file_dir(path, filename)
+
+    ret_val = 200
+    # Check if the file to upload is in a subdirectory of the provided path.
+    if file_dir != path:
+        ret_val, _ = check_or_create_upload_dir(file_dir, base_path=base_path)
+
+    return ret_val, file_dir
+
+
+def create_file_dirs(path, filenames, base_path=utils.BASE_PATH):
+    """Make sure the destination directories of many files exist.
+
+    Each directory is checked only once, however many files it will hold.
+
+    :param path: The path where the files should be saved.
+    :type path: str
+    :param filenames: The names of the files to save.
+    :type filenames: list
+    :return dict The status code (200 or 500) of each file directory.
+    """
+    dirs_status = {}
+
+    for filename in filenames:
+        file_dir = get_file_dir(path, filename)
+        if file_dir not in dirs_status:
+            if file_dir == path:
+                dirs_status[file_dir] = 200
+            else:
+                dirs_status[file_dir], _ = check_or_create_upload_dir(
+                    file_dir, base_path=base_path)
+
+    return dirs_status
+
+
+def move_temp_file(
+        tmp_path, path, filename, base_path=utils.BASE_PATH, digest=None):
+    """Move an uploaded temporary file in place, creating or replacing it.
+
+    If the digest of the file is provided, the file is stored in the
+    content-addressed store (if not already there) and linked in place.
+
+    :param tmp_path: The path of the temporary file.
+    :type tmp_path: str
+    :param path: The path where the file should be saved.
+    :type path: str
+    :param filename: The name of the file to save.
+    :type filename: str
+    :param digest: The hex SHA-256 digest of the file content.
+    :type digest: str
+    :return A dictionary that contains the status code of the operation, an
+    error string if it occurred, the bytes written, the file name and, if
+    stored as an object, its digest.
+    """
+    ret_dict = {
+        "status": 201,
+        "error": None,
+        "bytes": 0,
+        "filename": filename
+    }
+
+    real_path = os.path.join(base_path, path, filename)
+
+    ret_val, file_dir = _prepare_file_dir(path, filename, base_path)
+    if ret_val == 200:
+        if os.path.exists(real_path):
+            ret_dict["status"] = 200
+
+        try:
+            ret_dict["bytes"] = os.path.getsize(tmp_path)
+            if digest:
+                _link_object(
+                    _store_object(tmp_path, digest, base_path), real_path)
+                ret_dict["digest"] = digest
+            else:
+                _move_file(tmp_path, real_path)
+        except (IOError, OSError), ex:
+            utils.LOG.exception(ex)
+            utils.LOG.error("Unable to move file to '%s'", real_path)
+            ret_dict["status"] = 500
+            ret_dict["error"] = "Error writing file '%s'" % filename
+            _remove_file(tmp_path)
+    else:
+        ret_dict["status"] = 500
+        ret_dict["error"] = "Error creating upload dir '%s'" % file_dir
+        _remove_file(tmp_path)
+
+    return ret_dict
+
+
 def create_or_update_file(path,
                           filename,
-                          content_type, content, base_path=utils.BASE_PATH):
+                          content_type,
+                          content,
+                          base_path=utils.BASE_PATH,
+                          dedup=False, check_dir=True):
     """Create or replace a file.
 
+    With `dedup`, the file is stored in the content-addressed store (if not
+    already there) and linked in place.
+
+    With `check_dir` set to False, the destination directory must have been
+    already created (see `create_file_dirs`).
+
     :param path: The path where the file should be saved.
     :type path: str
     :param filename: The name of the file to save.
@@ -108,8 +458,13 @@ def create_or_update_file(path,
     :type content_type: str
     :param content: The content of the file.
     :type content: str
+    :param dedup: If the file should be stored by its digest.
+    :type dedup: bool
+    :param check_dir: If the destination directory should be checked.
+    :type check_dir: bool
     :return A dictionary that contains the status code of the operation, an
-    error string if it occurred, the bytes written and the file name.
+    error string if it occurred, the bytes written, the file name and, with
+    `dedup`, its digest.
     """
     ret_dict = {
         "status": 201,
@@ -118,34 +473,59 @@ def create_or_update_file(path,
         "filename": filename
     }
 
-    file_path = os.path.join(path, filename)
-    real_path = os.path.join(base_path, file_path)
-
-    # Check if the file to upload is in a subdirectory of the provided path.
-    file_dir = os.path.dirname(file_path)
-    if path and all([path[-1] == "/", file_dir[-1] != "/"]):
-        file_dir += "/"
-
-    ret_val = 200
-    if file_dir != path:
-        ret_val, err = check_or_create_upload_dir(
-            file_dir, base_path=base_path)
+    real_path = os.path.join(base_path, path, filename)
 
+    if check_dir:
+        ret_val, file_dir = _prepare_file_dir(path, filename, base_path)
+    else:
+        ret_val = 200
     if ret_val == 200:
         if os.path.exists(real_path):
             # 201 means created anew, 200 means just OK, as in HTTP.
             ret_dict["status"] = 200
 
+        # Write the content in a temporary file next to the destination one,
+        # and then move it in place: nobody will see a partially written
+        # file.
+        tmp_path = None
         w_stream = None
+        digest = None
         try:
-            w_stream = io.open(real_path, mode="bw")
-            ret_dict["bytes"] = w_stream.write(content)
-            w_stream.flush()
-        except IOError, ex:
+            if dedup:
+                digest = get_digest(content)
+                ret_dict["digest"] = digest
+
+            if digest and object_exists(digest, base_path=base_path):
+                # Known content, no need to write it again.
+                ret_dict["bytes"] = len(content)
+                _link_object(
+                    get_object_path(digest, base_path=base_path), real_path)
+            else:
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=os.path.dirname(real_path),
+                    prefix="." + os.path.basename(real_path) + ".")
+                os.close(fd)
+
+                w_stream = io.open(tmp_path, mode="bw")
+                ret_dict["bytes"] = w_stream.write(content)
+                w_stream.flush()
+                w_stream.close()
+
+                if digest:
+                    _link_object(
+                        _store_object(tmp_path, digest, base_path),
+                        real_path)
+                else:
+                    _move_file(tmp_path, real_path)
+        except (IOError, OSError), ex:
             utils.LOG.exception(ex)
-            utils.LOG.error("Unable to open file '%s'", file_path)
+            utils.LOG.error(
+                "Unable to open file '%s'", os.path.join(path, filename))
             ret_dict["status"] = 500
             ret_dict["error"] = "Error writing file '%s'" % filename
+
+            if tmp_path:
+                _remove_file(tmp_path)
         finally:
             if w_stream:
                 w_stream.close()
@@ -154,3 +534,199 @@ def create_or_update_file(path,
         ret_dict["error"] = "Error creating upload dir '%s'" % file_dir
 
     return ret_dict
+
+
+def link_object_file(digest, path, filename, base_path=utils.BASE_PATH):
+    """Create or replace a file linking an already stored object.
+
+    This is used when the client only sends the digest of a content it
+    knows is already stored.
+
+    :param digest: The hex SHA-256 digest of the object.
+    :type digest: str
+    :param path: The path where the file should be saved.
+    :type path: str
+    :param filename: The name of the file to save.
+    :type filename: str
+    :return A dictionary that contains the status code of the operation (404
+    if the object is not stored), an error string if it occurred, the bytes
+    of the file, the file name and the digest.
+    """
+    ret_dict = {
+        "status": 201,
+        "error": None,
+        "bytes": 0,
+        "filename": filename,
+        "digest": digest
+    }
+
+    real_path = os.path.join(base_path, path, filename)
+
+    if object_exists(digest, base_path=base_path):
+        ret_val, file_dir = _prepare_file_dir(path, filename, base_path)
+        if ret_val == 200:
+            if os.path.exists(real_path):
+                ret_dict["status"] = 200
+
+            obj_path = get_object_path(digest, base_path=base_path)
+            try:
+                ret_dict["bytes"] = os.path.getsize(obj_path)
+                _link_object(obj_path, real_path)
+            except OSError, ex:
+                utils.LOG.exception(ex)
+                utils.LOG.error("Unable to link object to '%s'", real_path)
+                ret_dict["status"] = 500
+                ret_dict["error"] = "Error writing file '%s'" % filename
+        else:
+            ret_dict["status"] = 500
+            ret_dict["error"] = "Error creating upload dir '%s'" % file_dir
+    else:
+        ret_dict["status"] = 404
+        ret_dict["error"] = "No content found with digest '%s'" % digest
+
+    return ret_dict
+
+
+def get_part_path(session_id, base_path=utils.BASE_PATH):
+    """The path of the file where the chunks of an upload session are written.
+
+    :param session_id: The ID of the upload session.
+    :type session_id: str
+    :return str The part file path.
+    """
+    return os.path.join(base_path, UPLOAD_TMP_DIR, "%s.part" % session_id)
+
+
+def create_part_file(session_id, size, base_path=utils.BASE_PATH):
+    """Create the part file of an upload session.
+
+    The file is created with its final size so that the chunks can be
+    written at their offset, in any order and in parallel.
+
+    :param session_id: The ID of the upload session.
+    :type session_id: str
+    :param size: The size of the file being uploaded.
+    :type size: int
+    :return str The part file path.
+    """
+    part_path = get_part_path(session_id, base_path=base_path)
+
+    try:
+        os.makedirs(os.path.dirname(part_path), mode=0775)
+    except OSError, ex:
+        if ex.errno != errno.EEXIST:
+            raise
+
+    with io.open(part_path, mode="wb") as w_stream:
+        w_stream.truncate(size)
+
+    return part_path
+
+
+def write_chunk(session_id, offset, content, base_path=utils.BASE_PATH):
+    """Write a chunk of an upload session at its offset.
+
+    :param session_id: The ID of the upload session.
+    :type session_id: str
+    :param offset: Where the chunk starts in the file.
+    :type offset: int
+    :param content: The chunk content.
+    :type content: str
+    :return The number of bytes written.
+    """
+    with io.open(
+            get_part_path(session_id, base_path=base_path),
+            mode="r+b") as w_stream:
+        w_stream.seek(offset)
+        written = w_stream.write(content)
+
+    return written
+
+
+def remove_part_file(session_id, base_path=utils.BASE_PATH):
+    """Remove the part file of an upload session, if there.
+
+    :param session_id: The ID of the upload session.
+    :type session_id: str
+    """
+    _remove_file(get_part_path(session_id, base_path=base_path))
+
+
+def remove_stale_part_files(max_age, base_path=utils.BASE_PATH):
+    """Remove the part files not modified in the last `max_age` seconds.
+
+    These are left behind by abandoned upload sessions.
+
+    :param max_age: The maximum age of a part file, in seconds.
+    :type max_age: int
+    """
+    tmp_dir = os.path.join(base_path, UPLOAD_TMP_DIR)
+    limit = time.time() - max_age
+
+    try:
+        for name in os.listdir(tmp_dir):
+            part_path = os.path.join(tmp_dir, name)
+            if all([name.endswith(".part"),
+                    os.path.getmtime(part_path) < limit]):
+                _remove_file(part_path)
+    except OSError:
+        pass
+
+
+def merge_ranges(ranges):
+    """Merge a list of byte ranges.
+
+    :param ranges: The ranges as [start, end) pairs, in any order.
+    :type ranges: list
+    :return list The sorted ranges, without overlaps or contiguous ranges.
+    """
+    merged = []
+
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    return merged
+
+
+def missing_ranges(ranges, size):
+    """The byte ranges of a file not yet covered by the provided ones.
+
+    :param ranges: The received ranges as [start, end) pairs.
+    :type ranges: list
+    :param size: The size of the file.
+    :type size: int
+    :return list The missing ranges as [start, end) pairs.
+    """
+    missing = []
+    position = 0
+
+    for start, end in merge_ranges(ranges):
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+
+    if position < size:
+        missing.append([position, size])
+
+    return missing
+
+
+def get_file_digest(path, block_size=1024 * 1024):
+    """Calculate the digest of a file, reading it in blocks.
+
+    :param path: The path of the file.
+    :type path: str
+    :param block_size: The size of the read blocks.
+    :type block_size: int
+    :return str The hex SHA-256 digest.
+    """
+    file_hash = hashlib.sha256()
+
+    with io.open(path, mode="rb") as r_stream:
+        for block in iter(lambda: r_stream.read(block_size), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()